@@ -0,0 +1,15 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Pyrakoon benchmark suite
+
+Run all benchmarks using ``python -m benchmarks`` from the repository root. See ``python -m benchmarks --help`` for
+filtering, JSON output and baseline comparison options.
+
+Benchmark modules:
+
+* :mod:`benchmarks.codec`: serialization and deserialization of protocol types and messages
+* :mod:`benchmarks.call`: overhead of client methods generated by :func:`pyrakoon.client.utils.call`
+* :mod:`benchmarks.clients`: end-to-end round trips against a loopback :class:`pyrakoon.fake.FakeServer`
+"""
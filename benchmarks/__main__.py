@@ -0,0 +1,12 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Run the benchmark suite, see :func:`benchmarks.runner.main`
+"""
+
+import sys
+
+from benchmarks import runner
+
+sys.exit(runner.main())
@@ -0,0 +1,54 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Overhead of client methods generated by :func:`pyrakoon.client.utils.call`
+
+The client used here doesn't talk to any server, so only the argument handling of the
+:func:`pyrakoon.utils.update_argspec` wrapper, type validation and message construction are measured.
+"""
+
+from __future__ import absolute_import
+
+from pyrakoon import client, consistency, protocol, sequence
+from .runner import throughput
+
+
+class _NullClient(client.AbstractClient, client.ClientMixin):
+    """
+    Client discarding all messages
+    """
+
+    connected = True
+
+    def _process(self, message):
+        return None
+
+
+def _register(name, fun):
+    @throughput('call.%s' % name)
+    def call_benchmark():
+        yield fun
+
+
+def _register_calls():
+    client_ = _NullClient()
+    key, value = 'key_0'.ljust(16, 'k'), 'v' * 64
+    keys = ['key_%d' % i for i in xrange(100)]
+    steps = [sequence.Set(key_, value) for key_ in keys]
+
+    message = protocol.Get(None, key)
+    _register('baseline.process', lambda: client_._process(message))
+    _register('baseline.message', lambda: protocol.Get(None, key))
+
+    _register('who_master', client_.who_master)
+    _register('get', lambda: client_.get(key))
+    _register('get.kwargs', lambda: client_.get(key=key, consistency=consistency.INCONSISTENT))
+    _register('set', lambda: client_.set(key, value))
+    _register('test_and_set', lambda: client_.test_and_set(key, None, value))
+    _register('multi_get.100', lambda: client_.multi_get(keys))
+    _register('range_entries', lambda: client_.range_entries(None, True, None, True, 100))
+    _register('sequence.100', lambda: client_.sequence(steps))
+
+
+_register_calls()
@@ -0,0 +1,166 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+End-to-end round trips against a loopback :class:`pyrakoon.fake.FakeServer`
+
+Covers the native :class:`pyrakoon.client.SocketClient`, the compatibility :class:`pyrakoon.compat.ArakoonClient`
+and, when Twisted is available, :class:`pyrakoon.tx.ArakoonProtocol`.
+"""
+
+from __future__ import absolute_import
+
+import time
+import threading
+
+from pyrakoon import client, compat, fake
+from .runner import latency, timed
+
+CLUSTER_ID = 'pyrakoon_benchmark'
+KEY = 'key_0'.ljust(16, 'k')
+VALUE_SIZES = (64, 4096, 1024 * 1024)
+# Number of concurrent requests in pipelined Twisted benchmarks
+PIPELINE_DEPTH = 32
+
+
+class _SocketClient(client.SocketClient, client.ClientMixin):
+    """
+    Native socket client
+    """
+
+
+def _server():
+    """
+    Start a fake server holding a value of every benchmarked size
+
+    :rtype: pyrakoon.fake.FakeServer
+    """
+    server = fake.FakeServer(CLUSTER_ID)
+    for size in VALUE_SIZES:
+        server.store.set('%s_%d' % (KEY, size), 'v' * size)
+    server.start()
+    return server
+
+
+def _register_socket_client():
+    def register(name, operation):
+        @latency('clients.socket.%s' % name)
+        def socket_benchmark():
+            server = _server()
+            try:
+                client_ = _SocketClient(server.address, CLUSTER_ID)
+                client_.connect()
+                yield timed(lambda: operation(client_))
+            finally:
+                server.stop()
+
+    register('who_master', lambda client_: client_.who_master())
+    register('exists', lambda client_: client_.exists(KEY))
+    for size in VALUE_SIZES:
+        register('get.%d' % size, lambda client_, size=size: client_.get('%s_%d' % (KEY, size)))
+        register('set.%d' % size, lambda client_, value='v' * size: client_.set(KEY, value))
+
+
+def _register_compat_client():
+    def register(name, operation):
+        @latency('clients.compat.%s' % name)
+        def compat_benchmark():
+            server = _server()
+            try:
+                client_ = compat.ArakoonClient(compat.ArakoonClientConfig(*server.client_config))
+                client_.whoMaster()
+                yield timed(lambda: operation(client_))
+                client_.dropConnections()
+            finally:
+                server.stop()
+
+    register('who_master', lambda client_: client_.whoMaster())
+    register('exists', lambda client_: client_.exists(KEY))
+    for size in VALUE_SIZES:
+        register('get.%d' % size, lambda client_, size=size: client_.get('%s_%d' % (KEY, size)))
+        register('set.%d' % size, lambda client_, value='v' * size: client_.set(KEY, value))
+
+
+class _Reactor(object):
+    """
+    Twisted reactor running in a background thread
+
+    A reactor can't be restarted, so it's started once and shared by all Twisted benchmarks.
+    """
+
+    _lock = threading.Lock()
+    _thread = None
+
+    @classmethod
+    def ensure_running(cls):
+        from twisted.internet import reactor
+
+        with cls._lock:
+            if cls._thread is None:
+                cls._thread = threading.Thread(target=reactor.run, kwargs={'installSignalHandlers': False},
+                                               name='benchmark-reactor')
+                cls._thread.daemon = True
+                cls._thread.start()
+
+        return reactor
+
+
+def _register_tx():
+    try:
+        from twisted.internet import defer, protocol as tx_protocol, threads
+        from pyrakoon import tx
+    except ImportError:
+        return
+
+    @defer.inlineCallbacks
+    def sequential(operation, proto, count):
+        clock = time.time
+        durations = []
+        for _ in xrange(count):
+            start = clock()
+            yield operation(proto)
+            durations.append(clock() - start)
+        defer.returnValue(durations)
+
+    @defer.inlineCallbacks
+    def pipelined(operation, proto, count):
+        # Every request of a batch is attributed the latency of the batch divided by the batch size
+        clock = time.time
+        durations = []
+        while len(durations) < count:
+            depth = min(PIPELINE_DEPTH, count - len(durations))
+            start = clock()
+            yield defer.DeferredList([operation(proto) for _ in xrange(depth)], fireOnOneErrback=True)
+            durations.extend([(clock() - start) / depth] * depth)
+        defer.returnValue(durations)
+
+    class Protocol(tx.ArakoonProtocol, client.ClientMixin):
+        """
+        Twisted protocol exposing client methods
+        """
+
+    def register(name, operation):
+        for mode, driver in (('sequential', sequential), ('pipelined', pipelined)):
+            @latency('clients.tx.%s.%s' % (name, mode))
+            def tx_benchmark(driver=driver):
+                reactor = _Reactor.ensure_running()
+                server = _server()
+                try:
+                    creator = tx_protocol.ClientCreator(reactor, Protocol, CLUSTER_ID)
+                    host, port = server.address
+                    proto = threads.blockingCallFromThread(reactor, creator.connectTCP, host, port)
+
+                    yield lambda count: threads.blockingCallFromThread(reactor, driver, operation, proto, count)
+
+                    reactor.callFromThread(proto.transport.loseConnection)
+                finally:
+                    server.stop()
+
+    register('who_master', lambda proto: proto.who_master())
+    for size in VALUE_SIZES:
+        register('get.%d' % size, lambda proto, size=size: proto.get('%s_%d' % (KEY, size)))
+
+
+_register_socket_client()
+_register_compat_client()
+_register_tx()
@@ -0,0 +1,200 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Serialization and deserialization throughput of protocol types and messages
+
+Types are encoded using :meth:`pyrakoon.protocol.Type.serialize` and decoded from an in-memory buffer through
+:meth:`pyrakoon.protocol.Type.receive`. Messages are serialized as a client sends them, and their results decoded
+from the bytes :class:`pyrakoon.fake.FakeServer` would reply with.
+"""
+
+from __future__ import absolute_import
+
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+from pyrakoon import consistency, fake, protocol, sequence, utils
+from pyrakoon.sequence import steps as sequence_steps
+from pyrakoon.protocol import admin
+from .runner import throughput
+
+# Key and value sizes, in bytes
+KEY_SIZES = (16, 256)
+VALUE_SIZES = (64, 4096, 1024 * 1024)
+# Number of items in lists and sequences
+LIST_LENGTHS = (1, 100, 10000)
+
+
+def _key(size, i=0):
+    return ('key_%d_' % i).ljust(size, 'k')
+
+
+def _value(size):
+    return 'v' * size
+
+
+def _serializer(type_, value):
+    def serialize():
+        ''.join(type_.serialize(value))
+    return serialize
+
+
+def _receiver(receive, data):
+    def decode():
+        utils.read_blocking(receive(), StringIO.StringIO(data).read)
+    return decode
+
+
+def _register_type(name, type_, value, data=None, decode=True):
+    """
+    Register encode and decode benchmarks of a single type and value
+
+    :param name: Benchmark name suffix
+    :type name: str
+    :param type_: Type to benchmark
+    :type type_: pyrakoon.protocol.Type
+    :param value: Value to encode
+    :param data: Encoded value, if it can't be produced by `type_.serialize`
+    :type data: str
+    :param decode: Whether to register a decode benchmark
+    :type decode: bool
+    """
+    if data is None:
+        serializer = _serializer(type_, value)
+
+        @throughput('codec.types.%s.serialize' % name)
+        def serialize_benchmark():
+            yield serializer
+
+        data = ''.join(type_.serialize(value))
+
+    if decode:
+        receiver = _receiver(type_.receive, data)
+
+        @throughput('codec.types.%s.receive' % name)
+        def receive_benchmark():
+            yield receiver
+
+
+def _register_types():
+    for size in KEY_SIZES:
+        _register_type('string.%d' % size, protocol.STRING, _value(size))
+    for size in VALUE_SIZES:
+        _register_type('string.%d' % size, protocol.STRING, _value(size))
+
+    _register_type('uint32', protocol.UINT32, 2 ** 31)
+    _register_type('uint64', protocol.UINT64, 2 ** 63)
+    _register_type('int8', protocol.INT8, -3)
+    _register_type('int32', protocol.INT32, -2 ** 30)
+    _register_type('int64', protocol.INT64, -2 ** 62)
+    _register_type('float', protocol.FLOAT, 3.14)
+    _register_type('bool', protocol.BOOL, True)
+    _register_type('unit', protocol.UNIT, None, data='')
+
+    _register_type('option.none', protocol.Option(protocol.STRING), None)
+    _register_type('option.string.64', protocol.Option(protocol.STRING), _value(64))
+    _register_type('product.string.string', protocol.Product(protocol.STRING, protocol.STRING),
+                   (_key(16), _value(64)))
+
+    _register_type('consistency.consistent', protocol.CONSISTENCY, consistency.CONSISTENT)
+    _register_type('consistency.at_least', protocol.CONSISTENCY, consistency.AtLeast(1234))
+
+    for length in LIST_LENGTHS:
+        keys = [_key(16, i) for i in xrange(length)]
+        entries = [(key, _value(64)) for key in keys]
+
+        _register_type('list.string.%d' % length, protocol.List(protocol.STRING), keys)
+        _register_type('array.string.%d' % length, protocol.Array(protocol.STRING), keys,
+                       data=''.join(fake.encode_result(protocol.Array(protocol.STRING), keys)))
+        _register_type('list.product.%d' % length, protocol.List(protocol.Product(protocol.STRING, protocol.STRING)),
+                       entries)
+
+        steps = [sequence.Set(key, _value(64)) for key in keys]
+        _register_type('step.sequence.%d' % length, protocol.STEP, sequence.Sequence(steps), decode=False)
+        _register_type('range_assertion.%d' % length, protocol.RANGE_ASSERTION,
+                       sequence_steps.ContainsExactly(keys), decode=False)
+
+    _register_type('step.set', protocol.STEP, sequence.Set(_key(16), _value(64)), decode=False)
+    _register_type('step.delete', protocol.STEP, sequence.Delete(_key(16)), decode=False)
+
+    statistics = fake.FakeServer('benchmark').handle_statistics(None)
+    _register_type('statistics', protocol.STATISTICS, statistics,
+                   data=''.join(fake.encode_result(protocol.STATISTICS, statistics)))
+
+
+def _register_message(name, message, result):
+    """
+    Register serialize and receive benchmarks of a single message
+
+    :param name: Benchmark name suffix
+    :type name: str
+    :param message: Message to benchmark
+    :type message: pyrakoon.protocol.Message
+    :param result: Result value the server replies with
+    """
+    @throughput('codec.messages.%s.serialize' % name)
+    def serialize_benchmark():
+        def serialize():
+            ''.join(message.serialize())
+        yield serialize
+
+    receiver = _receiver(message.receive, ''.join(fake.FakeServer.encode_success(message, result)))
+
+    @throughput('codec.messages.%s.receive' % name)
+    def receive_benchmark():
+        yield receiver
+
+
+def _register_messages():
+    key = _key(16)
+    small = _value(64)
+
+    _register_message('hello', protocol.Hello('benchmark', 'arakoon'), 'Arakoon 1.0.0')
+    _register_message('who_master', protocol.WhoMaster(), 'arakoon_0')
+    _register_message('expect_progress_possible', protocol.ExpectProgressPossible(), True)
+    _register_message('statistics', protocol.Statistics(), fake.FakeServer('benchmark').handle_statistics(None))
+    _register_message('version', protocol.Version(), (1, 0, 0, 'Arakoon'))
+    _register_message('nop', protocol.Nop(), None)
+    _register_message('get_current_state', protocol.GetCurrentState(), 'state')
+    _register_message('get_tx_id', protocol.GetTxID(), consistency.AtLeast(1234))
+    _register_message('user_function', protocol.UserFunction('function', small), small)
+    _register_message('get_key_count', protocol.GetKeyCount(), 1234)
+
+    _register_message('exists', protocol.Exists(None, key), True)
+    _register_message('assert', protocol.Assert(None, key, small), None)
+    _register_message('assert_exists', protocol.AssertExists(None, key), None)
+    _register_message('delete', protocol.Delete(key), None)
+    _register_message('delete_prefix', protocol.DeletePrefix(key), 12)
+    _register_message('replace', protocol.Replace(key, small), small)
+    _register_message('confirm', protocol.Confirm(key, small), None)
+    _register_message('test_and_set', protocol.TestAndSet(key, small, small), small)
+
+    for size in VALUE_SIZES:
+        value = _value(size)
+        _register_message('get.%d' % size, protocol.Get(None, key), value)
+        _register_message('set.%d' % size, protocol.Set(key, value), None)
+
+    for length in LIST_LENGTHS:
+        keys = [_key(16, i) for i in xrange(length)]
+        values = [small] * length
+        entries = [(key_, small) for key_ in keys]
+        steps = [sequence.Set(key_, small) for key_ in keys]
+
+        _register_message('multi_get.%d' % length, protocol.MultiGet(None, keys), values)
+        _register_message('multi_get_option.%d' % length, protocol.MultiGetOption(None, keys), values)
+        _register_message('prefix_keys.%d' % length, protocol.PrefixKeys(None, 'key_', length), keys)
+        _register_message('range.%d' % length, protocol.Range(None, None, True, None, True, length), keys)
+        _register_message('range_entries.%d' % length,
+                          protocol.RangeEntries(None, None, True, None, True, length), entries)
+        _register_message('rev_range_entries.%d' % length,
+                          protocol.RevRangeEntries(None, None, True, None, True, length), entries)
+        _register_message('sequence.%d' % length, protocol.Sequence(steps, False), None)
+
+    _register_message('admin.collapse_tlogs', admin.CollapseTlogs(4), [12, 34, 56, 78])
+
+
+_register_types()
+_register_messages()
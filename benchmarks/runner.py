@@ -0,0 +1,394 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Benchmark registry, measurement and baseline comparison
+"""
+
+from __future__ import absolute_import
+
+import gc
+import sys
+import json
+import time
+import fnmatch
+import logging
+import platform
+import argparse
+import contextlib
+
+import pyrakoon
+
+# Benchmark kinds
+KIND_THROUGHPUT = 'throughput'
+KIND_LATENCY = 'latency'
+
+PERCENTILES = (50, 90, 99, 99.9)
+DEFAULT_THRESHOLD = 0.1
+
+BENCHMARKS = []
+
+
+class Benchmark(object):
+    """
+    A registered benchmark
+
+    The factory is a context manager function yielding the thing to measure:
+
+    * for :data:`KIND_THROUGHPUT`, a callable taking no arguments, called in a tight loop
+    * for :data:`KIND_LATENCY`, a callable taking an operation count, running that many operations and returning the
+      duration of each of them in seconds
+    """
+
+    def __init__(self, name, kind, factory):
+        """
+        :param name: Dotted benchmark name
+        :type name: str
+        :param kind: Benchmark kind
+        :type kind: str
+        :param factory: Context manager function yielding the benchmark callable
+        :type factory: callable
+        """
+        self.name = name
+        self.kind = kind
+        self.factory = factory
+
+    def __repr__(self):
+        return '<Benchmark %s (%s)>' % (self.name, self.kind)
+
+
+def register(name, kind, factory):
+    """
+    Register a benchmark
+
+    :param name: Dotted benchmark name, must be unique
+    :type name: str
+    :param kind: Benchmark kind
+    :type kind: str
+    :param factory: Function yielding the benchmark callable, wrapped using :func:`contextlib.contextmanager`
+    :type factory: callable
+    :return: The registered benchmark
+    :rtype: Benchmark
+    """
+    if any(benchmark.name == name for benchmark in BENCHMARKS):
+        raise ValueError('Benchmark %s registered twice' % name)
+
+    benchmark = Benchmark(name, kind, contextlib.contextmanager(factory))
+    BENCHMARKS.append(benchmark)
+    return benchmark
+
+
+def throughput(name):
+    """
+    Decorator registering a throughput benchmark factory
+
+    :param name: Dotted benchmark name
+    :type name: str
+    """
+    def wrapper(factory):
+        register(name, KIND_THROUGHPUT, factory)
+        return factory
+    return wrapper
+
+
+def latency(name):
+    """
+    Decorator registering a latency benchmark factory
+
+    :param name: Dotted benchmark name
+    :type name: str
+    """
+    def wrapper(factory):
+        register(name, KIND_LATENCY, factory)
+        return factory
+    return wrapper
+
+
+def timed(operation):
+    """
+    Turn a blocking callable into a latency benchmark callable
+
+    :param operation: Callable performing a single operation
+    :type operation: callable
+    :return: Callable running `count` operations, returning their durations
+    :rtype: callable
+    """
+    def run(count):
+        clock = time.time
+        durations = []
+        append = durations.append
+        for _ in xrange(count):
+            start = clock()
+            operation()
+            append(clock() - start)
+        return durations
+    return run
+
+
+def percentile(ordered, pct):
+    """
+    Nearest-rank percentile of a sorted sequence
+
+    >>> percentile(range(1, 101), 50)
+    50
+    >>> percentile(range(1, 101), 99.9)
+    100
+    >>> percentile([3], 90)
+    3
+
+    :param ordered: Sorted values
+    :type ordered: list
+    :param pct: Percentile, between 0 and 100
+    :type pct: float
+    :return: Value at the given percentile
+    """
+    if not ordered:
+        raise ValueError('No values')
+
+    rank = int(-(-len(ordered) * pct // 100))
+    return ordered[max(rank, 1) - 1]
+
+
+def measure_throughput(operation, min_time, repeat):
+    """
+    Measure the throughput of a callable
+
+    The iteration count is calibrated so a single run takes at least `min_time`, then the best of `repeat` runs is
+    reported, like :mod:`timeit` advises.
+
+    :param operation: Callable to measure
+    :type operation: callable
+    :param min_time: Minimal duration of a single run in seconds
+    :type min_time: float
+    :param repeat: Number of runs
+    :type repeat: int
+    :return: Result fields
+    :rtype: dict
+    """
+    clock = time.time
+
+    def loop(count):
+        start = clock()
+        for _ in xrange(count):
+            operation()
+        return clock() - start
+
+    count = 1
+    while True:
+        elapsed = loop(count)
+        if elapsed >= min_time / 10:
+            break
+        count *= 10
+
+    count = max(int(count * min_time / max(elapsed, 1e-9)), 1)
+    best = min(loop(count) for _ in xrange(repeat))
+
+    return {
+        'iterations': count,
+        'ops_per_sec': count / best,
+        'ns_per_op': best / count * 1e9,
+    }
+
+
+def measure_latency(run, min_time, repeat):
+    """
+    Measure per-operation latencies of a latency benchmark callable
+
+    :param run: Callable as documented in :class:`Benchmark`
+    :type run: callable
+    :param min_time: Minimal total duration of the measurement in seconds
+    :type min_time: float
+    :param repeat: Number of calibration rounds of operations to take as warm-up
+    :type repeat: int
+    :return: Result fields
+    :rtype: dict
+    """
+    durations = []
+    for _ in xrange(repeat):
+        durations = run(10)
+
+    count = max(int(min_time / max(sum(durations) / len(durations), 1e-9)), 10)
+    durations = sorted(run(count))
+    total = sum(durations)
+
+    result = {
+        'iterations': count,
+        'ops_per_sec': count / total,
+        'mean_us': total / count * 1e6,
+        'min_us': durations[0] * 1e6,
+        'max_us': durations[-1] * 1e6,
+    }
+    for pct in PERCENTILES:
+        result['p%s_us' % ('%g' % pct).replace('.', '_')] = percentile(durations, pct) * 1e6
+
+    return result
+
+
+def run_benchmark(benchmark, min_time, repeat):
+    """
+    Set up, measure and tear down a single benchmark
+
+    :param benchmark: Benchmark to run
+    :type benchmark: Benchmark
+    :param min_time: Minimal duration of a measurement in seconds
+    :type min_time: float
+    :param repeat: Number of measurement or warm-up rounds
+    :type repeat: int
+    :return: Result fields
+    :rtype: dict
+    """
+    with benchmark.factory() as subject:
+        gc.collect()
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            if benchmark.kind == KIND_THROUGHPUT:
+                result = measure_throughput(subject, min_time, repeat)
+            else:
+                result = measure_latency(subject, min_time, repeat)
+        finally:
+            if gc_enabled:
+                gc.enable()
+
+    result['kind'] = benchmark.kind
+    return result
+
+
+def select(patterns):
+    """
+    Select registered benchmarks by name
+
+    :param patterns: Shell-style patterns, a benchmark is selected when any matches. Select all if empty.
+    :type patterns: list of str
+    :return: Matching benchmarks, in registration order
+    :rtype: list of Benchmark
+    """
+    if not patterns:
+        return list(BENCHMARKS)
+
+    return [benchmark for benchmark in BENCHMARKS
+            if any(fnmatch.fnmatchcase(benchmark.name, pattern) for pattern in patterns)]
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare results against a baseline
+
+    A benchmark regressed when its throughput dropped by more than `threshold` (a fraction) relative to the baseline.
+
+    >>> compare({'a': {'ops_per_sec': 80.0}, 'b': {'ops_per_sec': 95.0}},
+    ...         {'a': {'ops_per_sec': 100.0}, 'b': {'ops_per_sec': 100.0}})
+    [('a', 100.0, 80.0, -0.2)]
+
+    :param results: Benchmark results by name
+    :type results: dict
+    :param baseline: Baseline results by name
+    :type baseline: dict
+    :param threshold: Allowed relative slowdown
+    :type threshold: float
+    :return: Regressions as `(name, baseline ops/sec, ops/sec, relative change)` tuples
+    :rtype: list of tuple
+    """
+    regressions = []
+
+    for name in sorted(results):
+        if name not in baseline:
+            continue
+
+        old = baseline[name]['ops_per_sec']
+        new = results[name]['ops_per_sec']
+        change = (new - old) / old
+
+        if change < -threshold:
+            regressions.append((name, old, new, round(change, 4)))
+
+    return regressions
+
+
+def environment():
+    """
+    Describe the environment benchmarks ran in
+
+    :rtype: dict
+    """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'pyrakoon': pyrakoon.__version__,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+def load_modules():
+    """
+    Import all benchmark modules, registering their benchmarks
+    """
+    from . import codec, call, clients # pylint: disable=W0612
+
+
+def main(argv=None):
+    """
+    Command-line entry point
+
+    :param argv: Command-line arguments
+    :type argv: list of str
+    :return: Exit code, 1 if a regression against the baseline was found
+    :rtype: int
+    """
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Run the pyrakoon benchmarks')
+    parser.add_argument('patterns', nargs='*', metavar='PATTERN',
+                        help='only run benchmarks matching these shell-style patterns, e.g. "codec.types.*"')
+    parser.add_argument('-l', '--list', action='store_true', help='list benchmarks and exit')
+    parser.add_argument('-o', '--output', metavar='FILE', help='write JSON results to FILE')
+    parser.add_argument('-b', '--baseline', metavar='FILE', help='compare against JSON results stored in FILE')
+    parser.add_argument('-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='allowed relative slowdown against the baseline (default: %(default)s)')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimal duration of a measurement in seconds (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of measurement rounds (default: %(default)s)')
+    parser.add_argument('-q', '--quick', action='store_true', help='shorthand for --min-time 0.02 --repeat 1')
+    args = parser.parse_args(argv)
+
+    if args.quick:
+        args.min_time, args.repeat = 0.02, 1
+
+    logging.basicConfig(level=logging.WARNING)
+    load_modules()
+
+    benchmarks = select(args.patterns)
+    if args.list:
+        for benchmark in benchmarks:
+            print '%s (%s)' % (benchmark.name, benchmark.kind)
+        return 0
+
+    results = {}
+    for benchmark in benchmarks:
+        result = run_benchmark(benchmark, args.min_time, args.repeat)
+        results[benchmark.name] = result
+
+        if benchmark.kind == KIND_THROUGHPUT:
+            print '%-60s %14.0f ops/s %12.1f ns/op' % (benchmark.name, result['ops_per_sec'], result['ns_per_op'])
+        else:
+            print '%-60s %14.0f ops/s %9.1f us p50 %9.1f us p99' % (
+                benchmark.name, result['ops_per_sec'], result['p50_us'], result['p99_us'])
+        sys.stdout.flush()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'environment': environment(), 'results': results}, output, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+        regressions = compare(results, baseline, args.threshold)
+        for name, old, new, change in regressions:
+            print 'REGRESSION %s: %.0f -> %.0f ops/s (%+.1f%%)' % (name, old, new, change * 100)
+
+        if regressions:
+            return 1
+        print 'No regressions against %s' % args.baseline
+
+    return 0
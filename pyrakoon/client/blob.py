@@ -0,0 +1,571 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Large values split into chunks
+
+A :class:`BlobStore` stores values of many megabytes as a series of fixed-size chunk keys and a small manifest at the
+key of the value itself. Chunk keys are named after a random identifier of the blob, under a separate prefix, so a
+new version of a blob never overwrites the chunks of the previous one: readers only find chunks through the
+manifest, and swapping the manifest is atomic.
+
+Blobs fitting in `max_sequence_bytes` are written in a single sequence. Larger blobs, and blobs written through a
+:class:`BlobWriter`, are written in several sequences of chunks, followed by a sequence setting the manifest and
+deleting the chunks of the previous version. No other call waits for more than a single sequence or a window of
+reads.
+
+Chunks are read using pipelined `multi_get` calls, several chunks per call. Clients which don't pipeline requests
+(see :meth:`pyrakoon.client.AbstractClient._process_many`) send these calls one by one.
+
+Manifests are fixed-size strings:
+
+>>> manifest = Manifest('0123456789abcdef', 3000000, 1048576, 3, 1234)
+>>> len(manifest.serialize())
+45
+>>> Manifest.parse(manifest.serialize()).count
+3
+>>> manifest.chunk_key('chunks/', 2)
+'chunks/0123456789abcdef/00000002'
+"""
+
+from __future__ import absolute_import
+
+import os
+import zlib
+import struct
+import logging
+
+from . import bulk
+from .utils import processor
+from .. import errors, protocol, sequence
+from ..constants.logging import PYRAKOON_CLIENT_LOGGER
+
+logger = logging.getLogger(PYRAKOON_CLIENT_LOGGER)
+
+MAGIC = 'PYRKBLOB'
+VERSION = 1
+
+# Default prefix of chunk keys, sorting before most application keys
+DEFAULT_CHUNK_PREFIX = '\x00pyrakoon/blob/'
+
+# Magic, version, blob identifier, size, chunk size, chunk count and CRC32 of the value
+_MANIFEST = struct.Struct('<8sB16sQIII')
+
+# Number of times a read starts over when the blob is replaced while it's read
+_MAX_READ_ATTEMPTS = 3
+
+
+class Manifest(object):
+    """
+    Description of a blob, stored at its key
+    """
+
+    __slots__ = 'blob_id', 'size', 'chunk_size', 'count', 'checksum'
+
+    def __init__(self, blob_id, size, chunk_size, count, checksum):
+        """
+        :param blob_id: Identifier of this version of the blob, 16 characters
+        :type blob_id: str
+        :param size: Size of the value, in bytes
+        :type size: int
+        :param chunk_size: Size of all chunks but the last, in bytes
+        :type chunk_size: int
+        :param count: Number of chunks
+        :type count: int
+        :param checksum: CRC32 of the value
+        :type checksum: int
+        """
+        self.blob_id = blob_id
+        self.size = size
+        self.chunk_size = chunk_size
+        self.count = count
+        self.checksum = checksum
+
+    def serialize(self):
+        """
+        Serialize the manifest
+
+        :rtype: str
+        """
+        return _MANIFEST.pack(MAGIC, VERSION, self.blob_id, self.size, self.chunk_size, self.count, self.checksum)
+
+    @classmethod
+    def parse(cls, value):
+        """
+        Parse a stored manifest
+
+        :param value: Value stored at the key of a blob
+        :type value: str
+        :return: Manifest, or `None` if `value` isn't a blob manifest
+        :rtype: Manifest
+        """
+        if len(value) != _MANIFEST.size or not value.startswith(MAGIC):
+            return None
+
+        _, version, blob_id, size, chunk_size, count, checksum = _MANIFEST.unpack(value)
+        if version != VERSION:
+            raise ValueError('Unsupported blob version %d' % version)
+
+        return cls(blob_id, size, chunk_size, count, checksum)
+
+    def chunks_prefix(self, chunk_prefix):
+        """
+        Prefix of the chunk keys of this version of the blob
+
+        :param chunk_prefix: Prefix of all chunk keys
+        :type chunk_prefix: str
+        :rtype: str
+        """
+        return '%s%s/' % (chunk_prefix, self.blob_id)
+
+    def chunk_key(self, chunk_prefix, index):
+        """
+        Key of a chunk
+
+        :param chunk_prefix: Prefix of all chunk keys
+        :type chunk_prefix: str
+        :param index: Position of the chunk, starting at 0
+        :type index: int
+        :rtype: str
+        """
+        return '%s%s/%08x' % (chunk_prefix, self.blob_id, index)
+
+    def __repr__(self):
+        return '<Manifest blob_id=%s size=%d count=%d>' % (self.blob_id, self.size, self.count)
+
+
+class BlobStore(object):
+    """
+    Store and retrieve chunked values
+
+    Example usage::
+
+        blobs = BlobStore(client, chunk_size=1024 * 1024)
+        blobs.put('images/debian', data)
+
+        with open('debian.img', 'wb') as output:
+            shutil.copyfileobj(blobs.open('images/debian'), output, 1024 * 1024)
+
+    Blobs bypass the `value_codec` of the client: chunks are stored as is.
+    """
+
+    def __init__(self, client, chunk_size=512 * 1024, chunk_prefix=DEFAULT_CHUNK_PREFIX,
+                 max_sequence_bytes=8 * 1024 * 1024, chunks_per_read=4, max_in_flight=4, consistency=None):
+        """
+        :param client: Client to use, implementing :class:`pyrakoon.client.ClientMixin`
+        :type client: pyrakoon.client.AbstractClient
+        :param chunk_size: Size of new chunks, in bytes
+        :type chunk_size: int
+        :param chunk_prefix: Prefix of chunk keys
+        :type chunk_prefix: str
+        :param max_sequence_bytes: Maximal size of chunks written in a single sequence, in bytes
+        :type max_sequence_bytes: int
+        :param chunks_per_read: Number of chunks fetched by a single `multi_get` call
+        :type chunks_per_read: int
+        :param max_in_flight: Maximal number of `multi_get` calls sent before their results are read
+        :type max_in_flight: int
+        :param consistency: Consistency of reads, `None` for consistent reads
+        :type consistency: pyrakoon.consistency.Consistency
+        """
+        if chunk_size < 1 or max_sequence_bytes < chunk_size:
+            raise ValueError('Invalid chunk size')
+        if chunks_per_read < 1 or max_in_flight < 1:
+            raise ValueError('Invalid read window')
+
+        self._client = client
+        self.chunk_size = chunk_size
+        self.chunk_prefix = chunk_prefix
+        self.max_sequence_bytes = max_sequence_bytes
+        self._chunks_per_read = chunks_per_read
+        self._max_in_flight = max_in_flight
+        self._consistency = consistency
+
+    def put(self, key, value):
+        """
+        Store a value as a blob, replacing any value stored at `key`
+
+        :param key: Key of the blob
+        :type key: str
+        :param value: Value
+        :type value: str
+
+        :raise pyrakoon.errors.AssertionFailed: The key was changed while the blob was written
+        """
+        with self.create(key) as writer:
+            writer.write(value)
+
+    def get(self, key):
+        """
+        Retrieve a blob
+
+        :param key: Key of the blob
+        :type key: str
+        :return: Value of the blob
+        :rtype: str
+
+        :raise pyrakoon.errors.NotFound: The blob doesn't exist
+        :raise ValueError: The key doesn't hold a blob, or the blob is corrupt
+        """
+        for attempt in xrange(_MAX_READ_ATTEMPTS):
+            manifest = self.stat(key)
+            buffer_ = bytearray(manifest.size)
+            view = memoryview(buffer_)
+            offset = 0
+            checksum = 0
+
+            try:
+                for index in xrange(0, manifest.count, self._window):
+                    for chunk in self._fetch(manifest, index, self._window):
+                        view[offset:offset + len(chunk)] = chunk
+                        offset += len(chunk)
+                        checksum = zlib.crc32(chunk, checksum)
+            except errors.NotFound:
+                # The blob was replaced or deleted while it was read
+                if attempt == _MAX_READ_ATTEMPTS - 1:
+                    raise
+                continue
+
+            _check(manifest, offset, checksum)
+            return str(buffer_)
+
+    def stat(self, key):
+        """
+        Retrieve the manifest of a blob
+
+        :param key: Key of the blob
+        :type key: str
+        :rtype: Manifest
+
+        :raise pyrakoon.errors.NotFound: The blob doesn't exist
+        :raise ValueError: The key doesn't hold a blob
+        """
+        manifest = Manifest.parse(self._process(protocol.Get(self._consistency, key)))
+        if manifest is None:
+            raise ValueError('Key %r does not hold a blob' % key)
+
+        return manifest
+
+    def open(self, key):
+        """
+        Open a blob for reading
+
+        :param key: Key of the blob
+        :type key: str
+        :rtype: BlobReader
+        """
+        return BlobReader(self, key)
+
+    def create(self, key):
+        """
+        Open a new version of a blob for writing
+
+        The blob replaces the value at `key` when the writer is closed.
+
+        :param key: Key of the blob
+        :type key: str
+        :rtype: BlobWriter
+        """
+        return BlobWriter(self, key)
+
+    def delete(self, key):
+        """
+        Delete a blob and its chunks
+
+        :param key: Key of the blob
+        :type key: str
+
+        :raise pyrakoon.errors.NotFound: The blob doesn't exist
+        :raise ValueError: The key doesn't hold a blob
+        """
+        value = self._process(protocol.Get(None, key))
+        manifest = Manifest.parse(value)
+        if manifest is None:
+            raise ValueError('Key %r does not hold a blob' % key)
+
+        builder = sequence.SequenceBuilder()
+        builder.add_assert(key, value)
+        builder.add_delete(key)
+        builder.add_delete_prefix(manifest.chunks_prefix(self.chunk_prefix))
+        self._process(protocol.Sequence([builder], False))
+
+    @property
+    def _window(self):
+        return self._chunks_per_read * self._max_in_flight
+
+    def _process(self, message):
+        return processor(self._client)(message)
+
+    def _fetch(self, manifest, start, count):
+        """
+        Fetch up to `count` chunks starting at `start`, pipelining `multi_get` calls
+
+        :rtype: list of str
+        """
+        end = min(start + count, manifest.count)
+        messages = [
+            protocol.MultiGet(self._consistency, [manifest.chunk_key(self.chunk_prefix, index)
+                for index in xrange(first, min(first + self._chunks_per_read, end))])
+            for first in xrange(start, end, self._chunks_per_read)]
+
+        chunks = []
+        for message, result in zip(messages, self._client._process_many(messages)): #pylint: disable=W0212
+            if isinstance(result, Exception):
+                if isinstance(result, errors.ArakoonError) and not isinstance(result, bulk.RETRYABLE_ERRORS):
+                    raise result
+                result = self._process(message)
+            chunks.extend(result)
+
+        return chunks
+
+
+def _check(manifest, size, checksum):
+    if size != manifest.size or (checksum & 0xffffffff) != manifest.checksum:
+        raise ValueError('Blob %s is corrupt' % manifest.blob_id)
+
+
+class BlobReader(object):
+    """
+    File-like object reading a blob
+
+    Chunks are fetched a window at a time, the blob is never held in memory as a whole. Reading a blob replaced or
+    deleted in the meantime fails with :class:`~pyrakoon.errors.NotFound`.
+    """
+
+    def __init__(self, store, key):
+        """
+        :param store: Store holding the blob
+        :type store: BlobStore
+        :param key: Key of the blob
+        :type key: str
+        """
+        self._store = store
+        self.manifest = store.stat(key)
+
+        self._chunks = []
+        self._offset = 0
+        self._next_chunk = 0
+        self._read = 0
+        self._checksum = 0
+        self.closed = False
+
+    @property
+    def size(self):
+        # type: () -> int
+        """
+        Size of the blob
+        """
+        return self.manifest.size
+
+    def _fill(self):
+        """
+        Make sure the current chunk holds unread data
+
+        :return: Whether data is available
+        :rtype: bool
+        """
+        while not self._chunks or self._offset == len(self._chunks[0]):
+            if self._chunks:
+                self._chunks.pop(0)
+                self._offset = 0
+                continue
+
+            manifest = self.manifest
+            if self._next_chunk == manifest.count:
+                return False
+
+            chunks = self._store._fetch(manifest, self._next_chunk, self._store._window) #pylint: disable=W0212
+            self._next_chunk += len(chunks)
+            for chunk in chunks:
+                self._read += len(chunk)
+                self._checksum = zlib.crc32(chunk, self._checksum)
+            if self._next_chunk == manifest.count:
+                _check(manifest, self._read, self._checksum)
+            self._chunks = chunks
+
+        return True
+
+    def read(self, size=-1):
+        """
+        Read up to `size` bytes, or all remaining bytes if `size` is negative
+
+        :rtype: str
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed blob')
+
+        parts = []
+        while size != 0 and self._fill():
+            chunk = self._chunks[0]
+            end = len(chunk) if size < 0 else min(len(chunk), self._offset + size)
+            parts.append(chunk[self._offset:end])
+            if size > 0:
+                size -= end - self._offset
+            self._offset = end
+
+        return ''.join(parts)
+
+    def readinto(self, buffer_):
+        """
+        Read into a preallocated, writable buffer
+
+        :return: Number of bytes read
+        :rtype: int
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed blob')
+
+        view = memoryview(buffer_)
+        count = 0
+        while count < len(view) and self._fill():
+            chunk = self._chunks[0]
+            length = min(len(chunk) - self._offset, len(view) - count)
+            view[count:count + length] = chunk[self._offset:self._offset + length]
+            self._offset += length
+            count += length
+
+        return count
+
+    def close(self):
+        """
+        Release the chunks held by the reader
+        """
+        self.closed = True
+        self._chunks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class BlobWriter(object):
+    """
+    File-like object writing a new version of a blob
+
+    Written data is cut into chunks, which are sent to the cluster as soon as `max_sequence_bytes` worth of chunks
+    is available. The blob only becomes visible when the writer is closed: the manifest is set if the key wasn't
+    changed since the writer was created, and the chunks of the previous version are deleted. Used as a context
+    manager, the writer is aborted instead when an exception is raised.
+
+    Chunks written before an aborted write, or a write failing on a connection error, can be left behind under the
+    chunk prefix.
+    """
+
+    def __init__(self, store, key):
+        """
+        :param store: Store to write to
+        :type store: BlobStore
+        :param key: Key of the blob
+        :type key: str
+        """
+        self._store = store
+        self._key = key
+        try:
+            self._previous = store._process(protocol.Get(None, key)) #pylint: disable=W0212
+        except errors.NotFound:
+            self._previous = None
+
+        self._manifest = Manifest(os.urandom(8).encode('hex'), 0, store.chunk_size, 0, 0)
+        self._pending = bytearray()
+        self._builder = sequence.SequenceBuilder()
+        self._flushed = False
+        self.closed = False
+
+    def write(self, data):
+        """
+        Append data to the blob
+
+        :param data: Data to append
+        :type data: str
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed blob')
+
+        chunk_size = self._store.chunk_size
+        if not self._pending and len(data) >= chunk_size:
+            # Cut chunks straight from the data instead of copying it into the pending buffer
+            view = buffer(data)
+            end = len(data) - len(data) % chunk_size
+            for offset in xrange(0, end, chunk_size):
+                self._add_chunk(str(view[offset:offset + chunk_size]))
+            data = view[end:]
+
+        self._pending += data
+        while len(self._pending) >= chunk_size:
+            self._add_chunk(str(self._pending[:chunk_size]))
+            del self._pending[:chunk_size]
+
+    def _add_chunk(self, chunk):
+        store = self._store
+        manifest = self._manifest
+
+        if len(self._builder) > 0 and self._builder.size + len(chunk) > store.max_sequence_bytes:
+            store._process(protocol.Sequence([self._builder], False)) #pylint: disable=W0212
+            self._builder = sequence.SequenceBuilder()
+            self._flushed = True
+
+        self._builder.add_set(manifest.chunk_key(store.chunk_prefix, manifest.count), chunk)
+        manifest.count += 1
+        manifest.size += len(chunk)
+        manifest.checksum = zlib.crc32(chunk, manifest.checksum) & 0xffffffff
+
+    def close(self):
+        """
+        Write the remaining chunks and the manifest
+
+        :raise pyrakoon.errors.AssertionFailed: The key was changed since the writer was created
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        store = self._store
+
+        if self._pending:
+            self._add_chunk(str(self._pending))
+            self._pending = bytearray()
+
+        builder = self._builder
+        builder.add_assert(self._key, self._previous)
+        builder.add_set(self._key, self._manifest.serialize())
+        previous = None if self._previous is None else Manifest.parse(self._previous)
+        if previous is not None:
+            builder.add_delete_prefix(previous.chunks_prefix(store.chunk_prefix))
+
+        try:
+            store._process(protocol.Sequence([builder], False)) #pylint: disable=W0212
+        except errors.ArakoonError:
+            # The sequence was rejected, none of its chunks were written
+            self._cleanup()
+            raise
+
+    def abort(self):
+        """
+        Discard the blob, deleting chunks written so far
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        self._pending = bytearray()
+        self._cleanup()
+
+    def _cleanup(self):
+        if not self._flushed:
+            return
+
+        store = self._store
+        try:
+            store._process(protocol.DeletePrefix(self._manifest.chunks_prefix(store.chunk_prefix))) #pylint: disable=W0212
+        except Exception: #pylint: disable=W0703
+            logger.exception('Failed to delete chunks of blob %s', self._manifest.blob_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
@@ -0,0 +1,246 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Bulk writes split into size-limited batches
+
+A :class:`BulkWriter` loads a large number of sets and deletes using a series of sequences, cut at a maximal size and
+number of steps, so no single request is rejected by the cluster or stalls it. Batches are *not* atomic as a whole:
+each batch succeeds or fails on its own. Up to `max_in_flight` batches are pipelined on a single connection.
+
+>>> operations = [('key_%d' % i, 'x' * 100) for i in xrange(10)] + [('old', None)]
+>>> [(len(batch), batch.size) for batch in split(operations, max_bytes=500, max_steps=4)]
+[(4, 476), (4, 476), (3, 253)]
+"""
+
+from __future__ import absolute_import
+
+import logging
+
+from .utils import processor, processor_many
+from .. import errors, protocol, sequence
+from ..constants.logging import PYRAKOON_CLIENT_LOGGER
+
+logger = logging.getLogger(PYRAKOON_CLIENT_LOGGER)
+
+# Size of a serialized sequence step without any steps: tag and step count
+_SEQUENCE_OVERHEAD = 8
+
+# Server errors after which a batch can safely be submitted again
+RETRYABLE_ERRORS = (errors.NotMaster, errors.NoLongerMaster, errors.GoingDown)
+
+
+def estimate_size(operation):
+    """
+    Estimate the size of an operation serialized as a sequence step
+
+    The estimate is exact for sets and deletes.
+
+    >>> estimate_size(('key', 'value'))
+    20
+
+    :param operation: A :class:`~pyrakoon.sequence.Step`, or a `(key, value)` pair, where a value of `None` denotes
+     a delete
+    :type operation: pyrakoon.sequence.Step or (str, str)
+    :return: Size in bytes
+    :rtype: int
+    """
+    if isinstance(operation, tuple):
+        key, value = operation
+        return 8 + len(key) + (0 if value is None else 4 + len(value))
+
+    type_ = type(operation)
+    if type_ is sequence.Set:
+        return 12 + len(operation.key) + len(operation.value)
+    elif type_ is sequence.Delete:
+        return 8 + len(operation.key)
+
+    return sum(len(bytes_) for bytes_ in operation.serialize())
+
+
+def _add(builder, operation):
+    if isinstance(operation, tuple):
+        key, value = operation
+        if value is None:
+            builder.add_delete(key)
+        else:
+            builder.add_set(key, value)
+    else:
+        builder.extend((operation,))
+
+
+def _encode(codec, operation):
+    if isinstance(operation, tuple):
+        key, value = operation
+        return operation if value is None else (key, codec.encode(key, value))
+
+    return codec.encode_step(operation)
+
+
+def split(operations, max_bytes=1024 * 1024, max_steps=1000, codec=None):
+    """
+    Split operations into batches
+
+    An operation exceeding `max_bytes` by itself is put in a batch of its own. Values are encoded before batches are
+    cut, so limits apply to the size of the values as sent.
+
+    :param operations: Operations, see :func:`estimate_size`
+    :type operations: iterable
+    :param max_bytes: Maximal size of a batch serialized as a sequence step, in bytes
+    :type max_bytes: int
+    :param max_steps: Maximal number of steps in a batch
+    :type max_steps: int
+    :param codec: Codec to encode values with
+    :type codec: pyrakoon.client.compression.ValueCodec
+    :return: Batches, generated as the operations are consumed
+    :rtype: iterator of pyrakoon.sequence.SequenceBuilder
+    """
+    if max_bytes <= _SEQUENCE_OVERHEAD or max_steps < 1:
+        raise ValueError('Invalid batch limits')
+
+    builder = sequence.SequenceBuilder()
+    for operation in operations:
+        if codec is not None:
+            operation = _encode(codec, operation)
+
+        if len(builder) > 0 and (len(builder) >= max_steps or builder.size + estimate_size(operation) > max_bytes):
+            yield builder
+            builder = sequence.SequenceBuilder()
+
+        _add(builder, operation)
+
+    if len(builder) > 0:
+        yield builder
+
+
+class BatchResult(object):
+    """
+    Outcome of a single batch
+    """
+
+    __slots__ = 'index', 'steps', 'size', 'error', 'retried'
+
+    def __init__(self, index, steps, size, error, retried):
+        """
+        :param index: Position of the batch, starting at 0
+        :type index: int
+        :param steps: Number of operations in the batch
+        :type steps: int
+        :param size: Size of the batch serialized as a sequence step, in bytes
+        :type size: int
+        :param error: Exception the batch failed with, `None` if it succeeded
+        :type error: Exception
+        :param retried: Whether the batch was submitted again after a failure
+        :type retried: bool
+        """
+        self.index = index
+        self.steps = steps
+        self.size = size
+        self.error = error
+        self.retried = retried
+
+    @property
+    def ok(self):
+        # type: () -> bool
+        """
+        Whether the batch succeeded
+        """
+        return self.error is None
+
+    def __repr__(self):
+        return '<BatchResult index=%d steps=%d size=%d error=%r>' % (self.index, self.steps, self.size, self.error)
+
+
+class BulkWriter(object):
+    """
+    Write operations in batches, pipelining several batches at once
+
+    Values are encoded using the `value_codec` of the client, if any.
+
+    Batches failing on a connection error or a master change are submitted once more through the regular call path
+    of the client, which retries according to its own policy. A batch may have been applied before the connection
+    failed, so resubmitting it can fail when it contains deletes of keys which no longer exist.
+
+    Example usage::
+
+        writer = BulkWriter(client, max_bytes=512 * 1024, progress=lambda result: log(result))
+        results = writer.write(data.iteritems())
+        failed = [result for result in results if not result.ok]
+    """
+
+    def __init__(self, client, max_bytes=1024 * 1024, max_steps=1000, max_in_flight=4, sync=False, progress=None):
+        """
+        :param client: Client to submit batches with
+        :type client: pyrakoon.client.AbstractClient
+        :param max_bytes: Maximal size of a batch, in bytes
+        :type max_bytes: int
+        :param max_steps: Maximal number of operations in a batch
+        :type max_steps: int
+        :param max_in_flight: Maximal number of batches sent before their results are read
+        :type max_in_flight: int
+        :param sync: Submit batches as synced sequences
+        :type sync: bool
+        :param progress: Callable called with the :class:`BatchResult` of every batch, in order. Exceptions raised by
+         the callback are logged and otherwise ignored.
+        :type progress: callable
+        """
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be positive')
+
+        self._client = client
+        self._max_bytes = max_bytes
+        self._max_steps = max_steps
+        self._max_in_flight = max_in_flight
+        self._sync = sync
+        self._progress = progress
+
+    def write(self, operations):
+        """
+        Write operations
+
+        Operations are consumed lazily, at most `max_in_flight` batches are kept in memory.
+
+        :param operations: Operations, see :func:`estimate_size`
+        :type operations: iterable
+        :return: Result of every batch, in order
+        :rtype: list of BatchResult
+        """
+        results = []
+        window = []
+
+        for batch in split(operations, self._max_bytes, self._max_steps, self._client.value_codec):
+            window.append(batch)
+            if len(window) == self._max_in_flight:
+                self._submit(window, results)
+                window = []
+
+        if window:
+            self._submit(window, results)
+
+        return results
+
+    def _submit(self, batches, results):
+        messages = [protocol.Sequence([batch], self._sync) for batch in batches]
+        outcomes = processor_many(self._client)(messages)
+
+        for batch, message, outcome in zip(batches, messages, outcomes):
+            error = outcome if isinstance(outcome, Exception) else None
+            retried = False
+
+            if error is not None and (isinstance(error, RETRYABLE_ERRORS) or not isinstance(error, errors.ArakoonError)):
+                logger.warning('%s: Batch %d failed, submitting it again', error, len(results))
+                retried = True
+                try:
+                    processor(self._client)(message)
+                    error = None
+                except Exception as exc: #pylint: disable=W0703
+                    error = exc
+
+            result = BatchResult(len(results), len(batch), batch.size, error, retried)
+            results.append(result)
+
+            if self._progress is not None:
+                try:
+                    self._progress(result)
+                except Exception: #pylint: disable=W0703
+                    logger.exception('Bulk write progress callback %r failed', self._progress)
@@ -0,0 +1,428 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Transparent value compression
+
+A :class:`ValueCodec` set as the `value_codec` of a client compresses values above a size threshold using zlib before
+they're sent to the cluster, and decompresses them again in the results of `get`, `multi_get`, `multi_get_option`,
+`range_entries`, `rev_range_entries`, `test_and_set` and `replace`. Compressed values start with a short header
+which can't occur in text values, every other value is passed through as is, so values written without a codec can
+still be read, and clients without a codec read compressed values as opaque bytes. Values stored uncompressed which
+happen to start with a header are prefixed with :data:`RAW_HEADER`, so every value reads back as written.
+
+Values compared by the cluster, in `test_and_set`, `assert` and `Assert` steps, are encoded as well. When the stored
+value was written with another encoding, e.g. before compression was enabled, `test_and_set` and `assert` compare
+again against the stored bytes if these decode to the expected value. Sequences can't be retried this way: they fail
+with an :class:`~pyrakoon.errors.AssertionFailed` error naming the keys stored with another encoding.
+
+>>> import json
+>>> codec = ValueCodec(CompressionPolicy(threshold=64), prefixes={'raw/': None})
+>>> value = json.dumps([{'name': 'disk_%d' % i, 'size': 1024} for i in xrange(20)])
+>>> stored = codec.encode('json/disks', value)
+>>> stored.startswith(HEADER), len(stored) < len(value) / 4
+(True, True)
+>>> codec.decode(stored) == value, codec.decode('legacy value')
+(True, 'legacy value')
+>>> codec.encode('raw/disks', value) == value
+True
+>>> stored = codec.encode('raw/disks', HEADER + 'raw')
+>>> stored.startswith(RAW_HEADER), codec.decode(stored) == HEADER + 'raw'
+(True, True)
+"""
+
+from __future__ import absolute_import
+
+import zlib
+import threading
+
+from .. import errors, protocol, sequence
+
+# Marks a compressed value. A leading 0xff byte never occurs in UTF-8 encoded text, including JSON documents.
+HEADER = '\xffPZ\x01'
+# Marks a value stored uncompressed which starts with `HEADER` or `RAW_HEADER` itself, stripped when decoding
+RAW_HEADER = '\xffPZ\x00'
+
+# Maximal number of comparisons by `test_and_set` and `assert` when the stored value is encoded differently
+_COMPARISONS = 3
+
+
+class CompressionPolicy(object):
+    """
+    When and how to compress values
+    """
+
+    __slots__ = 'threshold', 'level'
+
+    def __init__(self, threshold=1024, level=6):
+        """
+        :param threshold: Minimal size of a value to compress, in bytes
+        :type threshold: int
+        :param level: zlib compression level, from 1 (fastest) to 9 (smallest)
+        :type level: int
+        """
+        if threshold < 0:
+            raise ValueError('threshold must not be negative')
+        if not 1 <= level <= 9:
+            raise ValueError('level must be between 1 and 9')
+
+        self.threshold = threshold
+        self.level = level
+
+    def __repr__(self):
+        return '<CompressionPolicy threshold=%d level=%d>' % (self.threshold, self.level)
+
+
+def _chain(process, message, callback, errback=None):
+    """
+    Process a message, and pass its result to a callback
+
+    Works with processes returning a `Deferred` as well, in which case a `Deferred` is returned.
+
+    :param callback: Callable receiving the result
+    :type callback: callable
+    :param errback: Callable receiving :class:`~pyrakoon.errors.AssertionFailed` errors, if any
+    :type errback: callable
+    """
+    if errback is None:
+        result = process(message)
+    else:
+        try:
+            result = process(message)
+        except errors.AssertionFailed as exc:
+            return errback(exc)
+
+    if not hasattr(result, 'addCallbacks'):
+        return callback(result)
+
+    if errback is None:
+        return result.addCallback(callback)
+
+    def failed(failure):
+        failure.trap(errors.AssertionFailed)
+        return errback(failure.value)
+
+    return result.addCallbacks(callback, failed)
+
+
+def _value_positions(message_type, names):
+    arg_names = [arg[0] for arg in message_type.ARGS]
+    return arg_names.index('key'), tuple(arg_names.index(name) for name in names)
+
+# Position of the key and the value arguments of messages writing or comparing values
+_VALUE_ARGUMENTS = dict((message_type, _value_positions(message_type, names)) for (message_type, names) in (
+    (protocol.Set, ('value',)),
+    (protocol.Confirm, ('value',)),
+    (protocol.Replace, ('value',)),
+    (protocol.Assert, ('value',)),
+    (protocol.TestAndSet, ('test_value', 'set_value')),
+))
+
+
+class ValueCodec(object):
+    """
+    Compress values on their way to the cluster, and decompress them on their way back
+
+    Values are compressed according to the :class:`CompressionPolicy` of the longest matching prefix in `prefixes`,
+    or the `default` policy. A policy of `None` disables compression. A value is only stored compressed if that saves
+    space. Decompression doesn't depend on the policies, so these can be changed at any time.
+
+    Values passed to `test_and_set`, `assert` and `Assert` steps are encoded as well, since these are compared with
+    the stored value byte by byte. When such a comparison fails because the stored value was written using another
+    encoding, see the module documentation. :class:`~pyrakoon.sequence.SequenceBuilder` instances serialize values as
+    they're added: create these with the codec of the client to have their values compressed.
+    """
+
+    def __init__(self, default=CompressionPolicy(), prefixes=None):
+        """
+        :param default: Policy of keys not matching any prefix, `None` to only compress values matching a prefix
+        :type default: CompressionPolicy
+        :param prefixes: Policies by key prefix
+        :type prefixes: dict of (str, CompressionPolicy)
+        """
+        self._default = default
+        self._prefixes = sorted((prefixes or {}).iteritems(), key=lambda item: len(item[0]), reverse=True)
+
+        self._lock = threading.Lock()
+        self._values_encoded = 0
+        self._values_compressed = 0
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._values_decompressed = 0
+        self._bytes_decompressed = 0
+        self._decode_errors = 0
+
+    def policy(self, key):
+        """
+        Look up the policy of a key
+
+        :param key: Key
+        :type key: str
+        :rtype: CompressionPolicy
+        """
+        for prefix, policy in self._prefixes:
+            if key.startswith(prefix):
+                return policy
+
+        return self._default
+
+    def encode(self, key, value):
+        """
+        Encode a value to store
+
+        :param key: Key the value is stored at
+        :type key: str
+        :param value: Value
+        :type value: str
+        :return: Value to send to the cluster
+        :rtype: str
+        """
+        policy = self.policy(key)
+        stored = value
+
+        if policy is not None and len(value) >= policy.threshold:
+            compressed = HEADER + zlib.compress(value, policy.level)
+            if len(compressed) < len(value):
+                stored = compressed
+
+        if stored is value and (value.startswith(HEADER) or value.startswith(RAW_HEADER)):
+            stored = RAW_HEADER + value
+
+        with self._lock:
+            self._values_encoded += 1
+            self._bytes_in += len(value)
+            self._bytes_out += len(stored)
+            if stored is not value and not stored.startswith(RAW_HEADER):
+                self._values_compressed += 1
+
+        return stored
+
+    def decode(self, value):
+        """
+        Decode a stored value
+
+        Values without the compression header are returned as is, values starting with :data:`RAW_HEADER` without it.
+        Values which do start with the compression header but can't be decompressed are assumed to be written without
+        compression, and returned as is as well.
+
+        :param value: Value received from the cluster
+        :type value: str
+        :rtype: str
+        """
+        if not value.startswith(HEADER):
+            if value.startswith(RAW_HEADER):
+                return value[len(RAW_HEADER):]
+            return value
+
+        try:
+            decoded = zlib.decompress(buffer(value, len(HEADER)))
+        except zlib.error:
+            with self._lock:
+                self._decode_errors += 1
+            return value
+
+        with self._lock:
+            self._values_decompressed += 1
+            self._bytes_decompressed += len(value)
+
+        return decoded
+
+    def _decode_option(self, value):
+        return None if value is None else self.decode(value)
+
+    def encode_step(self, step, asserts=None):
+        """
+        Encode the values of a sequence step
+
+        :param step: Step
+        :type step: pyrakoon.sequence.Step
+        :param asserts: List to add `(key, value, encoded)` tuples to, for "Assert" steps whose value is compressed
+        :type asserts: list
+        :return: Step with encoded values, or `step` itself if it holds no values
+        :rtype: pyrakoon.sequence.Step
+        """
+        type_ = type(step)
+
+        if type_ is sequence.Set:
+            return sequence.Set(step.key, self.encode(step.key, step.value))
+        elif type_ is sequence.Assert and step.value is not None:
+            encoded = self.encode(step.key, step.value)
+            if asserts is not None and encoded is not step.value:
+                asserts.append((step.key, step.value, encoded))
+            return sequence.Assert(step.key, encoded)
+        elif type_ is sequence.Replace and step.wanted is not None:
+            return sequence.Replace(step.key, self.encode(step.key, step.wanted))
+        elif type_ is sequence.Sequence:
+            return sequence.Sequence([self.encode_step(step_, asserts) for step_ in step.steps])
+        elif asserts is not None and isinstance(step, sequence.SequenceBuilder):
+            asserts.extend(step.compressed_asserts)
+
+        return step
+
+    def encode_arguments(self, message_type, args):
+        """
+        Encode the values in the arguments of a call
+
+        :param message_type: Type of the message to send
+        :type message_type: Type[pyrakoon.protocol.Message]
+        :param args: Arguments of the message, in the order of its `ARGS`
+        :type args: tuple
+        :rtype: tuple
+        """
+        if message_type is protocol.Sequence:
+            steps, sync = args
+            return [self.encode_step(step) for step in steps], sync
+
+        positions = _VALUE_ARGUMENTS.get(message_type)
+        if positions is None:
+            return args
+
+        key_position, value_positions = positions
+        key = args[key_position]
+        args = list(args)
+        for position in value_positions:
+            if args[position] is not None:
+                args[position] = self.encode(key, args[position])
+
+        return tuple(args)
+
+    def decode_result(self, message_type, result):
+        """
+        Decode the values in the result of a call
+
+        :param message_type: Type of the message sent
+        :type message_type: Type[pyrakoon.protocol.Message]
+        :param result: Result, or a `Deferred` firing with the result
+        :type result: object
+        :return: Decoded result, or `result` itself if it holds no values
+        :rtype: object
+        """
+        decode = _DECODERS.get(message_type)
+        if decode is None:
+            return result
+
+        if hasattr(result, 'addCallback'):
+            return result.addCallback(lambda result_: decode(self, result_))
+
+        return decode(self, result)
+
+    def process(self, process, message_type, args):
+        """
+        Encode the values in the arguments of a call, process it, and decode the values in its result
+
+        :param process: Callable sending a message and returning its result, or a `Deferred` firing with it
+        :type process: callable
+        :param message_type: Type of the message to send
+        :type message_type: Type[pyrakoon.protocol.Message]
+        :param args: Arguments of the message, in the order of its `ARGS`
+        :type args: tuple
+        :return: Decoded result, or a `Deferred` firing with it
+        :rtype: object
+        """
+        if message_type is protocol.TestAndSet:
+            key, test_value, set_value = args
+            if test_value is not None:
+                set_value = None if set_value is None else self.encode(key, set_value)
+                return self._test_and_set(process, key, test_value, self.encode(key, test_value), set_value,
+                                          _COMPARISONS)
+        elif message_type is protocol.Assert:
+            consistency_, key, value = args
+            if value is not None:
+                return self._assert(process, consistency_, key, value, self.encode(key, value), _COMPARISONS)
+        elif message_type is protocol.Sequence:
+            steps, sync = args
+            asserts = []
+            steps = [self.encode_step(step, asserts) for step in steps]
+            if asserts:
+                return self._sequence(process, protocol.Sequence(steps, sync), asserts)
+            return process(protocol.Sequence(steps, sync))
+
+        args = self.encode_arguments(message_type, args)
+        return self.decode_result(message_type, process(message_type(*args)))
+
+    def _test_and_set(self, process, key, test_value, expected, set_value, comparisons):
+        def compared(stored):
+            if stored is None or stored == expected:
+                return self._decode_option(stored)
+
+            decoded = self.decode(stored)
+            if decoded != test_value or comparisons <= 1:
+                return decoded
+
+            # Same value, encoded differently: compare with the bytes as stored
+            return self._test_and_set(process, key, test_value, stored, set_value, comparisons - 1)
+
+        return _chain(process, protocol.TestAndSet(key, expected, set_value), compared)
+
+    def _assert(self, process, consistency_, key, value, expected, comparisons):
+        def failed(exc):
+            if comparisons <= 1:
+                raise exc
+
+            def read(values):
+                stored = values[0]
+                if stored is None or stored == expected or self.decode(stored) != value:
+                    raise exc
+
+                # Same value, encoded differently: assert the bytes as stored
+                return self._assert(process, consistency_, key, value, stored, comparisons - 1)
+
+            return _chain(process, protocol.MultiGetOption(consistency_, [key]), read)
+
+        return _chain(process, protocol.Assert(consistency_, key, expected), lambda result: result, failed)
+
+    def _sequence(self, process, message, asserts):
+        def failed(exc):
+            def read(values):
+                mismatched = [key for ((key, value, encoded), stored) in zip(asserts, values)
+                              if stored is not None and stored != encoded and self.decode(stored) == value]
+                if not mismatched:
+                    raise exc
+
+                raise errors.AssertionFailed(
+                    'Assert failed because the stored values of %s are encoded differently, e.g. written before '
+                    'compression was enabled' % ', '.join(repr(key) for key in mismatched))
+
+            return _chain(process, protocol.MultiGetOption(None, [key for (key, _, _) in asserts]), read)
+
+        return _chain(process, message, lambda result: result, failed)
+
+    def stats(self):
+        """
+        Take a snapshot of the compression counters
+
+        The snapshot is a dictionary containing:
+
+        * `values_encoded`: Number of values encoded
+        * `values_compressed`: Number of values stored compressed
+        * `bytes_in`: Size of all encoded values
+        * `bytes_out`: Size of all encoded values as stored
+        * `bytes_saved`: Difference between `bytes_in` and `bytes_out`
+        * `values_decompressed`: Number of compressed values decoded
+        * `bytes_decompressed`: Size of all compressed values decoded, as stored
+        * `decode_errors`: Number of values starting with the header which couldn't be decompressed
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'values_encoded': self._values_encoded,
+                'values_compressed': self._values_compressed,
+                'bytes_in': self._bytes_in,
+                'bytes_out': self._bytes_out,
+                'bytes_saved': self._bytes_in - self._bytes_out,
+                'values_decompressed': self._values_decompressed,
+                'bytes_decompressed': self._bytes_decompressed,
+                'decode_errors': self._decode_errors,
+            }
+
+
+_DECODERS = {
+    protocol.Get: ValueCodec.decode,
+    protocol.MultiGet: lambda codec, values: [codec.decode(value) for value in values],
+    protocol.MultiGetOption: lambda codec, values: [codec._decode_option(value) for value in values], #pylint: disable=W0212
+    protocol.RangeEntries: lambda codec, entries: [(key, codec.decode(value)) for (key, value) in entries],
+    protocol.RevRangeEntries: lambda codec, entries: [(key, codec.decode(value)) for (key, value) in entries],
+    protocol.TestAndSet: ValueCodec._decode_option, #pylint: disable=W0212
+    protocol.Replace: ValueCodec._decode_option, #pylint: disable=W0212
+}
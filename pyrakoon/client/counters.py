@@ -0,0 +1,302 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Batched counter increments
+
+A :class:`CounterBatcher` coalesces increments of counters locally, and applies all pending increments in a single
+compare-and-swap cycle: one `multi_get_option` call reading the current values, followed by one sequence asserting
+these values and setting the new ones. Counters are stored as decimal strings, missing counters count as 0.
+
+When the sequence fails because a counter was changed concurrently, the counters are read again. Counters whose
+value changed are *contended*: on the next attempt, the uncontended counters are written in one sequence and every
+contended counter in a sequence of its own, all pipelined, so a single hot key doesn't make the whole batch fail
+again.
+
+>>> batcher = CounterBatcher(None)
+>>> batcher.add('requests', 1)
+>>> batcher.add('requests', 2)
+>>> batcher.add('errors', 1)
+>>> sorted(batcher.pending().items())
+[('errors', 1), ('requests', 3)]
+>>> batcher.stats()['coalesced']
+1
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+import collections
+
+from .retry import RetryPolicy
+from .utils import processor_many
+from .. import errors, protocol, sequence
+from ..constants.logging import PYRAKOON_CLIENT_LOGGER
+
+logger = logging.getLogger(PYRAKOON_CLIENT_LOGGER)
+
+# Number of most contended keys reported by `CounterBatcher.stats`
+_HOT_KEYS = 10
+
+
+class CounterBatcher(object):
+    """
+    Coalesce counter increments, and apply them in batches
+
+    Increments are applied when :meth:`flush` is called, or every `interval` seconds by a background thread. Deltas
+    which are definitely not applied, because their sequence was rejected, are kept pending and retried on the next
+    flush. Deltas whose sequence failed on a connection error may or may not have been applied: these are dropped,
+    and logged.
+
+    Example usage::
+
+        with CounterBatcher(client, interval=1.0) as counters:
+            for request in requests:
+                counters.add('requests/%s' % request.path)
+    """
+
+    def __init__(self, client, interval=None, max_attempts=10, policy=None):
+        """
+        :param client: Client to use, implementing :class:`pyrakoon.client.ClientMixin`
+        :type client: pyrakoon.client.AbstractClient
+        :param interval: Time between flushes by a background thread, in seconds, `None` to only flush explicitly
+        :type interval: float
+        :param max_attempts: Maximal number of compare-and-swap attempts per flush
+        :type max_attempts: int
+        :param policy: Retry policy providing backoff between attempts
+        :type policy: pyrakoon.client.retry.RetryPolicy
+        """
+        if max_attempts < 1:
+            raise ValueError('max_attempts must be positive')
+
+        self._client = client
+        self._codec = None if client is None else client.value_codec
+        self._max_attempts = max_attempts
+        self._policy = policy or RetryPolicy(base=0.005, cap=0.5, burst=max_attempts)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+
+        self._increments = 0
+        self._coalesced = 0
+        self._flushes = 0
+        self._keys_written = 0
+        self._attempts = 0
+        self._conflicts = 0
+        self._requeued = 0
+        self._dropped = 0
+        self._contention = collections.Counter()
+
+        self._stop = threading.Event()
+        self._thread = None
+        if interval is not None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='pyrakoon-counters')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def add(self, key, delta=1):
+        """
+        Add a delta to a counter
+
+        :param key: Key of the counter
+        :type key: str
+        :param delta: Value to add, can be negative
+        :type delta: int
+        """
+        protocol.STRING.check(key)
+
+        with self._lock:
+            self._increments += 1
+            if key in self._pending:
+                self._coalesced += 1
+                self._pending[key] += delta
+            else:
+                self._pending[key] = delta
+
+    def pending(self):
+        """
+        Deltas not applied yet
+
+        :rtype: dict of (str, int)
+        """
+        with self._lock:
+            return dict(self._pending)
+
+    def flush(self):
+        """
+        Apply all pending deltas
+
+        :return: New value of every counter written
+        :rtype: dict of (str, int)
+
+        :raise pyrakoon.errors.AssertionFailed: Counters were still contended after `max_attempts` attempts, their
+         deltas are kept pending
+        """
+        with self._flush_lock:
+            with self._lock:
+                deltas, self._pending = self._pending, {}
+                self._flushes += 1
+
+            deltas = dict((key, delta) for (key, delta) in deltas.iteritems() if delta != 0)
+            if not deltas:
+                return {}
+
+            return self._apply(deltas)
+
+    def _read(self, keys):
+        # Values are kept as stored, to assert them as is
+        values = self._client._process(protocol.MultiGetOption(None, keys)) #pylint: disable=W0212
+        return dict(zip(keys, values))
+
+    def _parse(self, value):
+        if value is None:
+            return 0
+        if self._codec is not None:
+            value = self._codec.decode(value)
+        return int(value)
+
+    def _sequence(self, keys, current, deltas):
+        builder = sequence.SequenceBuilder()
+        for key in keys:
+            builder.add_assert(key, current[key])
+        for key in keys:
+            value = str(self._parse(current[key]) + deltas[key])
+            builder.add_set(key, value if self._codec is None else self._codec.encode(key, value))
+
+        return protocol.Sequence([builder], False)
+
+    def _apply(self, deltas):
+        keys = sorted(deltas)
+        try:
+            current = self._read(keys)
+        except Exception:
+            self._requeue(keys, deltas)
+            raise
+        results = {}
+        schedule = self._policy.start(None)
+        groups = [keys]
+        attempt = 0
+
+        while True:
+            attempt += 1
+            messages = [self._sequence(group, current, deltas) for group in groups]
+            outcomes = processor_many(self._client)(messages)
+
+            failed = []
+            rejected = []
+            lost = []
+            written = 0
+            for group, outcome in zip(groups, outcomes):
+                if not isinstance(outcome, Exception):
+                    written += len(group)
+                    for key in group:
+                        results[key] = self._parse(current[key]) + deltas[key]
+                elif isinstance(outcome, errors.AssertionFailed):
+                    failed.extend(group)
+                elif isinstance(outcome, errors.ArakoonError):
+                    rejected.append((group, outcome))
+                else:
+                    lost.append((group, outcome))
+
+            with self._lock:
+                self._attempts += len(messages)
+                self._keys_written += written
+
+            if lost:
+                lost_keys = [key for (group, _) in lost for key in group]
+                with self._lock:
+                    self._dropped += len(lost_keys)
+                logger.warning('%s: Increments of %d counters may not have been applied: %s',
+                               lost[0][1], len(lost_keys), ', '.join(lost_keys))
+
+            if rejected or lost:
+                self._requeue(failed + [key for (group, _) in rejected for key in group], deltas)
+                raise (rejected or lost)[0][1]
+
+            if not failed:
+                return results
+
+            sleep = schedule.next_sleep() if attempt < self._max_attempts else None
+            if sleep is None:
+                self._requeue(failed, deltas)
+                raise errors.AssertionFailed('Counters still contended after %d attempts' % attempt)
+
+            try:
+                fresh = self._read(failed)
+            except Exception:
+                self._requeue(failed, deltas)
+                raise
+            contended = [key for key in failed if fresh[key] != current[key]]
+            uncontended = [key for key in failed if fresh[key] == current[key]]
+            current.update(fresh)
+
+            with self._lock:
+                self._conflicts += len(contended)
+                self._contention.update(contended)
+
+            groups = ([uncontended] if uncontended else []) + [[key] for key in contended]
+            time.sleep(sleep)
+
+    def _requeue(self, keys, deltas):
+        with self._lock:
+            self._requeued += len(keys)
+            for key in keys:
+                self._pending[key] = self._pending.get(key, 0) + deltas[key]
+
+    def stats(self):
+        """
+        Take a snapshot of the counters of the batcher
+
+        The snapshot is a dictionary containing:
+
+        * `increments`: Number of calls to :meth:`add`
+        * `coalesced`: Number of increments merged into a pending delta of the same key
+        * `flushes`: Number of flushes
+        * `keys_written`: Number of counters written
+        * `attempts`: Number of sequences sent
+        * `conflicts`: Number of times a counter was found to be changed concurrently
+        * `requeued`: Number of deltas kept pending after a failed flush
+        * `dropped`: Number of deltas dropped after a connection failure
+        * `hot_keys`: Most contended keys, as `(key, conflicts)` pairs
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'increments': self._increments,
+                'coalesced': self._coalesced,
+                'flushes': self._flushes,
+                'keys_written': self._keys_written,
+                'attempts': self._attempts,
+                'conflicts': self._conflicts,
+                'requeued': self._requeued,
+                'dropped': self._dropped,
+                'hot_keys': self._contention.most_common(_HOT_KEYS),
+            }
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except Exception: #pylint: disable=W0703
+                logger.exception('Failed to flush counters')
+
+    def close(self):
+        """
+        Stop the background thread, if any, and flush pending deltas
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,290 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Node health tracking and circuit breaking
+
+A :class:`HealthTracker` keeps, per node, an exponentially weighted moving average (EWMA) of the call latency and
+error rate, and the number of consecutive failures. When a node looks sick, its circuit *opens* and clients skip it
+for a cool-down period. Afterwards the circuit is *half-open*: a single probe is allowed, which closes the circuit
+when it succeeds, or opens it again when it fails.
+
+>>> tracker = HealthTracker(failure_threshold=2, cool_down=60)
+>>> tracker.record_success('arakoon_0', 0.001)
+>>> tracker.state('arakoon_0')
+'closed'
+>>> tracker.record_failure('arakoon_0')
+>>> tracker.record_failure('arakoon_0', timeout=True)
+>>> tracker.state('arakoon_0')
+'open'
+>>> tracker.available('arakoon_0')
+False
+>>> tracker.order(['arakoon_0', 'arakoon_1'])
+['arakoon_1', 'arakoon_0']
+"""
+
+from __future__ import absolute_import
+
+import os
+import time
+import threading
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class _NodeHealth(object):
+    """
+    Health statistics of a single node
+    """
+
+    __slots__ = 'state', 'opened_at', 'probing', 'calls', 'failures', 'timeouts', 'consecutive_failures', \
+        'latency', 'error_rate'
+
+    def __init__(self):
+        self.state = STATE_CLOSED
+        self.opened_at = None
+        self.probing = False
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.consecutive_failures = 0
+        # EWMAs, `None` until the first call
+        self.latency = None
+        self.error_rate = 0.0
+
+
+class HealthTracker(object):
+    """
+    Track the health of cluster nodes, opening a circuit on sick nodes
+
+    A circuit opens when a node fails `failure_threshold` times in a row, when its error rate EWMA exceeds
+    `error_rate_threshold` after at least `min_calls` calls, or when its latency EWMA exceeds `slow_latency`.
+    """
+
+    def __init__(self, failure_threshold=3, error_rate_threshold=0.5, slow_latency=None, cool_down=5.0, alpha=0.2,
+                 min_calls=10):
+        """
+        :param failure_threshold: Number of consecutive failures opening the circuit
+        :type failure_threshold: int
+        :param error_rate_threshold: Error rate EWMA opening the circuit, between 0 and 1
+        :type error_rate_threshold: float
+        :param slow_latency: Latency EWMA opening the circuit, in seconds, `None` to ignore latencies
+        :type slow_latency: float
+        :param cool_down: Time a node is skipped once its circuit opened, in seconds
+        :type cool_down: float
+        :param alpha: Weight of a new observation in the EWMAs, between 0 and 1
+        :type alpha: float
+        :param min_calls: Number of calls required before the error rate and latency are taken into account
+        :type min_calls: int
+        """
+        if failure_threshold < 1:
+            raise ValueError('failure_threshold must be positive')
+        if not 0 < alpha <= 1:
+            raise ValueError('alpha must be between 0 and 1')
+
+        self._failure_threshold = failure_threshold
+        self._error_rate_threshold = error_rate_threshold
+        self._slow_latency = slow_latency
+        self._cool_down = cool_down
+        self._alpha = alpha
+        self._min_calls = min_calls
+
+        self._pid = os.getpid()
+        self._process_lock = threading.Lock()
+        self._nodes = {}
+
+    @property
+    def _lock(self):
+        if self._pid != os.getpid():
+            # The lock may have been held by another thread of the parent process at fork time
+            self._process_lock = threading.Lock()
+            self._pid = os.getpid()
+        return self._process_lock
+
+    def _node(self, node_id):
+        node = self._nodes.get(node_id)
+        if node is None:
+            node = self._nodes[node_id] = _NodeHealth()
+        return node
+
+    def _update_state(self, node):
+        """
+        Move an open circuit to half-open once the cool-down passed
+        """
+        if node.state == STATE_OPEN and time.time() - node.opened_at >= self._cool_down:
+            node.state = STATE_HALF_OPEN
+            node.probing = False
+
+    def _open(self, node):
+        node.state = STATE_OPEN
+        node.opened_at = time.time()
+        node.probing = False
+
+    def record_success(self, node_id, latency):
+        """
+        Record a successful call
+
+        Server-side errors, like a missing key, count as a success: the node replied.
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :param latency: Duration of the call, in seconds
+        :type latency: float
+        """
+        with self._lock:
+            node = self._node(node_id)
+            node.calls += 1
+            node.consecutive_failures = 0
+            node.error_rate *= 1 - self._alpha
+            if node.latency is None:
+                node.latency = latency
+            else:
+                node.latency += self._alpha * (latency - node.latency)
+
+            if node.state == STATE_HALF_OPEN:
+                node.state = STATE_CLOSED
+                node.probing = False
+            elif self._slow_latency is not None and node.calls >= self._min_calls and \
+                    node.latency > self._slow_latency:
+                self._open(node)
+
+    def record_failure(self, node_id, timeout=False):
+        """
+        Record a failed call
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :param timeout: Whether the call timed out
+        :type timeout: bool
+        """
+        with self._lock:
+            node = self._node(node_id)
+            node.calls += 1
+            node.failures += 1
+            if timeout:
+                node.timeouts += 1
+            node.consecutive_failures += 1
+            node.error_rate += self._alpha * (1 - node.error_rate)
+
+            if node.state == STATE_HALF_OPEN or node.consecutive_failures >= self._failure_threshold or \
+                    (node.calls >= self._min_calls and node.error_rate > self._error_rate_threshold):
+                self._open(node)
+
+    def state(self, node_id):
+        """
+        Get the circuit state of a node
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :return: :data:`STATE_CLOSED`, :data:`STATE_OPEN` or :data:`STATE_HALF_OPEN`
+        :rtype: str
+        """
+        with self._lock:
+            node = self._nodes.get(node_id)
+            if node is None:
+                return STATE_CLOSED
+
+            self._update_state(node)
+            return node.state
+
+    def available(self, node_id):
+        """
+        Check whether calls can be sent to a node without probing it first
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :rtype: bool
+        """
+        return self.state(node_id) == STATE_CLOSED
+
+    def acquire_probe(self, node_id):
+        """
+        Reserve the probe of a node with a half-open circuit
+
+        The caller should send a cheap call to the node, and record its outcome.
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :return: Whether the caller should probe the node
+        :rtype: bool
+        """
+        with self._lock:
+            node = self._nodes.get(node_id)
+            if node is None:
+                return False
+
+            self._update_state(node)
+            if node.state != STATE_HALF_OPEN or node.probing:
+                return False
+
+            node.probing = True
+            return True
+
+    def score(self, node_id):
+        """
+        Health score of a node, lower is healthier
+
+        The score is the latency EWMA, inflated by the error rate EWMA. Unknown nodes score 0.
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :rtype: float
+        """
+        with self._lock:
+            node = self._nodes.get(node_id)
+            if node is None or node.latency is None:
+                return 0.0
+
+            return node.latency / max(1 - node.error_rate, 0.01)
+
+    def order(self, node_ids):
+        """
+        Sort nodes from most to least preferable
+
+        Nodes with a closed circuit come first, then half-open ones, then open ones, each sorted by score.
+
+        :param node_ids: Node identifiers
+        :type node_ids: iterable of str
+        :rtype: list of str
+        """
+        rank = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+        return sorted(node_ids, key=lambda node_id: (rank[self.state(node_id)], self.score(node_id)))
+
+    def reset(self, node_id=None):
+        """
+        Forget the health of a node, or of all nodes
+
+        :param node_id: Node identifier, `None` for all nodes
+        :type node_id: str
+        """
+        with self._lock:
+            if node_id is None:
+                self._nodes.clear()
+            else:
+                self._nodes.pop(node_id, None)
+
+    def snapshot(self):
+        """
+        Get the health of all known nodes
+
+        :return: Health by node, e.g. ``{'arakoon_0': {'state': 'closed', 'calls': 10, 'failures': 1,
+         'timeouts': 0, 'consecutive_failures': 0, 'latency': 0.0012, 'error_rate': 0.03}}``
+        :rtype: dict
+        """
+        with self._lock:
+            result = {}
+            for node_id, node in self._nodes.iteritems():
+                self._update_state(node)
+                result[node_id] = {
+                    'state': node.state,
+                    'calls': node.calls,
+                    'failures': node.failures,
+                    'timeouts': node.timeouts,
+                    'consecutive_failures': node.consecutive_failures,
+                    'latency': node.latency,
+                    'error_rate': node.error_rate,
+                }
+
+            return result
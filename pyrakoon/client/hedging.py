@@ -0,0 +1,192 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Hedged read policy
+
+Reads which don't need to be served by the master (using the `INCONSISTENT` or `AtLeast` consistency) can be
+*hedged*: when the node a read was sent to didn't reply within a delay, the same read is sent to a second node, and
+the first reply wins. This cuts tail latencies caused by a single stalling node, e.g. on garbage collection or fsync.
+
+A :class:`HedgePolicy` decides which reads are eligible and how long to wait before hedging, based on a percentile
+of recent read latencies. To prevent load amplification, hedges are limited to a fraction of all eligible reads (the
+budget) and optionally to a maximal rate:
+
+>>> from pyrakoon import consistency, protocol
+>>> policy = HedgePolicy(initial_delay=0.05, budget=0.5, burst=1)
+>>> policy.eligible(protocol.Get(consistency.CONSISTENT, 'key'))
+False
+>>> policy.eligible(protocol.Get(consistency.INCONSISTENT, 'key'))
+True
+>>> policy.start()
+0.05
+>>> policy.acquire(), policy.acquire()
+(True, False)
+"""
+
+from __future__ import absolute_import
+
+import os
+import time
+import threading
+
+from .. import consistency
+from ..histogram import Histogram
+
+
+class HedgePolicy(object):
+    """
+    Delay and budget of hedged reads
+
+    The delay is the configured percentile of the latencies recorded over the last one to two windows of reads,
+    clamped between `min_delay` and `max_delay`. Until enough latencies are recorded, `initial_delay` is used.
+    """
+
+    # Recompute the delay after this many recorded latencies
+    _REFRESH_INTERVAL = 32
+
+    def __init__(self, percentile=95.0, initial_delay=0.05, min_delay=0.001, max_delay=1.0, budget=0.05, burst=10,
+                 max_per_second=None, window=1000, min_samples=100):
+        """
+        :param percentile: Latency percentile after which reads are hedged
+        :type percentile: float
+        :param initial_delay: Delay used until `min_samples` latencies are recorded, in seconds
+        :type initial_delay: float
+        :param min_delay: Minimal delay, in seconds
+        :type min_delay: float
+        :param max_delay: Maximal delay, in seconds
+        :type max_delay: float
+        :param budget: Number of hedges allowed per eligible read
+        :type budget: float
+        :param burst: Maximal number of hedges which can be saved up
+        :type burst: float
+        :param max_per_second: Maximal number of hedges per second, `None` for no limit
+        :type max_per_second: float
+        :param window: Number of latencies after which older latencies are forgotten
+        :type window: int
+        :param min_samples: Number of latencies required before the percentile is used
+        :type min_samples: int
+        """
+        if not 0 < percentile < 100:
+            raise ValueError('percentile must be between 0 and 100')
+        if not 0 <= min_delay <= max_delay:
+            raise ValueError('min_delay must be between 0 and max_delay')
+        if budget < 0 or burst < 1:
+            raise ValueError('Invalid budget')
+        if max_per_second is not None and max_per_second <= 0:
+            raise ValueError('max_per_second must be positive')
+
+        self._percentile = percentile
+        self._initial_delay = initial_delay
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._budget = budget
+        self._burst = burst
+        self._max_per_second = max_per_second
+        self._window = window
+        self._min_samples = min_samples
+
+        self._pid = os.getpid()
+        self._process_lock = threading.Lock()
+        # Latencies in microseconds
+        self._current = Histogram()
+        self._previous = Histogram()
+        self._delay = initial_delay
+        self._pending = 0
+
+        self._tokens = float(burst)
+        self._rate_tokens = max_per_second
+        self._refilled = time.time()
+
+    @property
+    def _lock(self):
+        if self._pid != os.getpid():
+            # The lock may have been held by another thread of the parent process at fork time
+            self._process_lock = threading.Lock()
+            self._pid = os.getpid()
+        return self._process_lock
+
+    @staticmethod
+    def eligible(message):
+        """
+        Check whether a message can be hedged
+
+        :param message: Message to process
+        :type message: pyrakoon.protocol.Message
+        :rtype: bool
+        """
+        consistency_ = getattr(message, 'consistency', None)
+        return consistency_ is consistency.INCONSISTENT or isinstance(consistency_, consistency.AtLeast)
+
+    @property
+    def delay(self):
+        # type: () -> float
+        """
+        Current hedge delay, in seconds
+        """
+        return self._delay
+
+    def start(self):
+        """
+        Account an eligible read, adding to the hedge budget
+
+        :return: Time to wait for a reply before hedging, in seconds
+        :rtype: float
+        """
+        with self._lock:
+            self._tokens = min(self._tokens + self._budget, self._burst)
+            return self._delay
+
+    def acquire(self):
+        """
+        Take a hedge from the budget
+
+        :return: Whether a hedge is allowed
+        :rtype: bool
+        """
+        with self._lock:
+            if self._tokens < 1:
+                return False
+
+            if self._max_per_second is not None:
+                now = time.time()
+                self._rate_tokens = min(self._rate_tokens + (now - self._refilled) * self._max_per_second,
+                                        self._max_per_second)
+                self._refilled = now
+                if self._rate_tokens < 1:
+                    return False
+                self._rate_tokens -= 1
+
+            self._tokens -= 1
+            return True
+
+    def record(self, latency):
+        """
+        Record the latency of an eligible read
+
+        :param latency: Time until the first reply arrived, in seconds
+        :type latency: float
+        """
+        with self._lock:
+            self._current.record(latency * 1e6)
+
+            if self._current.count >= self._window:
+                self._previous = self._current
+                self._current = Histogram()
+
+            self._pending += 1
+            if self._pending >= self._REFRESH_INTERVAL or \
+                    self._previous.count + self._current.count == self._min_samples:
+                self._pending = 0
+                self._refresh()
+
+    def _refresh(self):
+        histogram = Histogram()
+        histogram.merge(self._previous)
+        histogram.merge(self._current)
+
+        if histogram.count < self._min_samples:
+            self._delay = self._initial_delay
+        else:
+            delay = histogram.percentile(self._percentile) / 1e6
+            self._delay = min(max(delay, self._min_delay), self._max_delay)
@@ -3,10 +3,12 @@
 
 from __future__ import absolute_import
 
+import time
 import socket
 import threading
+from .metrics import ClientMetrics, CountingReader
 from .utils import call
-from .. import errors, protocol, utils
+from .. import errors, profiling, protocol, tracing, utils
 
 
 class ClientMixin(object):
@@ -143,6 +145,29 @@ class AbstractClient(object):
     # Flag to denote whether the client is connected
     # If this is False, a NotConnectedError will be raised when a call is issued.
     connected = False
+    # Call metrics, implementations recording metrics set this to a ClientMetrics instance
+    _metrics = None
+    # Set to a :class:`pyrakoon.client.slowlog.SlowCallLog` to report slow calls, on implementations supporting it
+    slow_call_log = None
+    # Set to a :class:`pyrakoon.client.compression.ValueCodec` to compress values
+    value_codec = None
+    # Set to a :class:`pyrakoon.client.singleflight.SingleFlight` to coalesce identical concurrent reads
+    single_flight = None
+    # Set to a :class:`pyrakoon.client.negativecache.NegativeCache` to remember keys found not to exist
+    negative_cache = None
+
+    def metrics(self):
+        """
+        Take a snapshot of the call metrics recorded by this client
+
+        :return: Metrics as documented in :meth:`pyrakoon.client.metrics.ClientMetrics.snapshot`, or `None` if this
+         client doesn't record metrics
+        :rtype: dict
+        """
+        if self._metrics is None:
+            return None
+
+        return self._metrics.snapshot()
 
     def _process(self, message):
         """
@@ -166,6 +191,30 @@ class AbstractClient(object):
 
         raise NotImplementedError()
 
+    def _process_many(self, messages):
+        """
+        Submit several messages to the server, and return their results
+
+        Failures of individual messages don't prevent the other messages from being processed, which makes this
+        unsuitable for messages depending on each other. This implementation processes the messages one by one,
+        implementations can pipeline them instead, sending all requests before reading any reply.
+
+        :param messages: Messages to handle
+        :type messages: list of :class:`pyrakoon.protocol.Message`
+
+        :return: Result of every message, or the exception it failed with
+        :rtype: list
+        """
+
+        results = []
+        for message in messages:
+            try:
+                results.append(self._process(message)) #pylint: disable=E1111
+            except Exception as exc: #pylint: disable=W0703
+                results.append(exc)
+
+        return results
+
 
 class SocketClient(AbstractClient):
     """
@@ -186,6 +235,7 @@ class SocketClient(AbstractClient):
         super(SocketClient, self).__init__()
 
         self._lock = threading.Lock()
+        self._metrics = ClientMetrics()
 
         self._socket = None
         self._address = address
@@ -205,6 +255,16 @@ class SocketClient(AbstractClient):
         prologue = protocol.build_prologue(self._cluster_id)
         self._socket.sendall(prologue)
 
+    def close(self):
+        """
+        Close the connection to the server
+        """
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            finally:
+                self._socket = None
+
     @property
     def connected(self):
         """
@@ -213,13 +273,29 @@ class SocketClient(AbstractClient):
         return self._socket is not None
 
     def _process(self, message):
+        trace = tracing.start(message)
+        profile = profiling.start(message)
+        data = ''.join(message.serialize()) if profile is None else profile.serialize()
+        read = CountingReader(self._read if trace is None else trace.reader(self._read))
+        error = None
+
+        requested = time.time()
         self._lock.acquire()
+        start = time.time()
         try:
-            for part in message.serialize():
-                self._socket.sendall(part)
+            self._socket.sendall(data)
+            if trace is not None:
+                trace.written(len(data), '%s:%s' % self._address)
+
+            result = utils.read_blocking(message.receive(), read, profile)
+            if trace is not None:
+                trace.decoded()
 
-            return utils.read_blocking(message.receive(), self._socket.recv)
+            return result
         except Exception as exc:
+            error = exc
+            if trace is not None:
+                trace.failed(exc)
             if not isinstance(exc, errors.ArakoonError):
                 try:
                     if self._socket:
@@ -230,3 +306,34 @@ class SocketClient(AbstractClient):
             raise
         finally:
             self._lock.release()
+            end = time.time()
+            self._metrics.record(message, end - start, error, len(data), read.count)
+            if profile is not None:
+                profile.finish(error)
+            if self.slow_call_log is not None:
+                self.slow_call_log.observe(message, start - requested, end - start, '%s:%s' % self._address,
+                                           len(data), read.count, 0, error)
+
+    def _read(self, count):
+        """
+        Read exactly `count` bytes from the socket
+
+        :param count: Number of bytes to read
+        :type count: int
+        :return: Data read
+        :rtype: str
+        """
+        data = self._socket.recv(count)
+        if len(data) == count:
+            return data
+
+        chunks = [data]
+        remaining = count - len(data)
+        while remaining > 0:
+            if not data:
+                raise socket.error('Connection closed by server')
+            data = self._socket.recv(remaining)
+            chunks.append(data)
+            remaining -= len(data)
+
+        return ''.join(chunks)
@@ -0,0 +1,186 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Client call instrumentation
+
+Clients record every call processed through their `_process` method in a :class:`ClientMetrics` instance, and expose
+a snapshot of it through :meth:`pyrakoon.client.AbstractClient.metrics`.
+"""
+
+from __future__ import absolute_import
+
+import time
+import threading
+
+from ..histogram import Histogram
+
+# Percentiles included in snapshots
+SNAPSHOT_PERCENTILES = (50, 90, 99, 99.9)
+
+
+class CountingReader(object):
+    """
+    Wrap a `read` callable, counting the number of bytes read
+    """
+
+    __slots__ = '_read', 'count'
+
+    def __init__(self, read):
+        """
+        :param read: Callable taking a byte count, returning data
+        :type read: callable
+        """
+        self._read = read
+        self.count = 0
+
+    def __call__(self, count):
+        data = self._read(count)
+        self.count += len(data)
+        return data
+
+
+class _CommandMetrics(object):
+    """
+    Counters and latency histogram of a single message type
+    """
+
+    __slots__ = 'calls', 'errors', 'latency'
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        # Microseconds
+        self.latency = Histogram()
+
+
+class ClientMetrics(object):
+    """
+    Thread-safe call counters and latency histograms of a client
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._since = time.time()
+        self._commands = {}
+        self._errors = {}
+        self._bytes_sent = 0
+        self._bytes_received = 0
+        self._retries = 0
+        self._master_rediscoveries = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+
+    def record(self, message, duration, error=None, bytes_sent=0, bytes_received=0):
+        """
+        Record a call
+
+        :param message: Message which was processed
+        :type message: pyrakoon.protocol.Message
+        :param duration: Duration of the call, in seconds
+        :type duration: float
+        :param error: Exception the call failed with, if any
+        :type error: Exception
+        :param bytes_sent: Number of bytes sent
+        :type bytes_sent: int
+        :param bytes_received: Number of bytes received
+        :type bytes_received: int
+        """
+        name = type(message).__name__
+
+        with self._lock:
+            command = self._commands.get(name)
+            if command is None:
+                command = self._commands[name] = _CommandMetrics()
+
+            command.calls += 1
+            command.latency.record(duration * 1e6)
+
+            if error is not None:
+                command.errors += 1
+                error_name = type(error).__name__
+                self._errors[error_name] = self._errors.get(error_name, 0) + 1
+
+            self._bytes_sent += bytes_sent
+            self._bytes_received += bytes_received
+
+    def add_bytes_received(self, count):
+        """
+        Record bytes received outside of :meth:`record`
+
+        :param count: Number of bytes
+        :type count: int
+        """
+        with self._lock:
+            self._bytes_received += count
+
+    def add_retry(self):
+        """
+        Record a call being retried
+        """
+        with self._lock:
+            self._retries += 1
+
+    def add_master_rediscovery(self):
+        """
+        Record a lookup of the master node
+        """
+        with self._lock:
+            self._master_rediscoveries += 1
+
+    def add_hedge(self, won):
+        """
+        Record a hedged read
+
+        :param won: Whether the hedge replied before the original read
+        :type won: bool
+        """
+        with self._lock:
+            self._hedges += 1
+            if won:
+                self._hedge_wins += 1
+
+    def reset(self):
+        """
+        Clear all recorded metrics
+        """
+        with self._lock:
+            self._since = time.time()
+            self._commands = {}
+            self._errors = {}
+            self._bytes_sent = 0
+            self._bytes_received = 0
+            self._retries = 0
+            self._master_rediscoveries = 0
+            self._hedges = 0
+            self._hedge_wins = 0
+
+    def snapshot(self):
+        """
+        Take a snapshot of all metrics
+
+        Latencies are reported in microseconds. Errors are counted by exception class name.
+
+        :return: Metrics, e.g. ``{'commands': {'Get': {'calls': 2, 'errors': 1, 'latency_us': {...}}},
+         'errors': {'NotFound': 1}, 'bytes_sent': 60, 'bytes_received': 21, 'retries': 0, 'master_rediscoveries': 0,
+         'hedges': 0, 'hedge_wins': 0, 'since': 1500000000.0}``
+        :rtype: dict
+        """
+        with self._lock:
+            commands = dict((name, {
+                'calls': command.calls,
+                'errors': command.errors,
+                'latency_us': command.latency.to_dict(SNAPSHOT_PERCENTILES),
+            }) for name, command in self._commands.iteritems())
+
+            return {
+                'since': self._since,
+                'commands': commands,
+                'errors': dict(self._errors),
+                'bytes_sent': self._bytes_sent,
+                'bytes_received': self._bytes_received,
+                'retries': self._retries,
+                'master_rediscoveries': self._master_rediscoveries,
+                'hedges': self._hedges,
+                'hedge_wins': self._hedge_wins,
+            }
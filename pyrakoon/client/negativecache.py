@@ -0,0 +1,322 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Cache of keys known not to exist
+
+When a :class:`NegativeCache` is set as the `negative_cache` of a client, `get` calls failing with
+:class:`~pyrakoon.errors.NotFound` and `exists` calls returning `False` are remembered for a while. Later `get` and
+`exists` calls for these keys using the `INCONSISTENT` consistency are answered from the cache, without a round trip.
+Consistent reads, and reads using an `AtLeast` consistency, always go to the cluster.
+
+Entries are removed when the client itself writes the key, through `set`, `test_and_set`, `replace`, `confirm` or
+a sequence, including sequences committed by helpers like :class:`~pyrakoon.client.transaction.Transaction`. Writes
+by other clients are only noticed once entries expire, like any other stale read.
+
+>>> from pyrakoon import consistency, errors, protocol
+>>> cache = NegativeCache(ttl=60)
+>>> def process(message):
+...     raise errors.NotFound(message.key)
+>>> message = protocol.Get(consistency.INCONSISTENT, 'key')
+>>> for _ in xrange(3):
+...     try:
+...         cache.process(process, message)
+...     except errors.NotFound:
+...         pass
+>>> cache.stats()['hits'], cache.stats()['misses']
+(2, 1)
+>>> cache.process(lambda message: None, protocol.Set('key', 'value'))
+>>> 'key' in cache
+False
+"""
+
+from __future__ import absolute_import
+
+import time
+import struct
+import threading
+import collections
+
+from .. import consistency, errors, protocol, sequence
+
+_UINT32 = struct.Struct('<I')
+# Kind and key count of a serialized range assertion
+_ASSERTION = struct.Struct('<II')
+# Marks writes whose keys can't be determined
+_ALL_KEYS = object()
+
+
+def _skip_string(data, offset):
+    length, = _UINT32.unpack_from(data, offset)
+    end = offset + 4 + length
+    if end > len(data):
+        raise ValueError('Truncated string')
+    return end
+
+
+def _scan(data, offset, keys):
+    """
+    Collect the keys set or replaced by a serialized step
+
+    :param data: Serialized steps
+    :type data: str
+    :param offset: Offset of the step in `data`
+    :type offset: int
+    :param keys: List to add keys to
+    :type keys: list of str
+    :return: Offset of the next step
+    :rtype: int
+
+    :raise ValueError: The step can't be parsed
+    """
+    tag, = _UINT32.unpack_from(data, offset)
+    offset += 4
+
+    if tag == sequence.Sequence.TAG:
+        count, = _UINT32.unpack_from(data, offset)
+        offset += 4
+        for _ in xrange(count):
+            offset = _scan(data, offset, keys)
+        return offset
+
+    end = _skip_string(data, offset)
+    if tag in (sequence.Set.TAG, sequence.Replace.TAG):
+        keys.append(data[offset + 4:end])
+    offset = end
+
+    if tag == sequence.Set.TAG:
+        offset = _skip_string(data, offset)
+    elif tag in (sequence.Assert.TAG, sequence.Replace.TAG):
+        if data[offset] != '\x00':
+            offset = _skip_string(data, offset + 1)
+        else:
+            offset += 1
+    elif tag == sequence.AssertRange.TAG:
+        _, count = _ASSERTION.unpack_from(data, offset)
+        offset += _ASSERTION.size
+        for _ in xrange(count):
+            offset = _skip_string(data, offset)
+    elif tag not in (sequence.Delete.TAG, sequence.AssertExists.TAG, sequence.DeletePrefix.TAG):
+        raise ValueError('Unknown step tag %d' % tag)
+
+    return offset
+
+
+def _sequence_keys(step, keys):
+    """
+    Collect the keys set or replaced by a sequence step
+
+    :raise ValueError: The keys can't be determined
+    """
+    type_ = type(step)
+    if type_ is sequence.Set or type_ is sequence.Replace:
+        keys.append(step.key)
+    elif type_ is sequence.Sequence:
+        for step_ in step.steps:
+            _sequence_keys(step_, keys)
+    elif isinstance(step, sequence.SequenceBuilder):
+        # Steps of a builder are only available serialized
+        try:
+            _scan(step.serialize_body(), 0, keys)
+        except (struct.error, IndexError):
+            raise ValueError('Malformed sequence')
+
+
+def written_keys(message):
+    """
+    Determine the keys a message can create
+
+    :param message: Message to send
+    :type message: pyrakoon.protocol.Message
+    :return: Keys, `None` if the message doesn't create keys, or `_ALL_KEYS` if these can't be determined
+    :rtype: list of str
+    """
+    type_ = type(message)
+
+    if type_ in (protocol.Set, protocol.Confirm, protocol.TestAndSet, protocol.Replace):
+        return [message.key]
+    elif type_ is protocol.Sequence:
+        keys = []
+        try:
+            _sequence_keys(message.sequence, keys)
+        except ValueError:
+            return _ALL_KEYS
+        return keys
+    elif type_ is protocol.UserFunction:
+        return _ALL_KEYS
+
+    return None
+
+
+class NegativeCache(object):
+    """
+    Bounded cache of keys known not to exist, expiring after a time-to-live
+
+    When the cache is full, the least recently added keys are evicted. The cache is meant for threaded clients:
+    calls answered from the cache return or raise immediately, instead of returning a `Deferred`.
+    """
+
+    def __init__(self, ttl=1.0, max_size=10000):
+        """
+        :param ttl: Time after which keys are no longer assumed not to exist, in seconds
+        :type ttl: float
+        :param max_size: Maximal number of keys to remember
+        :type max_size: int
+        """
+        if ttl <= 0:
+            raise ValueError('ttl must be positive')
+        if max_size < 1:
+            raise ValueError('max_size must be positive')
+
+        self._ttl = ttl
+        self._max_size = max_size
+
+        self._lock = threading.Lock()
+        # Expiry time by key, in order of insertion
+        self._entries = collections.OrderedDict()
+        # Incremented on every write, misses observed by reads overlapping with a write aren't remembered
+        self._generation = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            expiry = self._entries.get(key)
+            if expiry is None:
+                return False
+            if expiry < time.time():
+                del self._entries[key]
+                return False
+            return True
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remember(self, key, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+
+            self._misses += 1
+            self._entries.pop(key, None)
+            self._entries[key] = time.time() + self._ttl
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, keys=None):
+        """
+        Forget keys
+
+        :param keys: Keys to forget, `None` to forget all keys
+        :type keys: iterable of str
+        """
+        with self._lock:
+            self._generation += 1
+            if keys is None:
+                self._invalidations += len(self._entries)
+                self._entries.clear()
+                return
+
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self._invalidations += 1
+
+    def process(self, process, message):
+        """
+        Process a message, answering reads of keys known not to exist from the cache
+
+        :param process: Callable sending a message and returning its result
+        :type process: callable
+        :param message: Message to send
+        :type message: pyrakoon.protocol.Message
+        :return: Result of the message
+        :rtype: object
+        """
+        type_ = type(message)
+
+        if type_ is protocol.Get or type_ is protocol.Exists:
+            key = message.key
+            if message.consistency is consistency.INCONSISTENT and key in self:
+                with self._lock:
+                    self._hits += 1
+                if type_ is protocol.Get:
+                    raise errors.NotFound(key)
+                return False
+
+            generation = self._generation
+            try:
+                result = process(message)
+            except errors.NotFound:
+                self._remember(key, generation)
+                raise
+
+            if result is False:
+                self._remember(key, generation)
+            return result
+
+        keys = written_keys(message)
+        if keys is None:
+            return process(message)
+
+        return self._write(process, message, None if keys is _ALL_KEYS else keys)
+
+    def process_many(self, process_many, messages):
+        """
+        Process several messages, forgetting the keys they write
+
+        Reads are neither answered from the cache nor remembered.
+
+        :param process_many: Callable sending messages and returning their results
+        :type process_many: callable
+        :param messages: Messages to send
+        :type messages: list of pyrakoon.protocol.Message
+        :return: Result of every message, or the exception it failed with
+        :rtype: list
+        """
+        keys = []
+        for message in messages:
+            keys_ = written_keys(message)
+            if keys_ is _ALL_KEYS:
+                return self._write(process_many, messages, None)
+            if keys_ is not None:
+                keys.extend(keys_)
+
+        if not keys:
+            return process_many(messages)
+
+        return self._write(process_many, messages, keys)
+
+    def _write(self, process, arg, keys):
+        self.invalidate(keys)
+        try:
+            return process(arg)
+        finally:
+            # Reads sent while the write was in flight may have observed the key as missing
+            self.invalidate(keys)
+
+    def stats(self):
+        """
+        Take a snapshot of the cache counters
+
+        The snapshot is a dictionary containing:
+
+        * `hits`: Number of reads answered from the cache
+        * `misses`: Number of keys remembered not to exist
+        * `evictions`: Number of keys forgotten because the cache was full
+        * `invalidations`: Number of keys forgotten because they were written
+        * `size`: Number of keys in the cache, including expired keys
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'size': len(self._entries),
+            }
@@ -0,0 +1,154 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Deadline-aware retry scheduling
+
+A :class:`RetryPolicy` schedules the retries of calls failing on transient errors, like a master re-election:
+
+* sleeps grow exponentially with *decorrelated jitter*: every sleep is drawn uniformly between `base` and three times
+  the previous sleep, capped at `cap`, which spreads retries of concurrent callers
+* sleeps never extend past the deadline of the call
+* retries are limited by a budget shared by all calls using the policy: every call adds `budget_ratio` retries to it,
+  and `min_per_second` retries are always allowed, so a cluster-wide outage doesn't multiply the load by the number
+  of attempts per call
+
+>>> policy = RetryPolicy(base=0.1, cap=1.0, budget_ratio=0, min_per_second=0, burst=2)
+>>> schedule = policy.start(deadline=None)
+>>> all(0.1 <= schedule.next_sleep() <= 1.0 for _ in xrange(2))
+True
+>>> schedule.next_sleep() is None
+True
+"""
+
+from __future__ import absolute_import
+
+import time
+import random
+import threading
+
+
+class RetryPolicy(object):
+    """
+    Backoff and retry budget, shared by all calls of a client
+    """
+
+    def __init__(self, base=0.05, cap=2.0, budget_ratio=0.2, min_per_second=5.0, burst=20.0):
+        """
+        :param base: Minimal sleep between attempts, in seconds
+        :type base: float
+        :param cap: Maximal sleep between attempts, in seconds
+        :type cap: float
+        :param budget_ratio: Number of retries added to the budget by every call
+        :type budget_ratio: float
+        :param min_per_second: Number of retries added to the budget every second
+        :type min_per_second: float
+        :param burst: Maximal number of retries in the budget
+        :type burst: float
+        """
+        if not 0 < base <= cap:
+            raise ValueError('base must be between 0 and cap')
+        if budget_ratio < 0 or min_per_second < 0 or burst < 1:
+            raise ValueError('Invalid budget')
+
+        self.base = base
+        self.cap = cap
+        self._budget_ratio = budget_ratio
+        self._min_per_second = min_per_second
+        self._burst = burst
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._refilled = time.time()
+
+    def start(self, deadline):
+        """
+        Start scheduling the attempts of a call, adding to the retry budget
+
+        :param deadline: Time after which the call should no longer be attempted, `None` for no deadline
+        :type deadline: float
+        :rtype: RetrySchedule
+        """
+        with self._lock:
+            self._tokens = min(self._tokens + self._budget_ratio, self._burst)
+
+        return RetrySchedule(self, deadline)
+
+    def withdraw(self):
+        """
+        Take a retry from the budget
+
+        :return: Whether a retry is allowed
+        :rtype: bool
+        """
+        with self._lock:
+            now = time.time()
+            self._tokens = min(self._tokens + (now - self._refilled) * self._min_per_second, self._burst)
+            self._refilled = now
+
+            if self._tokens < 1:
+                return False
+
+            self._tokens -= 1
+            return True
+
+
+class RetrySchedule(object):
+    """
+    Retry schedule of a single call
+    """
+
+    __slots__ = '_policy', 'deadline', 'retries', '_previous'
+
+    def __init__(self, policy, deadline):
+        """
+        :param policy: Policy providing backoff parameters and the retry budget
+        :type policy: RetryPolicy
+        :param deadline: Time after which the call should no longer be attempted, `None` for no deadline
+        :type deadline: float
+        """
+        self._policy = policy
+        self.deadline = deadline
+        self.retries = 0
+        self._previous = policy.base
+
+    def remaining(self):
+        """
+        Time left until the deadline
+
+        :return: Seconds, `None` if there is no deadline
+        :rtype: float
+        """
+        if self.deadline is None:
+            return None
+        return self.deadline - time.time()
+
+    def next_sleep(self, backoff=None):
+        """
+        Schedule a retry
+
+        :param backoff: Time to sleep instead of the jittered backoff of the policy, e.g. one configured by a compat
+         client, in seconds
+        :type backoff: float
+        :return: Time to sleep before retrying, in seconds, or `None` if the call shouldn't be retried because the
+         deadline passed or the retry budget is exhausted
+        :rtype: float
+        """
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            return None
+
+        if not self._policy.withdraw():
+            return None
+
+        self.retries += 1
+        if backoff is None:
+            sleep = min(self._policy.cap, random.uniform(self._policy.base, self._previous * 3))
+            self._previous = sleep
+        else:
+            sleep = backoff
+
+        if remaining is not None:
+            sleep = min(sleep, remaining)
+
+        return sleep
@@ -0,0 +1,229 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Coalescing of identical concurrent reads
+
+When a :class:`SingleFlight` is set as the `single_flight` of a client, a read issued while an identical read is in
+flight doesn't send a request of its own: it waits for the reply of the request in flight instead, and receives the
+same result or exception. Reads are identical when their message type and serialized arguments, including the
+consistency, are equal.
+
+On the threaded clients, waiting callers block until the reply arrives. On the Twisted protocol, every caller gets a
+`Deferred` of its own, fired when the shared reply arrives.
+
+Coalescing doesn't weaken consistency on clients sending all requests to the master over a single ordered
+connection: a read only joins a request in flight when no write went through the same :class:`SingleFlight` since
+that request was sent, so every write completed before the read was issued is observed by the reply.
+
+>>> from pyrakoon import consistency, protocol
+>>> single_flight = SingleFlight()
+>>> single_flight.key(protocol.Get(consistency.CONSISTENT, 'key')) is not None
+True
+>>> single_flight.key(protocol.Set('key', 'value')) is None
+True
+"""
+
+from __future__ import absolute_import
+
+import os
+import threading
+
+from .. import protocol
+
+# Messages which don't modify the cluster
+READ_MESSAGES = frozenset((
+    protocol.Get, protocol.Exists, protocol.MultiGet, protocol.MultiGetOption, protocol.PrefixKeys, protocol.Range,
+    protocol.RangeEntries, protocol.RevRangeEntries,
+))
+
+# Messages which may modify the cluster, reads sent before one of these aren't joined by later reads
+WRITE_MESSAGES = frozenset((
+    protocol.Set, protocol.Delete, protocol.TestAndSet, protocol.Replace, protocol.Confirm, protocol.Sequence,
+    protocol.DeletePrefix, protocol.UserFunction,
+))
+
+
+class _Flight(object):
+    """
+    A request in flight, and the callers waiting for its reply
+    """
+
+    __slots__ = 'done', 'result', 'error', 'deferreds'
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        # Deferreds of waiting callers, when the request is processed by a Twisted protocol
+        self.deferreds = None
+
+
+def _copy(result):
+    # Callers may modify lists they receive
+    return list(result) if isinstance(result, list) else result
+
+
+class SingleFlight(object):
+    """
+    Registry of reads in flight
+    """
+
+    def __init__(self, message_types=READ_MESSAGES):
+        """
+        :param message_types: Types of messages to coalesce, these should not modify the cluster
+        :type message_types: iterable of Type[pyrakoon.protocol.Message]
+        """
+        self._message_types = frozenset(message_types)
+
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._flights = {}
+        # Incremented on every write, reads only join requests sent since the last one
+        self._writes = 0
+        self._requests = 0
+        self._coalesced = 0
+
+    def key(self, message):
+        """
+        Calculate the key identifying identical requests
+
+        :param message: Message to send
+        :type message: pyrakoon.protocol.Message
+        :return: Key, or `None` if the message shouldn't be coalesced
+        :rtype: tuple
+        """
+        type_ = type(message)
+        if type_ not in self._message_types:
+            return None
+
+        return type_, ''.join(message.serialize())
+
+    def process(self, process, message):
+        """
+        Process a message, or wait for the reply of an identical message in flight
+
+        :param process: Callable sending a message and returning its result, or a `Deferred` firing with it
+        :type process: callable
+        :param message: Message to send
+        :type message: pyrakoon.protocol.Message
+        :return: Result of the message, or a `Deferred` firing with it
+        :rtype: object
+        """
+        key = self.key(message)
+        if key is None:
+            if type(message) in WRITE_MESSAGES:
+                self._written()
+            return process(message)
+
+        self._check_fork()
+
+        with self._lock:
+            key += (self._writes,)
+            self._requests += 1
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._coalesced += 1
+                if flight.deferreds is not None:
+                    from twisted.internet import defer
+                    deferred = defer.Deferred()
+                    flight.deferreds.append(deferred)
+                    return deferred
+
+        if not leader:
+            return self._wait(flight)
+
+        try:
+            result = process(message)
+        except Exception as exc: #pylint: disable=W0703
+            self._finish(key, flight, None, exc)
+            raise
+
+        if hasattr(result, 'addBoth'):
+            with self._lock:
+                flight.deferreds = []
+            return result.addBoth(self._fired, key, flight)
+
+        self._finish(key, flight, result, None)
+        return result
+
+    def process_many(self, process_many, messages):
+        """
+        Process several messages, without coalescing them
+
+        :param process_many: Callable sending messages and returning their results
+        :type process_many: callable
+        :param messages: Messages to send
+        :type messages: list of pyrakoon.protocol.Message
+        :return: Result of every message, or the exception it failed with
+        :rtype: list
+        """
+        if any(type(message) in WRITE_MESSAGES for message in messages):
+            self._written()
+        return process_many(messages)
+
+    def _check_fork(self):
+        if os.getpid() != self._pid:
+            # The lock may have been held by another thread of the parent process at fork time
+            self._lock = threading.Lock()
+            self._flights = {}
+            self._pid = os.getpid()
+
+    def _written(self):
+        self._check_fork()
+        with self._lock:
+            self._writes += 1
+
+    def _wait(self, flight):
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return _copy(flight.result)
+
+    def _finish(self, key, flight, result, error):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    def _fired(self, result, key, flight):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            deferreds, flight.deferreds = flight.deferreds, []
+
+        from twisted.python import failure
+        for deferred in deferreds:
+            if isinstance(result, failure.Failure):
+                deferred.errback(result)
+            else:
+                deferred.callback(_copy(result))
+
+        flight.result = result
+        flight.done.set()
+        return result
+
+    def stats(self):
+        """
+        Take a snapshot of the coalescing counters
+
+        The snapshot is a dictionary containing:
+
+        * `requests`: Number of eligible requests
+        * `coalesced`: Number of requests served by the reply of an identical request
+        * `in_flight`: Number of requests in flight
+
+        :rtype: dict
+        """
+        with self._lock:
+            return {
+                'requests': self._requests,
+                'coalesced': self._coalesced,
+                'in_flight': len(self._flights),
+            }
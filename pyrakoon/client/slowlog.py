@@ -0,0 +1,242 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Logging of slow client calls
+
+A :class:`SlowCallLog` can be attached to a client by setting its `slow_call_log` attribute. Calls taking longer than
+the threshold are reported as :class:`SlowCall` records, logged as warnings or passed to a callback. To keep the
+overhead bounded in production, slow calls can be sampled, and reports are rate limited: calls dropped by the rate
+limit are counted, and the count is included in the next report.
+
+>>> from pyrakoon import protocol
+>>> calls = []
+>>> slow_call_log = SlowCallLog(0.1, callback=calls.append)
+>>> slow_call_log.observe(protocol.Get(None, 'key'), lock_wait=0.0, wire_time=0.05)
+>>> slow_call_log.observe(protocol.Get(None, 'key'), lock_wait=0.15, wire_time=0.05, node_id='arakoon_0')
+>>> calls
+[<SlowCall Get key='key' node=arakoon_0 duration=0.200 lock_wait=0.150 wire_time=0.050>]
+"""
+
+from __future__ import absolute_import
+
+import time
+import random
+import logging
+import threading
+
+from ..constants.logging import PYRAKOON_CLIENT_LOGGER
+
+# Message attributes identifying the keys a call works on, in order of preference
+KEY_ATTRIBUTES = ('key', 'prefix', 'begin_key')
+
+
+def describe_key(message, limit=64):
+    """
+    Describe the key or keys a message works on
+
+    >>> from pyrakoon import protocol
+    >>> describe_key(protocol.MultiGet(None, ['key_%d' % i for i in xrange(10)]))
+    "'key_0' (+9 keys)"
+    >>> describe_key(protocol.Set('x' * 100, 'value'), limit=8)
+    "'xxxxxxxx...'"
+
+    :param message: Message
+    :type message: pyrakoon.protocol.Message
+    :param limit: Maximal number of characters of a key to include
+    :type limit: int
+    :return: Description, or `None` if the message doesn't take a key
+    :rtype: str
+    """
+    for attribute in KEY_ATTRIBUTES:
+        key = getattr(message, attribute, None)
+        if key is not None:
+            return _truncate(key, limit)
+
+    keys = getattr(message, 'keys', None)
+    if keys:
+        if len(keys) == 1:
+            return _truncate(keys[0], limit)
+        return '%s (+%d keys)' % (_truncate(keys[0], limit), len(keys) - 1)
+
+    return None
+
+
+def _truncate(key, limit):
+    if len(key) > limit:
+        return repr(key[:limit])[:-1] + '...' + repr(key)[-1]
+    return repr(key)
+
+
+class SlowCall(object):
+    """
+    Record of a call exceeding the threshold of a :class:`SlowCallLog`
+
+    Durations are in seconds.
+    """
+
+    __slots__ = 'message_type', 'key', 'node_id', 'duration', 'lock_wait', 'wire_time', 'bytes_sent', \
+        'bytes_received', 'retries', 'error', 'suppressed'
+
+    def __init__(self, message_type, key, node_id, lock_wait, wire_time, bytes_sent, bytes_received, retries, error,
+                 suppressed):
+        """
+        :param message_type: Name of the message class
+        :type message_type: str
+        :param key: Truncated key or prefix the call worked on, see :func:`describe_key`
+        :type key: str
+        :param node_id: Node the call was sent to, if known
+        :type node_id: str
+        :param lock_wait: Time spent waiting for the client lock
+        :type lock_wait: float
+        :param wire_time: Time spent sending the request and receiving the reply, including retries
+        :type wire_time: float
+        :param bytes_sent: Size of the request(s) sent
+        :type bytes_sent: int
+        :param bytes_received: Size of the reply (or replies) received
+        :type bytes_received: int
+        :param retries: Number of times the call was retried
+        :type retries: int
+        :param error: Exception the call failed with, if any
+        :type error: Exception
+        :param suppressed: Number of slow calls dropped by the rate limit since the previous report
+        :type suppressed: int
+        """
+        self.message_type = message_type
+        self.key = key
+        self.node_id = node_id
+        self.duration = lock_wait + wire_time
+        self.lock_wait = lock_wait
+        self.wire_time = wire_time
+        self.bytes_sent = bytes_sent
+        self.bytes_received = bytes_received
+        self.retries = retries
+        self.error = error
+        self.suppressed = suppressed
+
+    def format(self):
+        """
+        Format the record as a log message
+
+        :rtype: str
+        """
+        parts = ['Slow call: %s' % self.message_type]
+        if self.key is not None:
+            parts.append('key=%s' % self.key)
+        parts.append('node=%s duration=%.3fs lock_wait=%.3fs wire_time=%.3fs sent=%dB received=%dB retries=%d' % (
+            self.node_id, self.duration, self.lock_wait, self.wire_time, self.bytes_sent, self.bytes_received,
+            self.retries))
+        if self.error is not None:
+            parts.append('error=%s' % type(self.error).__name__)
+        if self.suppressed:
+            parts.append('(%d more slow calls suppressed)' % self.suppressed)
+
+        return ' '.join(parts)
+
+    def __repr__(self):
+        return '<SlowCall %s key=%s node=%s duration=%.3f lock_wait=%.3f wire_time=%.3f>' % (
+            self.message_type, self.key, self.node_id, self.duration, self.lock_wait, self.wire_time)
+
+
+class SlowCallLog(object):
+    """
+    Report client calls exceeding a duration threshold, with sampling and rate limiting
+    """
+
+    def __init__(self, threshold, callback=None, sample_rate=1.0, max_per_second=10.0, key_limit=64, logger=None):
+        """
+        :param threshold: Minimal duration of a call to be reported, in seconds
+        :type threshold: float
+        :param callback: Callable receiving every reported :class:`SlowCall`. By default calls are logged as warnings.
+         Exceptions raised by the callback are logged and otherwise ignored.
+        :type callback: callable
+        :param sample_rate: Fraction of slow calls to report, between 0 and 1
+        :type sample_rate: float
+        :param max_per_second: Maximal average number of reports per second, bursts up to this number are allowed.
+         `None` disables rate limiting.
+        :type max_per_second: float
+        :param key_limit: Maximal number of characters of keys to report
+        :type key_limit: int
+        :param logger: Logger to report to, defaults to the client logger
+        :type logger: logging.Logger
+        """
+        if threshold < 0:
+            raise ValueError('threshold must not be negative')
+        if not 0 <= sample_rate <= 1:
+            raise ValueError('sample_rate must be between 0 and 1')
+        if max_per_second is not None and max_per_second <= 0:
+            raise ValueError('max_per_second must be positive')
+
+        self.threshold = threshold
+        self._callback = callback
+        self._sample_rate = sample_rate
+        self._max_per_second = max_per_second
+        self._key_limit = key_limit
+        self._logger = logger if logger is not None else logging.getLogger(PYRAKOON_CLIENT_LOGGER)
+
+        self._lock = threading.Lock()
+        # Token bucket
+        self._tokens = max_per_second
+        self._refilled = time.time()
+        self._suppressed = 0
+
+    def observe(self, message, lock_wait, wire_time, node_id=None, bytes_sent=0, bytes_received=0, retries=0,
+                error=None):
+        """
+        Check a finished call, reporting it when it exceeds the threshold
+
+        :param message: Message which was processed
+        :type message: pyrakoon.protocol.Message
+        :param lock_wait: Time spent waiting for the client lock, in seconds
+        :type lock_wait: float
+        :param wire_time: Time spent sending the request and receiving the reply, in seconds
+        :type wire_time: float
+        :param node_id: Node the call was sent to, if known
+        :type node_id: str
+        :param bytes_sent: Size of the request(s) sent
+        :type bytes_sent: int
+        :param bytes_received: Size of the reply (or replies) received
+        :type bytes_received: int
+        :param retries: Number of times the call was retried
+        :type retries: int
+        :param error: Exception the call failed with, if any
+        :type error: Exception
+        """
+        if lock_wait + wire_time < self.threshold:
+            return
+
+        if self._sample_rate < 1 and random.random() >= self._sample_rate:
+            return
+
+        with self._lock:
+            if not self._acquire_token():
+                self._suppressed += 1
+                return
+
+            suppressed = self._suppressed
+            self._suppressed = 0
+
+        record = SlowCall(type(message).__name__, describe_key(message, self._key_limit), node_id, lock_wait,
+                          wire_time, bytes_sent, bytes_received, retries, error, suppressed)
+
+        if self._callback is None:
+            self._logger.warning(record.format())
+        else:
+            try:
+                self._callback(record)
+            except Exception: #pylint: disable=W0703
+                self._logger.exception('Slow call callback %r failed', self._callback)
+
+    def _acquire_token(self):
+        if self._max_per_second is None:
+            return True
+
+        now = time.time()
+        self._tokens = min(self._tokens + (now - self._refilled) * self._max_per_second, self._max_per_second)
+        self._refilled = now
+
+        if self._tokens < 1:
+            return False
+
+        self._tokens -= 1
+        return True
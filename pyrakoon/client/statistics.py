@@ -0,0 +1,426 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Background polling of node statistics
+
+:class:`StatisticsPoller` samples the `statistics` call of every node of a cluster at a fixed interval, parses the
+results into :class:`StatisticsSample` instances and keeps the most recent ones in a ring buffer per node.
+Operation rates and average latencies over an interval are derived from two samples using :func:`compute_rates`:
+
+>>> previous = StatisticsSample.from_dict('arakoon_0', {'set_info': {'n': 10, 'min': 0.001, 'max': 0.003,
+...     'avg': 0.002, 'var': 0.0}}, 100.0)
+>>> current = StatisticsSample.from_dict('arakoon_0', {'set_info': {'n': 30, 'min': 0.001, 'max': 0.005,
+...     'avg': 0.003, 'var': 0.0}}, 110.0)
+>>> rates = compute_rates(previous, current)
+>>> rates.interval
+10.0
+>>> rate = rates.operations['set_info']
+>>> rate.count, rate.per_second, round(rate.avg_latency, 6)
+(20, 2.0, 0.0035)
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+import collections
+
+from .interfaces import SocketClient, ClientMixin
+from ..constants.logging import PYRAKOON_CLIENT_LOGGER
+
+logger = logging.getLogger(PYRAKOON_CLIENT_LOGGER)
+
+# Keys of the per-operation statistics reported by a node
+OPERATION_KEYS = frozenset(('n', 'min', 'max', 'avg', 'var'))
+
+
+class OperationStatistics(object):
+    """
+    Cumulative count and timing statistics of one operation type on a node
+
+    Durations are in seconds.
+    """
+
+    __slots__ = 'count', 'min', 'max', 'avg', 'var'
+
+    def __init__(self, count, min_, max_, avg, var):
+        # type: (int, float, float, float, float) -> None
+        self.count = count
+        self.min = min_
+        self.max = max_
+        self.avg = avg
+        self.var = var
+
+    def __repr__(self):
+        return '<OperationStatistics count=%d avg=%r>' % (self.count, self.avg)
+
+
+class StatisticsSample(object):
+    """
+    Parsed result of a single `statistics` call
+    """
+
+    __slots__ = 'node_id', 'timestamp', 'start', 'last', 'operations', 'node_is', 'values'
+
+    def __init__(self, node_id, timestamp, start, last, operations, node_is, values):
+        """
+        :param node_id: Node the sample was taken from
+        :type node_id: str
+        :param timestamp: Local time at which the sample was taken
+        :type timestamp: float
+        :param start: Time at which the node started collecting statistics
+        :type start: float
+        :param last: Time of the last statistics update on the node
+        :type last: float
+        :param operations: Statistics by operation name, e.g. `set_info`
+        :type operations: dict of (str, OperationStatistics)
+        :param node_is: Last known transaction counter by node
+        :type node_is: dict of (str, int)
+        :param values: All other scalar values reported, by name
+        :type values: dict
+        """
+        self.node_id = node_id
+        self.timestamp = timestamp
+        self.start = start
+        self.last = last
+        self.operations = operations
+        self.node_is = node_is
+        self.values = values
+
+    @classmethod
+    def from_dict(cls, node_id, statistics, timestamp=None):
+        """
+        Parse statistics as returned by :meth:`pyrakoon.client.ClientMixin.statistics`
+
+        :param node_id: Node the statistics were retrieved from
+        :type node_id: str
+        :param statistics: Statistics
+        :type statistics: dict
+        :param timestamp: Local time at which the statistics were retrieved, defaults to now
+        :type timestamp: float
+        :rtype: StatisticsSample
+        """
+        operations = {}
+        node_is = {}
+        values = {}
+
+        for name, value in statistics.iteritems():
+            if isinstance(value, dict):
+                if OPERATION_KEYS.issubset(value):
+                    operations[name] = OperationStatistics(
+                        value['n'], value['min'], value['max'], value['avg'], value['var'])
+                elif name == 'node_is':
+                    node_is = dict(value)
+            elif name not in ('start', 'last'):
+                values[name] = value
+
+        return cls(node_id, timestamp if timestamp is not None else time.time(),
+                   statistics.get('start'), statistics.get('last'), operations, node_is, values)
+
+    def __repr__(self):
+        return '<StatisticsSample node=%s timestamp=%r operations=%d>' % (
+            self.node_id, self.timestamp, len(self.operations))
+
+
+class OperationRate(object):
+    """
+    Activity of one operation type between two samples
+    """
+
+    __slots__ = 'count', 'per_second', 'avg_latency'
+
+    def __init__(self, count, per_second, avg_latency):
+        """
+        :param count: Number of operations performed
+        :type count: int
+        :param per_second: Operations per second
+        :type per_second: float
+        :param avg_latency: Average duration of the operations performed, in seconds, or `None` if there were none
+        :type avg_latency: float
+        """
+        self.count = count
+        self.per_second = per_second
+        self.avg_latency = avg_latency
+
+    def __repr__(self):
+        return '<OperationRate count=%d per_second=%r avg_latency=%r>' % (
+            self.count, self.per_second, self.avg_latency)
+
+
+class StatisticsRates(object):
+    """
+    Rates derived from two samples of the same node
+    """
+
+    __slots__ = 'node_id', 'interval', 'operations', 'restarted'
+
+    def __init__(self, node_id, interval, operations, restarted):
+        """
+        :param node_id: Node the samples were taken from
+        :type node_id: str
+        :param interval: Time between both samples, in seconds
+        :type interval: float
+        :param operations: Rates by operation name
+        :type operations: dict of (str, OperationRate)
+        :param restarted: Whether the node reset its statistics between both samples
+        :type restarted: bool
+        """
+        self.node_id = node_id
+        self.interval = interval
+        self.operations = operations
+        self.restarted = restarted
+
+
+def compute_rates(previous, current):
+    """
+    Derive operation rates and average latencies between two samples
+
+    Statistics are cumulative, so the average latency over the interval is derived from the averages and counts of
+    both samples. When the node reset its statistics in between (its counters went down, or its start time changed),
+    `current` is taken as the delta since the reset.
+
+    :param previous: Oldest sample
+    :type previous: StatisticsSample
+    :param current: Newest sample
+    :type current: StatisticsSample
+    :rtype: StatisticsRates
+    """
+    if previous.node_id != current.node_id:
+        raise ValueError('Samples of different nodes')
+
+    interval = current.timestamp - previous.timestamp
+    if interval <= 0:
+        raise ValueError('Samples not in chronological order')
+
+    restarted = previous.start != current.start or any(
+        operation.count < previous.operations[name].count
+        for name, operation in current.operations.iteritems() if name in previous.operations)
+
+    operations = {}
+    for name, operation in current.operations.iteritems():
+        before = None if restarted else previous.operations.get(name)
+        count = operation.count - (before.count if before is not None else 0)
+
+        avg_latency = None
+        if count > 0:
+            total = operation.avg * operation.count - (before.avg * before.count if before is not None else 0)
+            avg_latency = max(total, 0.0) / count
+
+        operations[name] = OperationRate(count, count / interval, avg_latency)
+
+    return StatisticsRates(current.node_id, interval, operations, restarted)
+
+
+class _NodeClient(SocketClient, ClientMixin):
+    """
+    Client connected to a single node
+    """
+
+
+class StatisticsPoller(object):
+    """
+    Periodically sample the statistics of all nodes of a cluster
+
+    A single connection is kept per node, and reopened on the next poll when it failed. Samples are kept in a ring
+    buffer per node, which can be queried while polling.
+
+    Example usage::
+
+        poller = StatisticsPoller(cluster_id, {'arakoon_0': (['127.0.0.1'], 4000)}, interval=5.0)
+        poller.start()
+        ...
+        rates = poller.rates('arakoon_0')
+        poller.stop()
+    """
+
+    def __init__(self, cluster_id, nodes, interval=10.0, history=60, callback=None):
+        """
+        :param cluster_id: Identifier of the cluster
+        :type cluster_id: str
+        :param nodes: Node locations by node identifier, as passed to :class:`pyrakoon.compat.ArakoonClientConfig`
+        :type nodes: dict of (str, (list of str, int))
+        :param interval: Time between two polls, in seconds
+        :type interval: float
+        :param history: Number of samples to keep per node
+        :type history: int
+        :param callback: Callable called with every new :class:`StatisticsSample`. Exceptions raised by the callback
+         are logged and otherwise ignored.
+        :type callback: callable
+        """
+        if interval <= 0:
+            raise ValueError('interval must be positive')
+        if history < 2:
+            raise ValueError('At least 2 samples must be kept to compute rates')
+
+        self._cluster_id = cluster_id
+        self._nodes = dict(nodes)
+        self._interval = interval
+        self._callback = callback
+
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._samples = dict((node_id, collections.deque(maxlen=history)) for node_id in self._nodes)
+        self._errors = dict.fromkeys(self._nodes, 0)
+
+        self._thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def interval(self):
+        # type: () -> float
+        """
+        Time between two polls, in seconds
+        """
+        return self._interval
+
+    def _client(self, node_id):
+        client = self._clients.get(node_id)
+        if client is None or not client.connected:
+            ips, port = self._nodes[node_id]
+            client = self._clients[node_id] = _NodeClient((ips[0], port), self._cluster_id)
+            client.connect()
+
+        return client
+
+    def poll(self):
+        """
+        Sample all nodes once
+
+        Failures are logged and counted, see :meth:`errors`.
+
+        :return: New samples by node, nodes which couldn't be sampled are left out
+        :rtype: dict of (str, StatisticsSample)
+        """
+        samples = {}
+
+        for node_id in sorted(self._nodes):
+            try:
+                client = self._client(node_id)
+                sample = StatisticsSample.from_dict(node_id, client.statistics())
+            except Exception: #pylint: disable=W0703
+                logger.exception('Failed to retrieve statistics of node %s', node_id)
+                with self._lock:
+                    self._errors[node_id] += 1
+                self._close(node_id)
+                continue
+
+            with self._lock:
+                self._samples[node_id].append(sample)
+            samples[node_id] = sample
+
+            if self._callback is not None:
+                try:
+                    self._callback(sample)
+                except Exception: #pylint: disable=W0703
+                    logger.exception('Statistics callback %r failed', self._callback)
+
+        return samples
+
+    def _close(self, node_id):
+        client = self._clients.pop(node_id, None)
+        if client is not None:
+            try:
+                client.close()
+            except Exception: #pylint: disable=W0703
+                pass
+
+    def _run(self):
+        while not self._stopping.is_set():
+            started = time.time()
+            self.poll()
+            self._stopping.wait(max(self._interval - (time.time() - started), 0))
+
+    def start(self):
+        """
+        Start polling in a background thread
+        """
+        if self._thread is not None:
+            raise RuntimeError('Poller already started')
+
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='pyrakoon-statistics-poller')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop polling and close all connections
+        """
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join()
+            self._thread = None
+
+        for node_id in list(self._clients):
+            self._close(node_id)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def samples(self, node_id):
+        """
+        Get the samples kept for a node
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :return: Samples, oldest first
+        :rtype: list of StatisticsSample
+        """
+        with self._lock:
+            return list(self._samples[node_id])
+
+    def latest(self, node_id):
+        """
+        Get the most recent sample of a node
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :return: Sample, or `None` if the node wasn't sampled yet
+        :rtype: StatisticsSample
+        """
+        with self._lock:
+            samples = self._samples[node_id]
+            return samples[-1] if samples else None
+
+    def rates(self, node_id, window=None):
+        """
+        Compute rates of a node over the most recent samples
+
+        :param node_id: Node identifier
+        :type node_id: str
+        :param window: Period to compute rates over, in seconds. The oldest sample within the window is used, by
+         default the previous sample.
+        :type window: float
+        :return: Rates, or `None` if fewer than 2 samples are available
+        :rtype: StatisticsRates
+        """
+        with self._lock:
+            samples = list(self._samples[node_id])
+
+        if len(samples) < 2:
+            return None
+
+        current = samples[-1]
+        previous = samples[-2]
+        if window is not None:
+            for sample in samples[:-1]:
+                if current.timestamp - sample.timestamp <= window:
+                    previous = sample
+                    break
+
+        return compute_rates(previous, current)
+
+    def errors(self):
+        """
+        Get the number of failed polls by node
+
+        :rtype: dict of (str, int)
+        """
+        with self._lock:
+            return dict(self._errors)
@@ -0,0 +1,239 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Optimistic transactions
+
+A :class:`Transaction` records every key read through it, with the value it observed, and buffers writes locally.
+On commit, a single sequence asserts all observed values and applies the writes, so the transaction fails with
+:class:`~pyrakoon.errors.AssertionFailed` if any key it read was changed in the meantime. Keys written by the
+transaction are read back from the write buffer.
+
+:func:`run` calls a function with a new transaction and commits it, starting over when the commit fails on a
+conflict. This replaces read-modify-write loops of `test_and_set` calls with a single round trip per key read and a
+single sequence::
+
+    def transfer(transaction):
+        source = int(transaction.get('accounts/ann'))
+        target = int(transaction.get('accounts/bob'))
+        transaction.set('accounts/ann', str(source - 10))
+        transaction.set('accounts/bob', str(target + 10))
+
+    run(client, transfer)
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import collections
+
+from .retry import RetryPolicy
+from .utils import processor
+from .. import errors, protocol, sequence
+from ..constants.logging import PYRAKOON_CLIENT_LOGGER
+
+logger = logging.getLogger(PYRAKOON_CLIENT_LOGGER)
+
+
+class Transaction(object):
+    """
+    Read set and buffered writes of an optimistic transaction
+
+    Values are asserted as stored, so values compressed by the `value_codec` of the client are compared byte by
+    byte as well. Ranges and prefixes can't be read through a transaction.
+    """
+
+    def __init__(self, client, consistency=None):
+        """
+        :param client: Client to use, implementing :class:`pyrakoon.client.ClientMixin`
+        :type client: pyrakoon.client.AbstractClient
+        :param consistency: Consistency of reads, `None` for consistent reads
+        :type consistency: pyrakoon.consistency.Consistency
+        """
+        self._client = client
+        self._codec = client.value_codec
+        self._consistency = consistency
+
+        # Values observed by reads, as stored, by key. `None` denotes a key which didn't exist.
+        self._reads = {}
+        # Values to write by key, `None` denotes a delete
+        self._writes = collections.OrderedDict()
+        self.committed = False
+
+    @property
+    def read_set(self):
+        # type: () -> set
+        """
+        Keys read from the cluster
+        """
+        return set(self._reads)
+
+    @property
+    def write_set(self):
+        # type: () -> set
+        """
+        Keys written or deleted
+        """
+        return set(self._writes)
+
+    def _decode(self, value):
+        if value is None or self._codec is None:
+            return value
+        return self._codec.decode(value)
+
+    def get_many(self, keys):
+        """
+        Retrieve several values, using `None` for missing keys
+
+        Keys not read before are retrieved in a single call.
+
+        :param keys: Keys to retrieve
+        :type keys: list of str
+        :rtype: list of str
+        """
+        missing = [key for key in keys if key not in self._writes and key not in self._reads]
+        if missing:
+            message = protocol.MultiGetOption(self._consistency, missing)
+            values = self._client._process(message) #pylint: disable=W0212
+            self._reads.update(zip(missing, values))
+
+        return [self._writes[key] if key in self._writes else self._decode(self._reads[key]) for key in keys]
+
+    def get_option(self, key):
+        """
+        Retrieve a value
+
+        :param key: Key to retrieve
+        :type key: str
+        :return: Value, or `None` if the key doesn't exist
+        :rtype: str
+        """
+        return self.get_many([key])[0]
+
+    def get(self, key):
+        """
+        Retrieve a value
+
+        :param key: Key to retrieve
+        :type key: str
+        :rtype: str
+
+        :raise pyrakoon.errors.NotFound: The key doesn't exist
+        """
+        value = self.get_option(key)
+        if value is None:
+            raise errors.NotFound(key)
+        return value
+
+    def exists(self, key):
+        """
+        Check whether a key exists
+
+        The value of the key is read, and asserted on commit.
+
+        :param key: Key to check
+        :type key: str
+        :rtype: bool
+        """
+        return self.get_option(key) is not None
+
+    def set(self, key, value):
+        """
+        Set a key on commit
+
+        :param key: Key to set
+        :type key: str
+        :param value: Value to set
+        :type value: str
+        """
+        protocol.STRING.check(key)
+        protocol.STRING.check(value)
+        self._writes[key] = value
+
+    def delete(self, key):
+        """
+        Delete a key on commit, if it exists
+
+        :param key: Key to delete
+        :type key: str
+        """
+        protocol.STRING.check(key)
+        self._writes[key] = None
+
+    def commit(self, sync=False):
+        """
+        Assert all values read and apply the writes, in a single sequence
+
+        :param sync: Submit a synced sequence
+        :type sync: bool
+
+        :raise pyrakoon.errors.AssertionFailed: A key read by the transaction was changed
+        """
+        if self.committed:
+            raise RuntimeError('Transaction already committed')
+
+        builder = sequence.SequenceBuilder()
+        for key, value in self._reads.iteritems():
+            builder.add_assert(key, value)
+        for key, value in self._writes.iteritems():
+            if value is None:
+                builder.add_replace(key, None)
+            else:
+                builder.add_set(key, value if self._codec is None else self._codec.encode(key, value))
+
+        if len(builder) > 0:
+            processor(self._client)(protocol.Sequence([builder], sync))
+
+        self.committed = True
+
+
+def run(client, function, max_attempts=5, policy=None, timeout=None, consistency=None, sync=False):
+    """
+    Run a function in a transaction, starting over on conflicts
+
+    `function` is called with a new :class:`Transaction` on every attempt, and should not have side effects beyond
+    the transaction. Attempts are spaced using the backoff of `policy`.
+
+    :param client: Client to use, implementing :class:`pyrakoon.client.ClientMixin`
+    :type client: pyrakoon.client.AbstractClient
+    :param function: Callable taking a transaction
+    :type function: callable
+    :param max_attempts: Maximal number of attempts
+    :type max_attempts: int
+    :param policy: Retry policy providing backoff and a retry budget, which can be shared by several callers.
+     By default, a policy without a shared budget is used.
+    :type policy: pyrakoon.client.retry.RetryPolicy
+    :param timeout: Time after which no further attempts are made, in seconds, `None` for no limit
+    :type timeout: float
+    :param consistency: Consistency of reads, `None` for consistent reads
+    :type consistency: pyrakoon.consistency.Consistency
+    :param sync: Commit using synced sequences
+    :type sync: bool
+    :return: Result of `function` in the committed attempt
+
+    :raise pyrakoon.errors.AssertionFailed: The last attempt failed on a conflict
+    """
+    if max_attempts < 1:
+        raise ValueError('max_attempts must be positive')
+
+    if policy is None:
+        policy = RetryPolicy(base=0.01, cap=1.0, burst=max_attempts)
+    schedule = policy.start(None if timeout is None else time.time() + timeout)
+
+    attempt = 1
+    while True:
+        transaction = Transaction(client, consistency)
+        result = function(transaction)
+
+        try:
+            transaction.commit(sync)
+            return result
+        except errors.AssertionFailed:
+            sleep = schedule.next_sleep() if attempt < max_attempts else None
+            if sleep is None:
+                raise
+
+            logger.debug('Transaction conflict on attempt %d, retrying in %.3fs', attempt, sleep)
+            attempt += 1
+            time.sleep(sleep)
@@ -0,0 +1,429 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Structured values
+
+A :class:`TypedClient` wraps a client implementing :class:`pyrakoon.client.ClientMixin`, serializing values with the
+:class:`Serializer` registered for the longest matching key prefix. Results of `multi_get` are decoded in batches,
+one call per serializer. Entries returned by `range_entries` are decoded lazily, when they're accessed, so scans
+only looking at a few entries don't pay for decoding all of them:
+
+>>> JSON.loads_many(['{"name":"ann"}', '[1,2]', 'null'])
+[{u'name': u'ann'}, [1, 2], None]
+>>> entries = LazyEntries([('users/1', '{"name":"ann"}'), ('users/2', '{"name":"bob"}')], [JSON, JSON])
+>>> entries[1], entries.decoded
+(('users/2', {u'name': u'bob'}), 1)
+>>> entries.keys()
+['users/1', 'users/2']
+"""
+
+from __future__ import absolute_import
+
+import json
+import marshal
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from .. import sequence
+
+
+class Serializer(object):
+    """
+    Conversion between values and strings
+
+    Subclasses implement :meth:`dumps` and :meth:`loads`, and can override :meth:`dumps_many` and
+    :meth:`loads_many` with faster batch implementations.
+    """
+
+    name = None
+
+    def dumps(self, value):
+        """
+        Serialize a value
+
+        :rtype: str
+        """
+        raise NotImplementedError()
+
+    def loads(self, data):
+        """
+        Deserialize a value
+
+        :type data: str
+        """
+        raise NotImplementedError()
+
+    def dumps_many(self, values):
+        """
+        Serialize several values
+
+        :rtype: list of str
+        """
+        dumps = self.dumps
+        return [dumps(value) for value in values]
+
+    def loads_many(self, data):
+        """
+        Deserialize several values
+
+        :type data: list of str
+        :rtype: list
+        """
+        loads = self.loads
+        return [loads(data_) for data_ in data]
+
+    def __repr__(self):
+        return '<%s>' % type(self).__name__
+
+
+class RawSerializer(Serializer):
+    """
+    Values are stored as is, and must be strings
+    """
+
+    name = 'raw'
+
+    def dumps(self, value):
+        if not isinstance(value, str):
+            raise TypeError('Raw values must be strings')
+        return value
+
+    def loads(self, data):
+        return data
+
+    def loads_many(self, data):
+        return list(data)
+
+
+class JSONSerializer(Serializer):
+    """
+    Values are stored as compact JSON documents
+
+    Batches are decoded by running the scanner of the decoder on every value directly, which skips the whitespace
+    handling and checks of :meth:`loads`. A value is only accepted when it's scanned entirely as a single document,
+    other values are decoded using :meth:`loads`, which raises `ValueError` for invalid documents.
+    """
+
+    name = 'json'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder(separators=(',', ':'))
+        self._decoder = json.JSONDecoder()
+
+    def dumps(self, value):
+        return self._encoder.encode(value)
+
+    def loads(self, data):
+        return self._decoder.decode(data)
+
+    def loads_many(self, data):
+        scan = self._decoder.scan_once
+        loads = self.loads
+
+        values = []
+        for data_ in data:
+            try:
+                value, end = scan(data_, 0)
+            except StopIteration:
+                end = None
+            values.append(value if end == len(data_) else loads(data_))
+
+        return values
+
+
+class MarshalSerializer(Serializer):
+    """
+    Values are stored in the :mod:`marshal` format
+
+    The format depends on the Python version, and is restricted to builtin types.
+    """
+
+    name = 'marshal'
+
+    def dumps(self, value):
+        return marshal.dumps(value)
+
+    def loads(self, data):
+        return marshal.loads(data)
+
+
+class PickleSerializer(Serializer):
+    """
+    Values are stored as pickles
+
+    :warning: Unpickling data can execute arbitrary code, only use this on keys written by trusted clients.
+    """
+
+    name = 'pickle'
+
+    def __init__(self, protocol=pickle.HIGHEST_PROTOCOL):
+        """
+        :param protocol: Pickle protocol version
+        :type protocol: int
+        """
+        self._protocol = protocol
+
+    def dumps(self, value):
+        return pickle.dumps(value, self._protocol)
+
+    def loads(self, data):
+        return pickle.loads(data)
+
+
+RAW = RawSerializer()
+JSON = JSONSerializer()
+MARSHAL = MarshalSerializer()
+PICKLE = PickleSerializer()
+
+_UNDECODED = object()
+
+
+class LazyEntries(object):
+    """
+    Sequence of `(key, value)` pairs, deserializing values when they're accessed
+
+    Values are deserialized once, and cached.
+    """
+
+    def __init__(self, entries, serializers):
+        """
+        :param entries: Entries as returned by the client
+        :type entries: list of (str, str)
+        :param serializers: Serializer of every entry
+        :type serializers: list of Serializer
+        """
+        self._entries = entries
+        self._serializers = serializers
+        self._values = [_UNDECODED] * len(entries)
+        self.decoded = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[index_] for index_ in xrange(*index.indices(len(self)))]
+
+        return self._entries[index][0], self.value(index)
+
+    def __iter__(self):
+        for index in xrange(len(self._entries)):
+            yield self[index]
+
+    def __repr__(self):
+        return '<LazyEntries count=%d decoded=%d>' % (len(self), self.decoded)
+
+    def keys(self):
+        """
+        Keys of all entries, without deserializing any value
+
+        :rtype: list of str
+        """
+        return [key for (key, _) in self._entries]
+
+    def raw(self, index):
+        """
+        Serialized value of an entry
+
+        :rtype: str
+        """
+        return self._entries[index][1]
+
+    def value(self, index):
+        """
+        Deserialized value of an entry
+        """
+        value = self._values[index]
+        if value is _UNDECODED:
+            value = self._values[index] = self._serializers[index].loads(self._entries[index][1])
+            self.decoded += 1
+        return value
+
+    def decode_all(self):
+        """
+        Deserialize all remaining values in batches, one per serializer
+
+        :return: All entries
+        :rtype: list of (str, object)
+        """
+        pending = [index for (index, value) in enumerate(self._values) if value is _UNDECODED]
+        for serializer, indexes in _group(pending, lambda index: self._serializers[index]):
+            values = serializer.loads_many([self._entries[index][1] for index in indexes])
+            for index, value in zip(indexes, values):
+                self._values[index] = value
+            self.decoded += len(indexes)
+
+        return [(key, value) for ((key, _), value) in zip(self._entries, self._values)]
+
+
+def _group(items, get_serializer):
+    """
+    Group items by serializer, preserving their order within every group
+
+    :rtype: list of (Serializer, list)
+    """
+    groups = {}
+    order = []
+    for item in items:
+        serializer = get_serializer(item)
+        group = groups.get(id(serializer))
+        if group is None:
+            group = groups[id(serializer)] = []
+            order.append((serializer, group))
+        group.append(item)
+
+    return order
+
+
+class TypedClient(object):
+    """
+    Client wrapper serializing values by key prefix
+
+    Example usage::
+
+        users = TypedClient(client, serializers={'users/': JSON, 'sessions/': PICKLE})
+        users.set('users/ann', {'name': 'Ann', 'groups': ['admin']})
+        admins = [key for (key, user) in users.range_entries('users/', True, 'users0', False)
+                  if 'admin' in user['groups']]
+    """
+
+    def __init__(self, client, default=JSON, serializers=None):
+        """
+        :param client: Client to wrap
+        :type client: pyrakoon.client.ClientMixin
+        :param default: Serializer of keys not matching any prefix
+        :type default: Serializer
+        :param serializers: Serializers by key prefix
+        :type serializers: dict of (str, Serializer)
+        """
+        self.client = client
+        self._default = default
+        self._prefixes = []
+
+        for prefix, serializer in (serializers or {}).iteritems():
+            self.register(prefix, serializer)
+
+    def register(self, prefix, serializer):
+        """
+        Register the serializer of a key prefix
+
+        :param prefix: Key prefix
+        :type prefix: str
+        :param serializer: Serializer
+        :type serializer: Serializer
+        """
+        self._prefixes = [item for item in self._prefixes if item[0] != prefix] + [(prefix, serializer)]
+        self._prefixes.sort(key=lambda item: len(item[0]), reverse=True)
+
+    def serializer(self, key):
+        """
+        Look up the serializer of a key
+
+        :param key: Key
+        :type key: str
+        :rtype: Serializer
+        """
+        for prefix, serializer in self._prefixes:
+            if key.startswith(prefix):
+                return serializer
+
+        return self._default
+
+    def get(self, key, consistency=None):
+        """
+        Retrieve and deserialize a value
+
+        :raise pyrakoon.errors.NotFound: The key doesn't exist
+        """
+        return self.serializer(key).loads(self.client.get(key, consistency=consistency))
+
+    def set(self, key, value):
+        """
+        Serialize and store a value
+        """
+        self.client.set(key, self.serializer(key).dumps(value))
+
+    def set_many(self, items, sync=False):
+        """
+        Serialize and store several values in a single sequence
+
+        Values are serialized in batches, one per serializer.
+
+        :param items: `(key, value)` pairs
+        :type items: iterable of (str, object)
+        :param sync: Submit a synced sequence
+        :type sync: bool
+        """
+        items = list(items)
+        data = [None] * len(items)
+        for serializer, indexes in _group(range(len(items)), lambda index: self.serializer(items[index][0])):
+            for index, data_ in zip(indexes, serializer.dumps_many([items[index][1] for index in indexes])):
+                data[index] = data_
+
+        builder = sequence.SequenceBuilder(self.client.value_codec)
+        for (key, _), data_ in zip(items, data):
+            builder.add_set(key, data_)
+
+        self.client.sequence([builder], sync=sync)
+
+    def delete(self, key):
+        """
+        Delete a key
+        """
+        self.client.delete(key)
+
+    def multi_get(self, keys, consistency=None):
+        """
+        Retrieve and deserialize several values, in batches
+
+        :raise pyrakoon.errors.NotFound: A key doesn't exist
+        :rtype: list
+        """
+        return self._loads_many(keys, self.client.multi_get(keys, consistency=consistency))
+
+    def multi_get_option(self, keys, consistency=None):
+        """
+        Retrieve and deserialize several values, in batches, using `None` for missing keys
+
+        :rtype: list
+        """
+        data = self.client.multi_get_option(keys, consistency=consistency)
+        found = [index for (index, data_) in enumerate(data) if data_ is not None]
+        values = [None] * len(data)
+        for index, value in zip(found, self._loads_many([keys[index] for index in found],
+                                                        [data[index] for index in found])):
+            values[index] = value
+        return values
+
+    def range_entries(self, begin_key, begin_inclusive, end_key, end_inclusive, max_elements=-1, consistency=None):
+        """
+        Retrieve entries in a range, deserializing values when they're accessed
+
+        :rtype: LazyEntries
+        """
+        return self._lazy(self.client.range_entries(begin_key, begin_inclusive, end_key, end_inclusive,
+                                                    max_elements, consistency=consistency))
+
+    def rev_range_entries(self, begin_key, begin_inclusive, end_key, end_inclusive, max_elements=-1,
+                          consistency=None):
+        """
+        Retrieve entries in a range in reverse order, deserializing values when they're accessed
+
+        :rtype: LazyEntries
+        """
+        return self._lazy(self.client.rev_range_entries(begin_key, begin_inclusive, end_key, end_inclusive,
+                                                        max_elements, consistency=consistency))
+
+    def _lazy(self, entries):
+        return LazyEntries(entries, [self.serializer(key) for (key, _) in entries])
+
+    def _loads_many(self, keys, data):
+        values = [None] * len(data)
+        for serializer, indexes in _group(range(len(keys)), lambda index: self.serializer(keys[index])):
+            for index, value in zip(indexes, serializer.loads_many([data[index] for index in indexes])):
+                values[index] = value
+        return values
@@ -32,6 +32,50 @@ def validate_types(specs, args):
             raise ValueError('Invalid value of argument "%s"' % name)
 
 
+def processor(client):
+    """
+    Build a callable processing messages through the single-flight layer and negative cache of a client
+
+    Helpers sending messages on behalf of a client, like :class:`pyrakoon.client.transaction.Transaction`, use this
+    for their writes, so these layers observe them like writes through methods exposed by :func:`call`.
+
+    :param client: Client to process messages on
+    :type client: pyrakoon.client.AbstractClient
+
+    :return: Callable taking a message and returning its result
+    :rtype: callable
+    """
+    process = client._process #pylint: disable=W0212
+    if client.single_flight is not None:
+        process = functools.partial(client.single_flight.process, process)
+    if client.negative_cache is not None:
+        process = functools.partial(client.negative_cache.process, process)
+
+    return process
+
+
+def processor_many(client):
+    """
+    Build a callable processing several messages through the single-flight layer and negative cache of a client
+
+    :param client: Client to process messages on
+    :type client: pyrakoon.client.AbstractClient
+
+    :return: Callable taking a list of messages and returning their results, as
+     :meth:`pyrakoon.client.AbstractClient._process_many`
+    :rtype: callable
+
+    :see: :func:`processor`
+    """
+    process_many = client._process_many #pylint: disable=W0212
+    if client.single_flight is not None:
+        process_many = functools.partial(client.single_flight.process_many, process_many)
+    if client.negative_cache is not None:
+        process_many = functools.partial(client.negative_cache.process_many, process_many)
+
+    return process_many
+
+
 def call(message_type):
     # type: (Type[protocol.Message]) -> callable
     """
@@ -40,6 +84,12 @@ def call(message_type):
     :note: If the client method has a `consistency` option (i.e. :data:`pyrakoon.protocol.CONSISTENCY_ARG` is present
      in the :attr:`ARGS` field of `message_type`), an `allow_dirty`  argument is added automatically,
      and both are moved to the back.
+    :note: Values are encoded and decoded by the `value_codec` of the client, if any, see
+     :class:`pyrakoon.client.compression.ValueCodec`.
+    :note: Identical concurrent reads are coalesced by the `single_flight` of the client, if any, see
+     :class:`pyrakoon.client.singleflight.SingleFlight`.
+    :note: Inconsistent reads of keys known not to exist are answered by the `negative_cache` of the client, if any,
+     see :class:`pyrakoon.client.negativecache.NegativeCache`.
 
     :param message_type: Type of the message this method should call
     :type message_type: Type[protocol.Message]
@@ -83,9 +133,12 @@ def call(message_type):
             args = tuple(kwargs[arg[0]] for arg in message_type.ARGS)
             validate_types(message_type.ARGS, args)
 
-            message = message_type(*args)
+            process = processor(self)
+            codec = self.value_codec
+            if codec is None:
+                return process(message_type(*args))
 
-            return self._process(message)
+            return codec.process(process, message_type, args)
 
         wrapped.__doc__ = message_type.DOC
 
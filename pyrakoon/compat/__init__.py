@@ -5,7 +5,7 @@ from __future__ import absolute_import
 
 # When rewriting this, I don't know why the consistency classes were created once more but I did not want to break things
 # Backwards compatibility
-from .config import ArakoonClientConfig, ARA_CFG_CONN_BACKOFF, ARA_CFG_CONN_TIMEOUT, ARA_CFG_NO_MASTER_RETRY, ARA_CFG_TRY_CNT
+from .config import ArakoonClientConfig, create_ssl_context, ARA_CFG_CONN_BACKOFF, ARA_CFG_CONN_TIMEOUT, ARA_CFG_NO_MASTER_RETRY, ARA_CFG_TRY_CNT
 from .consistency import Consistency, Consistent, AtLeast, NoGuarantee
 from .errors import ArakoonException, ArakoonNotFound, ArakoonUnknownNode, ArakoonNodeNotLocal, ArakoonNotConnected,\
     ArakoonNoMaster, ArakoonNoMasterResult, ArakoonNodeNotMaster, ArakoonNodeNoLongerMaster, ArakoonGoingDown,\
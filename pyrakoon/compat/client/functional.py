@@ -12,10 +12,13 @@ import logging
 
 from .socket import ArakoonSocketClient
 from ..consistency import Consistency, Consistent, NoGuarantee, AtLeast
-from ..utils import convert_exceptions as _convert_exceptions, validate_signature as _validate_signature
+from ..utils import convert_exceptions as _convert_exceptions, validate_signature as _validate_signature, \
+    _convert_exception
 from ..sequence import Set, Delete, DeletePrefix, Assert, AssertExists, Replace, Sequence, AssertRange
 from ..errors import ArakoonException
 from ... import utils, consistency, sequence, protocol
+from ...client.bulk import BulkWriter
+from ...client.slowlog import SlowCallLog
 from ...constants.logging import PYRAKOON_COMPAT_LOGGER
 from ...protocol import admin
 
@@ -91,7 +94,7 @@ class ArakoonClient(object):
         @return : True if there is a value for that key, False otherwise
         """
 
-        return self._client.exists(key, consistency=consistency)
+        return self._client.exists(key, consistency=self._determine_consistency(consistency))
 
     @utils.update_argspec('self', 'key', ('consistency', None))
     @_convert_exceptions
@@ -139,56 +142,75 @@ class ArakoonClient(object):
         Try to execute a sequence of updates.
 
         It's all-or-nothing: either all updates succeed, or they all fail.
-        @type seq: Sequence
-        """
-
-        def convert_set(step):
-            return sequence.Set(step._key, step._value)
-
-        def convert_delete(step):
-            return sequence.Delete(step._key)
-
-        def convert_assert(step):
-            return sequence.Assert(step._key, step._value)
-
-        def convert_delete_prefix(step):
-            return sequence.DeletePrefix(step._prefix)
 
-        def convert_assert_exists(step):
-            return sequence.AssertExists(step._key)
-
-        def convert_replace(step):
-            return sequence.Replace(step._key, step._wanted)
-
-        def convert_assert_range(step):
-            return sequence.AssertRange(step._prefix, step._rangeAssertion)
+        Large sequences can be built using a L{pyrakoon.sequence.SequenceBuilder}, which serializes updates as
+        they're added, and passed as is. Such builders encode values using their own codec, not the one set using
+        L{setValueCodec}.
+        @type seq: Sequence or L{pyrakoon.sequence.SequenceBuilder}
+        """
 
         def convert_sequence(sequence_):
-            steps = []
+            builder = sequence.SequenceBuilder(self._client.value_codec)
 
             for step in sequence_._updates:
                 if isinstance(step, Set):
-                    steps.append(convert_set(step))
+                    builder.add_set(step._key, step._value)
                 elif isinstance(step, Delete):
-                    steps.append(convert_delete(step))
+                    builder.add_delete(step._key)
                 elif isinstance(step, DeletePrefix):
-                    steps.append(convert_delete_prefix(step))
+                    builder.add_delete_prefix(step._prefix)
                 elif isinstance(step, Assert):
-                    steps.append(convert_assert(step))
+                    builder.add_assert(step._key, step._value)
                 elif isinstance(step, AssertExists):
-                    steps.append(convert_assert_exists(step))
+                    builder.add_assert_exists(step._key)
                 elif isinstance(step, Sequence):
-                    steps.append(convert_sequence(step))
+                    builder.add_step(convert_sequence(step))
                 elif isinstance(step, Replace):
-                    steps.append(convert_replace(step))
+                    builder.add_replace(step._key, step._wanted)
                 elif isinstance(step, AssertRange):
-                    steps.append(convert_assert_range(step))
+                    builder.add_step(sequence.AssertRange(step._prefix, step._rangeAssertion))
                 else:
                     raise TypeError
 
-            return sequence.Sequence(steps)
+            return builder
+
+        if not isinstance(seq, sequence.SequenceBuilder):
+            seq = convert_sequence(seq)
 
-        return self._client.sequence((convert_sequence(seq),), sync=sync)
+        return self._client.sequence((seq,), sync=sync)
+
+    def bulkWrite(self, operations, maxBytes=1024 * 1024, maxSteps=1000, maxInFlight=4, sync=False, progress=None):
+        """
+        Write a large number of sets and deletes, split into sequences of limited size
+
+        Unlike L{sequence}, this is not atomic: every batch succeeds or fails on its own. Up to C{maxInFlight}
+        batches are sent before their results are read.
+
+        @type operations: iterable
+        @param operations: C{(key, value)} pairs, where a value of None deletes the key, or L{pyrakoon.sequence.Step}
+            instances
+        @type maxBytes: int
+        @param maxBytes: Maximal size of a batch, in bytes
+        @type maxSteps: int
+        @param maxSteps: Maximal number of operations in a batch
+        @type maxInFlight: int
+        @param maxInFlight: Maximal number of batches sent before their results are read
+        @type sync: bool
+        @param sync: Submit batches as synced sequences
+        @type progress: callable
+        @param progress: Called with the result of every batch, in order
+        @rtype: list of L{pyrakoon.client.bulk.BatchResult}
+        @return: Result of every batch, in order
+        """
+
+        def convert(result):
+            if result.error is not None:
+                result.error = _convert_exception(result.error)
+            if progress is not None:
+                progress(result)
+
+        writer = BulkWriter(self._client, maxBytes, maxSteps, maxInFlight, sync, convert)
+        return writer.write(operations)
 
     @utils.update_argspec('self', 'key')
     @_convert_exceptions
@@ -539,6 +561,151 @@ class ArakoonClient(object):
     def dropConnections(self):
         return self._client.drop_connections()
 
+    def metrics(self):
+        """
+        Take a snapshot of the call metrics recorded by this client
+
+        Next to per-message call counts, error counts and latency histograms, this includes the number of retries and
+        master lookups.
+
+        @rtype: dict
+        @return: Metrics as documented in L{pyrakoon.client.metrics.ClientMetrics.snapshot}
+        """
+        return self._client.metrics()
+
+    def setSlowCallThreshold(self, threshold, callback=None, sampleRate=1.0, maxPerSecond=10.0):
+        """
+        Report calls taking longer than a threshold
+
+        Slow calls are logged as warnings on the compat logger, or passed to the callback as
+        L{pyrakoon.client.slowlog.SlowCall} records, which split the time spent waiting for the client lock from
+        the time spent on the wire.
+
+        @type threshold: float
+        @param threshold: Minimal duration of a call to be reported, in seconds, or None to disable reporting
+        @type callback: callable
+        @param callback: Callable receiving every reported record
+        @type sampleRate: float
+        @param sampleRate: Fraction of slow calls to report, between 0 and 1
+        @type maxPerSecond: float
+        @param maxPerSecond: Maximal average number of reports per second, or None to report all
+        """
+        if threshold is None:
+            self._client.slow_call_log = None
+        else:
+            self._client.slow_call_log = SlowCallLog(threshold, callback, sampleRate, maxPerSecond, logger=logger)
+
+    def setHedgePolicy(self, policy):
+        """
+        Hedge reads which don't require consistency
+
+        Reads using the NoGuarantee or AtLeast consistency which aren't answered by the master within the delay of
+        the policy are sent to another node as well, and the first reply is used.
+
+        @type policy: L{pyrakoon.client.hedging.HedgePolicy}
+        @param policy: Hedge policy, or None to disable hedging
+        """
+        self._client.hedge_policy = policy
+
+    def setValueCodec(self, codec):
+        """
+        Compress values transparently
+
+        Values are compressed before they're written, and decompressed in the results of reads, L{testAndSet} and
+        L{replace}. Values written without compression can still be read.
+
+        @type codec: L{pyrakoon.client.compression.ValueCodec}
+        @param codec: Value codec, or None to disable compression
+        """
+        self._client.value_codec = codec
+
+    def setSingleFlight(self, singleFlight):
+        """
+        Coalesce identical concurrent reads
+
+        A read issued while an identical read is in flight waits for the reply of that read, instead of queueing
+        a request of its own.
+
+        @type singleFlight: L{pyrakoon.client.singleflight.SingleFlight}
+        @param singleFlight: Registry of reads in flight, or None to disable coalescing
+        """
+        self._client.single_flight = singleFlight
+
+    def setNegativeCache(self, cache):
+        """
+        Remember keys found not to exist
+
+        Reads of missing keys using the NoGuarantee consistency are answered from the cache until its entries expire.
+        Entries are removed when this client writes their keys.
+
+        @type cache: L{pyrakoon.client.negativecache.NegativeCache}
+        @param cache: Negative cache, or None to disable caching
+        """
+        self._client.negative_cache = cache
+
+    def setHealthTracker(self, tracker):
+        """
+        Track the health of nodes, skipping sick ones
+
+        Nodes failing repeatedly are skipped for a cool-down period, after which they are probed with a Nop call
+        before being used again. Master discovery and hedged reads prefer healthy nodes.
+
+        @type tracker: L{pyrakoon.client.health.HealthTracker}
+        @param tracker: Health tracker, or None to disable tracking
+        """
+        self._client.health_tracker = tracker
+
+    def warmUp(self, validate=True, timeout=None):
+        """
+        Connect to all nodes in parallel and look up the master, before the client takes traffic
+
+        @type validate: bool
+        @param validate: Whether to check new connections with a Hello call
+        @type timeout: float
+        @param timeout: Maximal time to wait for connections to be set up, in seconds, or None to wait until all
+            connection attempts finished
+        @rtype: dict
+        @return: Whether a connection to each node is available, by node
+        """
+        return self._client.warm_up(validate=validate, timeout=timeout)
+
+    def setRetryPolicy(self, policy):
+        """
+        Set the policy scheduling retries of calls while no master is available
+
+        @type policy: L{pyrakoon.client.retry.RetryPolicy}
+        @param policy: Retry policy
+        """
+        self._client.retry_policy = policy
+
+    def deadline(self, timeout):
+        """
+        Limit the time calls made by the current thread can take, including retries
+
+        Usage::
+
+            with client.deadline(0.5):
+                client.get('key')
+
+        @type timeout: float
+        @param timeout: Time in seconds
+        @return: Context manager
+        """
+        return self._client.deadline(timeout)
+
+    def setWarmUpAfterFork(self, enabled=True):
+        """
+        Connect to all nodes as soon as the client is used in a forked child process
+
+        Clients can be created before forking, e.g. in the master process of a prefork server: connections, locks
+        and the cached master inherited from the parent are dropped when a child first uses the client. With this
+        setting, the child then warms up all connections at once, see L{warmUp}.
+
+        @type enabled: bool
+        @param enabled: Whether to warm up after a fork
+        """
+        self._client.warm_up_after_fork = enabled
+
     _masterId = property(
         lambda self: self._client.master_id,
         lambda self, v: setattr(self._client, 'master_id', v))
@@ -8,6 +8,7 @@ Communicates to the Arakoon server with sockets
 
 from __future__ import absolute_import
 
+import os
 import ssl
 import time
 import random
@@ -15,23 +16,69 @@ import select
 import socket
 import logging
 import threading
+import contextlib
 
-from ..config import ArakoonClientConfig
+from ..config import ArakoonClientConfig, create_ssl_context
 from ..errors import ArakoonNotConnected, ArakoonNoMaster, ArakoonSockReadNoBytes,\
     ArakoonSockNotReadable, ArakoonSockRecvError, ArakoonSockRecvClosed, ArakoonSockSendError
-from ... import utils, protocol, errors, client
+from ... import utils, protocol, errors, client, profiling, tracing
+from ...client.metrics import ClientMetrics, CountingReader
+from ...client.retry import RetryPolicy
 from ...constants.logging import PYRAKOON_COMPAT_LOGGER
 
 logger = logging.getLogger(PYRAKOON_COMPAT_LOGGER)
 
+# Serializes resets of client state after a fork, see `ArakoonSocketClient._check_fork`
+_FORK_LOCK = threading.Lock()
+# Process owning `_FORK_LOCK`
+_FORK_LOCK_PID = os.getpid()
+
+
+def _fork_lock():
+    """
+    Get the lock serializing resets of client state after a fork
+
+    The lock may have been held by another thread of the parent process at fork time, so a child gets a lock of its
+    own. Right after a fork, the child runs a single thread, which resets the lock before starting others.
+
+    @rtype: L{threading.Lock}
+    """
+    global _FORK_LOCK, _FORK_LOCK_PID #pylint: disable=W0603
+
+    pid = os.getpid()
+    if pid != _FORK_LOCK_PID:
+        _FORK_LOCK = threading.Lock()
+        _FORK_LOCK_PID = pid
+    return _FORK_LOCK
+
 
 class ArakoonSocketClient(client.AbstractClient, client.ClientMixin):
+    # Client identifier sent when validating connections, see `warm_up`
+    WARM_UP_CLIENT_ID = 'pyrakoon'
+
     def __init__(self, config, timeout=0, noMasterTimeout=0):
         self._config = config
         self.master_id = None
 
         self._lock = threading.RLock()
+        self._metrics = ClientMetrics()
         self._connections = dict()
+        # Messages whose replies are still to be read and discarded, by node, see `_send_hedged`
+        self._draining = dict()
+        # Set to a `pyrakoon.client.hedging.HedgePolicy` to hedge eligible reads
+        self.hedge_policy = None
+        # Set to a `pyrakoon.client.health.HealthTracker` to skip sick nodes
+        self.health_tracker = None
+        # Schedules retries of calls failing while no master is available
+        self.retry_policy = RetryPolicy()
+        # Incremented whenever a master discovery completes, see `determine_master`
+        self._discovery_generation = 0
+        # Per-thread call deadline, see `deadline`
+        self._local = threading.local()
+        # Process owning the connections and the lock, see `_check_fork`
+        self._pid = os.getpid()
+        # Whether to connect to all nodes once a fork was detected, see `warm_up`
+        self.warm_up_after_fork = False
         self._timeout = timeout
         if (isinstance(timeout, (int, float)) and timeout > 0) or timeout is None:
             self._master_timeout = noMasterTimeout
@@ -43,93 +90,475 @@ class ArakoonSocketClient(client.AbstractClient, client.ClientMixin):
         return True
 
     def _process(self, message, node_id=None, retry=True):
-
-        bytes_ = ''.join(message.serialize())
-
-        self._lock.acquire()
-
+        self._check_fork()
+
+        trace = tracing.start(message, node_id)
+        profile = profiling.start(message)
+        bytes_ = ''.join(message.serialize()) if profile is None else profile.serialize()
+
+        start = time.time()
+        lock_wait = 0.0
+        error = None
+        bytes_sent = 0
+        bytes_received = 0
+        # Node which was sent the request whose reply is read, the winner of hedged reads
+        answering = node_id
+        deadline = start + self._master_timeout
+        call_deadline = getattr(self._local, 'deadline', None)
+        if call_deadline is not None:
+            deadline = min(deadline, call_deadline)
+        schedule = self.retry_policy.start(deadline)
+        failed_sends = 0
         try:
-            start = time.time()
-            tryCount = 0.0
-            backoffPeriod = 0.2
-            deadline = start + self._master_timeout
             while True:
+                generation = self._discovery_generation
+                acquiring = time.time()
+                self._lock.acquire()
+                lock_wait += time.time() - acquiring
+                backoff = False
                 try:
                     # Send on wire
-                    if node_id is None:
-                        connection = self._send_to_master(bytes_)
+                    sends = 1
+                    target = node_id
+                    hedge_won = False
+                    attempt = time.time()
+                    try:
+                        if node_id is not None:
+                            connection = self._send_message(node_id, bytes_)
+                        elif self.hedge_policy is not None and self.hedge_policy.eligible(message):
+                            target, connection, sends = self._send_hedged(message, bytes_, generation)
+                            hedge_won = target != self.master_id
+                        else:
+                            connection = self._send_to_master(bytes_, generation)
+                    except (ArakoonNotConnected, ArakoonSockSendError):
+                        failed_sends += 1
+                        if not retry or failed_sends >= self._config.getTryCount():
+                            raise
+                        # Back off as configured for the compat client, within the deadline and retry budget
+                        sleepPeriod = schedule.next_sleep(
+                            random.randint(0, failed_sends * ArakoonClientConfig.getBackoffInterval()))
+                        if sleepPeriod is None:
+                            raise
+                        backoff = True
+                        self._metrics.add_retry()
                     else:
-                        connection = self._send_message(node_id, bytes_)
-                    return utils.read_blocking(message.receive(),
-                                               connection.read)
+                        # The master may have been looked up by this attempt, and must be forgotten if it isn't
+                        generation = self._discovery_generation
+                        bytes_sent += len(bytes_) * sends
+                        target = answering = target or self.master_id
+                        if trace is None:
+                            read = CountingReader(connection.read)
+                        else:
+                            trace.written(len(bytes_) * sends, target)
+                            read = CountingReader(trace.reader(connection.read))
+                        try:
+                            result = utils.read_blocking(message.receive(), read, profile)
+                        except errors.ArakoonError:
+                            # The node replied
+                            self._record_health(target, time.time() - attempt)
+                            raise
+                        except Exception as e:
+                            self._record_health(target, error=e)
+                            raise
+                        finally:
+                            bytes_received += read.count
+                        self._record_health(target, time.time() - attempt)
+                        if trace is not None:
+                            trace.decoded()
+                        return result
                 except (errors.NotMaster,
                         ArakoonNoMaster,
                         ArakoonNotConnected,
                         ArakoonSockReadNoBytes):
-                    self.master_id = None
-                    self.drop_connections()
-
-                    sleepPeriod = backoffPeriod * tryCount
-                    if retry and time.time() + sleepPeriod <= deadline:
-                        tryCount += 1.0
-                        logger.warning('Master not found, retrying in %0.2f seconds' % sleepPeriod)
-                        time.sleep(sleepPeriod)
-                    else:
+                    if not hedge_won:
+                        # A failing hedge target tells nothing about the master
+                        self._invalidate_master(generation)
+
+                    sleepPeriod = schedule.next_sleep() if retry else None
+                    if sleepPeriod is None:
                         raise
+                    self._metrics.add_retry()
+                finally:
+                    self._lock.release()
+
+                # Sleep without holding the lock, so other calls can proceed
+                if backoff:
+                    logger.warning('Sending message failed, retrying in %d seconds' % sleepPeriod)
+                else:
+                    logger.warning('Master not found, retrying in %0.2f seconds' % sleepPeriod)
+                time.sleep(sleepPeriod)
+        except Exception as exc:
+            error = exc
+            if trace is not None:
+                trace.failed(exc)
+            raise
+        finally:
+            end = time.time()
+            self._metrics.record(message, end - start - lock_wait, error, bytes_sent, bytes_received)
+            if profile is not None:
+                profile.finish(error)
+            if self.slow_call_log is not None:
+                self.slow_call_log.observe(message, lock_wait, end - start - lock_wait, answering or self.master_id,
+                                           bytes_sent, bytes_received, schedule.retries, error)
+
+    def _process_many(self, messages):
+        """
+        Pipeline messages to the master: all requests are sent before any reply is read
+
+        Messages aren't retried. When the connection fails, all messages whose reply wasn't read yet fail with the
+        same exception, although the master may have processed them.
+
+        @type messages: list of L{pyrakoon.protocol.Message}
+        @param messages: Messages to process
+        @rtype: list
+        @return: Result of every message, or the exception it failed with
+        """
+        self._check_fork()
+
+        data = [''.join(message.serialize()) for message in messages]
+        results = []
+        start = time.time()
+
+        with self._lock:
+            lock_wait = time.time() - start
+            generation = self._discovery_generation
+            failure = None
+            try:
+                connection = self._send_to_master(''.join(data), generation)
+                generation = self._discovery_generation
+            except Exception as e: #pylint: disable=W0703
+                failure = e
+
+            master_id = self.master_id
+            for message, bytes_ in zip(messages, data):
+                if failure is not None:
+                    results.append(failure)
+                    self._metrics.record(message, time.time() - start - lock_wait, failure, len(bytes_), 0)
+                    continue
+
+                read = CountingReader(connection.read)
+                error = None
+                try:
+                    results.append(utils.read_blocking(message.receive(), read))
+                except errors.ArakoonError as e:
+                    # The node replied, the connection can be read from
+                    error = e
+                    results.append(e)
+                except Exception as e: #pylint: disable=W0703
+                    error = failure = e
+                    results.append(e)
+                finally:
+                    self._metrics.record(message, time.time() - start - lock_wait, error, len(bytes_), read.count)
+
+            if failure is not None:
+                self._record_health(master_id, error=failure)
+            else:
+                self._record_health(master_id, time.time() - start - lock_wait)
+
+            if failure is not None or any(isinstance(result, errors.NotMaster) for result in results):
+                self._invalidate_master(generation)
+
+        return results
+
+    def _check_fork(self):
+        """
+        Reset the state inherited from the parent process when running in a forked child
+
+        Connections inherited from the parent can't be used, since both processes would interleave requests and read
+        each other's replies, and the lock may have been held by another thread of the parent at fork time. The
+        connections are closed in the child only, the parent can keep using its own.
+
+        @rtype: bool
+        @return: Whether the state was reset
+        """
+        pid = os.getpid()
+        if pid == self._pid:
+            return False
 
+        with _fork_lock():
+            if pid == self._pid:
+                return False
+
+            self._lock = threading.RLock()
+            for connection in self._connections.itervalues():
+                connection.close()
+            self._connections = dict()
+            self._draining = dict()
+            self.master_id = None
+            self._discovery_generation += 1
+            self._local = threading.local()
+            self._metrics = ClientMetrics()
+            self._pid = pid
+
+        logger.info('Fork detected, dropped client state inherited from the parent process')
+
+        if self.warm_up_after_fork:
+            self.warm_up()
+
+        return True
+
+    @contextlib.contextmanager
+    def deadline(self, timeout):
+        """
+        Limit the time calls made by the current thread within the block, including retries, can take
+
+        Retries are abandoned once the deadline passed. A single attempt is still bound by the connection timeout.
+
+        @type timeout: float
+        @param timeout: Time in seconds
+        """
+        previous = getattr(self._local, 'deadline', None)
+        deadline = time.time() + timeout
+        self._local.deadline = deadline if previous is None else min(previous, deadline)
+        try:
+            yield
         finally:
-            self._lock.release()
+            self._local.deadline = previous
 
-    def _send_message(self, node_id, data, count=-1):
-        result = None
+    def _invalidate_master(self, generation):
+        """
+        Forget the master after a call failed, unless it was rediscovered since the call started
 
-        if count < 0:
-            count = self._config.getTryCount()
+        @type generation: int
+        @param generation: Value of the discovery generation when the failed call started
+        """
+        if generation == self._discovery_generation:
+            self.master_id = None
+            self.drop_connections()
 
-        last_exception = None
-        for i in xrange(count):
-            if i > 0:
-                max_sleep = i * ArakoonClientConfig.getBackoffInterval()
-                time.sleep(random.randint(0, max_sleep))
+    def _send_message(self, node_id, data):
+        """
+        Send a message to a node, in a single attempt
 
-            self._lock.acquire()
-            try:
-                connection = self._get_connection(node_id)
-                connection.send(data)
+        Failed sends are retried by L{_process}, which backs off without holding the lock.
 
-                result = connection
-                break
-            except Exception as e:
-                last_exception = e
-                logger.exception('%s : Message exchange with node %s failed',
-                                 e, node_id)
-                try:
-                    self._connections.pop(node_id).close()
-                finally:
-                    self.master_id = None
+        @rtype: L{ArakoonSocketClientConnection}
+        @return: Connection to read the reply from
+        """
+        self._check_health(node_id)
+
+        self._lock.acquire()
+        try:
+            connection = self._get_connection(node_id)
+            connection.send(data)
+        except Exception as e:
+            self._record_health(node_id, error=e)
+            logger.exception('%s : Message exchange with node %s failed',
+                             e, node_id)
+            try:
+                connection = self._connections.pop(node_id, None)
+                if connection is not None:
+                    connection.close()
             finally:
-                self._lock.release()
+                self.master_id = None
+            raise
+        finally:
+            self._lock.release()
+
+        return connection
+
+    def _record_health(self, node_id, latency=None, error=None):
+        """
+        Record the outcome of a call to a node in the health tracker, if any
+        """
+        if self.health_tracker is None or node_id is None:
+            return
+
+        if error is None:
+            self.health_tracker.record_success(node_id, latency)
+        else:
+            self.health_tracker.record_failure(node_id, timeout=isinstance(error, ArakoonSockNotReadable))
+
+    def _check_health(self, node_id):
+        """
+        Make sure a node can be used, probing it when its circuit is half-open
+
+        @raise ArakoonNotConnected: The circuit of the node is open, or the probe failed
+        """
+        health = self.health_tracker
+        if health is None or health.available(node_id):
+            return
 
-        if not result:
-            raise last_exception
+        if health.acquire_probe(node_id) and self._probe(node_id):
+            return
 
-        return result
+        raise ArakoonNotConnected(self._config.getNodeLocation(node_id))
 
-    def _send_to_master(self, data):
-        self.determine_master()
+    def _probe(self, node_id):
+        """
+        Probe a node with a `Nop` call, recording the outcome in the health tracker
+
+        @rtype: bool
+        @return: Whether the node replied
+        """
+        message = protocol.Nop()
+        data = ''.join(message.serialize())
+
+        start = time.time()
+        try:
+            connection = self._get_connection(node_id)
+            connection.send(data)
+            utils.read_blocking(message.receive(), connection.read)
+        except errors.ArakoonError:
+            # An error reply, e.g. from a node which isn't master, is fine
+            pass
+        except Exception as e: #pylint: disable=W0703
+            logger.warning('%s: Probe of node %s failed', e, node_id)
+            self._record_health(node_id, error=e)
+            connection = self._connections.pop(node_id, None)
+            if connection is not None:
+                connection.close()
+            return False
+
+        self._record_health(node_id, time.time() - start)
+        return True
+
+    def _send_to_master(self, data, generation=None):
+        self.determine_master(generation)
 
         connection = self._send_message(self.master_id, data)
 
         return connection
 
+    def _send_hedged(self, message, data, generation=None):
+        """
+        Send a read to the master, and to another node if the master doesn't reply within the hedge delay
+
+        The reply which arrives first wins. The reply to the other request is read and discarded before its
+        connection is used again.
+
+        Like any other call, this blocks while holding the client lock. Waiting for either reply is bound by the
+        connection timeout, counted from when the request was sent to the master, as when reading an unhedged reply.
+
+        @type message: L{pyrakoon.protocol.Message}
+        @param message: Message to send, eligible according to L{hedge_policy}
+        @type data: string
+        @param data: Serialized message
+        @type generation: int
+        @param generation: See L{determine_master}
+        @rtype: (string, L{ArakoonSocketClientConnection}, int)
+        @return: Node whose reply to read, its connection, and the number of requests sent
+        @raise ArakoonSockNotReadable: No reply arrived within the connection timeout
+        """
+        policy = self.hedge_policy
+        delay = policy.start()
+
+        self.determine_master(generation)
+        primary = self.master_id
+        connection = self._send_message(primary, data)
+        sent = time.time()
+
+        if _wait_readable([connection], delay):
+            policy.record(time.time() - sent)
+            return primary, connection, 1
+
+        others = [node for node in self._config.getNodes() if node != primary]
+        if self.health_tracker is not None:
+            others = [node for node in others if self.health_tracker.available(node)]
+        hedge = None
+        if others and policy.acquire():
+            hedge_node = random.choice(others)
+            try:
+                hedge = self._send_hedge(hedge_node, data)
+            except Exception as e: #pylint: disable=W0703
+                logger.warning('%s: Unable to send hedged read to node %s', e, hedge_node)
+
+        candidates = [connection] if hedge is None else [connection, hedge]
+        timeout = connection.timeout
+        ready = _wait_readable(candidates, None if timeout is None else max(timeout - (time.time() - sent), 0))
+        if not ready:
+            # Reading would wait for another full timeout
+            connection.close()
+            if hedge is not None:
+                self._connections.pop(hedge_node).close()
+            error = ArakoonSockNotReadable()
+            self._record_health(primary, error=error)
+            raise error
+
+        policy.record(time.time() - sent)
+        if hedge is None:
+            return primary, connection, 1
+
+        if connection not in ready:
+            self._draining[primary] = message
+            self._metrics.add_hedge(True)
+            return hedge_node, hedge, 2
+
+        self._draining[hedge_node] = message
+        self._metrics.add_hedge(False)
+        return primary, connection, 2
+
+    def _send_hedge(self, node_id, data):
+        """
+        Send a hedged read to a node other than the master, without retries
+
+        Unlike L{_send_message}, a failure doesn't make the client forget the master.
+
+        @rtype: L{ArakoonSocketClientConnection}
+        @return: Connection to read the reply from
+        """
+        try:
+            connection = self._get_connection(node_id)
+            connection.send(data)
+        except Exception as e: #pylint: disable=W0703
+            self._record_health(node_id, error=e)
+            connection = self._connections.pop(node_id, None)
+            if connection is not None:
+                connection.close()
+            raise
+
+        return connection
+
+    def _drain(self, node_id, connection):
+        """
+        Discard the reply of a hedged read which lost, or drop the connection if it didn't arrive yet
+
+        @rtype: L{ArakoonSocketClientConnection}
+        @return: The connection if it can be reused, else None
+        """
+        message = self._draining.pop(node_id)
+
+        if _wait_readable([connection], 0):
+            try:
+                utils.read_blocking(message.receive(), connection.read)
+                return connection
+            except errors.ArakoonError:
+                # Error reply, read entirely
+                return connection
+            except Exception as e: #pylint: disable=W0703
+                logger.warning('%s: Unable to drain hedged reply from node %s', e, node_id)
+
+        self._connections.pop(node_id).close()
+        return None
+
     def drop_connections(self):
+        self._check_fork()
+
         for key in tuple(self._connections.iterkeys()):
             self._connections.pop(key).close()
+        self._draining.clear()
+
+    def determine_master(self, generation=None):
+        """
+        Look up the master node, unless it's known
+
+        Callers waiting for the lock while another caller looks up the master share its result: when a lookup
+        completed since `generation` was read and didn't find a master, L{ArakoonNoMaster} is raised right away.
+
+        @type generation: int
+        @param generation: Value of the discovery generation read before waiting for the lock, if any
+        @raise ArakoonNoMaster: No master was found
+        """
+        if self.master_id is None and generation is not None and generation != self._discovery_generation:
+            raise ArakoonNoMaster
 
-    def determine_master(self):
         if self.master_id is None:
+            self._metrics.add_master_rediscovery()
             node_ids = self._config.getNodes().keys()
             random.shuffle(node_ids)
+            if self.health_tracker is not None:
+                # Nodes are popped from the end, so healthy nodes go last
+                node_ids = self.health_tracker.order(node_ids)[::-1]
             while self.master_id is None and node_ids:
                 node = node_ids.pop()
                 try:
@@ -151,6 +580,8 @@ class ArakoonSocketClient(client.AbstractClient, client.ClientMixin):
                     logger.exception(
                         '%s: Unable to query node "%s" to look up master', e, node)
 
+            self._discovery_generation += 1
+
         if not self.master_id:
             logger.error('Unable to determine master node')
             raise ArakoonNoMaster
@@ -177,25 +608,117 @@ class ArakoonSocketClient(client.AbstractClient, client.ClientMixin):
 
         if node_id in self._connections:
             connection = self._connections[node_id]
+            if node_id in self._draining:
+                connection = self._drain(node_id, connection)
 
         if not connection:
-            node_location = self._config.getNodeLocation(node_id)
-            connection = ArakoonSocketClientConnection(node_location,
-                                                       self._config.getClusterId(),
-                                                       self._config.tls, self._config.tls_ca_cert,
-                                                       self._config.tls_cert,
-                                                       self._timeout)
+            self._draining.pop(node_id, None)
+            connection = self._new_connection(node_id)
             connection.connect()
 
             self._connections[node_id] = connection
 
         return connection
 
+    def _new_connection(self, node_id):
+        node_location = self._config.getNodeLocation(node_id)
+        return ArakoonSocketClientConnection(node_location,
+                                             self._config.getClusterId(),
+                                             self._config.tls, self._config.tls_ca_cert,
+                                             self._config.tls_cert,
+                                             self._timeout,
+                                             self._config.ssl_context)
+
+    def warm_up(self, validate=True, determine_master=True, timeout=None):
+        """
+        Connect to all configured nodes in parallel, so the first calls don't pay for connection setup
+
+        Connections which are set up successfully are added to the connection pool, unless a connection to the node
+        is already available.
+
+        @type validate: bool
+        @param validate: Whether to check new connections with a Hello call
+        @type determine_master: bool
+        @param determine_master: Whether to look up the master once connected
+        @type timeout: float
+        @param timeout: Maximal time to wait for connections to be set up, in seconds, or None to wait until all
+            connection attempts finished
+        @rtype: dict
+        @return: Whether a connection to each node is available, by node
+        """
+        self._check_fork()
+
+        node_ids = self._config.getNodes().keys()
+        connections = {}
+        # Connections set up after the timeout are closed, since nothing else would
+        abandoned = []
+        abandoned_lock = threading.Lock()
+
+        def connect(node_id):
+            connection = self._new_connection(node_id)
+            start = time.time()
+            connection.connect()
+            if connection.connected and validate:
+                message = protocol.Hello(self.WARM_UP_CLIENT_ID, self._config.getClusterId())
+                try:
+                    connection.send(''.join(message.serialize()))
+                    utils.read_blocking(message.receive(), connection.read)
+                except Exception as e: #pylint: disable=W0703
+                    logger.warning('%s: Validation of connection to node %s failed', e, node_id)
+                    connection.close()
+                    self._record_health(node_id, error=e)
+                else:
+                    self._record_health(node_id, time.time() - start)
+            with abandoned_lock:
+                if abandoned:
+                    connection.close()
+                else:
+                    connections[node_id] = connection
+
+        threads = []
+        for node_id in node_ids:
+            thread = threading.Thread(target=connect, args=(node_id,), name='pyrakoon-warm-up-%s' % node_id)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+
+        deadline = None if timeout is None else time.time() + timeout
+        for thread in threads:
+            thread.join(None if deadline is None else max(deadline - time.time(), 0))
+
+        with abandoned_lock:
+            abandoned.append(True)
+            connections = dict(connections)
+
+        results = {}
+        with self._lock:
+            for node_id in node_ids:
+                connection = connections.get(node_id)
+                existing = self._connections.get(node_id)
+                if existing is not None and existing.connected:
+                    if connection is not None:
+                        connection.close()
+                    results[node_id] = True
+                elif connection is not None and connection.connected:
+                    self._connections[node_id] = connection
+                    self._draining.pop(node_id, None)
+                    results[node_id] = True
+                else:
+                    results[node_id] = False
+
+            if determine_master:
+                try:
+                    self.determine_master()
+                except ArakoonNoMaster:
+                    logger.warning('Unable to determine master node during warm-up')
+
+        return results
+
 
 class ArakoonSocketClientConnection(object):
     def __init__(self, address, cluster_id,
                  tls, tls_ca_cert, tls_cert,
-                 timeout=0):
+                 timeout=0, ssl_context=None):
         self._address = address
         self._connected = False
         self._socket = None
@@ -203,6 +726,9 @@ class ArakoonSocketClientConnection(object):
         self._tls = tls
         self._tls_ca_cert = tls_ca_cert
         self._tls_cert = tls_cert
+        if tls and ssl_context is None:
+            ssl_context = create_ssl_context(tls_ca_cert, tls_cert)
+        self._ssl_context = ssl_context
         if (isinstance(timeout, (int, float)) and timeout > 0) or timeout is None:
             self._timeout = timeout
         else:
@@ -225,22 +751,7 @@ class ArakoonSocketClientConnection(object):
             self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, max_fails)
 
             if self._tls:
-                kwargs = {
-                    'ssl_version': ssl.PROTOCOL_TLSv1,
-                    'cert_reqs': ssl.CERT_OPTIONAL,
-                    'do_handshake_on_onnect': True
-                }
-
-                if self._tls_ca_cert:
-                    kwargs['cert_reqs'] = ssl.CERT_REQUIRED
-                    kwargs['ca_certs'] = self._tls_ca_cert
-
-                if self._tls_cert:
-                    cert, key = self._tls_cert
-                    kwargs['keyfile'] = key
-                    kwargs['certfile'] = cert
-
-                self._socket = ssl.wap_socket(self._socket, **kwargs)
+                self._socket = self._ssl_context.wrap_socket(self._socket)
 
             data = protocol.build_prologue(self._cluster_id)
             self._socket.sendall(data)
@@ -263,6 +774,23 @@ class ArakoonSocketClientConnection(object):
             self.close()
             raise ArakoonSockSendError()
 
+    @property
+    def connected(self):
+        return self._connected
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    def fileno(self):
+        return self._socket.fileno()
+
+    def pending(self):
+        """
+        Check whether received data is buffered by the TLS layer, which isn't reported by `select`
+        """
+        return isinstance(self._socket, ssl.SSLSocket) and self._socket.pending() > 0
+
     def close(self):
         if self._connected and self._socket:
             try:
@@ -281,46 +809,43 @@ class ArakoonSocketClientConnection(object):
         bytes_remaining = count
         result = []
 
-        if isinstance(self._socket, ssl.SSLSocket):
-            pending = self._socket.pending()
-            if pending > 0:
-                tmp = self._socket.recv(min(bytes_remaining, pending))
-                result.append(tmp)
-                bytes_remaining = bytes_remaining - len(tmp)
-
+        # The socket timeout covers data buffered by the TLS layer as well, unlike `select`
         while bytes_remaining > 0:
-            reads, _, _ = select.select([self._socket], [], [], self._timeout)
-
-            if self._socket in reads:
-                try:
-                    data = self._socket.recv(bytes_remaining)
-                except Exception as e:
-                    logger.exception('%s: Error while reading socket', e)
-                    self._connected = False
+            try:
+                data = self._socket.recv(bytes_remaining)
+            except socket.timeout:
+                self.close()
+                raise ArakoonSockNotReadable()
+            except Exception as e:
+                logger.exception('%s: Error while reading socket', e)
+                self._connected = False
 
-                    raise ArakoonSockRecvError()
+                raise ArakoonSockRecvError()
 
-                if len(data) == 0:
-                    try:
-                        self.close()
-                    except Exception as e:
-                        logger.exception('%s: Error while closing socket', e)
+            if len(data) == 0:
+                self.close()
+                raise ArakoonSockReadNoBytes()
 
-                    self._connected = False
+            result.append(data)
+            bytes_remaining -= len(data)
 
-                    raise ArakoonSockReadNoBytes()
+        return ''.join(result)
 
-                result.append(data)
-                bytes_remaining -= len(data)
 
-            else:
-                try:
-                    self.close()
-                except Exception as e:
-                    logger.exception('%s: Error while closing socket', e)
-                finally:
-                    self._connnected = False
+def _wait_readable(connections, timeout):
+    """
+    Wait until data can be read from any of the given connections
 
-                raise ArakoonSockNotReadable()
+    @type connections: list of L{ArakoonSocketClientConnection}
+    @param connections: Connected connections
+    @type timeout: float
+    @param timeout: Maximal time to wait, in seconds, or None to wait indefinitely
+    @rtype: list of L{ArakoonSocketClientConnection}
+    @return: Connections which can be read from
+    """
+    ready = [connection for connection in connections if connection.pending()]
+    if ready:
+        return ready
 
-        return ''.join(result)
+    reads, _, _ = select.select(connections, [], [], timeout)
+    return [connection for connection in connections if connection in reads]
@@ -2,6 +2,8 @@
 # This file is part of Open vStorage. For license information, see <LICENSE.txt>
 
 import os
+import ssl
+import threading
 
 # This is copied from the ArakoonProtocol module
 ARA_CFG_TRY_CNT = 1
@@ -10,6 +12,37 @@ ARA_CFG_CONN_BACKOFF = 5
 ARA_CFG_NO_MASTER_RETRY = 60
 
 
+def create_ssl_context(tls_ca_cert=None, tls_cert=None):
+    """
+    Create a client-side TLS context accepting TLS 1.2 and later only
+
+    When a CA certificate is given, node certificates are verified against it, otherwise they aren't verified.
+    Host names aren't checked, since nodes are configured by address.
+
+    @type tls_ca_cert: string
+    @param tls_ca_cert: Path of the CA certificate to verify node certificates against
+    @type tls_cert: (string, string)
+    @param tls_cert: Paths of the client certificate and key files
+    @rtype: L{ssl.SSLContext}
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.options |= ssl.OP_NO_SSLv2 | ssl.OP_NO_SSLv3 | ssl.OP_NO_TLSv1 | ssl.OP_NO_TLSv1_1 | \
+        ssl.OP_NO_COMPRESSION
+    context.check_hostname = False
+
+    if tls_ca_cert:
+        context.verify_mode = ssl.CERT_REQUIRED
+        context.load_verify_locations(tls_ca_cert)
+    else:
+        context.verify_mode = ssl.CERT_NONE
+
+    if tls_cert:
+        cert, key = tls_cert
+        context.load_cert_chain(cert, key)
+
+    return context
+
+
 class ArakoonClientConfig(object):
     def __init__(self, clusterId, nodes, tls=False, tls_ca_cert=None, tls_cert=None):
         """
@@ -27,8 +60,8 @@ class ArakoonClientConfig(object):
                   "myThirdNode"  : (["127.0.0.1"], 6000 )
                 })
 
-        Note: This client only supports TLSv1 when connecting to nodes,
-        due to Python 2.x.
+        Note: This client only supports TLS 1.2 and later when connecting
+        to nodes. All connections share a single TLS context, see L{ssl_context}.
 
         @type clusterId: string
         @param clusterId: name of the cluster
@@ -68,6 +101,8 @@ class ArakoonClientConfig(object):
         self._tls = tls
         self._tls_ca_cert = tls_ca_cert
         self._tls_cert = tls_cert
+        self._ssl_context = None
+        self._ssl_context_lock = threading.Lock()
 
     @property
     def tls(self):
@@ -81,6 +116,25 @@ class ArakoonClientConfig(object):
     def tls_cert(self):
         return self._tls_cert
 
+    @property
+    def ssl_context(self):
+        """
+        TLS context shared by all connections using this configuration
+
+        The context is created on first use, so certificates are loaded once rather than on every (re)connect.
+
+        @rtype: L{ssl.SSLContext}
+        @return: The context, or None if TLS isn't enabled
+        """
+        if not self._tls:
+            return None
+
+        with self._ssl_context_lock:
+            if self._ssl_context is None:
+                self._ssl_context = create_ssl_context(self._tls_ca_cert, self._tls_cert)
+
+            return self._ssl_context
+
     @staticmethod
     def getNoMasterRetryPeriod():
         """
@@ -29,6 +29,7 @@ PARAM_NATIVE_TYPE_MAPPING = {
 def validate(arg, arg_type):
     # Avoid circular import
     from .sequence import Sequence
+    from ..sequence import SequenceBuilder
 
     # type: (any, any) -> bool
     if arg_type in PARAM_NATIVE_TYPE_MAPPING:
@@ -38,7 +39,7 @@ def validate(arg, arg_type):
     elif arg_type == 'string_list':
         r = all(isinstance(value, str) for value in arg)
     elif arg_type == 'sequence':
-        r = isinstance(arg, Sequence)
+        r = isinstance(arg, (Sequence, SequenceBuilder))
     elif arg_type == 'consistency_option':
         r = isinstance(arg, Consistency) or arg is None
     elif arg_type == 'consistency':
@@ -6,3 +6,8 @@ PYRAKOON_LOGGER = 'pyrakoon'
 
 PYRAKOON_COMPAT_LOGGER = '{0}.compat'.format(PYRAKOON_LOGGER)
 PYRAKOON_UTILS_LOGGER = '{0}.utils'.format(PYRAKOON_LOGGER)
+PYRAKOON_FAKE_LOGGER = '{0}.fake'.format(PYRAKOON_LOGGER)
+PYRAKOON_TOOLS_LOGGER = '{0}.tools'.format(PYRAKOON_LOGGER)
+PYRAKOON_TRACING_LOGGER = '{0}.tracing'.format(PYRAKOON_LOGGER)
+PYRAKOON_PROFILING_LOGGER = '{0}.profiling'.format(PYRAKOON_LOGGER)
+PYRAKOON_CLIENT_LOGGER = '{0}.client'.format(PYRAKOON_LOGGER)
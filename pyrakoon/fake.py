@@ -0,0 +1,1196 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Fake Arakoon server
+In-process server speaking the Arakoon client protocol over real sockets, backed by a sorted in-memory store.
+This allows running the clients end to end without an `arakoon` binary.
+"""
+
+from __future__ import absolute_import
+
+import time
+import bisect
+import socket
+import logging
+import threading
+import SocketServer
+try:
+    import cStringIO as StringIO
+except ImportError:
+    import StringIO
+
+from . import consistency, errors, protocol, utils
+from .constants.logging import PYRAKOON_FAKE_LOGGER
+from .protocol import admin
+
+logger = logging.getLogger(PYRAKOON_FAKE_LOGGER)
+
+# Tags of the "sequence" and "synced_sequence" messages, which don't have a fixed `TAG`
+SEQUENCE_TAG = 0x0010 | protocol.Message.MASK
+SYNCED_SEQUENCE_TAG = 0x0024 | protocol.Message.MASK
+
+# Message types the fake server can decode, by tag
+MESSAGE_TYPES = dict((message_type.TAG, message_type) for message_type in (
+    protocol.Hello, protocol.WhoMaster, protocol.Exists, protocol.Get, protocol.Set, protocol.Delete,
+    protocol.Range, protocol.PrefixKeys, protocol.TestAndSet, protocol.RangeEntries, protocol.MultiGet,
+    protocol.ExpectProgressPossible, protocol.Statistics, protocol.UserFunction, protocol.Assert,
+    protocol.GetKeyCount, protocol.Confirm, protocol.RevRangeEntries, protocol.DeletePrefix, protocol.Version,
+    protocol.AssertExists, protocol.MultiGetOption, protocol.GetCurrentState, protocol.Replace, protocol.Nop,
+    protocol.GetTxID,
+    admin.OptimizeDB, admin.DefragDB, admin.DropMaster, admin.CollapseTlogs, admin.FlushStore))
+
+
+# Node states, see :attr:`FakeServer.state`
+STATE_RUNNING = 'running'
+STATE_HALF_OPEN = 'half_open'
+STATE_GOING_DOWN = 'going_down'
+
+# Messages which can only be handled by the master node
+WRITE_MESSAGE_TYPES = (protocol.Set, protocol.Delete, protocol.TestAndSet, protocol.Sequence, protocol.Confirm,
+                       protocol.DeletePrefix, protocol.Replace, protocol.Nop, protocol.UserFunction)
+
+
+class ConnectionClosed(Exception):
+    """
+    Raised when the peer closed the connection while a request was being read
+    """
+
+
+class DecodedSequence(protocol.Sequence):
+    """
+    "sequence" message as decoded by the fake server
+    """
+
+    def __init__(self, steps, sync):
+        """
+        :param steps: Decoded steps, see :func:`decode_steps`
+        :type steps: list[tuple]
+        :param sync: Synced sequence
+        :type sync: bool
+        """
+        super(DecodedSequence, self).__init__([], sync)
+        self.decoded_steps = steps
+
+
+class FakeStore(object):
+    """
+    Sorted in-memory key-value store
+
+    All public methods are thread-safe. :meth:`apply` executes a list of steps atomically.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._values = {}
+        self._keys = []
+        self._i = 0
+
+    @property
+    def lock(self):
+        """
+        Lock guarding the store, can be held to run several operations atomically
+        :rtype: threading.RLock
+        """
+        return self._lock
+
+    @property
+    def i(self):
+        """
+        Number of updates applied to the store
+        :rtype: int
+        """
+        return self._i
+
+    def __len__(self):
+        return len(self._keys)
+
+    def exists(self, key):
+        # type: (str) -> bool
+        return key in self._values
+
+    def get(self, key):
+        # type: (str) -> str
+        """
+        :raise errors.NotFound: The key doesn't exist
+        """
+        try:
+            return self._values[key]
+        except KeyError:
+            raise errors.NotFound(key)
+
+    def get_option(self, key):
+        # type: (str) -> Union[str, None]
+        return self._values.get(key)
+
+    def set(self, key, value):
+        # type: (str, str) -> None
+        with self._lock:
+            self._set(key, value)
+            self._i += 1
+
+    def delete(self, key):
+        # type: (str) -> None
+        """
+        :raise errors.NotFound: The key doesn't exist
+        """
+        with self._lock:
+            self._delete(key)
+            self._i += 1
+
+    def delete_prefix(self, prefix):
+        # type: (str) -> int
+        """
+        Delete all keys starting with `prefix`
+        :return: Number of deleted keys
+        :rtype: int
+        """
+        with self._lock:
+            keys = self.prefix_keys(prefix, -1)
+            for key in keys:
+                self._delete(key)
+            self._i += 1
+            return len(keys)
+
+    def nop(self):
+        with self._lock:
+            self._i += 1
+
+    def prefix_keys(self, prefix, max_elements):
+        # type: (str, int) -> List[str]
+        with self._lock:
+            result = []
+            for idx in xrange(bisect.bisect_left(self._keys, prefix), len(self._keys)):
+                key = self._keys[idx]
+                if not key.startswith(prefix) or len(result) == max_elements:
+                    break
+                result.append(key)
+            return result
+
+    def range(self, begin_key, begin_inclusive, end_key, end_inclusive, max_elements):
+        # type: (Union[str, None], bool, Union[str, None], bool, int) -> List[str]
+        """
+        List the keys between `begin_key` and `end_key`, in ascending order
+        """
+        with self._lock:
+            if begin_key is None:
+                start = 0
+            elif begin_inclusive:
+                start = bisect.bisect_left(self._keys, begin_key)
+            else:
+                start = bisect.bisect_right(self._keys, begin_key)
+
+            if end_key is None:
+                stop = len(self._keys)
+            elif end_inclusive:
+                stop = bisect.bisect_right(self._keys, end_key)
+            else:
+                stop = bisect.bisect_left(self._keys, end_key)
+
+            if 0 <= max_elements < stop - start:
+                stop = start + max_elements
+            return self._keys[start:stop]
+
+    def rev_range(self, begin_key, begin_inclusive, end_key, end_inclusive, max_elements):
+        # type: (Union[str, None], bool, Union[str, None], bool, int) -> List[str]
+        """
+        List the keys from `begin_key` down to `end_key`, in descending order
+        """
+        with self._lock:
+            if begin_key is None:
+                stop = len(self._keys)
+            elif begin_inclusive:
+                stop = bisect.bisect_right(self._keys, begin_key)
+            else:
+                stop = bisect.bisect_left(self._keys, begin_key)
+
+            if end_key is None:
+                start = 0
+            elif end_inclusive:
+                start = bisect.bisect_left(self._keys, end_key)
+            else:
+                start = bisect.bisect_right(self._keys, end_key)
+
+            if 0 <= max_elements < stop - start:
+                start = stop - max_elements
+            return self._keys[start:stop][::-1]
+
+    def apply(self, steps):
+        """
+        Apply a list of decoded sequence steps atomically
+
+        Every step is a tuple starting with the step name, as generated by :func:`decode_steps`.
+        When a step fails, all previous steps are rolled back and the error is re-raised.
+
+        :param steps: Steps to apply
+        :type steps: list[tuple]
+        """
+        with self._lock:
+            undo = []
+            try:
+                self._apply(steps, undo)
+            except Exception:
+                for key, value in reversed(undo):
+                    if value is None:
+                        if key in self._values:
+                            self._delete(key)
+                    else:
+                        self._set(key, value)
+                raise
+            self._i += 1
+
+    def _apply(self, steps, undo):
+        for step in steps:
+            name = step[0]
+            if name == 'set':
+                undo.append((step[1], self._values.get(step[1])))
+                self._set(step[1], step[2])
+            elif name == 'delete':
+                undo.append((step[1], self._values.get(step[1])))
+                self._delete(step[1])
+            elif name == 'replace':
+                undo.append((step[1], self._values.get(step[1])))
+                if step[2] is None:
+                    if step[1] in self._values:
+                        self._delete(step[1])
+                else:
+                    self._set(step[1], step[2])
+            elif name == 'delete_prefix':
+                for key in self.prefix_keys(step[1], -1):
+                    undo.append((key, self._values[key]))
+                    self._delete(key)
+            elif name == 'assert':
+                if self._values.get(step[1]) != step[2]:
+                    raise errors.AssertionFailed(step[1])
+            elif name == 'assert_exists':
+                if step[1] not in self._values:
+                    raise errors.AssertionFailed(step[1])
+            elif name == 'assert_range':
+                if self.prefix_keys(step[1], -1) != sorted(step[2]):
+                    raise errors.AssertionFailed(step[1])
+            elif name == 'sequence':
+                self._apply(step[1], undo)
+            else:
+                raise ValueError('Unknown step %r' % name)
+
+    def _set(self, key, value):
+        if key not in self._values:
+            bisect.insort(self._keys, key)
+        self._values[key] = value
+
+    def _delete(self, key):
+        if key not in self._values:
+            raise errors.NotFound(key)
+        del self._values[key]
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+
+def decode_steps(read):
+    """
+    Decode the steps of a serialized :class:`pyrakoon.sequence.Sequence`
+
+    :param read: Callable to read a given number of bytes
+    :type read: callable
+    :return: Steps as tuples, see :meth:`FakeStore.apply`
+    :rtype: list[tuple]
+    """
+    recv = lambda type_: utils.read_blocking(type_.receive(), read)
+
+    tag = recv(protocol.UINT32)
+    if tag != 5:
+        raise ValueError('Expected a sequence, got step tag %d' % tag)
+    return _decode_sequence_steps(recv)
+
+
+def _decode_sequence_steps(recv):
+    count = recv(protocol.UINT32)
+    steps = []
+    for _ in xrange(count):
+        tag = recv(protocol.UINT32)
+        if tag == 1:
+            steps.append(('set', recv(protocol.STRING), recv(protocol.STRING)))
+        elif tag == 2:
+            steps.append(('delete', recv(protocol.STRING)))
+        elif tag == 5:
+            steps.append(('sequence', _decode_sequence_steps(recv)))
+        elif tag == 8:
+            steps.append(('assert', recv(protocol.STRING), recv(protocol.Option(protocol.STRING))))
+        elif tag == 14:
+            steps.append(('delete_prefix', recv(protocol.STRING)))
+        elif tag == 15:
+            steps.append(('assert_exists', recv(protocol.STRING)))
+        elif tag == 16:
+            steps.append(('replace', recv(protocol.STRING), recv(protocol.Option(protocol.STRING))))
+        elif tag == 17:
+            prefix = recv(protocol.STRING)
+            _ = recv(protocol.INT32)
+            keys = [recv(protocol.STRING) for _ in xrange(recv(protocol.INT32))]
+            steps.append(('assert_range', prefix, keys))
+        else:
+            raise ValueError('Unknown step tag %d' % tag)
+    return steps
+
+
+def encode_result(type_, value):
+    """
+    Serialize a result value the way an Arakoon server does
+
+    Unlike :meth:`pyrakoon.protocol.Type.serialize`, this handles types which are only ever received by clients,
+    and emits :class:`~pyrakoon.protocol.List` items in the reversed order :meth:`List.receive` expects.
+
+    :param type_: Return type of the message
+    :type type_: pyrakoon.protocol.Type
+    :param value: Value to serialize
+    :type value: any
+    :return: Iterable of bytes
+    :rtype: iterable of str
+    """
+    if isinstance(type_, protocol.Unit):
+        return
+    elif isinstance(type_, (protocol.List, protocol.Array)):
+        values = list(value)
+        for bytes_ in protocol.UINT32.serialize(len(values)):
+            yield bytes_
+        if isinstance(type_, protocol.List):
+            values.reverse()
+        for item in values:
+            for bytes_ in encode_result(type_._inner_type, item):
+                yield bytes_
+    elif isinstance(type_, protocol.Option):
+        for bytes_ in protocol.BOOL.serialize(value is not None):
+            yield bytes_
+        if value is not None:
+            for bytes_ in encode_result(type_._inner_type, value):
+                yield bytes_
+    elif isinstance(type_, protocol.Product):
+        for inner_type, item in zip(type_._inner_types, value):
+            for bytes_ in encode_result(inner_type, item):
+                yield bytes_
+    elif isinstance(type_, protocol.StatisticsType):
+        blob = ''.join(encode_named_field('arakoon_stats', value))
+        for bytes_ in protocol.STRING.serialize(blob):
+            yield bytes_
+    else:
+        for bytes_ in type_.serialize(value):
+            yield bytes_
+
+
+def encode_named_field(name, value):
+    """
+    Serialize a value as decoded by :class:`pyrakoon.protocol.NamedField`
+
+    Dictionaries become nested field lists, :class:`int` values 64bit integers.
+
+    :param name: Field name
+    :type name: str
+    :param value: Field value
+    :type value: Union[dict, int, float, str]
+    :return: Iterable of bytes
+    :rtype: iterable of str
+    """
+    if isinstance(value, dict):
+        field_type = protocol.NamedField.FIELD_TYPE_LIST
+    elif isinstance(value, bool):
+        raise TypeError('Booleans can\'t be encoded as named field')
+    elif isinstance(value, (int, long)):
+        field_type = protocol.NamedField.FIELD_TYPE_INT64
+    elif isinstance(value, float):
+        field_type = protocol.NamedField.FIELD_TYPE_FLOAT
+    elif isinstance(value, str):
+        field_type = protocol.NamedField.FIELD_TYPE_STRING
+    else:
+        raise TypeError('Unsupported named field value %r' % value)
+
+    for bytes_ in protocol.INT32.serialize(field_type):
+        yield bytes_
+    for bytes_ in protocol.STRING.serialize(name):
+        yield bytes_
+
+    if field_type == protocol.NamedField.FIELD_TYPE_LIST:
+        for bytes_ in protocol.UINT32.serialize(len(value)):
+            yield bytes_
+        for sub_name, sub_value in sorted(value.iteritems()):
+            for bytes_ in encode_named_field(sub_name, sub_value):
+                yield bytes_
+    elif field_type == protocol.NamedField.FIELD_TYPE_INT64:
+        for bytes_ in protocol.INT64.serialize(value):
+            yield bytes_
+    elif field_type == protocol.NamedField.FIELD_TYPE_FLOAT:
+        for bytes_ in protocol.FLOAT.serialize(value):
+            yield bytes_
+    else:
+        for bytes_ in protocol.STRING.serialize(value):
+            yield bytes_
+
+
+class _OperationStatistics(object):
+    """
+    Running count and timing information of one operation type
+    """
+
+    __slots__ = ('n', 'min', 'max', 'avg', 'var')
+
+    def __init__(self):
+        self.n = 0
+        self.min = 0.0
+        self.max = 0.0
+        self.avg = 0.0
+        self.var = 0.0
+
+    def add(self, duration):
+        # type: (float) -> None
+        # Welford's online algorithm
+        self.n += 1
+        if self.n == 1:
+            self.min = self.max = duration
+        else:
+            self.min = min(self.min, duration)
+            self.max = max(self.max, duration)
+        delta = duration - self.avg
+        self.avg += delta / self.n
+        self.var += delta * (duration - self.avg)
+
+    def to_dict(self):
+        # type: () -> dict
+        return {'n': self.n, 'min': self.min, 'max': self.max, 'avg': self.avg,
+                'var': self.var / self.n if self.n > 1 else 0.0}
+
+
+class FakeServer(object):
+    """
+    In-process fake Arakoon node
+
+    The server listens on a local TCP port, validates the prologue sent by clients and serves requests from a
+    :class:`FakeStore`. Every connection is handled in its own thread and requests are answered in order,
+    so pipelined requests are supported.
+
+    Example usage::
+
+        server = FakeServer('cluster')
+        server.start()
+        client = compat.ArakoonClient(compat.ArakoonClientConfig(*server.client_config))
+        ...
+        server.stop()
+    """
+
+    VERSION = (1, 0, 0, 'FakeRakoon/0.1')
+    # Operations for which statistics are kept, by message type
+    STATISTICS_OPERATIONS = {
+        protocol.Set: 'set_info',
+        protocol.Get: 'get_info',
+        protocol.Delete: 'del_info',
+        protocol.MultiGet: 'mget_info',
+        protocol.MultiGetOption: 'mget_option_info',
+        DecodedSequence: 'seq_info',
+        protocol.TestAndSet: 'tas_info',
+        protocol.Range: 'range_info',
+        protocol.RangeEntries: 'range_entries_info',
+        protocol.RevRangeEntries: 'rev_range_entries_info',
+        protocol.PrefixKeys: 'prefix_info',
+        protocol.DeletePrefix: 'delete_prefix_info',
+    }
+
+    def __init__(self, cluster_id, node_id='arakoon_0', address=('127.0.0.1', 0), store=None, cluster=None):
+        # type: (str, str, Tuple[str, int], FakeStore, FakeCluster) -> None
+        """
+        :param cluster_id: Identifier of the cluster, clients sending another identifier are refused
+        :type cluster_id: str
+        :param node_id: Identifier of this node
+        :type node_id: str
+        :param address: Address to listen on. Port 0 picks a free port
+        :type address: (str, int)
+        :param store: Store to serve, nodes of a cluster can share one
+        :type store: FakeStore
+        :param cluster: Cluster this node is part of. A node without cluster is always master
+        :type cluster: FakeCluster
+        """
+        self._cluster_id = cluster_id
+        self._node_id = node_id
+        self._bind_address = address
+        self._store = store if store is not None else FakeStore()
+        self._cluster = cluster
+
+        # Fault injection: node state, reply latency in seconds (or a callable returning it) and reply bandwidth
+        # in bytes per second
+        self.state = STATE_RUNNING
+        self.latency = 0.0
+        self.bandwidth = None
+
+        self._server = None
+        self._thread = None
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+
+        self._statistics_lock = threading.Lock()
+        self._start_time = time.time()
+        self._last_time = self._start_time
+        self._operations = dict((name, _OperationStatistics())
+                                for name in self.STATISTICS_OPERATIONS.itervalues())
+        self._operations['op_info'] = _OperationStatistics()
+
+        self._handlers = {
+            protocol.Hello: self.handle_hello,
+            protocol.WhoMaster: self.handle_who_master,
+            protocol.Exists: self.handle_exists,
+            protocol.Get: self.handle_get,
+            protocol.Set: self.handle_set,
+            protocol.Delete: self.handle_delete,
+            protocol.Range: self.handle_range,
+            protocol.PrefixKeys: self.handle_prefix_keys,
+            protocol.TestAndSet: self.handle_test_and_set,
+            protocol.RangeEntries: self.handle_range_entries,
+            protocol.MultiGet: self.handle_multi_get,
+            protocol.ExpectProgressPossible: lambda message: True,
+            protocol.Statistics: self.handle_statistics,
+            protocol.UserFunction: self.handle_user_function,
+            protocol.Assert: self.handle_assert,
+            protocol.GetKeyCount: lambda message: len(self._store),
+            protocol.Confirm: self.handle_confirm,
+            protocol.RevRangeEntries: self.handle_rev_range_entries,
+            protocol.DeletePrefix: lambda message: self._store.delete_prefix(message.prefix),
+            protocol.Version: lambda message: self.VERSION,
+            protocol.AssertExists: self.handle_assert_exists,
+            protocol.MultiGetOption: self.handle_multi_get_option,
+            protocol.GetCurrentState: lambda message: 'FakeServer(%s)' % self._node_id,
+            protocol.Replace: self.handle_replace,
+            protocol.Nop: lambda message: self._store.nop(),
+            protocol.GetTxID: lambda message: consistency.AtLeast(self._store.i),
+            DecodedSequence: self.handle_sequence,
+            admin.OptimizeDB: lambda message: None,
+            admin.DefragDB: lambda message: None,
+            admin.DropMaster: self.handle_drop_master,
+            admin.CollapseTlogs: lambda message: [],
+            admin.FlushStore: lambda message: None,
+        }
+
+    @property
+    def node_id(self):
+        # type: () -> str
+        return self._node_id
+
+    @property
+    def cluster_id(self):
+        # type: () -> str
+        return self._cluster_id
+
+    @property
+    def store(self):
+        # type: () -> FakeStore
+        return self._store
+
+    @property
+    def master_id(self):
+        # type: () -> Union[str, None]
+        """
+        Node the cluster currently considers master, `None` during an election
+        """
+        if self._cluster is None:
+            return self._node_id
+        return self._cluster.master
+
+    @property
+    def address(self):
+        # type: () -> Tuple[str, int]
+        """
+        Address the server is listening on
+        """
+        if self._server is None:
+            raise RuntimeError('Server not started')
+        return self._server.server_address
+
+    @property
+    def running(self):
+        # type: () -> bool
+        return self._server is not None
+
+    @property
+    def client_config(self):
+        # type: () -> Tuple[str, dict]
+        """
+        Client configuration tuple, which can be passed to :class:`pyrakoon.compat.ArakoonClientConfig`
+        """
+        host, port = self.address
+        return self._cluster_id, {self._node_id: ([host], port)}
+
+    def start(self):
+        """
+        Start listening and serving requests in a background thread
+        """
+        if self._server is not None:
+            raise RuntimeError('Server already started')
+
+        self._server = _ThreadingServer(self._bind_address, _RequestHandler, self)
+        # Keep listening on the same port when restarted
+        self._bind_address = self._server.server_address
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={'poll_interval': 0.05},
+                                        name='FakeServer-%s' % self._node_id)
+        self._thread.daemon = True
+        self._thread.start()
+        logger.debug('Fake node %s listening on %s:%d', self._node_id, *self._bind_address)
+
+    def stop(self):
+        """
+        Stop listening and close all client connections
+        """
+        if self._server is None:
+            return
+
+        server, self._server = self._server, None
+        server.shutdown()
+        server.server_close()
+        self._thread.join()
+        self._thread = None
+        self.close_connections()
+        logger.debug('Fake node %s stopped', self._node_id)
+
+    def close_connections(self):
+        """
+        Forcibly close all client connections
+        """
+        with self._connections_lock:
+            connections = tuple(self._connections)
+            self._connections.clear()
+
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            connection.close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def read_request(self, read):
+        """
+        Read and decode a single request
+
+        :param read: Callable to read a given number of bytes
+        :type read: callable
+        :return: Decoded message, or `None` if the message tag is unknown
+        :rtype: pyrakoon.protocol.Message
+        """
+        recv = lambda type_: utils.read_blocking(type_.receive(), read)
+
+        tag = recv(protocol.UINT32)
+
+        if tag in (SEQUENCE_TAG, SYNCED_SEQUENCE_TAG):
+            body = recv(protocol.STRING)
+            return DecodedSequence(decode_steps(StringIO.StringIO(body).read), tag == SYNCED_SEQUENCE_TAG)
+
+        message_type = MESSAGE_TYPES.get(tag)
+        if message_type is None:
+            logger.warning('Fake node %s received unknown command 0x%x', self._node_id, tag)
+            return None
+
+        args = []
+        for arg in message_type.ARGS:
+            value = recv(arg[1])
+            if isinstance(arg[1], protocol.List):
+                # `List.receive` reverses the order in which the client sent the items
+                value.reverse()
+            args.append(value)
+
+        return message_type(*args)
+
+    def process(self, message):
+        """
+        Process a decoded request
+
+        :param message: Request to process
+        :type message: pyrakoon.protocol.Message
+        :return: Serialized response
+        :rtype: str
+        """
+        if message is None:
+            return ''.join(self.encode_error(errors.UnknownFailure('Unknown command')))
+
+        start = time.time()
+        try:
+            if self.state == STATE_GOING_DOWN:
+                raise errors.GoingDown('Node %s is going down' % self._node_id)
+            if self.master_id != self._node_id and self.requires_master(message):
+                raise errors.NotMaster('Node %s is not master' % self._node_id)
+
+            result = self._handlers[type(message)](message)
+        except errors.ArakoonError as exc:
+            return ''.join(self.encode_error(exc))
+        finally:
+            self._record(message, time.time() - start)
+
+        return ''.join(self.encode_success(message, result))
+
+    @staticmethod
+    def requires_master(message):
+        # type: (protocol.Message) -> bool
+        """
+        Check whether a message can only be processed by the master node
+        Reads are served by slaves unless they require a consistent result.
+        """
+        if isinstance(message, WRITE_MESSAGE_TYPES):
+            return True
+        if protocol.CONSISTENCY_ARG in message.ARGS:
+            return message.consistency is None or message.consistency is consistency.CONSISTENT
+        return False
+
+    def reply_delay(self, size):
+        # type: (int) -> float
+        """
+        Time to wait before sending a reply of `size` bytes, based on :attr:`latency` and :attr:`bandwidth`
+        """
+        latency = self.latency() if callable(self.latency) else self.latency
+        if self.bandwidth:
+            latency += float(size) / self.bandwidth
+        return latency
+
+    @staticmethod
+    def encode_success(message, result):
+        for bytes_ in protocol.UINT32.serialize(protocol.RESULT_SUCCESS):
+            yield bytes_
+        if isinstance(message, admin.CollapseTlogs):
+            for bytes_ in protocol.INT32.serialize(len(result)):
+                yield bytes_
+            for duration in result:
+                for bytes_ in protocol.INT32.serialize(0):
+                    yield bytes_
+                for bytes_ in protocol.INT64.serialize(duration):
+                    yield bytes_
+        else:
+            for bytes_ in encode_result(message.RETURN_TYPE, result):
+                yield bytes_
+
+    @staticmethod
+    def encode_error(exc):
+        code = exc.CODE if exc.CODE is not None else errors.UnknownFailure.CODE
+        for bytes_ in protocol.UINT32.serialize(code):
+            yield bytes_
+        for bytes_ in protocol.STRING.serialize(str(exc.args[0]) if exc.args else ''):
+            yield bytes_
+
+    def _record(self, message, duration):
+        name = self.STATISTICS_OPERATIONS.get(type(message))
+        with self._statistics_lock:
+            self._last_time = time.time()
+            self._operations['op_info'].add(duration)
+            if name is not None:
+                self._operations[name].add(duration)
+
+    def _register_connection(self, connection):
+        with self._connections_lock:
+            self._connections.add(connection)
+
+    def _unregister_connection(self, connection):
+        with self._connections_lock:
+            self._connections.discard(connection)
+
+    # Handlers
+    def handle_hello(self, message):
+        return '%s %s' % (self._node_id, self.VERSION[3])
+
+    def handle_who_master(self, message):
+        return self.master_id
+
+    def handle_drop_master(self, message):
+        if self._cluster is not None and self.master_id == self._node_id:
+            self._cluster.drop_master()
+
+    def handle_exists(self, message):
+        return self._store.exists(message.key)
+
+    def handle_get(self, message):
+        return self._store.get(message.key)
+
+    def handle_set(self, message):
+        self._store.set(message.key, message.value)
+
+    def handle_delete(self, message):
+        self._store.delete(message.key)
+
+    def handle_confirm(self, message):
+        with self._store.lock:
+            if self._store.get_option(message.key) != message.value:
+                self._store.set(message.key, message.value)
+
+    def handle_replace(self, message):
+        with self._store.lock:
+            old_value = self._store.get_option(message.key)
+            self._store.apply([('replace', message.key, message.value)])
+            return old_value
+
+    def handle_test_and_set(self, message):
+        with self._store.lock:
+            old_value = self._store.get_option(message.key)
+            if old_value == message.test_value:
+                self._store.apply([('replace', message.key, message.set_value)])
+            return old_value
+
+    def handle_assert(self, message):
+        if self._store.get_option(message.key) != message.value:
+            raise errors.AssertionFailed(message.key)
+
+    def handle_assert_exists(self, message):
+        if not self._store.exists(message.key):
+            raise errors.AssertionFailed(message.key)
+
+    def handle_multi_get(self, message):
+        with self._store.lock:
+            return [self._store.get(key) for key in message.keys]
+
+    def handle_multi_get_option(self, message):
+        with self._store.lock:
+            return [self._store.get_option(key) for key in message.keys]
+
+    def handle_prefix_keys(self, message):
+        return self._store.prefix_keys(message.prefix, message.max_elements)
+
+    def handle_range(self, message):
+        return self._store.range(message.begin_key, message.begin_inclusive,
+                                 message.end_key, message.end_inclusive, message.max_elements)
+
+    def handle_range_entries(self, message):
+        with self._store.lock:
+            keys = self.handle_range(message)
+            return [(key, self._store.get(key)) for key in keys]
+
+    def handle_rev_range_entries(self, message):
+        with self._store.lock:
+            keys = self._store.rev_range(message.begin_key, message.begin_inclusive,
+                                         message.end_key, message.end_inclusive, message.max_elements)
+            return [(key, self._store.get(key)) for key in keys]
+
+    def handle_sequence(self, message):
+        self._store.apply(message.decoded_steps)
+
+    def handle_user_function(self, message):
+        raise errors.NotSupported('User function %s is not available' % message.function)
+
+    def handle_statistics(self, message):
+        with self._statistics_lock:
+            result = dict((name, operation.to_dict()) for name, operation in self._operations.iteritems())
+            result['start'] = self._start_time
+            result['last'] = self._last_time
+        result['node_is'] = {self._node_id: self._store.i}
+        return result
+
+
+class FakeCluster(object):
+    """
+    Local multi-node cluster simulator
+
+    Starts a number of :class:`FakeServer` nodes on loopback ports, sharing a single :class:`FakeStore`. One node is
+    master: all nodes answer "who_master" with it, and the others return `NotMaster` for writes and consistent
+    reads. Faults can be injected directly or scripted using :meth:`run_script`, and every event is time-stamped in
+    :attr:`events` so failover times can be measured.
+
+    Example usage::
+
+        with FakeCluster('cluster', node_count=3) as cluster:
+            client = compat.ArakoonClient(compat.ArakoonClientConfig(*cluster.client_config))
+            cluster.run_script([(0.5, 'crash', 'arakoon_0'), (2.0, 'restart', 'arakoon_0')])
+            ...
+    """
+
+    def __init__(self, cluster_id, node_count=3, host='127.0.0.1', election_delay=0.0):
+        # type: (str, int, str, float) -> None
+        """
+        :param cluster_id: Identifier of the cluster
+        :type cluster_id: str
+        :param node_count: Number of nodes
+        :type node_count: int
+        :param host: Address to listen on
+        :type host: str
+        :param election_delay: Time without master after the master crashed or dropped its role
+        :type election_delay: float
+        """
+        if node_count < 1:
+            raise ValueError('At least one node is required')
+
+        self._cluster_id = cluster_id
+        self._election_delay = election_delay
+        self._store = FakeStore()
+        self._lock = threading.RLock()
+        self._timers = []
+        self._events = []
+
+        self._node_ids = ['arakoon_%d' % i for i in xrange(node_count)]
+        self._nodes = dict((node_id, FakeServer(cluster_id, node_id, (host, 0), self._store, self))
+                           for node_id in self._node_ids)
+        self._master = self._node_ids[0]
+
+    @property
+    def store(self):
+        # type: () -> FakeStore
+        return self._store
+
+    @property
+    def nodes(self):
+        # type: () -> Dict[str, FakeServer]
+        return dict(self._nodes)
+
+    @property
+    def master(self):
+        # type: () -> Union[str, None]
+        """
+        Current master node, `None` while electing
+        """
+        return self._master
+
+    @property
+    def events(self):
+        # type: () -> List[Tuple[float, str, str]]
+        """
+        Log of `(timestamp, event, node_id)` tuples
+        """
+        with self._lock:
+            return list(self._events)
+
+    @property
+    def client_config(self):
+        # type: () -> Tuple[str, dict]
+        """
+        Client configuration tuple, which can be passed to :class:`pyrakoon.compat.ArakoonClientConfig`
+        """
+        nodes = {}
+        for node_id, node in self._nodes.iteritems():
+            host, port = node.address
+            nodes[node_id] = ([host], port)
+        return self._cluster_id, nodes
+
+    def node(self, node_id):
+        # type: (str) -> FakeServer
+        return self._nodes[node_id]
+
+    def start(self):
+        for node in self._nodes.itervalues():
+            node.start()
+        self._log('start', None)
+
+    def stop(self):
+        with self._lock:
+            timers, self._timers = self._timers, []
+        for timer in timers:
+            timer.cancel()
+        for node in self._nodes.itervalues():
+            node.stop()
+        self._log('stop', None)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def set_master(self, node_id):
+        # type: (Union[str, None]) -> None
+        """
+        Make a node master. Passing `None` leaves the cluster without master
+        """
+        if node_id is not None and node_id not in self._nodes:
+            raise ValueError('Unknown node %s' % node_id)
+        with self._lock:
+            self._master = node_id
+        self._log('master', node_id)
+
+    def elect(self):
+        # type: () -> Union[str, None]
+        """
+        Make the first running node master
+        :return: New master, `None` if no node is available
+        """
+        for node_id in self._node_ids:
+            node = self._nodes[node_id]
+            if node.running and node.state == STATE_RUNNING:
+                self.set_master(node_id)
+                return node_id
+        self.set_master(None)
+        return None
+
+    def drop_master(self):
+        """
+        Let the master lose its role, a new master is elected after the election delay
+        """
+        self.set_master(None)
+        self._schedule(self._election_delay, self.elect)
+
+    def crash(self, node_id):
+        # type: (str) -> None
+        """
+        Stop a node, closing all its connections. A new master is elected if the node was master
+        """
+        self._nodes[node_id].stop()
+        self._log('crash', node_id)
+        if self._master == node_id:
+            self.drop_master()
+
+    def restart(self, node_id):
+        # type: (str) -> None
+        """
+        Restart a crashed node on the same port, clearing injected faults
+        """
+        self.recover(node_id)
+        node = self._nodes[node_id]
+        if not node.running:
+            node.start()
+        self._log('restart', node_id)
+        if self._master is None:
+            self.elect()
+
+    def slow(self, node_id, latency, bandwidth=None):
+        # type: (str, Union[float, callable], Union[int, None]) -> None
+        """
+        Delay all replies of a node
+
+        :param latency: Delay in seconds, or a callable returning a delay for every reply
+        :type latency: float or callable
+        :param bandwidth: Maximal reply bandwidth in bytes per second
+        :type bandwidth: int
+        """
+        node = self._nodes[node_id]
+        node.latency = latency
+        node.bandwidth = bandwidth
+        self._log('slow', node_id)
+
+    def half_open(self, node_id):
+        # type: (str) -> None
+        """
+        Keep the connections of a node open while never replying, as happens when a peer disappears from the network
+        """
+        self._nodes[node_id].state = STATE_HALF_OPEN
+        self._log('half_open', node_id)
+
+    def going_down(self, node_id):
+        # type: (str) -> None
+        """
+        Let a node answer every request with `GoingDown`. A new master is elected if the node was master
+        """
+        self._nodes[node_id].state = STATE_GOING_DOWN
+        self._log('going_down', node_id)
+        if self._master == node_id:
+            self.drop_master()
+
+    def recover(self, node_id):
+        # type: (str) -> None
+        """
+        Clear all faults injected in a node
+        """
+        node = self._nodes[node_id]
+        node.state = STATE_RUNNING
+        node.latency = 0.0
+        node.bandwidth = None
+        self._log('recover', node_id)
+
+    def run_script(self, script):
+        """
+        Schedule a list of events
+
+        Every event is a tuple of a delay in seconds (relative to now), the name of a method of this class and its
+        arguments, e.g. `(1.5, 'crash', 'arakoon_0')`.
+
+        :param script: Events to schedule
+        :type script: iterable of tuple
+        """
+        for event in script:
+            delay, action, args = event[0], event[1], event[2:]
+            self._schedule(delay, getattr(self, action), *args)
+
+    def _schedule(self, delay, fun, *args):
+        if delay <= 0:
+            fun(*args)
+            return
+
+        timer = threading.Timer(delay, fun, args)
+        timer.daemon = True
+        with self._lock:
+            self._timers.append(timer)
+        timer.start()
+
+    def _log(self, event, node_id):
+        logger.debug('Fake cluster %s: %s %s', self._cluster_id, event, node_id or '')
+        with self._lock:
+            self._events.append((time.time(), event, node_id))
+
+
+class _ThreadingServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """
+    TCP server handling every connection in a daemon thread
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, handler_class, fake_server):
+        self.fake_server = fake_server
+        SocketServer.TCPServer.__init__(self, address, handler_class)
+
+
+class _RequestHandler(SocketServer.StreamRequestHandler):
+    """
+    Handler for a single client connection
+    """
+
+    def setup(self):
+        SocketServer.StreamRequestHandler.setup(self)
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.fake_server._register_connection(self.request)
+
+    def finish(self):
+        self.server.fake_server._unregister_connection(self.request)
+        try:
+            SocketServer.StreamRequestHandler.finish(self)
+        except socket.error:
+            pass
+
+    def read(self, count):
+        # type: (int) -> str
+        data = self.rfile.read(count)
+        if len(data) != count:
+            raise ConnectionClosed()
+        return data
+
+    def handle(self):
+        fake_server = self.server.fake_server
+        try:
+            if not self.handle_prologue(fake_server):
+                return
+
+            while True:
+                message = fake_server.read_request(self.read)
+                if fake_server.state == STATE_HALF_OPEN:
+                    # Swallow the request, the client won't ever get a reply
+                    continue
+
+                response = fake_server.process(message)
+                delay = fake_server.reply_delay(len(response))
+                if delay > 0:
+                    time.sleep(delay)
+                self.request.sendall(response)
+                if message is None:
+                    # The remainder of an unknown command can't be skipped
+                    return
+        except (ConnectionClosed, socket.error, ValueError):
+            pass
+
+    def handle_prologue(self, fake_server):
+        # type: (FakeServer) -> bool
+        recv = lambda type_: utils.read_blocking(type_.receive(), self.read)
+
+        mask = recv(protocol.UINT32)
+        if mask != protocol.Message.MASK:
+            error = errors.NoMagic('Invalid magic 0x%x' % mask)
+        else:
+            version = recv(protocol.UINT32)
+            cluster_id = recv(protocol.STRING)
+            if version != protocol.PROTOCOL_VERSION:
+                error = errors.UnknownFailure('Unsupported protocol version %d' % version)
+            elif cluster_id != fake_server.cluster_id:
+                error = errors.WrongCluster('Wrong cluster %s, expected %s' % (cluster_id, fake_server.cluster_id))
+            else:
+                return True
+
+        self.request.sendall(''.join(fake_server.encode_error(error)))
+        return False
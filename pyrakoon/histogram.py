@@ -0,0 +1,304 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+High dynamic range histogram
+
+A log-linear histogram modelled after HdrHistogram: values are grouped in power-of-two buckets, each of which is split
+in a fixed number of linear sub-buckets. This bounds the relative error of recorded values by the configured number
+of significant digits, using a small, fixed amount of memory regardless of the range of recorded values.
+Percentiles report the highest value equivalent to the recorded ones:
+
+>>> histogram = Histogram()
+>>> for value in xrange(1, 1001):
+...     histogram.record(value)
+>>> histogram.count
+1000
+>>> histogram.min, histogram.max
+(1, 1000)
+>>> histogram.percentile(50)
+501
+>>> histogram.percentile(99)
+991
+"""
+
+from __future__ import absolute_import
+
+import math
+
+
+class Histogram(object):
+    """
+    Log-linear histogram of non-negative integer values
+
+    Integer values within ``[0, 2 * 10 ** significant_digits]`` are recorded exactly, larger values are recorded with
+    a relative error below ``10 ** -significant_digits``. Recording a value takes constant time.
+    """
+
+    __slots__ = '_significant_digits', '_sub_bucket_bits', '_sub_bucket_mask', '_counts', '_count', '_total', \
+        '_min', '_max'
+
+    def __init__(self, significant_digits=2):
+        """
+        :param significant_digits: Number of significant decimal digits to maintain, between 1 and 5
+        :type significant_digits: int
+        """
+        if not 1 <= significant_digits <= 5:
+            raise ValueError('significant_digits must be between 1 and 5')
+
+        self._significant_digits = significant_digits
+        self._sub_bucket_bits = int(math.ceil(math.log(2 * 10 ** significant_digits, 2)))
+        self._sub_bucket_mask = (1 << self._sub_bucket_bits) - 1
+        self._counts = {}
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    @property
+    def significant_digits(self):
+        # type: () -> int
+        """
+        Number of significant decimal digits maintained
+        """
+        return self._significant_digits
+
+    @property
+    def count(self):
+        # type: () -> int
+        """
+        Number of recorded values
+        """
+        return self._count
+
+    @property
+    def min(self):
+        # type: () -> int
+        """
+        Smallest recorded value, or `None` if the histogram is empty
+        """
+        return self._min
+
+    @property
+    def max(self):
+        # type: () -> int
+        """
+        Largest recorded value, or `None` if the histogram is empty
+        """
+        return self._max
+
+    @property
+    def mean(self):
+        # type: () -> float
+        """
+        Mean of all recorded values, or `None` if the histogram is empty
+        """
+        if not self._count:
+            return None
+        return float(self._total) / self._count
+
+    def _index(self, value):
+        bucket = max(value.bit_length() - self._sub_bucket_bits, 0)
+        return (bucket << self._sub_bucket_bits) | (value >> bucket)
+
+    def _value_range(self, index):
+        """
+        Lowest and highest value which are recorded at the given index
+        """
+        bucket = index >> self._sub_bucket_bits
+        sub_bucket = index & self._sub_bucket_mask
+        lowest = sub_bucket << bucket
+        return lowest, lowest + (1 << bucket) - 1
+
+    def record(self, value, count=1):
+        """
+        Record a value
+
+        :param value: Value to record, floats are truncated
+        :type value: int
+        :param count: Number of times to record the value
+        :type count: int
+        """
+        value = int(value)
+        if value < 0:
+            raise ValueError('Negative values can\'t be recorded')
+
+        index = self._index(value)
+        self._counts[index] = self._counts.get(index, 0) + count
+        self._count += count
+        self._total += value * count
+
+        if self._min is None or value < self._min:
+            self._min = value
+        if self._max is None or value > self._max:
+            self._max = value
+
+    def merge(self, other):
+        """
+        Add all values recorded in another histogram to this one
+
+        :param other: Histogram to merge, using the same number of significant digits
+        :type other: Histogram
+        """
+        if other.significant_digits != self._significant_digits:
+            raise ValueError('Can\'t merge histograms with different precision')
+
+        for index, count in other._counts.iteritems():
+            self._counts[index] = self._counts.get(index, 0) + count
+
+        self._count += other._count
+        self._total += other._total
+
+        if other._min is not None and (self._min is None or other._min < self._min):
+            self._min = other._min
+        if other._max is not None and (self._max is None or other._max > self._max):
+            self._max = other._max
+
+    def reset(self):
+        """
+        Remove all recorded values
+        """
+        self._counts.clear()
+        self._count = 0
+        self._total = 0
+        self._min = None
+        self._max = None
+
+    def percentile(self, percentile):
+        """
+        Value at the given percentile
+
+        The highest value equivalent to the recorded one is returned, capped by the largest recorded value, so a
+        percentile is never under-reported.
+
+        >>> histogram = Histogram()
+        >>> histogram.percentile(50) is None
+        True
+        >>> histogram.record(123456)
+        >>> histogram.percentile(50)
+        123456
+
+        :param percentile: Percentile, between 0 and 100
+        :type percentile: float
+        :return: Value at the percentile, or `None` if the histogram is empty
+        :rtype: int
+        """
+        for value, _ in self._iter_percentiles([percentile]):
+            return value
+        return None
+
+    def percentiles(self, percentiles):
+        """
+        Values at several percentiles
+
+        :param percentiles: Percentiles, between 0 and 100
+        :type percentiles: iterable of float
+        :return: Mapping of percentile to value, empty if the histogram is empty
+        :rtype: dict
+        """
+        return dict((percentile, value) for value, percentile in self._iter_percentiles(percentiles))
+
+    def _iter_percentiles(self, percentiles):
+        if not self._count:
+            return
+
+        wanted = sorted(percentiles)
+        position = 0
+        seen = 0
+        for index in sorted(self._counts):
+            seen += self._counts[index]
+            # Round to avoid floating point errors bumping the rank, e.g. 99.9% of 10000 values
+            while position < len(wanted) and seen >= math.ceil(round(wanted[position] / 100.0 * self._count, 9)):
+                yield min(self._value_range(index)[1], self._max), wanted[position]
+                position += 1
+            if position == len(wanted):
+                return
+
+    def distribution(self, ticks_per_half_distance=5):
+        """
+        Percentile distribution, as plotted by HdrHistogram tools
+
+        The distance to 100% is halved repeatedly, and every half is split in `ticks_per_half_distance` steps, which
+        gives more detail in the tail of the distribution.
+
+        :param ticks_per_half_distance: Number of reported percentiles per halving of the distance to 100%
+        :type ticks_per_half_distance: int
+        :return: List of `(value, percentile, total count)` tuples, ending at the maximum value
+        :rtype: list of (int, float, int)
+        """
+        if not self._count:
+            return []
+
+        percentiles = [0.0]
+        half_distance = 50.0
+        while 100.0 - percentiles[-1] > 100.0 / self._count and half_distance > 1e-6:
+            base = percentiles[-1]
+            step = half_distance / ticks_per_half_distance
+            percentiles.extend(base + step * tick for tick in xrange(1, ticks_per_half_distance + 1))
+            half_distance /= 2
+
+        values = self.percentiles(percentiles)
+        result = []
+        for percentile in percentiles:
+            value = values[percentile]
+            count = sum(count for index, count in self._counts.iteritems() if self._value_range(index)[0] <= value)
+            result.append((value, percentile, count))
+        result.append((self._max, 100.0, self._count))
+
+        return result
+
+    def format_distribution(self, scale=1.0, ticks_per_half_distance=5):
+        """
+        Format the percentile distribution in the HdrHistogram text format
+
+        :param scale: Divisor applied to reported values, e.g. 1000.0 to report microseconds as milliseconds
+        :type scale: float
+        :param ticks_per_half_distance: See :meth:`distribution`
+        :type ticks_per_half_distance: int
+        :return: Formatted distribution
+        :rtype: str
+        """
+        lines = ['%12s %14s %10s %14s' % ('Value', 'Percentile', 'TotalCount', '1/(1-Percentile)'), '']
+        for value, percentile, count in self.distribution(ticks_per_half_distance):
+            fraction = percentile / 100.0
+            inverse = '%14.2f' % (1 / (1 - fraction)) if fraction < 1 else '%14s' % 'inf'
+            lines.append('%12.3f %14.12f %10d %s' % (value / scale, fraction, count, inverse))
+
+        mean = self.mean
+        lines.append('#[Mean    = %12.3f, Max        = %12.3f]' % (
+            (mean or 0) / scale, (self._max or 0) / scale))
+        lines.append('#[Count   = %12d]' % self._count)
+
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self, percentiles=(50, 90, 99, 99.9, 99.99), scale=1.0):
+        """
+        Summarize the histogram
+
+        :param percentiles: Percentiles to report
+        :type percentiles: iterable of float
+        :param scale: Divisor applied to reported values
+        :type scale: float
+        :return: Count, min, max, mean and requested percentiles, as `p<percentile>` keys
+        :rtype: dict
+        """
+        result = {
+            'count': self._count,
+            'min': self._min / scale if self._min is not None else None,
+            'max': self._max / scale if self._max is not None else None,
+            'mean': self.mean / scale if self._count else None,
+        }
+        for percentile, value in self.percentiles(percentiles).iteritems():
+            result['p%g' % percentile] = value / scale
+
+        return result
+
+    def __getstate__(self):
+        return dict((slot, getattr(self, slot)) for slot in self.__slots__)
+
+    def __setstate__(self, state):
+        for slot, value in state.iteritems():
+            setattr(self, slot, value)
+
+    def __repr__(self):
+        return '<Histogram count=%d min=%r max=%r>' % (self._count, self._min, self._max)
@@ -0,0 +1,280 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Opt-in breakdown of call time in serialization, network and decoding
+
+While a :class:`Profiler` is enabled, every call processed through :func:`pyrakoon.utils.process_blocking`, the
+native :class:`pyrakoon.client.SocketClient` or the compat :class:`pyrakoon.compat.ArakoonClient` accounts the time
+spent in three phases, aggregated per message type:
+
+* *serialize*: time spent in :meth:`pyrakoon.protocol.Message.serialize`
+* *network*: time spent waiting in the `read` callable passed to :func:`pyrakoon.utils.read_blocking`
+* *decode*: time spent in the steps of the :meth:`pyrakoon.protocol.Message.receive` coroutine
+
+The number of decoder steps is reported as well: a large number of steps per call points at per-field decoding
+overhead in :mod:`pyrakoon.protocol.types` rather than at the network.
+
+>>> import StringIO
+>>> from pyrakoon import protocol, utils
+>>> class Stream(StringIO.StringIO):
+...     def write(self, data):
+...         pass
+>>> stream = Stream('\\x00\\x00\\x00\\x00' '\\x01' '\\x09\\x00\\x00\\x00' 'arakoon_0')
+>>> with Profiler() as profiler:
+...     utils.process_blocking(protocol.WhoMaster(), stream)
+'arakoon_0'
+>>> stats = profiler.stats()['WhoMaster']
+>>> stats['calls'], stats['decode_steps'], stats['bytes_sent'], stats['bytes_received']
+(1, 5, 4, 18)
+
+When no profiler is enabled, :func:`start` returns `None` and clients skip all profiling work.
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+from .constants.logging import PYRAKOON_PROFILING_LOGGER
+
+logger = logging.getLogger(PYRAKOON_PROFILING_LOGGER)
+
+_ACTIVE = None
+_ACTIVE_LOCK = threading.Lock()
+
+
+def active():
+    """
+    Get the enabled profiler
+
+    :return: Enabled profiler, or `None`
+    :rtype: Profiler
+    """
+    return _ACTIVE
+
+
+def start(message):
+    """
+    Start profiling a call
+
+    :param message: Message being processed
+    :type message: pyrakoon.protocol.Message
+    :return: Profile of the call, or `None` if no profiler is enabled
+    :rtype: CallProfile
+    """
+    profiler = _ACTIVE
+    if profiler is None:
+        return None
+
+    return CallProfile(profiler, message)
+
+
+class CallProfile(object):
+    """
+    Time spent in the phases of a single call
+
+    All durations are in seconds.
+    """
+
+    __slots__ = 'message', 'serialize_time', 'network_time', 'decode_time', 'decode_steps', 'bytes_sent', \
+        'bytes_received', 'error', '_profiler'
+
+    def __init__(self, profiler, message):
+        """
+        :param profiler: Profiler to report to
+        :type profiler: Profiler
+        :param message: Message being processed
+        :type message: pyrakoon.protocol.Message
+        """
+        self.message = message
+        self.serialize_time = 0.0
+        self.network_time = 0.0
+        self.decode_time = 0.0
+        self.decode_steps = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.error = None
+        self._profiler = profiler
+
+    @property
+    def message_type(self):
+        # type: () -> str
+        """
+        Name of the message class
+        """
+        return type(self.message).__name__
+
+    def serialize(self):
+        """
+        Serialize the message, accounting the time spent
+
+        :return: Serialized message
+        :rtype: str
+        """
+        start = time.time()
+        data = ''.join(self.message.serialize())
+        self.serialize_time += time.time() - start
+        self.bytes_sent = len(data)
+
+        return data
+
+    def finish(self, error=None):
+        """
+        Report the call to the profiler
+
+        :param error: Exception the call failed with, if any
+        :type error: Exception
+        """
+        self.error = error
+        self._profiler.record(self)
+
+
+class _MessageTotals(object):
+    """
+    Aggregated phase durations of a single message type
+    """
+
+    __slots__ = 'calls', 'errors', 'serialize', 'network', 'decode', 'decode_steps', 'bytes_sent', 'bytes_received'
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.serialize = 0.0
+        self.network = 0.0
+        self.decode = 0.0
+        self.decode_steps = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class Profiler(object):
+    """
+    Aggregate call profiles per message type
+
+    Only a single profiler can be enabled at a time. A profiler can be used as a context manager, which enables it
+    for the duration of the block.
+    """
+
+    def __init__(self, callback=None):
+        """
+        :param callback: Callable called with every :class:`CallProfile` once the call finished. Exceptions raised by
+         the callback are logged and otherwise ignored.
+        :type callback: callable
+        """
+        self._callback = callback
+        self._lock = threading.Lock()
+        self._totals = {}
+
+    @property
+    def enabled(self):
+        # type: () -> bool
+        """
+        Whether this profiler is enabled
+        """
+        return _ACTIVE is self
+
+    def enable(self):
+        """
+        Enable this profiler
+
+        :raise RuntimeError: Another profiler is enabled
+        """
+        global _ACTIVE
+
+        with _ACTIVE_LOCK:
+            if _ACTIVE is not None and _ACTIVE is not self:
+                raise RuntimeError('Another profiler is enabled')
+            _ACTIVE = self
+
+    def disable(self):
+        """
+        Disable this profiler, calls in progress are still recorded
+        """
+        global _ACTIVE
+
+        with _ACTIVE_LOCK:
+            if _ACTIVE is self:
+                _ACTIVE = None
+
+    def __enter__(self):
+        self.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.disable()
+
+    def record(self, profile):
+        """
+        Add a call profile to the totals
+
+        :param profile: Profile of a finished call
+        :type profile: CallProfile
+        """
+        name = profile.message_type
+
+        with self._lock:
+            totals = self._totals.get(name)
+            if totals is None:
+                totals = self._totals[name] = _MessageTotals()
+
+            totals.calls += 1
+            if profile.error is not None:
+                totals.errors += 1
+            totals.serialize += profile.serialize_time
+            totals.network += profile.network_time
+            totals.decode += profile.decode_time
+            totals.decode_steps += profile.decode_steps
+            totals.bytes_sent += profile.bytes_sent
+            totals.bytes_received += profile.bytes_received
+
+        if self._callback is not None:
+            try:
+                self._callback(profile)
+            except Exception: #pylint: disable=W0703
+                logger.exception('Profiler callback %r failed', self._callback)
+
+    def reset(self):
+        """
+        Clear all totals
+        """
+        with self._lock:
+            self._totals = {}
+
+    def stats(self):
+        """
+        Get the totals per message type
+
+        Durations are in seconds.
+
+        :return: Totals by message class name, e.g. ``{'Range': {'calls': 10, 'errors': 0, 'serialize': 0.0001,
+         'network': 0.012, 'decode': 0.034, 'decode_steps': 20020, 'bytes_sent': 420, 'bytes_received': 1100080}}``
+        :rtype: dict
+        """
+        with self._lock:
+            return dict((name, dict((slot, getattr(totals, slot)) for slot in _MessageTotals.__slots__))
+                        for name, totals in self._totals.iteritems())
+
+    def report(self):
+        """
+        Format the totals as a table, sorted by total time spent
+
+        :return: Report, durations in milliseconds
+        :rtype: str
+        """
+        stats = self.stats()
+        header = '%-24s %8s %13s %13s %13s %10s %12s %8s' % (
+            'Message', 'Calls', 'Serialize ms', 'Network ms', 'Decode ms', 'Steps/call', 'Bytes recv', 'Decode%')
+        lines = [header, '-' * len(header)]
+
+        by_total = lambda name: -(stats[name]['serialize'] + stats[name]['network'] + stats[name]['decode'])
+        for name in sorted(stats, key=by_total):
+            totals = stats[name]
+            total = totals['serialize'] + totals['network'] + totals['decode']
+            lines.append('%-24s %8d %13.3f %13.3f %13.3f %10.1f %12d %7.1f%%' % (
+                name, totals['calls'], totals['serialize'] * 1000, totals['network'] * 1000,
+                totals['decode'] * 1000, float(totals['decode_steps']) / totals['calls'], totals['bytes_received'],
+                100.0 * totals['decode'] / total if total else 0.0))
+
+        return '\n'.join(lines) + '\n'
@@ -151,6 +151,10 @@ class Sequence(Message):
         implementations of the :class:`pyrakoon.sequence.Step` class. These
         operations will be executed in an all-or-nothing transaction.
 
+        Large transactions can be built using a single
+        :class:`pyrakoon.sequence.SequenceBuilder`, which serializes steps as
+        they're added.
+
         :param steps: Steps to execute
         :type steps: iterable of :class:`pyrakoon.sequence.Step`
         :param sync: Use *synced_sequence*
@@ -163,7 +167,7 @@ class Sequence(Message):
 
         super(Sequence, self).__init__()
 
-        if len(steps) == 1 and isinstance(steps[0], sequence.Sequence):
+        if len(steps) == 1 and isinstance(steps[0], (sequence.Sequence, sequence.SequenceBuilder)):
             self._sequence = steps[0]
         else:
             self._sequence = sequence.Sequence(steps)
@@ -179,11 +183,19 @@ class Sequence(Message):
         return self._sync
 
     def serialize(self):
+        # Circular dependency
+        from ... import sequence
+
         tag = (0x0010 if not self.sync else 0x0024) | Message.MASK
 
         for bytes_ in UINT32.serialize(tag):
             yield bytes_
 
+        if isinstance(self.sequence, sequence.SequenceBuilder):
+            # Already serialized, including the length prefix
+            yield self.sequence.serialize_string()
+            return
+
         sequence_bytes = ''.join(self.sequence.serialize())
 
         for bytes_ in STRING.serialize(sequence_bytes):
@@ -534,17 +534,10 @@ class NamedField(Type):
 
         name = request.value
 
-        if type_ == cls.FIELD_TYPE_INT:
-            value_receiver = INT32.receive()
-        elif type_ == cls.FIELD_TYPE_INT64:
-            value_receiver = INT64.receive()
-        elif type_ == cls.FIELD_TYPE_FLOAT:
-            value_receiver = FLOAT.receive()
-        elif type_ == cls.FIELD_TYPE_STRING:
-            value_receiver = STRING.receive()
-        elif type_ == cls.FIELD_TYPE_LIST:
-            value_receiver = List(NamedField).receive()
-        else:
+        # Field types are shared, rather than allocated for every field
+        try:
+            value_receiver = _NAMED_FIELD_TYPES[type_].receive()
+        except KeyError:
             raise ValueError('Unknown named field type %d' % type_)
 
         request = value_receiver.next()
@@ -690,6 +683,15 @@ STEP = Step()
 
 STATISTICS = StatisticsType()
 
+# Value types of `NamedField` field types
+_NAMED_FIELD_TYPES = {
+    NamedField.FIELD_TYPE_INT: INT32,
+    NamedField.FIELD_TYPE_INT64: INT64,
+    NamedField.FIELD_TYPE_FLOAT: FLOAT,
+    NamedField.FIELD_TYPE_STRING: STRING,
+    NamedField.FIELD_TYPE_LIST: List(NamedField),
+}
+
 CONSISTENCY = Consistency()
 
 # Well-known `consistency` argument
@@ -4,6 +4,7 @@
 from __future__ import absolute_import
 
 from .steps import Step, Step, Set, Delete, Assert, AssertExists, Replace, DeletePrefix, AssertRange
+from .builder import SequenceBuilder
 from .. import protocol
 
 
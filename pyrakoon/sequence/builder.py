@@ -0,0 +1,256 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Streaming sequence builder
+
+A :class:`SequenceBuilder` serializes steps straight into a growing buffer as they're added, instead of creating a
+:class:`~pyrakoon.sequence.Step` instance per step and serializing all of them when the sequence is sent. The step
+count and the length prefix of the sequence are reserved at the start of the buffer, and patched when the buffer is
+read. This keeps memory usage and CPU time of large transactions close to the size of the request itself.
+
+A builder can be passed to :meth:`pyrakoon.client.ClientMixin.sequence` like any other step:
+
+>>> from pyrakoon import sequence
+>>> builder = SequenceBuilder()
+>>> builder.add_set('key', 'value')
+>>> builder.add_delete('other')
+>>> len(builder)
+2
+>>> builder.serialize_body() == ''.join(sequence.Sequence([
+...     sequence.Set('key', 'value'), sequence.Delete('other')]).serialize())
+True
+"""
+
+from __future__ import absolute_import
+
+import struct
+
+from .steps import Step, Set, Delete, Assert, AssertExists, Replace, DeletePrefix
+
+_UINT32 = struct.Struct('<I')
+# Step tag followed by the length of the first string argument, also used for the sequence tag and step count
+_TAG_LENGTH = struct.Struct('<II')
+# Option flag followed by the length of the string
+_SOME_LENGTH = struct.Struct('<cI')
+
+_SOME = chr(1)
+_NONE = chr(0)
+
+# The buffer starts with the length of the remainder, followed by the sequence tag and step count
+_HEADER_SIZE = 12
+_BODY_OFFSET = 4
+
+
+def _check_string(value):
+    if not isinstance(value, str):
+        raise TypeError
+
+
+class SequenceBuilder(Step):
+    """
+    Sequence whose steps are serialized as they're added
+
+    Arguments are type-checked once, when a step is added. Steps can't be inspected or removed once added.
+    Values of "Set", "Assert" and "Replace" steps are encoded by the given codec, if any, when they're added.
+    """
+
+    # Tag of a (nested) sequence step, see `pyrakoon.sequence.Sequence`
+    TAG = 5
+    ARGS = ()
+
+    def __init__(self, codec=None):
+        """
+        :param codec: Codec to encode values with
+        :type codec: pyrakoon.client.compression.ValueCodec
+        """
+        super(SequenceBuilder, self).__init__()
+
+        self._buffer = bytearray(_HEADER_SIZE)
+        self._count = 0
+        self._codec = codec
+        self._compressed_asserts = []
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def compressed_asserts(self):
+        # type: () -> List[Tuple[str, str, str]]
+        """
+        "Assert" steps whose value was compressed by the codec, as `(key, value, encoded)` tuples
+        """
+        return self._compressed_asserts
+
+    @property
+    def size(self):
+        # type: () -> int
+        """
+        Size of the sequence serialized as a step, in bytes
+        """
+        return len(self._buffer) - _BODY_OFFSET
+
+    def add_set(self, key, value):
+        """
+        Add a "Set" step
+
+        :param key: Key to set
+        :type key: str
+        :param value: Value to set
+        :type value: str
+        """
+        _check_string(key)
+        _check_string(value)
+        if self._codec is not None:
+            value = self._codec.encode(key, value)
+
+        buffer_ = self._buffer
+        buffer_ += _TAG_LENGTH.pack(Set.TAG, len(key))
+        buffer_ += key
+        buffer_ += _UINT32.pack(len(value))
+        buffer_ += value
+        self._count += 1
+
+    def add_delete(self, key):
+        """
+        Add a "Delete" step
+
+        :param key: Key to delete
+        :type key: str
+        """
+        self._add_string(Delete.TAG, key)
+
+    def add_delete_prefix(self, prefix):
+        """
+        Add a "DeletePrefix" step
+
+        :param prefix: Prefix of the keys to delete
+        :type prefix: str
+        """
+        self._add_string(DeletePrefix.TAG, prefix)
+
+    def add_assert_exists(self, key):
+        """
+        Add an "AssertExists" step
+
+        :param key: Key to check
+        :type key: str
+        """
+        self._add_string(AssertExists.TAG, key)
+
+    def add_assert(self, key, value):
+        """
+        Add an "Assert" step
+
+        :param key: Key to check
+        :type key: str
+        :param value: Expected value, or `None` if the key should not exist
+        :type value: str
+        """
+        self._add_string_option(Assert.TAG, key, value)
+
+    def add_replace(self, key, wanted):
+        """
+        Add a "Replace" step
+
+        :param key: Key to replace
+        :type key: str
+        :param wanted: Value to set, or `None` to delete the key
+        :type wanted: str
+        """
+        self._add_string_option(Replace.TAG, key, wanted)
+
+    def add_step(self, step):
+        """
+        Add any step, including nested sequences and builders
+
+        Values of nested builders are encoded by their own codec.
+
+        :param step: Step to add
+        :type step: pyrakoon.sequence.Step
+        """
+        if not isinstance(step, Step):
+            raise TypeError
+
+        if self._codec is not None:
+            step = self._codec.encode_step(step, self._compressed_asserts)
+        elif isinstance(step, SequenceBuilder):
+            self._compressed_asserts.extend(step.compressed_asserts)
+
+        if isinstance(step, SequenceBuilder):
+            step._patch() #pylint: disable=W0212
+            self._buffer += buffer(step._buffer, _BODY_OFFSET) #pylint: disable=W0212
+        else:
+            self._buffer += ''.join(step.serialize())
+
+        self._count += 1
+
+    def extend(self, steps):
+        """
+        Add steps created as :class:`~pyrakoon.sequence.Step` instances
+
+        :param steps: Steps to add
+        :type steps: iterable of pyrakoon.sequence.Step
+        """
+        for step in steps:
+            type_ = type(step)
+            # Arguments of these steps were checked when they were created
+            if type_ is Set:
+                self.add_set(step.key, step.value)
+            elif type_ is Delete:
+                self.add_delete(step.key)
+            else:
+                self.add_step(step)
+
+    def _add_string(self, tag, value):
+        _check_string(value)
+
+        buffer_ = self._buffer
+        buffer_ += _TAG_LENGTH.pack(tag, len(value))
+        buffer_ += value
+        self._count += 1
+
+    def _add_string_option(self, tag, key, value):
+        _check_string(key)
+        if value is not None:
+            _check_string(value)
+            if self._codec is not None:
+                encoded = self._codec.encode(key, value)
+                if tag == Assert.TAG and encoded is not value:
+                    self._compressed_asserts.append((key, value, encoded))
+                value = encoded
+
+        buffer_ = self._buffer
+        buffer_ += _TAG_LENGTH.pack(tag, len(key))
+        buffer_ += key
+        if value is None:
+            buffer_ += _NONE
+        else:
+            buffer_ += _SOME_LENGTH.pack(_SOME, len(value))
+            buffer_ += value
+        self._count += 1
+
+    def _patch(self):
+        _UINT32.pack_into(self._buffer, 0, len(self._buffer) - _BODY_OFFSET)
+        _TAG_LENGTH.pack_into(self._buffer, _BODY_OFFSET, self.TAG, self._count)
+
+    def serialize_body(self):
+        """
+        Serialize the sequence as a step
+
+        :rtype: str
+        """
+        self._patch()
+        return str(buffer(self._buffer, _BODY_OFFSET))
+
+    def serialize(self):
+        yield self.serialize_body()
+
+    def serialize_string(self):
+        """
+        Serialize the sequence as the length-prefixed string sent in a "sequence" message
+
+        :rtype: str
+        """
+        self._patch()
+        return str(self._buffer)
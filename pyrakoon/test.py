@@ -22,7 +22,7 @@ from . import client, compat, errors, protocol, utils
 LOGGER = logging.getLogger(__name__)
 
 #pylint: disable=R0904
-class FakeClient(object, client.AbstractClient, client.ClientMixin):
+class FakeClient(client.AbstractClient, client.ClientMixin):
     '''Fake, in-memory Arakoon client'''
 
     VERSION = 'FakeRakoon/0.1'
@@ -0,0 +1,6 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Command-line tools built on top of the Pyrakoon clients
+"""
@@ -0,0 +1,888 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+YCSB-style workload generator
+
+Drives a configurable mix of read, update, insert, scan and read-modify-write operations against an Arakoon cluster,
+and reports throughput and latency histograms per operation. Exposed as the ``pyrakoon-bench`` command::
+
+    pyrakoon-bench --fake 3 --workload a --threads 8 --operations 100000
+    pyrakoon-bench --cluster-id ricky --node arakoon_0:10.0.0.1:4000 --node arakoon_1:10.0.0.2:4000 \\
+        --client compat --workload b --processes 4 --threads 4 --duration 60 --target 20000
+
+Workloads mirror the YCSB core workloads:
+
+* `a`: 50% reads, 50% updates, zipfian key distribution
+* `b`: 95% reads, 5% updates, zipfian key distribution
+* `c`: only reads, zipfian key distribution
+* `d`: 95% reads, 5% inserts, reads favour recently inserted keys
+* `e`: 95% scans, 5% inserts, zipfian key distribution
+* `f`: 50% reads, 50% read-modify-writes (using `test_and_set`), zipfian key distribution
+
+When a target rate is set, latencies are measured from the moment an operation was scheduled to start instead of
+when it actually started, so a stalling cluster doesn't hide its effect on the latency distribution (coordinated
+omission).
+"""
+
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import logging
+import argparse
+import itertools
+import threading
+import multiprocessing
+
+from .cli import parse_node
+from .. import client, compat, errors, fake
+from ..constants.logging import PYRAKOON_TOOLS_LOGGER
+from ..histogram import Histogram
+
+logger = logging.getLogger(PYRAKOON_TOOLS_LOGGER)
+
+OPERATIONS = ('read', 'update', 'insert', 'scan', 'read_modify_write')
+
+DISTRIBUTION_UNIFORM = 'uniform'
+DISTRIBUTION_ZIPFIAN = 'zipfian'
+DISTRIBUTION_LATEST = 'latest'
+DISTRIBUTIONS = (DISTRIBUTION_UNIFORM, DISTRIBUTION_ZIPFIAN, DISTRIBUTION_LATEST)
+
+WORKLOADS = {
+    'a': ({'read': 0.5, 'update': 0.5}, DISTRIBUTION_ZIPFIAN),
+    'b': ({'read': 0.95, 'update': 0.05}, DISTRIBUTION_ZIPFIAN),
+    'c': ({'read': 1.0}, DISTRIBUTION_ZIPFIAN),
+    'd': ({'read': 0.95, 'insert': 0.05}, DISTRIBUTION_LATEST),
+    'e': ({'scan': 0.95, 'insert': 0.05}, DISTRIBUTION_ZIPFIAN),
+    'f': ({'read': 0.5, 'read_modify_write': 0.5}, DISTRIBUTION_ZIPFIAN),
+}
+
+PHASE_LOAD = 'load'
+PHASE_RUN = 'run'
+
+REPORTED_PERCENTILES = (50, 90, 95, 99, 99.9, 99.99)
+
+_FNV_OFFSET_BASIS_64 = 0xCBF29CE484222325
+_FNV_PRIME_64 = 1099511628211
+_MASK_64 = 2 ** 64 - 1
+
+
+def fnv_hash64(value):
+    """
+    FNV-1a hash of the bytes of a 64bit integer, used to scatter popular keys over the key space
+
+    :param value: Value to hash
+    :type value: int
+    :rtype: int
+    """
+    hash_ = _FNV_OFFSET_BASIS_64
+    for _ in xrange(8):
+        hash_ ^= value & 0xff
+        hash_ = (hash_ * _FNV_PRIME_64) & _MASK_64
+        value >>= 8
+    return hash_
+
+
+class UniformGenerator(object):
+    """
+    Uniformly distributed item numbers
+    """
+
+    def __init__(self, random_):
+        """
+        :param random_: Source of randomness
+        :type random_: random.Random
+        """
+        self._random = random_
+
+    def next(self, items):
+        """
+        Generate an item number
+
+        :param items: Number of items to choose from
+        :type items: int
+        :return: Item number in ``[0, items)``
+        :rtype: int
+        """
+        return int(self._random.random() * items)
+
+
+class ZipfianGenerator(object):
+    """
+    Zipfian distributed item numbers, item 0 being the most popular
+
+    Uses the algorithm by Gray et al. from "Quickly Generating Billion-Record Synthetic Databases", like YCSB. The
+    zeta constant is extended incrementally when the number of items grows.
+    """
+
+    def __init__(self, random_, theta=0.99):
+        """
+        :param random_: Source of randomness
+        :type random_: random.Random
+        :param theta: Skew of the distribution, between 0 and 1 (exclusive)
+        :type theta: float
+        """
+        if not 0 < theta < 1:
+            raise ValueError('theta must be between 0 and 1')
+
+        self._random = random_
+        self._theta = theta
+        self._alpha = 1.0 / (1.0 - theta)
+        self._zeta2 = self._zeta(0, 2, 0.0)
+        self._items = 0
+        self._zetan = 0.0
+        self._eta = 0.0
+
+    def _zeta(self, start, end, initial):
+        theta = self._theta
+        return initial + sum(1.0 / ((i + 1) ** theta) for i in xrange(start, end))
+
+    def next(self, items):
+        """
+        Generate an item number
+
+        :param items: Number of items to choose from
+        :type items: int
+        :return: Item number in ``[0, items)``
+        :rtype: int
+        """
+        if items != self._items:
+            if items > self._items:
+                self._zetan = self._zeta(self._items, items, self._zetan)
+            else:
+                self._zetan = self._zeta(0, items, 0.0)
+            self._items = items
+            if items > 1:
+                self._eta = (1 - (2.0 / items) ** (1 - self._theta)) / (1 - self._zeta2 / self._zetan)
+
+        u = self._random.random()
+        uz = u * self._zetan
+
+        if uz < 1.0 or items < 2:
+            return 0
+        if uz < 1.0 + 0.5 ** self._theta:
+            return 1
+
+        return min(int(items * (self._eta * u - self._eta + 1) ** self._alpha), items - 1)
+
+
+class ScrambledZipfianGenerator(ZipfianGenerator):
+    """
+    Zipfian distributed item numbers, with popular items scattered over the item space
+    """
+
+    def next(self, items):
+        return fnv_hash64(super(ScrambledZipfianGenerator, self).next(items)) % items
+
+
+class LatestGenerator(ZipfianGenerator):
+    """
+    Zipfian distributed item numbers, the most recently inserted item being the most popular
+    """
+
+    def next(self, items):
+        return items - 1 - super(LatestGenerator, self).next(items)
+
+
+class KeySpace(object):
+    """
+    Key numbering and thread-safe allocation of keys to insert
+
+    Every process inserts keys from its own stride, so processes never insert the same key.
+    """
+
+    def __init__(self, prefix, record_count, stride=1, offset=0):
+        """
+        :param prefix: Key prefix
+        :type prefix: str
+        :param record_count: Number of keys stored by the load phase
+        :type record_count: int
+        :param stride: Number of processes inserting keys
+        :type stride: int
+        :param offset: Index of this process
+        :type offset: int
+        """
+        self._prefix = prefix
+        self._record_count = record_count
+        self._stride = stride
+        self._next_insert = record_count + offset
+        self._items = record_count
+        self._lock = threading.Lock()
+
+    @property
+    def items(self):
+        # type: () -> int
+        """
+        Number of keys known to exist
+        """
+        return self._items
+
+    def key(self, number):
+        """
+        Key of an item number
+
+        :param number: Item number
+        :type number: int
+        :rtype: str
+        """
+        return '%s%012d' % (self._prefix, number)
+
+    def next_insert(self):
+        """
+        Allocate an item number to insert
+
+        :rtype: int
+        """
+        with self._lock:
+            number = self._next_insert
+            self._next_insert += self._stride
+            return number
+
+    def inserted(self, number):
+        """
+        Mark an item number as inserted, making it available to reads
+
+        :param number: Item number
+        :type number: int
+        """
+        with self._lock:
+            self._items = max(self._items, number + 1)
+
+
+class ClientAdapter(object):
+    """
+    Map workload operations onto a client implementing the :class:`pyrakoon.client.ClientMixin` interface
+    """
+
+    def __init__(self, client_):
+        self.client = client_
+
+    def read(self, key):
+        return self.client.get(key)
+
+    def update(self, key, value):
+        self.client.set(key, value)
+
+    def insert(self, key, value):
+        self.client.set(key, value)
+
+    def scan(self, key, count):
+        return self.client.range_entries(key, True, None, True, count)
+
+    def read_modify_write(self, key, value):
+        self.client.test_and_set(key, self.read(key), value)
+
+    def recover(self):
+        """
+        Called after an operation failed with an error other than :class:`pyrakoon.errors.ArakoonError`
+        """
+
+    def close(self):
+        """
+        Release all resources held by the client
+        """
+
+
+class _NativeClient(client.SocketClient, client.ClientMixin):
+    """
+    Native socket client
+    """
+
+
+class NativeClientAdapter(ClientAdapter):
+    """
+    Adapter for :class:`pyrakoon.client.SocketClient`, connected to the master node
+    """
+
+    def __init__(self, cluster_id, nodes):
+        """
+        :param cluster_id: Identifier of the cluster
+        :type cluster_id: str
+        :param nodes: Node addresses by node identifier
+        :type nodes: dict of (str, int)
+        """
+        self._cluster_id = cluster_id
+        self._nodes = nodes
+        super(NativeClientAdapter, self).__init__(self._connect_master())
+
+    def _connect(self, address):
+        client_ = _NativeClient(address, self._cluster_id)
+        client_.connect()
+        return client_
+
+    def _connect_master(self):
+        for node_id in sorted(self._nodes):
+            try:
+                client_ = self._connect(self._nodes[node_id])
+                master = client_.who_master()
+            except (socket.error, errors.ArakoonError):
+                continue
+
+            if master == node_id:
+                return client_
+            if master in self._nodes:
+                return self._connect(self._nodes[master])
+
+        raise errors.NoMaster('Unable to find the master node')
+
+    def recover(self):
+        self.close()
+        self.client = self._connect_master()
+
+    def close(self):
+        if self.client.connected:
+            self.client._socket.close()
+
+
+class CompatClientAdapter(ClientAdapter):
+    """
+    Adapter for :class:`pyrakoon.compat.ArakoonClient`
+    """
+
+    def __init__(self, cluster_id, nodes):
+        """
+        :param cluster_id: Identifier of the cluster
+        :type cluster_id: str
+        :param nodes: Node addresses by node identifier
+        :type nodes: dict of (str, int)
+        """
+        config = compat.ArakoonClientConfig(cluster_id, dict(
+            (node_id, ([host], port)) for node_id, (host, port) in nodes.iteritems()))
+        super(CompatClientAdapter, self).__init__(compat.ArakoonClient(config))
+
+    def read_modify_write(self, key, value):
+        self.client.testAndSet(key, self.read(key), value)
+
+    def close(self):
+        self.client.dropConnections()
+
+
+CLIENTS = {
+    'native': NativeClientAdapter,
+    'compat': CompatClientAdapter,
+}
+
+
+def load_client_factory(name):
+    """
+    Look up a client adapter factory
+
+    :param name: One of :data:`CLIENTS`, or ``module:callable`` naming a callable which takes a cluster identifier
+     and a node address mapping, and returns a :class:`ClientAdapter` or a client implementing the
+     :class:`pyrakoon.client.ClientMixin` interface
+    :type name: str
+    :rtype: callable
+    """
+    if name in CLIENTS:
+        return CLIENTS[name]
+
+    if ':' not in name:
+        raise ValueError('Unknown client %r' % name)
+
+    module_name, attribute = name.split(':', 1)
+    module = __import__(module_name, fromlist=[attribute])
+    factory = getattr(module, attribute)
+
+    def create(cluster_id, nodes):
+        client_ = factory(cluster_id, nodes)
+        if not isinstance(client_, ClientAdapter):
+            client_ = ClientAdapter(client_)
+        return client_
+
+    return create
+
+
+class Settings(object):
+    """
+    Benchmark settings, shared with worker processes
+    """
+
+    def __init__(self, cluster_id, nodes, client_name='native', proportions=None,
+                 distribution=DISTRIBUTION_ZIPFIAN, record_count=1000, operation_count=10000, duration=None,
+                 value_size=100, scan_length=10, key_prefix='user', threads=1, processes=1, target=None, seed=None):
+        self.cluster_id = cluster_id
+        self.nodes = nodes
+        self.client_name = client_name
+        self.proportions = proportions or dict(WORKLOADS['a'][0])
+        self.distribution = distribution
+        self.record_count = record_count
+        self.operation_count = operation_count
+        self.duration = duration
+        self.value_size = value_size
+        self.scan_length = scan_length
+        self.key_prefix = key_prefix
+        self.threads = threads
+        self.processes = processes
+        self.target = target
+        self.seed = seed if seed is not None else int(time.time())
+
+        unknown = set(self.proportions) - set(OPERATIONS)
+        if unknown:
+            raise ValueError('Unknown operations: %s' % ', '.join(sorted(unknown)))
+        if sum(self.proportions.itervalues()) <= 0:
+            raise ValueError('No operations to run')
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError('Unknown distribution %r' % distribution)
+
+    @property
+    def workers(self):
+        # type: () -> int
+        """
+        Total number of worker threads
+        """
+        return self.threads * self.processes
+
+    def to_dict(self):
+        return dict((name, value) for name, value in vars(self).iteritems() if name != 'nodes')
+
+
+class Results(object):
+    """
+    Latency histograms, in microseconds, and error counts per operation
+    """
+
+    def __init__(self):
+        self.histograms = dict((operation, Histogram(3)) for operation in OPERATIONS)
+        self.errors = dict((operation, {}) for operation in OPERATIONS)
+        self.elapsed = 0.0
+
+    @property
+    def operations(self):
+        # type: () -> int
+        """
+        Number of executed operations, including failed ones
+        """
+        return sum(histogram.count for histogram in self.histograms.itervalues()) + \
+            sum(sum(counts.itervalues()) for counts in self.errors.itervalues())
+
+    def record_error(self, operation, exc):
+        counts = self.errors[operation]
+        name = type(exc).__name__
+        counts[name] = counts.get(name, 0) + 1
+
+    def merge(self, other):
+        """
+        Add the results of another worker
+
+        :type other: Results
+        """
+        for operation in OPERATIONS:
+            self.histograms[operation].merge(other.histograms[operation])
+            counts = self.errors[operation]
+            for name, count in other.errors[operation].iteritems():
+                counts[name] = counts.get(name, 0) + count
+        self.elapsed = max(self.elapsed, other.elapsed)
+
+    def to_dict(self):
+        operations = {}
+        for operation in OPERATIONS:
+            histogram = self.histograms[operation]
+            if not histogram.count and not self.errors[operation]:
+                continue
+            summary = histogram.to_dict(REPORTED_PERCENTILES)
+            summary['errors'] = dict(self.errors[operation])
+            operations[operation] = summary
+
+        return {
+            'elapsed': self.elapsed,
+            'operations': self.operations,
+            'throughput': self.operations / self.elapsed if self.elapsed else 0.0,
+            'latency_us': operations,
+        }
+
+
+class Worker(object):
+    """
+    Single benchmark thread, owning its own client
+    """
+
+    def __init__(self, settings, key_space, index, operation_count, deadline, rate):
+        """
+        :param settings: Benchmark settings
+        :type settings: Settings
+        :param key_space: Key space shared by all threads of the process
+        :type key_space: KeySpace
+        :param index: Global index of this worker
+        :type index: int
+        :param operation_count: Number of operations to run, or `None` to run until the deadline
+        :type operation_count: int
+        :param deadline: Time at which to stop, or `None`
+        :type deadline: float
+        :param rate: Target number of operations per second of this worker, or `None`
+        :type rate: float
+        """
+        self._settings = settings
+        self._key_space = key_space
+        self._operation_count = operation_count
+        self._deadline = deadline
+        self._rate = rate
+        self._random = random.Random(settings.seed * 1000003 + index)
+        self._value = os.urandom(settings.value_size)
+        self.results = Results()
+
+        if settings.distribution == DISTRIBUTION_UNIFORM:
+            self._generator = UniformGenerator(self._random)
+        elif settings.distribution == DISTRIBUTION_LATEST:
+            self._generator = LatestGenerator(self._random)
+        else:
+            self._generator = ScrambledZipfianGenerator(self._random)
+
+        total = float(sum(settings.proportions.itervalues()))
+        self._choices = []
+        cumulative = 0.0
+        for operation in OPERATIONS:
+            cumulative += settings.proportions.get(operation, 0.0) / total
+            self._choices.append((cumulative, operation))
+
+    def _choose(self):
+        value = self._random.random()
+        for cumulative, operation in self._choices:
+            if value < cumulative:
+                return operation
+        return self._choices[-1][1]
+
+    def _existing_key(self):
+        items = self._key_space.items
+        return self._key_space.key(self._generator.next(items))
+
+    def _execute(self, adapter, operation):
+        if operation == 'insert':
+            number = self._key_space.next_insert()
+            adapter.insert(self._key_space.key(number), self._value)
+            self._key_space.inserted(number)
+        elif operation == 'scan':
+            adapter.scan(self._existing_key(), self._random.randint(1, self._settings.scan_length))
+        elif operation == 'read':
+            adapter.read(self._existing_key())
+        else:
+            getattr(adapter, operation)(self._existing_key(), self._value)
+
+    def _timed(self, adapter, operation, intended):
+        start = time.time()
+        try:
+            self._execute(adapter, operation)
+        except (errors.ArakoonError, compat.ArakoonException) as exc:
+            self.results.record_error(operation, exc)
+        except (socket.error, client.NotConnectedError) as exc:
+            self.results.record_error(operation, exc)
+            try:
+                adapter.recover()
+            except Exception: #pylint: disable=W0703
+                logger.exception('Unable to recover client')
+        else:
+            self.results.histograms[operation].record((time.time() - (intended or start)) * 1e6)
+
+    def run(self, adapter, phase, numbers=None):
+        """
+        Run operations until the operation count or deadline is reached
+
+        :param adapter: Client to use
+        :type adapter: ClientAdapter
+        :param phase: Benchmark phase
+        :type phase: str
+        :param numbers: Item numbers to insert during the load phase
+        :type numbers: iterable of int
+        """
+        start = time.time()
+        interval = 1.0 / self._rate if self._rate else None
+
+        if phase == PHASE_LOAD:
+            work = ((number, 'insert') for number in numbers)
+        else:
+            numbers = xrange(self._operation_count) if self._operation_count is not None else itertools.count()
+            work = ((item, self._choose()) for item in numbers)
+
+        for done, (item, operation) in enumerate(work):
+            if self._deadline is not None and time.time() >= self._deadline:
+                break
+
+            intended = None
+            if interval is not None:
+                intended = start + done * interval
+                delay = intended - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if phase == PHASE_LOAD:
+                self._timed_load(adapter, item, intended)
+            else:
+                self._timed(adapter, operation, intended)
+
+        self.results.elapsed = time.time() - start
+
+    def _timed_load(self, adapter, number, intended):
+        start = time.time()
+        try:
+            adapter.insert(self._key_space.key(number), self._value)
+        except (errors.ArakoonError, compat.ArakoonException, socket.error, client.NotConnectedError) as exc:
+            self.results.record_error('insert', exc)
+        else:
+            self.results.histograms['insert'].record((time.time() - (intended or start)) * 1e6)
+
+
+def run_process(settings, phase, process_index):
+    """
+    Run the worker threads of a single benchmark process
+
+    :param settings: Benchmark settings
+    :type settings: Settings
+    :param phase: Phase to run, :data:`PHASE_LOAD` or :data:`PHASE_RUN`
+    :type phase: str
+    :param process_index: Index of this process
+    :type process_index: int
+    :return: Merged results of all threads
+    :rtype: Results
+    """
+    factory = load_client_factory(settings.client_name)
+    key_space = KeySpace(settings.key_prefix, settings.record_count, settings.processes, process_index)
+    deadline = time.time() + settings.duration if settings.duration and phase == PHASE_RUN else None
+    rate = float(settings.target) / settings.workers if settings.target else None
+
+    workers = []
+    for thread_index in xrange(settings.threads):
+        index = process_index * settings.threads + thread_index
+        # Split operations evenly over all workers
+        count = None
+        if settings.operation_count is not None:
+            count = settings.operation_count // settings.workers + \
+                (1 if index < settings.operation_count % settings.workers else 0)
+        workers.append(Worker(settings, key_space, index, count, deadline, rate))
+
+    adapters = [factory(settings.cluster_id, settings.nodes) for _ in workers]
+
+    threads = []
+    for index, (worker, adapter) in enumerate(zip(workers, adapters)):
+        global_index = process_index * settings.threads + index
+        numbers = xrange(global_index, settings.record_count, settings.workers)
+        thread = threading.Thread(target=worker.run, args=(adapter, phase, numbers),
+                                  name='pyrakoon-bench-%d' % global_index)
+        thread.daemon = True
+        threads.append(thread)
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for adapter in adapters:
+        try:
+            adapter.close()
+        except Exception: #pylint: disable=W0703
+            logger.exception('Unable to close client')
+
+    results = Results()
+    for worker in workers:
+        results.merge(worker.results)
+    return results
+
+
+def _run_process_star(args):
+    return run_process(*args)
+
+
+def run_phase(settings, phase):
+    """
+    Run a benchmark phase in all configured processes
+
+    :param settings: Benchmark settings
+    :type settings: Settings
+    :param phase: Phase to run, :data:`PHASE_LOAD` or :data:`PHASE_RUN`
+    :type phase: str
+    :return: Merged results of all processes
+    :rtype: Results
+    """
+    if settings.processes == 1:
+        return run_process(settings, phase, 0)
+
+    pool = multiprocessing.Pool(settings.processes)
+    try:
+        process_results = pool.map(_run_process_star,
+                                   [(settings, phase, index) for index in xrange(settings.processes)])
+    finally:
+        pool.close()
+        pool.join()
+
+    results = Results()
+    for process_result in process_results:
+        results.merge(process_result)
+    return results
+
+
+def format_results(phase, results):
+    """
+    Format phase results in the YCSB report layout
+
+    :param phase: Benchmark phase
+    :type phase: str
+    :param results: Phase results
+    :type results: Results
+    :rtype: str
+    """
+    summary = results.to_dict()
+    lines = [
+        '[%s OVERALL] Runtime(s): %.3f' % (phase.upper(), summary['elapsed']),
+        '[%s OVERALL] Operations: %d' % (phase.upper(), summary['operations']),
+        '[%s OVERALL] Throughput(ops/sec): %.1f' % (phase.upper(), summary['throughput']),
+    ]
+    for operation in OPERATIONS:
+        if operation not in summary['latency_us']:
+            continue
+        name = operation.upper()
+        operation_summary = summary['latency_us'][operation]
+        lines.append('[%s] Operations: %d' % (name, operation_summary['count']))
+        if operation_summary['count']:
+            lines.append('[%s] AverageLatency(us): %.1f' % (name, operation_summary['mean']))
+            lines.append('[%s] MinLatency(us): %d' % (name, operation_summary['min']))
+            lines.append('[%s] MaxLatency(us): %d' % (name, operation_summary['max']))
+            for percentile in REPORTED_PERCENTILES:
+                lines.append('[%s] %gthPercentileLatency(us): %d' % (
+                    name, percentile, operation_summary['p%g' % percentile]))
+        for error, count in sorted(operation_summary['errors'].iteritems()):
+            lines.append('[%s] Errors(%s): %d' % (name, error, count))
+
+    return '\n'.join(lines)
+
+
+def _parse_proportion(value):
+    try:
+        operation, proportion = value.split('=', 1)
+        proportion = float(proportion)
+    except ValueError:
+        raise argparse.ArgumentTypeError('Expected OPERATION=PROPORTION, got %r' % value)
+    if operation not in OPERATIONS:
+        raise argparse.ArgumentTypeError('Unknown operation %r, expected one of %s' % (
+            operation, ', '.join(OPERATIONS)))
+    return operation, proportion
+
+
+def build_parser():
+    """
+    Build the command-line argument parser
+
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(prog='pyrakoon-bench', description='YCSB-style Arakoon workload generator')
+
+    target = parser.add_argument_group('cluster')
+    target.add_argument('--cluster-id', default='arakoon', help='cluster identifier (default: %(default)s)')
+    target.add_argument('--node', dest='nodes', action='append', type=parse_node, default=[],
+                        metavar='NAME:HOST:PORT', help='cluster node, can be given multiple times')
+    target.add_argument('--fake', type=int, metavar='NODES',
+                        help='run against an in-process fake cluster with this many nodes')
+    target.add_argument('--client', default='native',
+                        help='client implementation: %s, or module:callable returning a client (default: '
+                             '%%(default)s)' % ', '.join(sorted(CLIENTS)))
+
+    workload = parser.add_argument_group('workload')
+    workload.add_argument('--workload', choices=sorted(WORKLOADS), default='a',
+                          help='core workload to run (default: %(default)s)')
+    workload.add_argument('--proportion', dest='proportions', action='append', type=_parse_proportion, default=[],
+                          metavar='OPERATION=PROPORTION',
+                          help='override the operation mix, operations are %s' % ', '.join(OPERATIONS))
+    workload.add_argument('--distribution', choices=DISTRIBUTIONS,
+                          help='key distribution, defaults to the one of the workload')
+    workload.add_argument('--records', type=int, default=1000,
+                          help='number of records stored by the load phase (default: %(default)s)')
+    workload.add_argument('--operations', type=int,
+                          help='number of operations of the run phase (default: 10000, unlimited if --duration '
+                               'is given)')
+    workload.add_argument('--duration', type=float, help='stop the run phase after this many seconds')
+    workload.add_argument('--value-size', type=int, default=100, help='value size in bytes (default: %(default)s)')
+    workload.add_argument('--scan-length', type=int, default=10,
+                          help='maximum number of records per scan (default: %(default)s)')
+    workload.add_argument('--key-prefix', default='user', help='key prefix (default: %(default)s)')
+    workload.add_argument('--phase', choices=(PHASE_LOAD, PHASE_RUN, 'all'), default='all',
+                          help='phases to run (default: %(default)s)')
+    workload.add_argument('--seed', type=int, help='random seed')
+
+    execution = parser.add_argument_group('execution')
+    execution.add_argument('--threads', type=int, default=1, help='worker threads per process (default: %(default)s)')
+    execution.add_argument('--processes', type=int, default=1, help='worker processes (default: %(default)s)')
+    execution.add_argument('--target', type=float, help='target total operations per second')
+
+    output = parser.add_argument_group('output')
+    output.add_argument('--json', metavar='FILE', help='write results as JSON to FILE')
+    output.add_argument('--histogram-dir', metavar='DIR',
+                        help='write HdrHistogram percentile distributions (in milliseconds) to DIR')
+    output.add_argument('-v', '--verbose', action='store_true', help='enable debug logging')
+
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the ``pyrakoon-bench`` command
+
+    :param argv: Command-line arguments
+    :type argv: list of str
+    :return: Exit code
+    :rtype: int
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    if not args.nodes and not args.fake:
+        parser.error('either --node or --fake is required')
+
+    if args.operations is None and args.duration is None:
+        args.operations = 10000
+
+    proportions, distribution = WORKLOADS[args.workload]
+    if args.proportions:
+        proportions = dict(args.proportions)
+
+    cluster = None
+    nodes = dict(args.nodes)
+    if args.fake:
+        cluster = fake.FakeCluster(args.cluster_id, node_count=args.fake)
+        cluster.start()
+        nodes = dict((node_id, cluster.node(node_id).address) for node_id in cluster.nodes)
+
+    try:
+        settings = Settings(args.cluster_id, nodes, client_name=args.client, proportions=proportions,
+                            distribution=args.distribution or distribution, record_count=args.records,
+                            operation_count=args.operations, duration=args.duration, value_size=args.value_size,
+                            scan_length=args.scan_length, key_prefix=args.key_prefix, threads=args.threads,
+                            processes=args.processes, target=args.target, seed=args.seed)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    phases = (PHASE_LOAD, PHASE_RUN) if args.phase == 'all' else (args.phase,)
+    report = {'settings': settings.to_dict(), 'phases': {}}
+
+    try:
+        for phase in phases:
+            results = run_phase(settings, phase)
+            print format_results(phase, results)
+            sys.stdout.flush()
+
+            report['phases'][phase] = results.to_dict()
+
+            if args.histogram_dir:
+                if not os.path.isdir(args.histogram_dir):
+                    os.makedirs(args.histogram_dir)
+                for operation, histogram in results.histograms.iteritems():
+                    if histogram.count:
+                        path = os.path.join(args.histogram_dir, '%s_%s.hgrm' % (phase, operation))
+                        with open(path, 'w') as histogram_file:
+                            histogram_file.write(histogram.format_distribution(scale=1000.0))
+    finally:
+        if cluster is not None:
+            cluster.stop()
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(report, json_file, indent=2, sort_keys=True)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
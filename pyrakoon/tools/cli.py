@@ -0,0 +1,31 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Command-line argument helpers shared by the tools
+
+>>> parse_node('arakoon_0:127.0.0.1:4000')
+('arakoon_0', ('127.0.0.1', 4000))
+"""
+
+from __future__ import absolute_import
+
+import argparse
+
+
+def parse_node(value):
+    """
+    Parse a node given as `NAME:HOST:PORT`
+
+    :param value: Argument value
+    :type value: str
+    :return: Node name and address
+    :rtype: (str, (str, int))
+
+    :raise argparse.ArgumentTypeError: The value is malformed
+    """
+    try:
+        node_id, host, port = value.rsplit(':', 2)
+        return node_id, (host, int(port))
+    except ValueError:
+        raise argparse.ArgumentTypeError('Expected NAME:HOST:PORT, got %r' % value)
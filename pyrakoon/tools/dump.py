@@ -0,0 +1,480 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Streaming export and import of a key space
+
+:func:`dump` pages through the key space using `range_entries` and streams the pairs into a dump file, :func:`restore`
+replays a dump file using size-bounded batches, see :class:`pyrakoon.client.bulk.BulkWriter`. Memory usage is bounded
+by the page, block and batch sizes, regardless of the size of the key space. Exposed as the ``pyrakoon-dump`` and
+``pyrakoon-restore`` commands::
+
+    pyrakoon-dump --cluster-id ricky --node arakoon_0:10.0.0.1:4000 --prefix users/ users.dump
+    pyrakoon-restore --cluster-id ricky --node arakoon_0:10.0.0.2:4000 users.dump
+
+A dump is not a snapshot: keys changed while paging may or may not be included.
+
+Dump files consist of a header, a series of blocks, a block index and a trailer. Every block holds length-prefixed
+keys and values, optionally compressed using zlib, and a checksum. The index lists the offset, record count and first
+key of every block, so readers can seek to a key without scanning the whole file:
+
+>>> import StringIO
+>>> output = StringIO.StringIO()
+>>> with DumpWriter(output, block_size=16) as writer:
+...     for i in xrange(5):
+...         writer.add('key_%d' % i, 'value')
+>>> reader = DumpReader(StringIO.StringIO(output.getvalue()))
+>>> [block.first_key for block in reader.index()]
+['key_0', 'key_1', 'key_2', 'key_3', 'key_4']
+>>> [key for key, _ in reader.records('key_3')]
+['key_3', 'key_4']
+"""
+
+from __future__ import absolute_import
+
+import sys
+import zlib
+import bisect
+import struct
+import logging
+import argparse
+
+from .cli import parse_node
+from .. import compat
+from ..client.bulk import BulkWriter
+from ..compat.client.socket import ArakoonSocketClient
+from ..constants.logging import PYRAKOON_TOOLS_LOGGER
+
+logger = logging.getLogger(PYRAKOON_TOOLS_LOGGER)
+
+MAGIC = 'PYRKDUMP'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sI')
+# Section tags
+_BLOCK = 'B'
+_INDEX = 'I'
+# Flags, stored size, raw size, record count and CRC32 of the raw records
+_BLOCK_HEADER = struct.Struct('<BIIII')
+_FLAG_COMPRESSED = 1
+_UINT32 = struct.Struct('<I')
+# Block offset, record count and length of the first key
+_INDEX_ENTRY = struct.Struct('<QII')
+# Offset of the index, and the magic
+_TRAILER = struct.Struct('<Q8s')
+
+
+class BlockInfo(object):
+    """
+    Index entry of a dump block
+    """
+
+    __slots__ = 'offset', 'count', 'first_key'
+
+    def __init__(self, offset, count, first_key):
+        # type: (int, int, str) -> None
+        self.offset = offset
+        self.count = count
+        self.first_key = first_key
+
+    def __repr__(self):
+        return '<BlockInfo offset=%d count=%d first_key=%r>' % (self.offset, self.count, self.first_key)
+
+
+class DumpWriter(object):
+    """
+    Write key-value pairs to a dump file
+
+    The file object only needs to support `write`, so dumps can be streamed to a pipe. Keys should be added in
+    ascending order for seeking to work.
+    """
+
+    def __init__(self, fileobj, compress=True, block_size=1024 * 1024):
+        """
+        :param fileobj: File to write to, not closed by :meth:`close`
+        :type fileobj: file
+        :param compress: Compress blocks using zlib
+        :type compress: bool
+        :param block_size: Size of the records in a block, before compression, in bytes
+        :type block_size: int
+        """
+        if block_size < 1:
+            raise ValueError('block_size must be positive')
+
+        self._file = fileobj
+        self._compress = compress
+        self._block_size = block_size
+
+        self._offset = 0
+        self._index = []
+        self._records = []
+        self._records_size = 0
+        self._first_key = None
+        self.count = 0
+
+        self._write(_HEADER.pack(MAGIC, VERSION))
+
+    def _write(self, data):
+        self._file.write(data)
+        self._offset += len(data)
+
+    def add(self, key, value):
+        """
+        Add a key-value pair
+
+        :param key: Key
+        :type key: str
+        :param value: Value
+        :type value: str
+        """
+        if not self._records:
+            self._first_key = key
+
+        self._records.extend((_UINT32.pack(len(key)), key, _UINT32.pack(len(value)), value))
+        self._records_size += 8 + len(key) + len(value)
+        self.count += 1
+
+        if self._records_size >= self._block_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._records:
+            return
+
+        raw = ''.join(self._records)
+        data, flags = raw, 0
+        if self._compress:
+            compressed = zlib.compress(raw)
+            if len(compressed) < len(raw):
+                data, flags = compressed, _FLAG_COMPRESSED
+
+        self._index.append(BlockInfo(self._offset, len(self._records) / 4, self._first_key))
+        self._write(_BLOCK)
+        self._write(_BLOCK_HEADER.pack(flags, len(data), len(raw), len(self._records) / 4,
+                                       zlib.crc32(raw) & 0xffffffff))
+        self._write(data)
+
+        self._records = []
+        self._records_size = 0
+
+    def close(self):
+        """
+        Write the last block, the index and the trailer
+        """
+        self._flush()
+
+        index_offset = self._offset
+        self._write(_INDEX)
+        self._write(_UINT32.pack(len(self._index)))
+        for block in self._index:
+            self._write(_INDEX_ENTRY.pack(block.offset, block.count, len(block.first_key)))
+            self._write(block.first_key)
+        self._write(_TRAILER.pack(index_offset, MAGIC))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+class DumpReader(object):
+    """
+    Read key-value pairs from a dump file
+
+    Iterating over the reader yields all pairs, reading one block at a time. Seeking requires a seekable file.
+    """
+
+    def __init__(self, fileobj):
+        """
+        :param fileobj: File to read from
+        :type fileobj: file
+        """
+        self._file = fileobj
+
+        magic, version = _HEADER.unpack(self._read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('Not a dump file')
+        if version != VERSION:
+            raise ValueError('Unsupported dump version %d' % version)
+
+    def _read(self, count):
+        data = self._file.read(count)
+        if len(data) != count:
+            raise ValueError('Truncated dump file')
+        return data
+
+    def index(self):
+        """
+        Read the block index
+
+        The position of the reader is left unchanged.
+
+        :rtype: list of BlockInfo
+        """
+        position = self._file.tell()
+        try:
+            self._file.seek(-_TRAILER.size, 2)
+            index_offset, magic = _TRAILER.unpack(self._read(_TRAILER.size))
+            if magic != MAGIC:
+                raise ValueError('Truncated dump file')
+
+            self._file.seek(index_offset)
+            if self._read(1) != _INDEX:
+                raise ValueError('Corrupt dump index')
+
+            blocks = []
+            count, = _UINT32.unpack(self._read(_UINT32.size))
+            for _ in xrange(count):
+                offset, records, key_length = _INDEX_ENTRY.unpack(self._read(_INDEX_ENTRY.size))
+                blocks.append(BlockInfo(offset, records, self._read(key_length)))
+        finally:
+            self._file.seek(position)
+
+        return blocks
+
+    def records(self, start_key=None):
+        """
+        Read key-value pairs, from the current position or starting at a key
+
+        :param start_key: Smallest key to return, `None` to read from the current position
+        :type start_key: str
+        :return: Key-value pairs
+        :rtype: iterator of (str, str)
+        """
+        if start_key is not None:
+            blocks = self.index()
+            if not blocks:
+                return
+            position = max(bisect.bisect_right([block.first_key for block in blocks], start_key) - 1, 0)
+            self._file.seek(blocks[position].offset)
+
+        while True:
+            tag = self._read(1)
+            if tag == _INDEX:
+                return
+            if tag != _BLOCK:
+                raise ValueError('Corrupt dump file')
+
+            for key, value in self._read_block():
+                if start_key is None or key >= start_key:
+                    yield key, value
+
+    def _read_block(self):
+        flags, stored_size, raw_size, count, checksum = _BLOCK_HEADER.unpack(self._read(_BLOCK_HEADER.size))
+        raw = self._read(stored_size)
+        if flags & _FLAG_COMPRESSED:
+            raw = zlib.decompress(raw)
+        if len(raw) != raw_size or zlib.crc32(raw) & 0xffffffff != checksum:
+            raise ValueError('Corrupt dump block')
+
+        records = []
+        offset = 0
+        for _ in xrange(count):
+            length, = _UINT32.unpack_from(raw, offset)
+            key = raw[offset + 4:offset + 4 + length]
+            offset += 4 + length
+            length, = _UINT32.unpack_from(raw, offset)
+            records.append((key, raw[offset + 4:offset + 4 + length]))
+            offset += 4 + length
+
+        return records
+
+    def __iter__(self):
+        return self.records()
+
+
+def _prefix_end(prefix):
+    """
+    Get the smallest key greater than all keys starting with a prefix
+
+    >>> _prefix_end('ab'), _prefix_end('a\\xff'), _prefix_end('\\xff')
+    ('ac', 'b', None)
+    """
+    prefix = prefix.rstrip('\xff')
+    if not prefix:
+        return None
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def iter_entries(client, prefix=None, page_size=1000, consistency=None):
+    """
+    Iterate over the key space in pages, using `range_entries`
+
+    :param client: Client to read with
+    :type client: pyrakoon.client.ClientMixin
+    :param prefix: Only return keys starting with this prefix
+    :type prefix: str
+    :param page_size: Number of pairs to retrieve per call
+    :type page_size: int
+    :param consistency: Consistency of the calls
+    :type consistency: pyrakoon.consistency.Consistency
+    :return: Key-value pairs, in ascending key order
+    :rtype: iterator of (str, str)
+    """
+    if page_size < 1:
+        raise ValueError('page_size must be positive')
+
+    begin_key, begin_inclusive = prefix or None, True
+    end_key = _prefix_end(prefix) if prefix else None
+
+    while True:
+        entries = client.range_entries(begin_key, begin_inclusive, end_key, False, page_size,
+                                       consistency=consistency)
+        for entry in entries:
+            yield entry
+
+        if len(entries) < page_size:
+            return
+
+        begin_key, begin_inclusive = entries[-1][0], False
+
+
+def dump(client, fileobj, prefix=None, page_size=1000, consistency=None, compress=True, block_size=1024 * 1024):
+    """
+    Export the key space, or the keys starting with a prefix, to a dump file
+
+    :param client: Client to read with
+    :type client: pyrakoon.client.ClientMixin
+    :param fileobj: File to write to
+    :type fileobj: file
+    :param prefix: Only export keys starting with this prefix
+    :type prefix: str
+    :param page_size: Number of pairs to retrieve per call
+    :type page_size: int
+    :param consistency: Consistency of the calls
+    :type consistency: pyrakoon.consistency.Consistency
+    :param compress: Compress blocks using zlib
+    :type compress: bool
+    :param block_size: Size of the records in a block, before compression, in bytes
+    :type block_size: int
+    :return: Number of pairs exported
+    :rtype: int
+    """
+    with DumpWriter(fileobj, compress, block_size) as writer:
+        for key, value in iter_entries(client, prefix, page_size, consistency):
+            writer.add(key, value)
+
+    return writer.count
+
+
+def restore(client, fileobj, max_bytes=1024 * 1024, max_steps=1000, max_in_flight=4, sync=False, progress=None):
+    """
+    Import a dump file
+
+    Existing keys are overwritten, other keys are left untouched.
+
+    :param client: Client to write with
+    :type client: pyrakoon.client.AbstractClient
+    :param fileobj: File to read from
+    :type fileobj: file
+    :param max_bytes: Maximal size of a batch, in bytes
+    :type max_bytes: int
+    :param max_steps: Maximal number of pairs in a batch
+    :type max_steps: int
+    :param max_in_flight: Maximal number of batches sent before their results are read
+    :type max_in_flight: int
+    :param sync: Submit batches as synced sequences
+    :type sync: bool
+    :param progress: Callable called with the result of every batch
+    :type progress: callable
+    :return: Result of every batch
+    :rtype: list of pyrakoon.client.bulk.BatchResult
+    """
+    writer = BulkWriter(client, max_bytes, max_steps, max_in_flight, sync, progress)
+    return writer.write(DumpReader(fileobj))
+
+
+def _build_parser(prog, description):
+    parser = argparse.ArgumentParser(prog=prog, description=description)
+    parser.add_argument('--cluster-id', default='arakoon', help='cluster identifier (default: %(default)s)')
+    parser.add_argument('--node', dest='nodes', action='append', type=parse_node, required=True,
+                        metavar='NAME:HOST:PORT', help='cluster node, can be given multiple times')
+    parser.add_argument('-v', '--verbose', action='store_true', help='enable debug logging')
+    parser.add_argument('file', metavar='FILE', help='dump file, - for standard %s' % (
+        'output' if prog == 'pyrakoon-dump' else 'input'))
+    return parser
+
+
+def _connect(args):
+    config = compat.ArakoonClientConfig(args.cluster_id, dict(
+        (node_id, ([host], port)) for node_id, (host, port) in args.nodes))
+    return ArakoonSocketClient(config)
+
+
+def dump_main(argv=None):
+    """
+    Entry point of the ``pyrakoon-dump`` command
+
+    :param argv: Command-line arguments
+    :type argv: list of str
+    :return: Exit code
+    :rtype: int
+    """
+    parser = _build_parser('pyrakoon-dump', 'Export an Arakoon key space to a dump file')
+    parser.add_argument('--prefix', help='only export keys starting with PREFIX')
+    parser.add_argument('--page-size', type=int, default=1000,
+                        help='number of pairs to retrieve per call (default: %(default)s)')
+    parser.add_argument('--block-size', type=int, default=1024 * 1024,
+                        help='uncompressed block size in bytes (default: %(default)s)')
+    parser.add_argument('--no-compress', dest='compress', action='store_false', help='don\'t compress blocks')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    client = _connect(args)
+    fileobj = sys.stdout if args.file == '-' else open(args.file, 'wb')
+    try:
+        count = dump(client, fileobj, args.prefix, args.page_size, compress=args.compress,
+                     block_size=args.block_size)
+    finally:
+        if fileobj is not sys.stdout:
+            fileobj.close()
+        client.drop_connections()
+
+    sys.stderr.write('Exported %d pairs\n' % count)
+    return 0
+
+
+def restore_main(argv=None):
+    """
+    Entry point of the ``pyrakoon-restore`` command
+
+    :param argv: Command-line arguments
+    :type argv: list of str
+    :return: Exit code, 1 if any batch failed
+    :rtype: int
+    """
+    parser = _build_parser('pyrakoon-restore', 'Import a dump file into an Arakoon cluster')
+    parser.add_argument('--max-bytes', type=int, default=1024 * 1024,
+                        help='maximal batch size in bytes (default: %(default)s)')
+    parser.add_argument('--max-steps', type=int, default=1000,
+                        help='maximal number of pairs per batch (default: %(default)s)')
+    parser.add_argument('--in-flight', type=int, default=4,
+                        help='number of batches sent before reading results (default: %(default)s)')
+    parser.add_argument('--sync', action='store_true', help='use synced sequences')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING)
+
+    client = _connect(args)
+    fileobj = sys.stdin if args.file == '-' else open(args.file, 'rb')
+    try:
+        results = restore(client, fileobj, args.max_bytes, args.max_steps, args.in_flight, args.sync)
+    finally:
+        if fileobj is not sys.stdin:
+            fileobj.close()
+        client.drop_connections()
+
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        logger.error('Batch %d of %d pairs failed: %s', result.index, result.steps, result.error)
+
+    sys.stderr.write('Imported %d pairs in %d batches, %d batches failed\n' % (
+        sum(result.steps for result in results if result.ok), len(results), len(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(dump_main())
@@ -0,0 +1,231 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+"""
+Tracing hooks around the phases of client calls
+
+Subscribers registered using :func:`subscribe` are called for every phase of every call processed by
+:class:`pyrakoon.client.SocketClient`, the compat :class:`pyrakoon.compat.ArakoonClient` and
+:class:`pyrakoon.tx.ArakoonProtocol`, with the event name and the :class:`Trace` of the call:
+
+* :data:`EVENT_REQUEST_START`: the call started
+* :data:`EVENT_BYTES_WRITTEN`: the serialized request was written, :attr:`Trace.bytes_sent` is set
+* :data:`EVENT_FIRST_BYTE`: the first bytes of the response were received
+* :data:`EVENT_DECODE_COMPLETE`: the response was decoded, :attr:`Trace.bytes_received` is set
+* :data:`EVENT_ERROR`: the call failed, :attr:`Trace.error` is set
+
+The time between :data:`EVENT_BYTES_WRITTEN` and :data:`EVENT_FIRST_BYTE` is spent on the network and in the server,
+the time between :data:`EVENT_FIRST_BYTE` and :data:`EVENT_DECODE_COMPLETE` on transferring and decoding the
+response.
+
+When no subscriber is registered, :func:`start` returns `None` and clients skip all further tracing work, so the
+hooks cost a single function call per request.
+
+Subscribers are called synchronously, in the thread processing the call, so they should be fast. Exceptions raised by
+subscribers are logged and otherwise ignored.
+
+>>> from pyrakoon import protocol
+>>> events = []
+>>> subscriber = subscribe(lambda event, trace: events.append((event, trace.message_type)))
+>>> trace = start(protocol.WhoMaster(), 'arakoon_0')
+>>> trace.written(8)
+>>> trace.decoded()
+>>> unsubscribe(subscriber)
+>>> events
+[('request_start', 'WhoMaster'), ('bytes_written', 'WhoMaster'), ('decode_complete', 'WhoMaster')]
+>>> start(protocol.WhoMaster()) is None
+True
+"""
+
+from __future__ import absolute_import
+
+import time
+import logging
+import threading
+
+from .constants.logging import PYRAKOON_TRACING_LOGGER
+
+logger = logging.getLogger(PYRAKOON_TRACING_LOGGER)
+
+EVENT_REQUEST_START = 'request_start'
+EVENT_BYTES_WRITTEN = 'bytes_written'
+EVENT_FIRST_BYTE = 'first_byte'
+EVENT_DECODE_COMPLETE = 'decode_complete'
+EVENT_ERROR = 'error'
+
+# Replaced, never mutated, so readers don't need to lock
+_SUBSCRIBERS = ()
+_SUBSCRIBERS_LOCK = threading.Lock()
+
+
+def subscribe(subscriber):
+    """
+    Register a subscriber
+
+    :param subscriber: Callable taking an event name and a :class:`Trace`
+    :type subscriber: callable
+    :return: The subscriber, so this can be used as a decorator
+    :rtype: callable
+    """
+    global _SUBSCRIBERS
+
+    with _SUBSCRIBERS_LOCK:
+        _SUBSCRIBERS = _SUBSCRIBERS + (subscriber,)
+
+    return subscriber
+
+
+def unsubscribe(subscriber):
+    """
+    Unregister a subscriber
+
+    :param subscriber: Subscriber registered using :func:`subscribe`
+    :type subscriber: callable
+    :raise ValueError: The subscriber isn't registered
+    """
+    global _SUBSCRIBERS
+
+    with _SUBSCRIBERS_LOCK:
+        if subscriber not in _SUBSCRIBERS:
+            raise ValueError('Subscriber not registered')
+
+        subscribers = list(_SUBSCRIBERS)
+        subscribers.remove(subscriber)
+        _SUBSCRIBERS = tuple(subscribers)
+
+
+def start(message, node_id=None):
+    """
+    Start tracing a call
+
+    :param message: Message being processed
+    :type message: pyrakoon.protocol.Message
+    :param node_id: Node the message is sent to, if known
+    :type node_id: str
+    :return: Trace of the call, or `None` if no subscribers are registered
+    :rtype: Trace
+    """
+    subscribers = _SUBSCRIBERS
+    if not subscribers:
+        return None
+
+    trace = Trace(message, node_id, subscribers)
+    trace.emit(EVENT_REQUEST_START)
+    return trace
+
+
+class Trace(object):
+    """
+    Trace of a single call
+    """
+
+    __slots__ = 'message', 'node_id', 'timestamps', 'bytes_sent', 'bytes_received', 'error', '_subscribers'
+
+    def __init__(self, message, node_id, subscribers):
+        """
+        :param message: Message being processed
+        :type message: pyrakoon.protocol.Message
+        :param node_id: Node the message is sent to, if known
+        :type node_id: str
+        :param subscribers: Subscribers to notify
+        :type subscribers: tuple of callable
+        """
+        self.message = message
+        self.node_id = node_id
+        # Time at which every event was emitted, by event name
+        self.timestamps = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.error = None
+        self._subscribers = subscribers
+
+    @property
+    def message_type(self):
+        # type: () -> str
+        """
+        Name of the message class
+        """
+        return type(self.message).__name__
+
+    def emit(self, event):
+        """
+        Notify subscribers of an event
+
+        :param event: Event name
+        :type event: str
+        """
+        self.timestamps[event] = time.time()
+
+        for subscriber in self._subscribers:
+            try:
+                subscriber(event, self)
+            except Exception: #pylint: disable=W0703
+                logger.exception('Tracing subscriber %r failed on %s', subscriber, event)
+
+    def written(self, count, node_id=None):
+        """
+        Mark the request as written
+
+        :param count: Number of bytes written
+        :type count: int
+        :param node_id: Node the request was written to, if not known before
+        :type node_id: str
+        """
+        if node_id is not None:
+            self.node_id = node_id
+        self.bytes_sent += count
+        self.emit(EVENT_BYTES_WRITTEN)
+
+    def first_byte(self):
+        """
+        Mark the first response bytes as received
+        """
+        if EVENT_FIRST_BYTE not in self.timestamps:
+            self.emit(EVENT_FIRST_BYTE)
+
+    def received(self, count):
+        """
+        Account for received response bytes, marking the first bytes as received
+
+        :param count: Number of bytes received
+        :type count: int
+        """
+        self.bytes_received += count
+        if EVENT_FIRST_BYTE not in self.timestamps:
+            self.emit(EVENT_FIRST_BYTE)
+
+    def reader(self, read):
+        """
+        Wrap a `read` callable to account for received bytes
+
+        :param read: Callable taking a byte count, returning data
+        :type read: callable
+        :return: Wrapped callable
+        :rtype: callable
+        """
+        def traced_read(count):
+            data = read(count)
+            self.received(len(data))
+            return data
+
+        return traced_read
+
+    def decoded(self):
+        """
+        Mark the response as decoded
+        """
+        self.emit(EVENT_DECODE_COMPLETE)
+
+    def failed(self, error):
+        """
+        Mark the call as failed
+
+        :param error: Exception the call failed with
+        :type error: Exception
+        """
+        self.error = error
+        self.emit(EVENT_ERROR)
+
+    def __repr__(self):
+        return '<Trace %s node=%s events=%s>' % (
+            self.message_type, self.node_id, sorted(self.timestamps, key=self.timestamps.get))
@@ -7,13 +7,15 @@
 .. _Arakoon: http://www.arakoon.org
 '''
 
+import time
 import collections
 
 from twisted.internet import defer, protocol as twisted_protocol
 from twisted.protocols import basic, stateful
-from twisted.python import log
+from twisted.python import failure, log
 
-from . import client, errors, protocol, utils
+from . import client, errors, protocol, tracing, utils
+from .client.metrics import ClientMetrics
 
 #pylint: disable=R0904,C0103,R0901
 
@@ -49,8 +51,7 @@ except AttributeError:
             self.transport.stopProducing()
 
 
-class ArakoonProtocol(object,
-    client.AbstractClient,
+class ArakoonProtocol(client.AbstractClient,
     stateful.StatefulProtocol, _PauseableMixin):
     '''Protocol to access an Arakoon server'''
 
@@ -68,6 +69,8 @@ class ArakoonProtocol(object,
 
         self._outstanding = collections.deque()
         self._currentHandler = None
+        self._currentTrace = None
+        self._metrics = ClientMetrics()
 
         self._cluster_id = cluster_id
 
@@ -76,14 +79,41 @@ class ArakoonProtocol(object,
             return defer.fail(
                 client.NotConnectedError('Protocol not connected'))
 
-        deferred = defer.Deferred()
-        self._outstanding.append((message.receive, deferred))
+        trace = tracing.start(message)
+        start = time.time()
 
         data = list(message.serialize())
+        bytes_sent = sum(len(part) for part in data)
+
+        def record(result):
+            '''Record the call in the protocol metrics and trace'''
+
+            error = result.value if isinstance(result, failure.Failure) else None
+            self._metrics.record(message, time.time() - start, error, bytes_sent)
+
+            if trace is not None:
+                if error is None:
+                    trace.decoded()
+                else:
+                    trace.failed(error)
+
+            return result
+
+        deferred = defer.Deferred()
+        deferred.addBoth(record)
+        self._outstanding.append((message.receive, deferred, trace))
+
         self.transport.writeSequence(data)
+        if trace is not None:
+            trace.written(bytes_sent)
 
         return deferred
 
+    def dataReceived(self, data):
+        self._metrics.add_bytes_received(len(data))
+
+        return stateful.StatefulProtocol.dataReceived(self, data)
+
     def getInitialState(self):
         assert self._currentHandler == None
 
@@ -104,6 +134,9 @@ class ArakoonProtocol(object,
 
         receiver = handler[0]()
         self._currentHandler = (receiver, handler[1])
+        self._currentTrace = handler[2]
+        if self._currentTrace is not None:
+            self._currentTrace.received(len(data))
 
         request = receiver.next()
 
@@ -138,6 +171,9 @@ class ArakoonProtocol(object,
 
         receiver, deferred = self._currentHandler #pylint: disable=W0633
 
+        if self._currentTrace is not None:
+            self._currentTrace.received(len(data))
+
         try:
             request = receiver.send(data)
         except Exception, exc: #pylint: disable=W0703
@@ -152,6 +188,7 @@ class ArakoonProtocol(object,
                 deferred.errback(exc)
 
                 self._currentHandler = None
+                self._currentTrace = None
                 utils.kill_coroutine(receiver, lambda msg: log.err(None, msg))
 
                 return self.getInitialState()
@@ -174,6 +211,7 @@ class ArakoonProtocol(object,
 
         receiver, deferred = self._currentHandler #pylint: disable=W0633
         self._currentHandler = None
+        self._currentTrace = None
 
         deferred.callback(result.value)
 
@@ -211,6 +249,7 @@ class ArakoonProtocol(object,
 
             receiver, deferred = self._currentHandler #pylint: disable=W0633
             self._currentHandler = None
+            self._currentTrace = None
 
             if not deferred.called:
                 deferred.errback(reason)
@@ -221,7 +260,7 @@ class ArakoonProtocol(object,
 
         while True:
             try:
-                _, deferred = self._outstanding.popleft()
+                deferred = self._outstanding.popleft()[1]
             except IndexError:
                 break
 
@@ -8,6 +8,7 @@ Utility functions
 from __future__ import absolute_import
 
 import __builtin__
+import time
 import uuid
 import logging
 import functools
@@ -297,14 +298,28 @@ def process_blocking(message, stream):
     :see: :meth:`pyrakoon.protocol.Message.serialize`
     :see: :meth:`pyrakoon.protocol.Message.receive`
     """
+    # Circular dependency
+    from . import profiling
+
+    profile = profiling.start(message)
+    if profile is None:
+        for bytes_ in message.serialize():
+            stream.write(bytes_)
 
-    for bytes_ in message.serialize():
-        stream.write(bytes_)
+        return read_blocking(message.receive(), stream.read)
 
-    return read_blocking(message.receive(), stream.read)
+    error = None
+    try:
+        stream.write(profile.serialize())
+        return read_blocking(message.receive(), stream.read, profile)
+    except Exception as exc:
+        error = exc
+        raise
+    finally:
+        profile.finish(error)
 
 
-def read_blocking(receiver, read_fun):
+def read_blocking(receiver, read_fun, profile=None):
     """
     Process message result parsing using a blocking stream read function
 
@@ -317,6 +332,9 @@ def read_blocking(receiver, read_fun):
     :param read_fun: Callable to read a given number of bytes from a result
         stream
     :type read_fun: `callable`
+    :param profile: Profile accounting the time spent reading and decoding,
+        if any
+    :type profile: :class:`pyrakoon.profiling.CallProfile`
 
     :return: Message result
     :rtype: :obj:`object`
@@ -329,6 +347,9 @@ def read_blocking(receiver, read_fun):
     # Circular dependency
     from . import protocol
 
+    if profile is not None:
+        return _read_blocking_profiled(receiver, read_fun, profile)
+
     request = receiver.next()
 
     while isinstance(request, protocol.Request):
@@ -341,3 +362,55 @@ def read_blocking(receiver, read_fun):
     kill_coroutine(receiver, logger.exception)
 
     return request.value
+
+
+def _read_blocking_profiled(receiver, read_fun, profile):
+    """
+    Variant of :func:`read_blocking` accounting the time spent in `read_fun`
+    and in the parsing coroutine in `profile`
+    """
+    # Circular dependency
+    from . import protocol
+
+    network = decode = 0.0
+    steps = received = 0
+    reading = False
+
+    start = time.time()
+    try:
+        request = receiver.next()
+        steps += 1
+        decode += time.time() - start
+
+        while isinstance(request, protocol.Request):
+            reading = True
+            start = time.time()
+            value = read_fun(request.count)
+            received += len(value)
+            now = time.time()
+            network += now - start
+
+            reading = False
+            start = now
+            request = receiver.send(value)
+            steps += 1
+            decode += time.time() - start
+    except Exception:
+        # Account the time spent in the failing step
+        if reading:
+            network += time.time() - start
+        else:
+            decode += time.time() - start
+        raise
+    finally:
+        profile.network_time += network
+        profile.decode_time += decode
+        profile.decode_steps += steps
+        profile.bytes_received += received
+
+    if not isinstance(request, protocol.Result):
+        raise TypeError
+
+    kill_coroutine(receiver, logger.exception)
+
+    return request.value
@@ -139,7 +139,7 @@ setup(
     author_email=EMAIL,
     python_requires=REQUIRES_PYTHON,
     url=URL,
-    packages=find_packages(exclude=('test', 'demo')),
+    packages=find_packages(exclude=('test', 'demo', 'benchmarks')),
     install_requires=REQUIRED,
     extras_require=EXTRAS,
     include_package_data=True,
@@ -152,6 +152,13 @@ setup(
         'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: Implementation :: CPython',
     ],
+    entry_points={
+        'console_scripts': [
+            'pyrakoon-bench = pyrakoon.tools.bench:main',
+            'pyrakoon-dump = pyrakoon.tools.dump:dump_main',
+            'pyrakoon-restore = pyrakoon.tools.dump:restore_main',
+        ],
+    },
     cmdclass={
         'install': PyrakoonInstall,
     },
@@ -0,0 +1,81 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.tools.bench`'''
+
+import random
+import unittest
+
+from pyrakoon import fake
+from pyrakoon.tools import bench
+
+class TestGenerators(unittest.TestCase):
+    '''Tests for the key distributions'''
+
+    def test_zipfian(self):
+        '''Test the zipfian distribution favours low item numbers'''
+
+        generator = bench.ZipfianGenerator(random.Random(42))
+        counts = [0] * 1000
+        for _ in xrange(10000):
+            counts[generator.next(1000)] += 1
+
+        self.assert_(counts[0] > counts[1] > counts[10] > counts[500])
+
+        # Growing the number of items extends the distribution
+        self.assert_(max(generator.next(100000) for _ in xrange(10000)) >= 1000)
+
+    def test_latest(self):
+        '''Test the latest distribution favours high item numbers'''
+
+        generator = bench.LatestGenerator(random.Random(42))
+        values = [generator.next(1000) for _ in xrange(1000)]
+
+        self.assert_(all(0 <= value < 1000 for value in values))
+        self.assert_(values.count(999) > values.count(500))
+
+
+class TestBench(unittest.TestCase):
+    '''Run workloads against `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster('pyrakoon_test_bench', node_count=2)
+        self.cluster.start()
+        self.nodes = dict((node_id, self.cluster.node(node_id).address)
+            for node_id in self.cluster.nodes)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def _run(self, client_name, workload):
+        proportions, distribution = bench.WORKLOADS[workload]
+        settings = bench.Settings('pyrakoon_test_bench', self.nodes,
+            client_name=client_name, proportions=proportions,
+            distribution=distribution, record_count=50, operation_count=200,
+            key_prefix=workload, threads=2, seed=42)
+
+        load = bench.run_phase(settings, bench.PHASE_LOAD)
+        self.assertEquals(load.histograms['insert'].count, 50)
+        self.assertEquals(len(self.cluster.store.prefix_keys(workload, -1)), 50)
+
+        return bench.run_phase(settings, bench.PHASE_RUN)
+
+    def test_native(self):
+        '''Run all operations using the native client'''
+
+        for workload in sorted(bench.WORKLOADS):
+            results = self._run('native', workload)
+
+            self.assertEquals(results.operations, 200)
+            self.assertEquals(results.to_dict()['operations'], 200)
+            for operation in bench.OPERATIONS:
+                self.assertEquals(results.errors[operation], {})
+
+    def test_compat(self):
+        '''Run a workload using the compat client'''
+
+        results = self._run('compat', 'f')
+
+        self.assertEquals(results.histograms['read'].count
+            + results.histograms['read_modify_write'].count, 200)
+        self.assert_('READ_MODIFY_WRITE' in bench.format_results('run', results))
@@ -0,0 +1,126 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.blob`'''
+
+import os
+import shutil
+import unittest
+import StringIO
+
+from pyrakoon import client, compat, errors, fake
+from pyrakoon.client import blob
+
+CLUSTER_ID = 'pyrakoon_test_blob'
+
+VALUE = os.urandom(100000)
+
+
+class Client(client.SocketClient, client.ClientMixin):
+    '''Native socket client'''
+
+
+class TestBlobStore(unittest.TestCase):
+    '''Store blobs in a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=2)
+        self.cluster.start()
+
+        self.client = compat.client._ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+        self.store = blob.BlobStore(self.client, chunk_size=4096, max_sequence_bytes=32768, chunks_per_read=3,
+            max_in_flight=2)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def _chunk_keys(self):
+        return self.client.prefix(blob.DEFAULT_CHUNK_PREFIX, -1)
+
+    def test_put_get(self):
+        '''Test blobs are read back as written, using pipelined reads'''
+
+        self.store.put('blob', VALUE)
+
+        manifest = self.store.stat('blob')
+        self.assertEquals((manifest.size, manifest.count), (len(VALUE), 25))
+        self.assertEquals(len(self._chunk_keys()), 25)
+
+        self.assertEquals(self.store.get('blob'), VALUE)
+        self.assertEquals(self.client.metrics()['commands']['MultiGet']['calls'], 9)
+
+    def test_single_sequence(self):
+        '''Test blobs fitting in a sequence are written atomically in one call'''
+
+        store = blob.BlobStore(self.client, chunk_size=4096)
+        store.put('blob', VALUE)
+
+        self.assertEquals(self.client.metrics()['commands']['Sequence']['calls'], 1)
+        self.assertEquals(store.get('blob'), VALUE)
+
+        store.put('empty', '')
+        self.assertEquals(store.get('empty'), '')
+
+    def test_replace(self):
+        '''Test chunks of a previous version are deleted when a blob is replaced or deleted'''
+
+        self.client.set('blob', 'plain value')
+        self.store.put('blob', VALUE)
+        self.store.put('blob', VALUE[:5000])
+
+        self.assertEquals(self.store.get('blob'), VALUE[:5000])
+        self.assertEquals(len(self._chunk_keys()), 2)
+
+        self.store.delete('blob')
+        self.assertRaises(errors.NotFound, self.store.get, 'blob')
+        self.assertEquals(self._chunk_keys(), [])
+
+        self.client.set('plain', 'value')
+        self.assertRaises(ValueError, self.store.get, 'plain')
+
+    def test_streaming(self):
+        '''Test reading and writing blobs as files'''
+
+        with self.store.create('blob') as writer:
+            source = StringIO.StringIO(VALUE)
+            shutil.copyfileobj(source, writer, 1000)
+            self.assertRaises(errors.NotFound, self.store.stat, 'blob')
+
+        reader = self.store.open('blob')
+        self.assertEquals(reader.size, len(VALUE))
+        self.assertEquals(reader.read(10), VALUE[:10])
+
+        buffer_ = bytearray(50000)
+        self.assertEquals(reader.readinto(buffer_), 50000)
+        self.assertEquals(str(buffer_), VALUE[10:50010])
+        self.assertEquals(reader.read(), VALUE[50010:])
+        self.assertEquals(reader.read(), '')
+
+    def test_conflict(self):
+        '''Test a writer fails when the key changes, and leaves no chunks behind'''
+
+        writer = self.store.create('blob')
+        writer.write(VALUE)
+        self.client.set('blob', 'concurrent')
+
+        self.assertRaises(errors.AssertionFailed, writer.close)
+        self.assertEquals(self.client.get('blob'), 'concurrent')
+        self.assertEquals(self._chunk_keys(), [])
+
+        with self.assertRaises(RuntimeError):
+            with self.store.create('other') as writer:
+                writer.write(VALUE)
+                raise RuntimeError
+        self.assertEquals(self._chunk_keys(), [])
+
+    def test_sequential(self):
+        '''Test clients without pipelining read chunks call by call'''
+
+        self.store.put('blob', VALUE)
+
+        native = Client(self.cluster.node(self.cluster.master).address, CLUSTER_ID)
+        native.connect()
+        try:
+            self.assertEquals(blob.BlobStore(native).get('blob'), VALUE)
+        finally:
+            native.close()
@@ -0,0 +1,112 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.bulk`'''
+
+import unittest
+
+from pyrakoon import client, compat, fake, sequence
+from pyrakoon.client import bulk
+
+CLUSTER_ID = 'pyrakoon_test_bulk'
+
+class Client(client.SocketClient, client.ClientMixin):
+    '''Native socket client'''
+
+
+class TestSplit(unittest.TestCase):
+    '''Tests for `pyrakoon.client.bulk.split`'''
+
+    def test_limits(self):
+        '''Test batches are cut at the byte and step limits'''
+
+        operations = [('key_%d' % i, 'x' * 100) for i in xrange(20)]
+
+        batches = list(bulk.split(operations, max_bytes=1000, max_steps=100))
+        self.assertEquals([len(batch) for batch in batches], [8, 8, 4])
+        self.assert_(all(batch.size <= 1000 for batch in batches))
+
+        batches = list(bulk.split(operations, max_bytes=10000, max_steps=6))
+        self.assertEquals([len(batch) for batch in batches], [6, 6, 6, 2])
+
+    def test_estimate(self):
+        '''Test size estimates match the serialized steps'''
+
+        for operation in (sequence.Set('key', 'value'), sequence.Delete('key'), sequence.Assert('key', None)):
+            builder = sequence.SequenceBuilder()
+            builder.extend([operation])
+            self.assertEquals(bulk.estimate_size(operation), builder.size - 8)
+
+    def test_oversized(self):
+        '''Test an operation exceeding the byte limit gets a batch of its own'''
+
+        operations = [('small', 'x'), ('large', 'x' * 1000), ('small', 'x')]
+
+        self.assertEquals([len(batch) for batch in bulk.split(operations, max_bytes=100)], [1, 1, 1])
+
+
+class TestBulkWriter(unittest.TestCase):
+    '''Write batches to a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=2)
+        self.cluster.start()
+
+        self.client = compat.ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config),
+            timeout=5, noMasterTimeout=5)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def test_pipelined(self):
+        '''Test batches are pipelined on the compat client'''
+
+        self.client.set('old', 'value')
+        progress = []
+        operations = [('key_%03d' % i, 'value_%d' % i) for i in xrange(95)] + [('old', None)]
+
+        results = self.client.bulkWrite(iter(operations), maxSteps=10, maxInFlight=3, progress=progress.append)
+
+        self.assertEquals([result.steps for result in results], [10] * 9 + [6])
+        self.assert_(all(result.ok and not result.retried for result in results))
+        self.assertEquals(progress, results)
+        self.assertEquals(self.client.getKeyCount(), 95)
+        self.assertFalse(self.client.exists('old'))
+        self.assertEquals(self.client.metrics()['commands']['Sequence']['calls'], 10)
+
+    def test_batch_failure(self):
+        '''Test a failing batch doesn't affect the other batches'''
+
+        operations = [('key_0', 'value'), ('missing', None), ('key_1', 'value')]
+
+        results = self.client.bulkWrite(operations, maxSteps=1)
+
+        self.assertEquals([result.ok for result in results], [True, False, True])
+        self.assert_(isinstance(results[1].error, compat.ArakoonNotFound))
+        self.assertFalse(results[1].retried)
+        self.assertEquals(self.client.getKeyCount(), 2)
+
+    def test_failover(self):
+        '''Test batches failing on a lost master are submitted again'''
+
+        self.client.set('key', 'value')
+        self.cluster.crash(self.client.whoMaster())
+
+        results = self.client.bulkWrite([('key_%d' % i, 'value') for i in xrange(10)], maxSteps=5)
+
+        self.assertEquals([(result.ok, result.retried) for result in results], [(True, True), (True, True)])
+        self.assertEquals(self.client.getKeyCount(), 11)
+
+    def test_sequential(self):
+        '''Test clients without pipelining process batches one by one'''
+
+        native = Client(self.cluster.node(self.cluster.master).address, CLUSTER_ID)
+        native.connect()
+        try:
+            results = bulk.BulkWriter(native, max_steps=4).write(('key_%d' % i, 'value') for i in xrange(10))
+        finally:
+            native.close()
+
+        self.assertEquals([(result.index, result.steps, result.ok) for result in results],
+            [(0, 4, True), (1, 4, True), (2, 2, True)])
+        self.assertEquals(self.client.getKeyCount(), 10)
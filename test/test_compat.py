@@ -3,13 +3,20 @@
 
 '''Tests for code in `pyrakoon.compat`'''
 
+import os
+import ssl
 import time
+import shutil
+import socket
 import logging
+import tempfile
 import unittest
+import threading
+import subprocess
 
 import nose
 
-from pyrakoon import compat, sequence, test
+from pyrakoon import compat, protocol, sequence, test
 
 LOGGER = logging.getLogger(__name__)
 
@@ -38,6 +45,91 @@ class TestArgumentChecks(unittest.TestCase):
         self.assertRaises(compat.ArakoonInvalidArguments, client.hello, 123)
 
 
+class TestTLS(unittest.TestCase):
+    '''Test TLS connections of the compatibility client'''
+
+    CLUSTER_ID = 'tls_test'
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='pyrakoon_test_tls_')
+        self.cert = os.path.join(self.directory, 'cert.pem')
+        self.key = os.path.join(self.directory, 'key.pem')
+
+        try:
+            subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                '-subj', '/CN=127.0.0.1', '-keyout', self.key, '-out', self.cert],
+                stdout=open(os.devnull, 'w'), stderr=subprocess.STDOUT)
+        except (OSError, subprocess.CalledProcessError):
+            shutil.rmtree(self.directory)
+            raise nose.SkipTest('Unable to generate a certificate using openssl')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _serve(self, count):
+        '''Accept `count` TLS connections in a thread, collecting the prologues received'''
+
+        context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+        context.load_cert_chain(self.cert, self.key)
+
+        listener = socket.socket()
+        listener.bind(('127.0.0.1', 0))
+        listener.listen(count)
+        prologues = []
+
+        def run():
+            try:
+                for _ in xrange(count):
+                    connection = context.wrap_socket(listener.accept()[0], server_side=True)
+                    prologue = protocol.build_prologue(self.CLUSTER_ID)
+                    data = ''
+                    while len(data) < len(prologue):
+                        data += connection.recv(len(prologue) - len(data))
+                    prologues.append((data, connection.version()))
+                    connection.close()
+            finally:
+                listener.close()
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+
+        return listener.getsockname(), thread, prologues
+
+    def test_context(self):
+        '''Test the TLS context is shared and only allows TLS 1.2 and later'''
+
+        config = compat.ArakoonClientConfig(self.CLUSTER_ID, {'arakoon_0': (['127.0.0.1'], 4000)},
+            tls=True, tls_ca_cert=self.cert, tls_cert=(self.cert, self.key))
+
+        context = config.ssl_context
+        self.assert_(config.ssl_context is context)
+        self.assertEquals(context.verify_mode, ssl.CERT_REQUIRED)
+        for option in (ssl.OP_NO_SSLv3, ssl.OP_NO_TLSv1, ssl.OP_NO_TLSv1_1):
+            self.assert_(context.options & option)
+
+        self.assertEquals(compat.create_ssl_context().verify_mode, ssl.CERT_NONE)
+        self.assert_(compat.ArakoonClientConfig(self.CLUSTER_ID, {}).ssl_context is None)
+
+    def test_connect(self):
+        '''Test connections are set up over TLS using the shared context'''
+
+        address, thread, prologues = self._serve(2)
+        config = compat.ArakoonClientConfig(self.CLUSTER_ID, {'arakoon_0': ([address[0]], address[1])},
+            tls=True, tls_ca_cert=self.cert)
+
+        for _ in xrange(2):
+            connection = compat._ClientConnection(address, self.CLUSTER_ID, True, self.cert, None, 5,
+                config.ssl_context)
+            connection.connect()
+            self.assert_(connection.connected)
+            connection.close()
+
+        thread.join(5)
+        self.assertEquals([data for data, _ in prologues], [protocol.build_prologue(self.CLUSTER_ID)] * 2)
+        self.assert_(all(version in ('TLSv1.2', 'TLSv1.3') for _, version in prologues))
+
+
 class TestCompatClient(unittest.TestCase, test.ArakoonEnvironmentMixin):
     '''Test the compatibility client against a real Arakoon server'''
 
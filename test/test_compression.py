@@ -0,0 +1,226 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.compression`'''
+
+import json
+import zlib
+import unittest
+
+from twisted.internet import defer
+
+from pyrakoon import compat, errors, fake, protocol, sequence
+from pyrakoon.client import compression
+
+CLUSTER_ID = 'pyrakoon_test_compression'
+
+VALUE = json.dumps([{'name': 'volume_%d' % i, 'size': 1024 * i, 'backend': 'alba'} for i in xrange(50)])
+
+
+class TestValueCodec(unittest.TestCase):
+    '''Tests for `pyrakoon.client.compression.ValueCodec`'''
+
+    def test_policies(self):
+        '''Test values are compressed according to the longest matching prefix'''
+
+        codec = compression.ValueCodec(None, prefixes={
+            'json/': compression.CompressionPolicy(threshold=100),
+            'json/raw/': None,
+        })
+
+        self.assert_(codec.encode('json/a', VALUE).startswith(compression.HEADER))
+        self.assertEquals(codec.encode('json/a', 'short'), 'short')
+        self.assertEquals(codec.encode('json/raw/a', VALUE), VALUE)
+        self.assertEquals(codec.encode('other', VALUE), VALUE)
+
+        stats = codec.stats()
+        self.assertEquals((stats['values_encoded'], stats['values_compressed']), (4, 1))
+        self.assertEquals(stats['bytes_in'], 3 * len(VALUE) + 5)
+        self.assert_(stats['bytes_saved'] > len(VALUE) / 2)
+
+    def test_incompressible(self):
+        '''Test values which don't shrink are stored as is'''
+
+        codec = compression.ValueCodec(compression.CompressionPolicy(threshold=0))
+        value = ''.join(chr(i) for i in xrange(256))
+
+        self.assertEquals(codec.encode('key', value), value)
+        self.assertEquals(codec.stats()['values_compressed'], 0)
+
+    def test_legacy(self):
+        '''Test values without a valid header are returned as is'''
+
+        codec = compression.ValueCodec()
+        fake_header = compression.HEADER + 'not compressed'
+
+        self.assertEquals(codec.decode(VALUE), VALUE)
+        self.assertEquals(codec.decode(''), '')
+        self.assertEquals(codec.decode(fake_header), fake_header)
+        self.assertEquals(codec.stats()['decode_errors'], 1)
+
+    def test_header_values(self):
+        '''Test uncompressed values starting with a header are stored escaped, and read back as written'''
+
+        codec = compression.ValueCodec()
+        for value in [
+                compression.HEADER + zlib.compress('hi'), compression.HEADER, compression.RAW_HEADER + 'value']:
+            stored = codec.encode('key', value)
+            self.assert_(stored.startswith(compression.RAW_HEADER))
+            self.assertEquals(codec.decode(stored), value)
+
+        self.assertEquals(codec.stats()['values_compressed'], 0)
+        self.assertEquals(codec.decode(codec.encode('key', '\xffPZ')), '\xffPZ')
+
+    def test_steps(self):
+        '''Test values in sequence steps are encoded'''
+
+        codec = compression.ValueCodec(compression.CompressionPolicy(threshold=100))
+        step = codec.encode_step(sequence.Sequence([
+            sequence.Set('a', VALUE), sequence.Delete('b'), sequence.Replace('c', None), sequence.Assert('d', VALUE)]))
+
+        set_, delete, replace, assert_ = step.steps
+        self.assertEquals(codec.decode(set_.value), VALUE)
+        self.assertNotEquals(set_.value, VALUE)
+        self.assertEquals(delete.key, 'b')
+        self.assertEquals(replace.wanted, None)
+        self.assertEquals(assert_.value, set_.value)
+
+        builder = sequence.SequenceBuilder(codec)
+        builder.add_set('a', VALUE)
+        self.assert_(builder.size < len(VALUE) / 2)
+
+        builder.add_assert('b', VALUE)
+        builder.add_assert('c', 'short')
+        builder.add_step(sequence.Assert('d', VALUE))
+        self.assertEquals([(key, value) for (key, value, _) in builder.compressed_asserts], [('b', VALUE), ('d', VALUE)])
+
+
+class _DeferredStore(object):
+    '''Process callable comparing values like the cluster does, returning Deferreds'''
+
+    def __init__(self, values):
+        self.values = values
+
+    def __call__(self, message):
+        if isinstance(message, protocol.TestAndSet):
+            current = self.values.get(message.key)
+            if current == message.test_value:
+                self.values[message.key] = message.set_value
+            return defer.succeed(current)
+        if isinstance(message, protocol.Assert):
+            if self.values.get(message.key) != message.value:
+                return defer.fail(errors.AssertionFailed(message.key))
+            return defer.succeed(None)
+        if isinstance(message, protocol.MultiGetOption):
+            return defer.succeed([self.values.get(key) for key in message.keys])
+        raise ValueError(message)
+
+
+class TestDeferredComparisons(unittest.TestCase):
+    '''Compare values stored without compression on a Twisted protocol'''
+
+    def test_comparisons(self):
+        '''Test comparisons are repeated with the stored bytes'''
+
+        codec = compression.ValueCodec(compression.CompressionPolicy(threshold=100))
+        process = _DeferredStore({'a': VALUE, 'b': VALUE})
+        results = []
+
+        codec.process(process, protocol.TestAndSet, ('a', VALUE, 'new')).addBoth(results.append)
+        codec.process(process, protocol.Assert, (None, 'b', VALUE)).addBoth(results.append)
+        codec.process(process, protocol.Assert, (None, 'b', 'other')).addBoth(results.append)
+
+        self.assertEquals(results[:2], [VALUE, None])
+        self.assert_(results[2].check(errors.AssertionFailed))
+        self.assertEquals(process.values['a'], 'new')
+
+
+class TestCompatCompression(unittest.TestCase):
+    '''Compress values stored in a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=2)
+        self.cluster.start()
+
+        config = compat.ArakoonClientConfig(*self.cluster.client_config)
+        self.codec = compression.ValueCodec(compression.CompressionPolicy(threshold=100))
+        self.client = compat.ArakoonClient(config, timeout=5, noMasterTimeout=5)
+        self.client.setValueCodec(self.codec)
+        self.legacy = compat.ArakoonClient(config, timeout=5, noMasterTimeout=5)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def test_reads(self):
+        '''Test values are decompressed in read results'''
+
+        self.client.set('a', VALUE)
+        self.legacy.set('b', VALUE)
+        self.client.set('c', 'small')
+
+        self.assert_(len(self.legacy.get('a')) < len(VALUE) / 2)
+        self.assertEquals(self.client.get('a'), VALUE)
+        self.assertEquals(self.client.get('b'), VALUE)
+        self.assertEquals(self.client.multiGet(['a', 'b', 'c']), [VALUE, VALUE, 'small'])
+        self.assertEquals(self.client.multiGetOption(['a', 'd']), [VALUE, None])
+        self.assertEquals(self.client.range_entries('a', True, 'c', True),
+            [('a', VALUE), ('b', VALUE), ('c', 'small')])
+        self.assertEquals(self.client.rev_range_entries('b', True, None, True), [('b', VALUE), ('a', VALUE)])
+        self.assertEquals(self.codec.stats()['values_decompressed'], 5)
+
+    def test_updates(self):
+        '''Test values are encoded in updates and decoded in their results'''
+
+        other = VALUE.replace('alba', 'ceph')
+
+        self.client.set('a', VALUE)
+        self.assertEquals(self.client.testAndSet('a', VALUE, other), VALUE)
+        self.assertEquals(self.client.replace('a', VALUE), other)
+        self.client.confirm('a', VALUE)
+        self.client.aSSert('a', VALUE)
+        self.assertEquals(self.client.get('a'), VALUE)
+
+        seq = self.client.makeSequence()
+        seq.addAssert('a', VALUE)
+        seq.addSet('b', other)
+        self.client.sequence(seq)
+        self.assertEquals(self.client.get('b'), other)
+        self.assertNotEquals(self.legacy.get('b'), other)
+
+    def test_legacy_comparisons(self):
+        '''Test comparisons with values stored before compression was enabled'''
+
+        other = VALUE.replace('alba', 'ceph')
+        for key in ('a', 'b', 'c'):
+            self.legacy.set(key, VALUE)
+
+        self.assertEquals(self.client.testAndSet('a', VALUE, other), VALUE)
+        self.assertEquals(self.client.get('a'), other)
+        self.assertEquals(self.client.testAndSet('b', other, VALUE), VALUE)
+        self.assertEquals(self.legacy.get('b'), VALUE)
+
+        self.client.aSSert('b', VALUE)
+        self.assertRaises(compat.ArakoonAssertionFailed, self.client.aSSert, 'b', other)
+
+        seq = self.client.makeSequence()
+        seq.addAssert('c', VALUE)
+        seq.addSet('d', 'value')
+        try:
+            self.client.sequence(seq)
+        except compat.ArakoonAssertionFailed as exc:
+            self.assert_("'c'" in str(exc), str(exc))
+        else:
+            self.fail('Sequence asserting a value stored without compression succeeded')
+        self.assertFalse(self.client.exists('d'))
+
+        seq = self.client.makeSequence()
+        seq.addAssert('c', other)
+        self.assertRaises(compat.ArakoonAssertionFailed, self.client.sequence, seq)
+
+    def test_bulk(self):
+        '''Test bulk writes are batched by the compressed size of values'''
+
+        results = self.client.bulkWrite([('key_%d' % i, VALUE) for i in xrange(10)], maxBytes=len(VALUE) * 2)
+
+        self.assertEquals(len(results), 1)
+        self.assertEquals(self.client.multiGet(['key_0', 'key_9']), [VALUE, VALUE])
@@ -0,0 +1,131 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.counters`'''
+
+import time
+import threading
+import unittest
+
+from pyrakoon import compat, errors, fake
+from pyrakoon.client import counters, retry
+
+CLUSTER_ID = 'pyrakoon_test_counters'
+
+
+class _Interfering(counters.CounterBatcher):
+    '''Batcher whose reads are followed by a concurrent increment of a counter'''
+
+    def __init__(self, client, other, key, times, **kwargs):
+        super(_Interfering, self).__init__(client, **kwargs)
+        self._other = other
+        self._key = key
+        self._times = times
+
+    def _read(self, keys):
+        values = super(_Interfering, self)._read(keys)
+        if self._times > 0:
+            self._times -= 1
+            self._other.set(self._key, str(int(self._other.get(self._key)) + 100))
+        return values
+
+
+class TestCounterBatcher(unittest.TestCase):
+    '''Increment counters stored in a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=1)
+        self.cluster.start()
+
+        self.client = self._client()
+        self.client.set('hot', '0')
+        self.policy = retry.RetryPolicy(base=0.001, cap=0.01, budget_ratio=1, burst=1000)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def _client(self):
+        return compat.client._ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+
+    def test_flush(self):
+        '''Test coalesced deltas are applied in a single cycle'''
+
+        batcher = counters.CounterBatcher(self.client)
+        for _ in xrange(10):
+            batcher.add('a')
+        batcher.add('b', 5)
+        batcher.add('hot', -3)
+        batcher.add('c', 2)
+        batcher.add('c', -2)
+
+        self.assertEquals(batcher.flush(), {'a': 10, 'b': 5, 'hot': -3})
+        commands = self.client.metrics()['commands']
+        self.assertEquals((commands['MultiGetOption']['calls'], commands['Sequence']['calls']), (1, 1))
+
+        self.assertEquals(self.client.multi_get_option(['a', 'b', 'c', 'hot']), ['10', '5', None, '-3'])
+        self.assertEquals(batcher.pending(), {})
+        self.assertEquals(batcher.flush(), {})
+        stats = batcher.stats()
+        self.assertEquals((stats['increments'], stats['coalesced'], stats['keys_written']), (14, 10, 3))
+
+    def test_contention(self):
+        '''Test only contended counters are retried on their own'''
+
+        batcher = _Interfering(self.client, self._client(), 'hot', 2, policy=self.policy)
+        for key in ('a', 'b', 'hot'):
+            batcher.add(key)
+
+        self.assertEquals(batcher.flush(), {'a': 1, 'b': 1, 'hot': 201})
+        self.assertEquals(self.client.multi_get(['a', 'b', 'hot']), ['1', '1', '201'])
+
+        stats = batcher.stats()
+        self.assertEquals((stats['attempts'], stats['conflicts'], stats['keys_written']), (4, 2, 3))
+        self.assertEquals(stats['hot_keys'], [('hot', 2)])
+
+    def test_exhausted(self):
+        '''Test deltas stay pending when counters remain contended'''
+
+        batcher = _Interfering(self.client, self._client(), 'hot', 1, max_attempts=1)
+        batcher.add('hot', 7)
+        batcher.add('other')
+
+        self.assertRaises(errors.AssertionFailed, batcher.flush)
+        self.assertEquals(batcher.pending(), {'hot': 7, 'other': 1})
+        self.assertFalse(self.client.exists('other'))
+
+        self.assertEquals(batcher.flush(), {'hot': 107, 'other': 1})
+        self.assertEquals(batcher.stats()['requeued'], 2)
+
+    def test_concurrent(self):
+        '''Test concurrent batchers don't lose increments'''
+
+        def worker():
+            with counters.CounterBatcher(self._client(), max_attempts=100, policy=self.policy) as batcher:
+                for i in xrange(50):
+                    batcher.add('hot')
+                    batcher.add('key_%d' % (i % 5))
+                    if i % 10 == 9:
+                        batcher.flush()
+
+        threads = [threading.Thread(target=worker) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(self.client.multi_get(['hot'] + ['key_%d' % i for i in xrange(5)]), ['200'] + ['40'] * 5)
+
+    def test_background(self):
+        '''Test deltas are flushed by the background thread'''
+
+        batcher = counters.CounterBatcher(self.client, interval=0.01)
+        batcher.add('a', 3)
+
+        deadline = time.time() + 5
+        while batcher.stats()['keys_written'] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEquals(self.client.get('a'), '3')
+
+        batcher.add('a', 1)
+        batcher.close()
+        self.assertEquals(self.client.get('a'), '4')
@@ -0,0 +1,129 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.tools.dump`'''
+
+import os
+import shutil
+import tempfile
+import unittest
+import StringIO
+
+from pyrakoon import compat, fake
+from pyrakoon.tools import dump
+
+CLUSTER_ID = 'pyrakoon_test_dump'
+
+class TestDumpFormat(unittest.TestCase):
+    '''Tests for `pyrakoon.tools.dump.DumpWriter` and `pyrakoon.tools.dump.DumpReader`'''
+
+    PAIRS = [('key_%04d' % i, 'value_%d' % i * (i % 7)) for i in xrange(1000)]
+
+    def _write(self, **kwargs):
+        output = StringIO.StringIO()
+        with dump.DumpWriter(output, **kwargs) as writer:
+            for key, value in self.PAIRS:
+                writer.add(key, value)
+
+        self.assertEquals(writer.count, len(self.PAIRS))
+        return output.getvalue()
+
+    def test_round_trip(self):
+        '''Test pairs are read back as written, with and without compression'''
+
+        compressed = self._write(block_size=4096)
+        raw = self._write(block_size=4096, compress=False)
+        self.assert_(len(compressed) < len(raw) / 2)
+
+        for data in (compressed, raw):
+            self.assertEquals(list(dump.DumpReader(StringIO.StringIO(data))), self.PAIRS)
+
+    def test_seek(self):
+        '''Test seeking to a key using the block index'''
+
+        reader = dump.DumpReader(StringIO.StringIO(self._write(block_size=1024)))
+
+        index = reader.index()
+        self.assert_(len(index) > 5)
+        self.assertEquals(sum(block.count for block in index), len(self.PAIRS))
+        self.assertEquals(list(reader.records('key_0500')), self.PAIRS[500:])
+        self.assertEquals(list(reader.records('key_05001')), self.PAIRS[501:])
+        self.assertEquals(list(reader.records('')), self.PAIRS)
+
+    def test_index_position(self):
+        '''Test reading the index doesn't move the reader'''
+
+        reader = dump.DumpReader(StringIO.StringIO(self._write(block_size=1024)))
+
+        reader.index()
+        self.assertEquals(list(reader.records()), self.PAIRS)
+
+    def test_corruption(self):
+        '''Test corrupt and truncated files are detected'''
+
+        data = self._write(compress=False)
+
+        self.assertRaises(ValueError, dump.DumpReader, StringIO.StringIO('garbage' * 4))
+        corrupt = data[:100] + chr(ord(data[100]) ^ 1) + data[101:]
+        self.assertRaises(ValueError, list, dump.DumpReader(StringIO.StringIO(corrupt)))
+        self.assertRaises(ValueError, list, dump.DumpReader(StringIO.StringIO(data[:len(data) / 2])))
+
+
+class TestDumpRestore(unittest.TestCase):
+    '''Dump and restore `pyrakoon.fake.FakeCluster` key spaces'''
+
+    def setUp(self):
+        self.source = fake.FakeCluster(CLUSTER_ID, node_count=1)
+        self.source.start()
+        self.target = fake.FakeCluster(CLUSTER_ID, node_count=1)
+        self.target.start()
+        self.directory = tempfile.mkdtemp(prefix='pyrakoon_test_dump_')
+
+        client = compat.ArakoonClient(compat.ArakoonClientConfig(*self.source.client_config))
+        for i in xrange(250):
+            client.set('a/%03d' % i, 'value_%d' % i)
+        client.set('b/0', 'other')
+        client.set('a\xff', 'last')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        self.source.stop()
+        self.target.stop()
+
+    def _arguments(self, cluster):
+        arguments = ['--cluster-id', CLUSTER_ID]
+        for node_id in cluster.nodes:
+            host, port = cluster.node(node_id).address
+            arguments.extend(('--node', '%s:%s:%d' % (node_id, host, port)))
+        return arguments
+
+    def test_library(self):
+        '''Test paging through a prefix and restoring in batches'''
+
+        source = compat.client._ArakoonClient(compat.ArakoonClientConfig(*self.source.client_config))
+        target = compat.client._ArakoonClient(compat.ArakoonClientConfig(*self.target.client_config))
+        output = StringIO.StringIO()
+
+        self.assertEquals(dump.dump(source, output, prefix='a/', page_size=100), 250)
+        self.assertEquals(source.metrics()['commands']['RangeEntries']['calls'], 3)
+
+        output.seek(0)
+        progress = []
+        results = dump.restore(target, output, max_steps=100, progress=progress.append)
+        self.assertEquals([result.steps for result in results], [100, 100, 50])
+        self.assertEquals(progress, results)
+        self.assertEquals(target.range_entries(None, True, None, True, -1),
+            source.range_entries('a/', True, 'a0', False, -1))
+
+    def test_commands(self):
+        '''Test the pyrakoon-dump and pyrakoon-restore commands'''
+
+        path = os.path.join(self.directory, 'all.dump')
+
+        self.assertEquals(dump.dump_main(self._arguments(self.source) + ['--page-size', '7', path]), 0)
+        self.assertEquals(dump.restore_main(self._arguments(self.target) + ['--max-steps', '10', path]), 0)
+
+        source, target = [compat.ArakoonClient(compat.ArakoonClientConfig(*cluster.client_config))
+            for cluster in (self.source, self.target)]
+        self.assertEquals(target.range_entries(None, True, None, True), source.range_entries(None, True, None, True))
+        self.assertEquals(target.getKeyCount(), 252)
@@ -0,0 +1,367 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.fake`'''
+
+import os
+import time
+import signal
+import socket
+import unittest
+
+from pyrakoon import client, compat, consistency, errors, fake, protocol, sequence, utils
+from pyrakoon.client import health, hedging
+from pyrakoon.compat.client import socket as socket_client
+
+CLUSTER_ID = 'pyrakoon_test_fake'
+
+class Client(client.SocketClient, client.ClientMixin):
+    '''Native socket client'''
+
+
+class TestFakeStore(unittest.TestCase):
+    '''Tests for `pyrakoon.fake.FakeStore`'''
+
+    def setUp(self):
+        self.store = fake.FakeStore()
+        for i in xrange(10):
+            self.store.set('key_%d' % i, 'value_%d' % i)
+
+    def test_range(self):
+        '''Test range boundaries'''
+
+        self.assertEquals(self.store.range('key_2', True, 'key_5', False, -1),
+            ['key_2', 'key_3', 'key_4'])
+        self.assertEquals(self.store.range('key_2', False, 'key_5', True, 2),
+            ['key_3', 'key_4'])
+        self.assertEquals(self.store.rev_range('key_5', True, 'key_2', False, -1),
+            ['key_5', 'key_4', 'key_3'])
+        self.assertEquals(len(self.store.range(None, True, None, True, -1)), 10)
+
+    def test_apply_rollback(self):
+        '''Test a failing sequence leaves the store untouched'''
+
+        self.assertRaises(errors.NotFound, self.store.apply, [
+            ('set', 'key_0', 'changed'),
+            ('delete_prefix', 'key_'),
+            ('delete', 'missing'),
+        ])
+
+        self.assertEquals(len(self.store), 10)
+        self.assertEquals(self.store.get('key_0'), 'value_0')
+
+
+class TestFakeServer(unittest.TestCase):
+    '''Run the clients against `pyrakoon.fake.FakeServer`'''
+
+    def setUp(self):
+        self.server = fake.FakeServer(CLUSTER_ID)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_native_client(self):
+        '''Run a scenario using `pyrakoon.client.SocketClient`'''
+
+        client_ = Client(self.server.address, CLUSTER_ID)
+        client_.connect()
+
+        self.assertEquals(client_.who_master(), 'arakoon_0')
+        self.assertFalse(client_.exists('key'))
+        self.assertRaises(errors.NotFound, client_.get, 'key')
+
+        for i in xrange(20):
+            client_.set('key_%02d' % i, 'value_%d' % i)
+
+        self.assertEquals(client_.multi_get(['key_01', 'key_02']),
+            ['value_1', 'value_2'])
+        self.assertEquals(client_.multi_get_option(['key_01', 'key']),
+            ['value_1', None])
+        self.assertEquals(client_.range('key_05', True, 'key_08', False),
+            ['key_05', 'key_06', 'key_07'])
+        self.assertEquals(client_.rev_range_entries('key_19', True, None, True, 2),
+            [('key_19', 'value_19'), ('key_18', 'value_18')])
+
+        client_.sequence([sequence.Set('skey', 'svalue'),
+            sequence.Delete('key_00')])
+        self.assertEquals(client_.get('skey'), 'svalue')
+        self.assertRaises(errors.AssertionFailed, client_.sequence,
+            [sequence.Delete('skey'), sequence.Assert('key_01', None)])
+        self.assertTrue(client_.exists('skey'))
+
+        self.assertEquals(client_.test_and_set('skey', 'svalue', 'other'), 'svalue')
+        self.assertEquals(client_.replace('skey', None), 'other')
+        self.assertEquals(client_.delete_prefix('key_'), 19)
+        self.assertEquals(client_.get_key_count(), 0)
+        self.assertEquals(client_.statistics()['seq_info']['n'], 2)
+
+        value = 'x' * (4 * 1024 * 1024)
+        client_.set('large', value)
+        self.assertEquals(client_.get('large'), value)
+
+    def test_metrics(self):
+        '''Test call metrics of `pyrakoon.client.SocketClient`'''
+
+        client_ = Client(self.server.address, CLUSTER_ID)
+        client_.connect()
+
+        client_.set('key', 'value')
+        self.assertEquals(client_.get('key'), 'value')
+        self.assertRaises(errors.NotFound, client_.get, 'other')
+
+        metrics = client_.metrics()
+        self.assertEquals(metrics['commands']['Set']['calls'], 1)
+        self.assertEquals(metrics['commands']['Get']['calls'], 2)
+        self.assertEquals(metrics['commands']['Get']['errors'], 1)
+        self.assertEquals(metrics['commands']['Get']['latency_us']['count'], 2)
+        self.assertEquals(metrics['errors'], {'NotFound': 1})
+        self.assertEquals(metrics['bytes_sent'], sum(
+            len(''.join(message.serialize())) for message in (protocol.Set('key', 'value'),
+                protocol.Get(None, 'key'), protocol.Get(None, 'other'))))
+        # Result codes, value and error message
+        self.assertEquals(metrics['bytes_received'], 3 * 4 + (4 + 5) + (4 + 5))
+
+    def test_pipelining(self):
+        '''Send several requests before reading any response'''
+
+        sock = socket.create_connection(self.server.address)
+        sock.sendall(protocol.build_prologue(CLUSTER_ID))
+
+        messages = [protocol.Set('key_%d' % i, 'value_%d' % i) for i in xrange(10)]
+        messages.append(protocol.GetKeyCount())
+        sock.sendall(''.join(''.join(message.serialize()) for message in messages))
+
+        read = sock.makefile('rb').read
+        results = [utils.read_blocking(message.receive(), read) for message in messages]
+        sock.close()
+
+        self.assertEquals(results, [None] * 10 + [10])
+
+    def test_compat_client(self):
+        '''Run a scenario using `pyrakoon.compat.ArakoonClient`'''
+
+        client_ = compat.ArakoonClient(
+            compat.ArakoonClientConfig(*self.server.client_config))
+
+        self.assertEquals(client_.whoMaster(), 'arakoon_0')
+        self.assertRaises(compat.ArakoonNotFound, client_.get, 'key')
+
+        sequence_ = compat.Sequence()
+        sequence_.addSet('key', 'value')
+        sequence_.addAssert('key', 'value')
+        client_.sequence(sequence_)
+
+        self.assertEquals(client_.get('key'), 'value')
+        self.assertEquals(client_.range_entries(None, True, None, True),
+            [('key', 'value')])
+        self.assertEquals(client_.getVersion()[0], 1)
+
+    def test_wrong_cluster(self):
+        '''Test connections for another cluster are refused'''
+
+        client_ = Client(self.server.address, 'other_cluster')
+        client_.connect()
+
+        self.assertRaises(errors.WrongCluster, client_.get_key_count)
+
+
+class TestFakeCluster(unittest.TestCase):
+    '''Tests for `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=3)
+        self.cluster.start()
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def _connect(self, node_id):
+        client_ = Client(self.cluster.node(node_id).address, CLUSTER_ID)
+        client_.connect()
+        return client_
+
+    def test_roles(self):
+        '''Test master and slave behaviour'''
+
+        master = self._connect('arakoon_0')
+        slave = self._connect('arakoon_1')
+
+        self.assertEquals(slave.who_master(), 'arakoon_0')
+        master.set('key', 'value')
+
+        self.assertRaises(errors.NotMaster, slave.set, 'key', 'other')
+        self.assertRaises(errors.NotMaster, slave.get, 'key')
+        self.assertEquals(slave.get('key', consistency=consistency.INCONSISTENT),
+            'value')
+
+        self.cluster.set_master('arakoon_1')
+        slave.set('key', 'other')
+        self.assertEquals(master.who_master(), 'arakoon_1')
+        self.assertRaises(errors.NotMaster, master.get, 'key')
+
+    def test_faults(self):
+        '''Test injected faults'''
+
+        client_ = self._connect('arakoon_0')
+
+        self.cluster.going_down('arakoon_0')
+        self.assertRaises(errors.GoingDown, client_.get_key_count)
+        self.assertEquals(self.cluster.master, 'arakoon_1')
+
+        self.cluster.crash('arakoon_1')
+        self.assertEquals(self.cluster.master, 'arakoon_2')
+        self.assertFalse(self.cluster.node('arakoon_1').running)
+
+        self.cluster.restart('arakoon_1')
+        self.assertEquals(self._connect('arakoon_1').who_master(), 'arakoon_2')
+
+        self.assertEquals([event[1] for event in self.cluster.events[1:]],
+            ['going_down', 'master', 'master', 'crash', 'master', 'master',
+             'recover', 'restart'])
+
+    def test_compat_failover(self):
+        '''Test the compat client follows a master change'''
+
+        client_ = compat.ArakoonClient(
+            compat.ArakoonClientConfig(*self.cluster.client_config),
+            timeout=1, noMasterTimeout=5)
+        client_.set('key', 'value')
+
+        self.cluster.crash(client_.whoMaster())
+        client_.set('key', 'other')
+
+        self.assertEquals(client_.whoMaster(), 'arakoon_1')
+        self.assertEquals(client_.get('key'), 'other')
+
+        metrics = client_.metrics()
+        self.assertEquals(metrics['commands']['Set']['calls'], 2)
+        self.assertEquals(metrics['commands']['Set']['errors'], 0)
+        self.assert_(metrics['retries'] >= 1)
+        self.assert_(metrics['master_rediscoveries'] >= 2)
+
+    def test_compat_warm_up(self):
+        '''Test the compat client connects to all nodes in parallel'''
+
+        client_ = compat.ArakoonClient(
+            compat.ArakoonClientConfig(*self.cluster.client_config))
+        connections = client_._client._connections #pylint: disable=W0212
+
+        self.cluster.crash('arakoon_2')
+        for node_id in ('arakoon_0', 'arakoon_1'):
+            self.cluster.slow(node_id, 0.2)
+
+        start = time.time()
+        self.assertEquals(client_._client.warm_up(determine_master=False), #pylint: disable=W0212
+            {'arakoon_0': True, 'arakoon_1': True, 'arakoon_2': False})
+        self.assert_(time.time() - start < 0.4)
+        self.assertEquals(sorted(connections), ['arakoon_0', 'arakoon_1'])
+
+        for node_id in ('arakoon_0', 'arakoon_1'):
+            self.cluster.slow(node_id, 0.0)
+        warm = dict(connections)
+
+        self.assertEquals(client_.warmUp()['arakoon_0'], True)
+        self.assertEquals(client_._masterId, 'arakoon_0') #pylint: disable=W0212
+        self.assertFalse(client_.exists('key'))
+        self.assert_(all(connections[node_id] is warm[node_id] for node_id in warm))
+
+    def test_compat_warm_up_timeout(self):
+        '''Test connections set up after the warm-up timed out are closed'''
+
+        client_ = compat.ArakoonClient(
+            compat.ArakoonClientConfig(*self.cluster.client_config))._client #pylint: disable=W0212
+        created = []
+        new_connection = client_._new_connection #pylint: disable=W0212
+
+        def record(node_id):
+            '''Keep track of new connections'''
+            connection = new_connection(node_id)
+            created.append((node_id, connection))
+            return connection
+
+        client_._new_connection = record #pylint: disable=W0212
+        self.cluster.slow('arakoon_1', 0.2)
+
+        self.assertEquals(client_.warm_up(determine_master=False, timeout=0.1),
+            {'arakoon_0': True, 'arakoon_1': False, 'arakoon_2': True})
+        time.sleep(0.3)
+
+        late = [connection for (node_id, connection) in created if node_id == 'arakoon_1']
+        self.assertEquals(len(late), 1)
+        self.assertFalse(late[0].connected)
+        self.assertFalse('arakoon_1' in client_._connections) #pylint: disable=W0212
+
+    def test_compat_fork(self):
+        '''Test a compat client created before forking is reset in the child'''
+
+        client_ = compat.ArakoonClient(
+            compat.ArakoonClientConfig(*self.cluster.client_config))
+        client_.setWarmUpAfterFork()
+        client_.set('key', 'value')
+        connections = client_._client._connections #pylint: disable=W0212
+        inherited = connections['arakoon_0']
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_fd)
+                value = client_.get('key')
+                children = client_._client._connections #pylint: disable=W0212
+                os.write(write_fd, '%s %d %s' % (
+                    value, len(children), children['arakoon_0'] is not inherited))
+                status = 0
+            finally:
+                os._exit(status) #pylint: disable=W0212
+
+        os.close(write_fd)
+        result = os.read(read_fd, 1024)
+        os.close(read_fd)
+        _, status = os.waitpid(pid, 0)
+
+        self.assertEquals(status, 0)
+        self.assertEquals(result, 'value 3 True')
+        self.assert_(connections['arakoon_0'] is inherited)
+        self.assertEquals(client_.get('key'), 'value')
+
+    def test_compat_fork_locks(self):
+        '''Test locks held in the parent at fork time don't block the child'''
+
+        client_ = compat.ArakoonClient(
+            compat.ArakoonClientConfig(*self.cluster.client_config))
+        client_.setHealthTracker(health.HealthTracker())
+        client_.setHedgePolicy(hedging.HedgePolicy())
+        client_.allowDirtyReads()
+        client_.set('key', 'value')
+
+        locks = [client_._client.health_tracker._lock, client_._client.hedge_policy._lock, #pylint: disable=W0212
+                 socket_client._fork_lock()] #pylint: disable=W0212
+        for lock in locks:
+            lock.acquire()
+
+        read_fd, write_fd = os.pipe()
+        try:
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    # Don't hang the test run on a deadlock
+                    signal.alarm(5)
+                    os.close(read_fd)
+                    os.write(write_fd, client_.get('key'))
+                    status = 0
+                finally:
+                    os._exit(status) #pylint: disable=W0212
+        finally:
+            for lock in locks:
+                lock.release()
+
+        os.close(write_fd)
+        result = os.read(read_fd, 1024)
+        os.close(read_fd)
+        _, status = os.waitpid(pid, 0)
+
+        self.assertEquals(status, 0)
+        self.assertEquals(result, 'value')
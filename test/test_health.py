@@ -0,0 +1,112 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.health`'''
+
+import time
+import unittest
+
+from pyrakoon import compat, fake
+from pyrakoon.client import health
+
+CLUSTER_ID = 'pyrakoon_test_health'
+
+class TestHealthTracker(unittest.TestCase):
+    '''Tests for `pyrakoon.client.health.HealthTracker`'''
+
+    def test_half_open(self):
+        '''Test a single probe is allowed once the cool-down passed'''
+
+        tracker = health.HealthTracker(failure_threshold=1, cool_down=0.05)
+        tracker.record_failure('arakoon_0')
+        self.assertFalse(tracker.acquire_probe('arakoon_0'))
+
+        time.sleep(0.05)
+        self.assertEquals(tracker.state('arakoon_0'), health.STATE_HALF_OPEN)
+        self.assertTrue(tracker.acquire_probe('arakoon_0'))
+        self.assertFalse(tracker.acquire_probe('arakoon_0'))
+
+        tracker.record_failure('arakoon_0')
+        self.assertEquals(tracker.state('arakoon_0'), health.STATE_OPEN)
+
+        time.sleep(0.05)
+        self.assertTrue(tracker.acquire_probe('arakoon_0'))
+        tracker.record_success('arakoon_0', 0.001)
+        self.assertEquals(tracker.state('arakoon_0'), health.STATE_CLOSED)
+
+    def test_error_rate(self):
+        '''Test the circuit opens on a high error rate'''
+
+        tracker = health.HealthTracker(failure_threshold=10, error_rate_threshold=0.3, min_calls=10)
+        for _ in xrange(10):
+            tracker.record_success('arakoon_0', 0.001)
+            tracker.record_failure('arakoon_0')
+
+        self.assertEquals(tracker.state('arakoon_0'), health.STATE_OPEN)
+        self.assertEquals(tracker.snapshot()['arakoon_0']['failures'], 10)
+
+    def test_slow_latency(self):
+        '''Test the circuit opens on a high latency, and nodes are ordered by score'''
+
+        tracker = health.HealthTracker(slow_latency=0.1, min_calls=3)
+        for _ in xrange(3):
+            tracker.record_success('arakoon_0', 0.01)
+            tracker.record_success('arakoon_1', 0.001)
+        self.assertEquals(tracker.order(['arakoon_0', 'arakoon_1', 'arakoon_2']),
+            ['arakoon_2', 'arakoon_1', 'arakoon_0'])
+
+        for _ in xrange(20):
+            tracker.record_success('arakoon_1', 0.5)
+        self.assertEquals(tracker.state('arakoon_1'), health.STATE_OPEN)
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    '''Skip sick nodes of a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=3)
+        self.cluster.start()
+
+        self.tracker = health.HealthTracker(failure_threshold=1, cool_down=0.5)
+        self.client = compat.ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config),
+            timeout=5, noMasterTimeout=0.1)
+        self.client.setHealthTracker(self.tracker)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def test_node(self):
+        '''Test a crashed node is skipped, probed and used again'''
+
+        self.client.set('key', 'value')
+        self.assertEquals(self.tracker.state(self.cluster.master), health.STATE_CLOSED)
+
+        self.cluster.crash('arakoon_1')
+        self.assertRaises(compat.ArakoonNotConnected, self.client.getVersion, 'arakoon_1')
+        self.assertEquals(self.tracker.state('arakoon_1'), health.STATE_OPEN)
+
+        # Skipped without connecting
+        calls = self.tracker.snapshot()['arakoon_1']['calls']
+        self.assertRaises(compat.ArakoonNotConnected, self.client.getVersion, 'arakoon_1')
+        self.assertEquals(self.tracker.snapshot()['arakoon_1']['calls'], calls)
+
+        # Failing probe
+        time.sleep(0.5)
+        self.assertRaises(compat.ArakoonNotConnected, self.client.getVersion, 'arakoon_1')
+        self.assertEquals(self.tracker.state('arakoon_1'), health.STATE_OPEN)
+
+        self.cluster.restart('arakoon_1')
+        time.sleep(0.5)
+        self.assertEquals(self.client.getVersion('arakoon_1'), fake.FakeServer.VERSION)
+        self.assertEquals(self.tracker.state('arakoon_1'), health.STATE_CLOSED)
+
+    def test_master_discovery(self):
+        '''Test master discovery skips nodes with an open circuit'''
+
+        self.cluster.set_master('arakoon_2')
+        self.cluster.crash('arakoon_0')
+        self.tracker.record_failure('arakoon_0')
+
+        self.client.set('key', 'value')
+        self.assertEquals(self.client._masterId, 'arakoon_2') #pylint: disable=W0212
+        self.assertEquals(self.tracker.snapshot()['arakoon_0']['calls'], 1)
@@ -0,0 +1,145 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.hedging`'''
+
+import time
+import unittest
+
+from pyrakoon import compat, consistency, fake, protocol
+from pyrakoon.client import hedging
+
+CLUSTER_ID = 'pyrakoon_test_hedging'
+
+class TestHedgePolicy(unittest.TestCase):
+    '''Tests for `pyrakoon.client.hedging.HedgePolicy`'''
+
+    def test_delay(self):
+        '''Test the delay follows the latency percentile'''
+
+        policy = hedging.HedgePolicy(percentile=90, initial_delay=0.5, min_delay=0.002, window=100,
+            min_samples=100)
+        self.assertEquals(policy.start(), 0.5)
+
+        for i in xrange(1, 101):
+            policy.record(i / 1000.0)
+        self.assertAlmostEquals(policy.start(), 0.09, 3)
+
+        # Older latencies are forgotten
+        for _ in xrange(200):
+            policy.record(0.0)
+        self.assertEquals(policy.start(), 0.002)
+
+    def test_budget(self):
+        '''Test hedges are limited by the budget and rate'''
+
+        policy = hedging.HedgePolicy(budget=0.5, burst=2)
+        self.assertEquals([policy.acquire() for _ in xrange(3)], [True, True, False])
+
+        policy.start()
+        self.assertFalse(policy.acquire())
+        policy.start()
+        self.assertTrue(policy.acquire())
+
+        policy = hedging.HedgePolicy(budget=1, burst=10, max_per_second=1)
+        self.assertEquals([policy.acquire() for _ in xrange(3)], [True, False, False])
+
+    def test_eligible(self):
+        '''Test only reads not requiring consistency are eligible'''
+
+        self.assertTrue(hedging.HedgePolicy.eligible(protocol.MultiGet(consistency.AtLeast(3), ['key'])))
+        self.assertFalse(hedging.HedgePolicy.eligible(protocol.Get(consistency.CONSISTENT, 'key')))
+        self.assertFalse(hedging.HedgePolicy.eligible(protocol.Set('key', 'value')))
+
+
+class TestHedgedReads(unittest.TestCase):
+    '''Hedge reads against a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=2)
+        self.cluster.start()
+
+        self.client = compat.ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+        self.client.set('key', 'value')
+        self.client.allowDirtyReads()
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def _get(self):
+        '''Time a get'''
+
+        start = time.time()
+        self.assertEquals(self.client.get('key'), 'value')
+        return time.time() - start
+
+    def test_hedge(self):
+        '''Test a stalling master is hedged, and its reply drained'''
+
+        self.client.setHedgePolicy(hedging.HedgePolicy(initial_delay=0.02, budget=0, burst=1))
+        self.cluster.slow('arakoon_0', 0.3)
+
+        self.assertTrue(self._get() < 0.25)
+        metrics = self.client.metrics()
+        self.assertEquals((metrics['hedges'], metrics['hedge_wins']), (1, 1))
+
+        # Budget exhausted
+        self.assertTrue(self._get() >= 0.3)
+        self.assertEquals(self.client.metrics()['hedges'], 1)
+
+    def test_slow_call(self):
+        '''Test slow hedged reads are reported on the node which replied'''
+
+        calls = []
+        self.client.setSlowCallThreshold(0.01, callback=calls.append)
+        self.client.setHedgePolicy(hedging.HedgePolicy(initial_delay=0.02, budget=0, burst=1))
+        self.cluster.slow('arakoon_0', 0.3)
+
+        self._get()
+        self.assertEquals(self.client.metrics()['hedge_wins'], 1)
+        self.assertEquals([call.node_id for call in calls], ['arakoon_1'])
+
+    def test_dead_hedge_target(self):
+        '''Test failing to send a hedge doesn't make the client forget the master'''
+
+        self.client.setHedgePolicy(hedging.HedgePolicy(initial_delay=0.02, budget=0, burst=1))
+        self.cluster.crash('arakoon_1')
+        self.cluster.slow('arakoon_0', 0.05)
+        rediscoveries = self.client.metrics()['master_rediscoveries']
+
+        self._get()
+        self._get()
+        self.assertEquals(self.client._client.master_id, 'arakoon_0') #pylint: disable=W0212
+        self.assertEquals(self.client.metrics()['master_rediscoveries'], rediscoveries)
+
+    def test_drain(self):
+        '''Test connections are reused once the losing reply is drained'''
+
+        self.client.setHedgePolicy(hedging.HedgePolicy(initial_delay=0.02, budget=0, burst=2))
+        self.cluster.slow('arakoon_0', 0.1)
+        self._get()
+
+        self.cluster.slow('arakoon_0', 0.0)
+        time.sleep(0.2)
+        connection = self.client._client._connections['arakoon_0'] #pylint: disable=W0212
+        self._get()
+        self.assertTrue(self.client._client._connections['arakoon_0'] is connection) #pylint: disable=W0212
+
+        # The reply didn't arrive yet, so the connection is replaced
+        self.cluster.slow('arakoon_0', 0.1)
+        self._get()
+        self.cluster.slow('arakoon_0', 0.0)
+        self._get()
+        self.assertTrue(self.client._client._connections['arakoon_0'] is not connection) #pylint: disable=W0212
+
+        self.assertEquals(self.client.metrics()['hedges'], 2)
+
+    def test_consistent(self):
+        '''Test consistent reads aren't hedged'''
+
+        self.client.setHedgePolicy(hedging.HedgePolicy(initial_delay=0.01))
+        self.client.disallowDirtyReads()
+        self.cluster.slow('arakoon_0', 0.05)
+
+        self.assertTrue(self._get() >= 0.05)
+        self.assertEquals(self.client.metrics()['hedges'], 0)
@@ -0,0 +1,54 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.histogram`'''
+
+import pickle
+import random
+import unittest
+
+from pyrakoon.histogram import Histogram
+
+class TestHistogram(unittest.TestCase):
+    '''Tests for `pyrakoon.histogram.Histogram`'''
+
+    def test_precision(self):
+        '''Test recorded values stay within the configured precision'''
+
+        random_ = random.Random(42)
+        values = sorted(int(random_.expovariate(1e-5)) for _ in xrange(10000))
+
+        for digits in (1, 2, 3):
+            histogram = Histogram(digits)
+            for value in values:
+                histogram.record(value)
+
+            for percentile in (50, 90, 99, 99.9, 100):
+                exact = values[max(int(len(values) * percentile / 100.0 + 0.5), 1) - 1]
+                reported = histogram.percentile(percentile)
+                self.assert_(exact <= reported <= exact * (1 + 10 ** -digits) + 1,
+                    '%d digits, p%g: %d vs %d' % (digits, percentile, reported, exact))
+
+        self.assertEquals(histogram.min, values[0])
+        self.assertEquals(histogram.max, values[-1])
+
+    def test_merge(self):
+        '''Test merging and pickling histograms'''
+
+        first, second = Histogram(), Histogram()
+        for value in xrange(100):
+            first.record(value)
+            second.record(value * 1000, 2)
+
+        first.merge(pickle.loads(pickle.dumps(second)))
+
+        self.assertEquals(first.count, 300)
+        self.assertEquals(first.max, 99000)
+        self.assertEquals(first.percentile(100), 99000)
+        self.assertEquals(first.percentile(33), 96)
+        self.assertRaises(ValueError, first.merge, Histogram(3))
+
+        distribution = first.distribution()
+        self.assertEquals(distribution[-1], (99000, 100.0, 300))
+        self.assertEquals([value for value, _, _ in distribution],
+            sorted(value for value, _, _ in distribution))
@@ -0,0 +1,224 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.negativecache`'''
+
+import time
+import unittest
+
+from pyrakoon import compat, consistency, errors, fake, protocol, sequence
+from pyrakoon.client import blob, bulk, counters, negativecache, transaction
+
+CLUSTER_ID = 'pyrakoon_test_negativecache'
+
+
+class _Process(object):
+    '''Process callable answering reads as if no key exists'''
+
+    def __init__(self):
+        self.messages = []
+
+    def __call__(self, message):
+        self.messages.append(message)
+        if isinstance(message, protocol.Get):
+            raise errors.NotFound(message.key)
+        if isinstance(message, protocol.Exists):
+            return False
+        return None
+
+
+class TestNegativeCache(unittest.TestCase):
+    '''Tests for `pyrakoon.client.negativecache.NegativeCache`'''
+
+    def _get(self, cache, process, key, consistency_=consistency.INCONSISTENT):
+        self.assertRaises(errors.NotFound, cache.process, process, protocol.Get(consistency_, key))
+
+    def test_hits(self):
+        '''Test inconsistent reads of missing keys are answered from the cache'''
+
+        cache = negativecache.NegativeCache()
+        process = _Process()
+
+        self._get(cache, process, 'a')
+        self._get(cache, process, 'a')
+        self.assertFalse(cache.process(process, protocol.Exists(consistency.INCONSISTENT, 'a')))
+        self.assertFalse(cache.process(process, protocol.Exists(consistency.INCONSISTENT, 'b')))
+        self.assertFalse(cache.process(process, protocol.Exists(consistency.INCONSISTENT, 'b')))
+
+        self.assertEquals(len(process.messages), 2)
+        self.assertEquals(cache.stats()['hits'], 3)
+
+    def test_consistent(self):
+        '''Test consistent reads are always sent'''
+
+        cache = negativecache.NegativeCache()
+        process = _Process()
+
+        self._get(cache, process, 'a', consistency.CONSISTENT)
+        self._get(cache, process, 'a', None)
+        self._get(cache, process, 'a', consistency.AtLeast(0))
+
+        self.assertEquals(len(process.messages), 3)
+        self.assertEquals(cache.stats()['hits'], 0)
+
+    def test_expiry(self):
+        '''Test entries expire after the time-to-live'''
+
+        cache = negativecache.NegativeCache(ttl=0.01)
+        process = _Process()
+
+        self._get(cache, process, 'a')
+        self.assert_('a' in cache)
+        time.sleep(0.02)
+        self.assertFalse('a' in cache)
+        self._get(cache, process, 'a')
+        self.assertEquals(len(process.messages), 2)
+
+    def test_eviction(self):
+        '''Test the oldest entries are evicted when the cache is full'''
+
+        cache = negativecache.NegativeCache(max_size=2)
+        process = _Process()
+
+        for key in ('a', 'b', 'c'):
+            self._get(cache, process, key)
+
+        self.assertEquals(('a' in cache, 'b' in cache, 'c' in cache), (False, True, True))
+        self.assertEquals(cache.stats()['evictions'], 1)
+
+    def test_writes(self):
+        '''Test written keys are forgotten'''
+
+        cache = negativecache.NegativeCache()
+        process = _Process()
+        keys = ['set', 'tas', 'replace', 'confirm', 'step', 'nested', 'builder', 'kept']
+        for key in keys:
+            self._get(cache, process, key)
+
+        builder = sequence.SequenceBuilder()
+        builder.add_assert('kept', None)
+        builder.add_replace('builder', 'value')
+        builder.add_delete('kept')
+        builder.add_step(sequence.AssertRange('kept', sequence.steps.ContainsExactly(['kept'])))
+
+        for message in [
+                protocol.Set('set', 'value'),
+                protocol.TestAndSet('tas', None, 'value'),
+                protocol.Replace('replace', 'value'),
+                protocol.Confirm('confirm', 'value'),
+                protocol.Sequence([
+                    sequence.Set('step', 'value'), sequence.Delete('kept'),
+                    sequence.Sequence([sequence.Replace('nested', 'value')]), builder,
+                ], False),
+                protocol.Delete('kept'),
+                protocol.DeletePrefix('kept'),
+        ]:
+            cache.process(process, message)
+
+        self.assertEquals([key for key in keys if key in cache], ['kept'])
+
+    def test_user_function(self):
+        '''Test user functions forget all keys'''
+
+        cache = negativecache.NegativeCache()
+        process = _Process()
+        self._get(cache, process, 'a')
+
+        cache.process(process, protocol.UserFunction('function', None))
+        self.assertEquals(len(cache), 0)
+
+    def test_concurrent_write(self):
+        '''Test misses observed while a write is in flight aren't remembered'''
+
+        cache = negativecache.NegativeCache()
+
+        def process(message):
+            cache.process(lambda _: None, protocol.Set('a', 'value'))
+            raise errors.NotFound(message.key)
+
+        self._get(cache, process, 'a')
+        self.assertFalse('a' in cache)
+
+
+class TestCompatNegativeCache(unittest.TestCase):
+    '''Cache missing keys of a compat client on a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=1)
+        self.cluster.start()
+
+        self.client = compat.ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+        self.client.allowDirtyReads()
+        self.cache = negativecache.NegativeCache(ttl=60)
+        self.client.setNegativeCache(self.cache)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def test_sequence(self):
+        '''Test keys set through a compat sequence are readable right away'''
+
+        self.assertRaises(compat.ArakoonNotFound, self.client.get, 'key')
+        self.assertFalse(self.client.exists('key'))
+        self.assertEquals(self.cache.stats()['hits'], 1)
+
+        seq = self.client.makeSequence()
+        seq.addSet('key', 'value')
+        self.client.sequence(seq)
+
+        self.assertTrue(self.client.exists('key'))
+        self.assertEquals(self.client.get('key'), 'value')
+
+    def _miss(self, key):
+        self.assertFalse(self.client.exists(key))
+        self.assert_(key in self.cache)
+
+    def test_transaction(self):
+        '''Test keys set through a transaction are readable right away'''
+
+        self._miss('key')
+        tx = transaction.Transaction(self.client._client) #pylint: disable=W0212
+        tx.set('key', 'value')
+        tx.commit()
+
+        self.assertEquals(self.client.get('key'), 'value')
+
+    def test_counters(self):
+        '''Test counters flushed by a batcher are readable right away'''
+
+        self._miss('counter')
+        batcher = counters.CounterBatcher(self.client._client) #pylint: disable=W0212
+        batcher.add('counter', 2)
+        batcher.flush()
+
+        self.assertEquals(self.client.get('counter'), '2')
+
+    def test_bulk(self):
+        '''Test keys loaded by a bulk writer are readable right away'''
+
+        self._miss('key')
+        results = bulk.BulkWriter(self.client._client).write([('key', 'value')]) #pylint: disable=W0212
+
+        self.assert_(all(result.ok for result in results))
+        self.assertEquals(self.client.get('key'), 'value')
+
+    def test_blob(self):
+        '''Test blobs stored by a blob store are readable right away'''
+
+        store = blob.BlobStore(self.client._client, chunk_size=4, max_sequence_bytes=8) #pylint: disable=W0212
+        self._miss('blob')
+        store.put('blob', 'x' * 10)
+
+        self.assertTrue(self.client.exists('blob'))
+        self.assertEquals(store.get('blob'), 'x' * 10)
+
+    def test_consistent(self):
+        '''Test consistent reads bypass the cache'''
+
+        self.assertRaises(compat.ArakoonNotFound, self.client.get, 'key')
+
+        other = compat.ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+        other.set('key', 'value')
+
+        self.assertRaises(compat.ArakoonNotFound, self.client.get, 'key')
+        self.assertEquals(self.client.get('key', compat.Consistent()), 'value')
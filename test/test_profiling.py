@@ -0,0 +1,81 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.profiling`'''
+
+import unittest
+
+from pyrakoon import client, compat, errors, fake, profiling
+
+CLUSTER_ID = 'pyrakoon_test_profiling'
+
+class Client(client.SocketClient, client.ClientMixin):
+    '''Native socket client'''
+
+
+class TestProfiler(unittest.TestCase):
+    '''Profile calls against `pyrakoon.fake.FakeServer`'''
+
+    def setUp(self):
+        self.server = fake.FakeServer(CLUSTER_ID)
+        self.server.start()
+
+        self.client = Client(self.server.address, CLUSTER_ID)
+        self.client.connect()
+        for i in xrange(100):
+            self.client.set('key_%03d' % i, 'value_%03d' % i)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_native_client(self):
+        '''Test phases of native client calls are accounted per message type'''
+
+        profiles = []
+        with profiling.Profiler(profiles.append) as profiler:
+            self.assertTrue(profiler.enabled)
+            self.assertEquals(len(self.client.range('key_', True, 'key_999', True, -1)), 100)
+            self.assertRaises(errors.NotFound, self.client.get, 'other')
+            self.assertRaises(errors.NotFound, self.client.get, 'other')
+
+        self.assertFalse(profiler.enabled)
+        self.assertTrue(profiling.start(None) is None)
+        self.assertEquals([profile.message_type for profile in profiles], ['Range', 'Get', 'Get'])
+
+        stats = profiler.stats()
+        self.assertEquals(sorted(stats), ['Get', 'Range'])
+        self.assertEquals((stats['Get']['calls'], stats['Get']['errors']), (2, 2))
+
+        range_ = stats['Range']
+        self.assertEquals(range_['calls'], 1)
+        self.assertEquals(range_['bytes_received'], 4 + 4 + 100 * (4 + 7))
+        # Return code, list length, and a size and data step per key
+        self.assertEquals(range_['decode_steps'], 1 + 1 + 1 + 100 * 2)
+        self.assertTrue(range_['network'] > 0)
+        self.assertTrue(range_['decode'] > 0)
+
+        report = profiler.report()
+        self.assertTrue(report.splitlines()[2].startswith('Range '))
+
+        profiler.reset()
+        self.assertEquals(profiler.stats(), {})
+
+    def test_compat_client(self):
+        '''Test compat client calls are profiled'''
+
+        client_ = compat.ArakoonClient(
+            compat.ArakoonClientConfig(*self.server.client_config))
+
+        with profiling.Profiler() as profiler:
+            self.assertEquals(client_.get('key_001'), 'value_001')
+
+        self.assertEquals(profiler.stats()['Get']['calls'], 1)
+
+    def test_single_profiler(self):
+        '''Test only a single profiler can be enabled'''
+
+        with profiling.Profiler() as profiler:
+            self.assertTrue(profiling.active() is profiler)
+            self.assertRaises(RuntimeError, profiling.Profiler().enable)
+
+        self.assertTrue(profiling.active() is None)
@@ -0,0 +1,204 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.retry`'''
+
+import time
+import random
+import threading
+import unittest
+
+from pyrakoon import compat, fake
+from pyrakoon.client import retry
+from pyrakoon.compat import config
+from pyrakoon.compat.client import socket as socket_client
+
+CLUSTER_ID = 'pyrakoon_test_retry'
+
+
+class _MaximalBackoff(object):
+    '''Stand-in for the `random` module, always picking the longest backoff'''
+
+    def __getattr__(self, name):
+        return getattr(random, name)
+
+    @staticmethod
+    def randint(_, maximum):
+        return maximum
+
+
+class TestRetryPolicy(unittest.TestCase):
+    '''Tests for `pyrakoon.client.retry.RetryPolicy`'''
+
+    def test_backoff(self):
+        '''Test sleeps are jittered between the base and cap'''
+
+        policy = retry.RetryPolicy(base=0.01, cap=0.5, burst=1000)
+        schedule = policy.start(None)
+        sleeps = [schedule.next_sleep() for _ in xrange(100)]
+
+        self.assertTrue(all(0.01 <= sleep <= 0.5 for sleep in sleeps))
+        self.assertTrue(max(sleeps) > 0.1)
+        self.assertEquals(schedule.retries, 100)
+
+    def test_deadline(self):
+        '''Test sleeps don't extend past the deadline'''
+
+        policy = retry.RetryPolicy(base=1, cap=2)
+        self.assertTrue(policy.start(time.time() + 0.1).next_sleep() <= 0.1)
+        self.assertTrue(policy.start(time.time() - 0.1).next_sleep() is None)
+
+    def test_budget(self):
+        '''Test retries are limited by the budget'''
+
+        policy = retry.RetryPolicy(budget_ratio=0.5, min_per_second=0, burst=1)
+        schedule = policy.start(None)
+        self.assertTrue(schedule.next_sleep() is not None)
+        self.assertTrue(schedule.next_sleep() is None)
+
+        policy.start(None)
+        self.assertTrue(schedule.next_sleep() is None)
+        policy.start(None)
+        self.assertTrue(schedule.next_sleep() is not None)
+
+
+class TestRetries(unittest.TestCase):
+    '''Retry calls during elections in a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=3, election_delay=1.0)
+        self.cluster.start()
+
+        self.client = compat.ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config),
+            timeout=5, noMasterTimeout=10)
+        self.client.set('key', 'value')
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def test_lock_released(self):
+        '''Test other calls proceed while a call waits for a new master'''
+
+        self.cluster.drop_master()
+        done = threading.Event()
+
+        def set_():
+            '''Set a key once a master is elected'''
+            self.client.set('key', 'other')
+            done.set()
+
+        thread = threading.Thread(target=set_)
+        thread.start()
+        try:
+            time.sleep(0.2)
+            start = time.time()
+            self.assertEquals(self.client.getVersion('arakoon_1'), fake.FakeServer.VERSION)
+            self.assertTrue(time.time() - start < 0.5)
+            self.assertFalse(done.is_set())
+        finally:
+            thread.join()
+
+        self.assertTrue(done.is_set())
+        self.assertTrue(self.client.metrics()['retries'] > 0)
+
+    def test_deadline(self):
+        '''Test retries stop at the deadline'''
+
+        self.cluster.drop_master()
+
+        start = time.time()
+        with self.client.deadline(0.2):
+            self.assertRaises(compat.ArakoonNoMaster, self.client.set, 'key', 'other')
+        self.assertTrue(time.time() - start < 0.5)
+
+    def test_shared_discovery(self):
+        '''Test callers waiting for a master lookup share its result'''
+
+        client_ = self.client._client #pylint: disable=W0212
+        generation = client_._discovery_generation #pylint: disable=W0212
+
+        self.cluster.drop_master()
+        client_._invalidate_master(generation) #pylint: disable=W0212
+        self.assertRaises(compat.ArakoonNoMaster, client_.determine_master, generation)
+        self.assertEquals(self.client.metrics()['master_rediscoveries'], 2)
+
+        # A waiter which started before the lookup doesn't look up again
+        self.assertRaises(compat.ArakoonNoMaster, client_.determine_master, generation)
+        self.assertEquals(self.client.metrics()['master_rediscoveries'], 2)
+
+    def test_stale_discovery(self):
+        '''Test a master looked up by a call is forgotten when it replies NotMaster'''
+
+        client_ = self.client._client #pylint: disable=W0212
+        client_._invalidate_master(client_._discovery_generation) #pylint: disable=W0212
+        determine_master = client_.determine_master
+
+        def stale_determine_master(generation=None):
+            '''Look up the master, which loses its role right away'''
+            determine_master(generation)
+            if client_.master_id == 'arakoon_0':
+                self.cluster.set_master('arakoon_1')
+
+        client_.determine_master = stale_determine_master
+        retries = self.client.metrics()['retries']
+        self.client.set('key', 'other')
+
+        self.assertEquals(client_.master_id, 'arakoon_1')
+        self.assertEquals(self.client.metrics()['retries'] - retries, 1)
+
+    def test_send_backoff(self):
+        '''Test other calls proceed while a call backs off after a failed send'''
+
+        self.cluster.crash('arakoon_2')
+        errors = []
+        calls = []
+        self.client.setSlowCallThreshold(0.5, callback=calls.append)
+
+        def get_version():
+            '''Fail to reach a crashed node'''
+            try:
+                with self.client.deadline(1.5):
+                    self.client.getVersion('arakoon_2')
+            except compat.ArakoonNotConnected as exc:
+                errors.append(exc)
+
+        try_count, backoff = config.ARA_CFG_TRY_CNT, config.ARA_CFG_CONN_BACKOFF
+        config.ARA_CFG_TRY_CNT, config.ARA_CFG_CONN_BACKOFF = 2, 1
+        socket_client.random = _MaximalBackoff()
+        try:
+            thread = threading.Thread(target=get_version)
+            thread.start()
+            time.sleep(0.2)
+            start = time.time()
+            self.assertEquals(self.client.getVersion('arakoon_1'), fake.FakeServer.VERSION)
+            self.assertTrue(time.time() - start < 0.5)
+            thread.join()
+        finally:
+            config.ARA_CFG_TRY_CNT, config.ARA_CFG_CONN_BACKOFF = try_count, backoff
+            socket_client.random = random
+
+        self.assertEquals(len(errors), 1)
+        self.assertEquals([call.retries for call in calls], [self.client.metrics()['retries']])
+
+    def test_send_budget(self):
+        '''Test failed sends aren't retried once the retry budget is exhausted'''
+
+        self.cluster.crash('arakoon_2')
+        policy = retry.RetryPolicy(budget_ratio=0, min_per_second=0, burst=1)
+        self.assertTrue(policy.withdraw())
+        self.client.setRetryPolicy(policy)
+
+        try_count, backoff = config.ARA_CFG_TRY_CNT, config.ARA_CFG_CONN_BACKOFF
+        config.ARA_CFG_TRY_CNT, config.ARA_CFG_CONN_BACKOFF = 3, 1
+        socket_client.random = _MaximalBackoff()
+        try:
+            start = time.time()
+            # The connection opened before the crash may still accept the request
+            self.assertRaises((compat.ArakoonNotConnected, compat.ArakoonSockReadNoBytes), self.client.getVersion,
+                'arakoon_2')
+            self.assertTrue(time.time() - start < 0.5)
+        finally:
+            config.ARA_CFG_TRY_CNT, config.ARA_CFG_CONN_BACKOFF = try_count, backoff
+            socket_client.random = random
+
+        self.assertEquals(self.client.metrics()['retries'], 0)
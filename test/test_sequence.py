@@ -124,3 +124,68 @@ class TestSequenceSerialization(unittest.TestCase):
             sequence.Sequence([])]).serialize())
 
         self.assertEquals(expected, received)
+
+
+class TestSequenceBuilder(unittest.TestCase):
+    '''Test `pyrakoon.sequence.SequenceBuilder`'''
+
+    def test_serialization(self):
+        '''Test a builder serializes like the equivalent sequence'''
+
+        steps = [
+            sequence.Set('key', 'value'),
+            sequence.Delete('key'),
+            sequence.DeletePrefix('prefix'),
+            sequence.Assert('key', None),
+            sequence.Assert('key', 'value'),
+            sequence.AssertExists('key'),
+            sequence.Replace('key', None),
+            sequence.Replace('key', 'wanted'),
+            sequence.Sequence([sequence.Set('nested', 'value')]),
+        ]
+
+        builder = sequence.SequenceBuilder()
+        builder.add_set('key', 'value')
+        builder.add_delete('key')
+        builder.add_delete_prefix('prefix')
+        builder.add_assert('key', None)
+        builder.add_assert('key', 'value')
+        builder.add_assert_exists('key')
+        builder.add_replace('key', None)
+        builder.add_replace('key', 'wanted')
+        nested = sequence.SequenceBuilder()
+        nested.add_set('nested', 'value')
+        builder.add_step(nested)
+
+        expected = ''.join(sequence.Sequence(steps).serialize())
+        self.assertEquals(len(builder), len(steps))
+        self.assertEquals(''.join(builder.serialize()), expected)
+
+        extended = sequence.SequenceBuilder()
+        extended.extend(steps)
+        self.assertEquals(''.join(extended.serialize()), expected)
+
+    def test_message(self):
+        '''Test a builder can be sent as a sequence message'''
+
+        from pyrakoon import protocol
+
+        builder = sequence.SequenceBuilder()
+        builder.add_set('key', 'value')
+        # Steps added after serialization are included next time
+        ''.join(protocol.Sequence([builder], False).serialize())
+        builder.add_delete('other')
+
+        self.assertEquals(
+            ''.join(protocol.Sequence([builder], True).serialize()),
+            ''.join(protocol.Sequence([sequence.Set('key', 'value'), sequence.Delete('other')], True).serialize()))
+
+    def test_checks(self):
+        '''Test arguments are checked when steps are added'''
+
+        builder = sequence.SequenceBuilder()
+
+        self.assertRaises(TypeError, builder.add_set, 'key', 1)
+        self.assertRaises(TypeError, builder.add_assert, u'key', None)
+        self.assertRaises(TypeError, builder.add_step, 'key')
+        self.assertEquals(len(builder), 0)
@@ -0,0 +1,198 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.singleflight`'''
+
+import threading
+import unittest
+
+from twisted.internet import defer
+
+from pyrakoon import compat, consistency, errors, fake, protocol
+from pyrakoon.client import singleflight
+
+CLUSTER_ID = 'pyrakoon_test_singleflight'
+
+
+class _BlockingProcess(object):
+    '''Process callable blocking until released'''
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, message):
+        self.calls += 1
+        self.started.set()
+        self.release.wait()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class TestSingleFlight(unittest.TestCase):
+    '''Tests for `pyrakoon.client.singleflight.SingleFlight`'''
+
+    def _run_concurrently(self, single_flight, process, message, count):
+        results = []
+
+        def call():
+            try:
+                results.append(single_flight.process(process, message))
+            except Exception as exc: #pylint: disable=W0703
+                results.append(exc)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        process.started.wait()
+
+        waiters = [threading.Thread(target=call) for _ in xrange(count - 1)]
+        for waiter in waiters:
+            waiter.start()
+        while single_flight.stats()['coalesced'] < count - 1:
+            process.release.wait(0.001)
+        process.release.set()
+
+        for thread in [leader] + waiters:
+            thread.join()
+
+        return results
+
+    def test_threads(self):
+        '''Test concurrent identical reads share a single request'''
+
+        single_flight = singleflight.SingleFlight()
+        process = _BlockingProcess(['a', 'b'])
+
+        results = self._run_concurrently(single_flight, process, protocol.MultiGet(None, ['a', 'b']), 5)
+
+        self.assertEquals(process.calls, 1)
+        self.assertEquals(results, [['a', 'b']] * 5)
+        self.assertEquals(len(set(id(result) for result in results)), 5)
+        self.assertEquals(single_flight.stats(), {'requests': 5, 'coalesced': 4, 'in_flight': 0})
+
+    def test_exception(self):
+        '''Test waiters receive the exception of the shared request'''
+
+        single_flight = singleflight.SingleFlight()
+        process = _BlockingProcess(errors.NotFound('key'))
+
+        results = self._run_concurrently(single_flight, process, protocol.Get(None, 'key'), 3)
+
+        self.assertEquals(process.calls, 1)
+        self.assert_(all(isinstance(result, errors.NotFound) for result in results))
+
+    def test_read_after_write(self):
+        '''Test reads issued after a write don't join a read sent before it'''
+
+        single_flight = singleflight.SingleFlight()
+        process = _BlockingProcess('old')
+        message = protocol.Get(None, 'key')
+        results = []
+
+        leader = threading.Thread(target=lambda: results.append(single_flight.process(process, message)))
+        leader.start()
+        process.started.wait()
+
+        single_flight.process(lambda _: None, protocol.Set('key', 'new'))
+        reader = threading.Thread(target=lambda: results.append(single_flight.process(lambda _: 'new', message)))
+        reader.start()
+        reader.join(1)
+
+        process.release.set()
+        leader.join()
+        reader.join()
+        self.assertEquals(results, ['new', 'old'])
+        self.assertEquals(single_flight.stats()['coalesced'], 0)
+
+    def test_read_after_non_write(self):
+        '''Test messages which don't modify the cluster don't prevent reads from joining'''
+
+        single_flight = singleflight.SingleFlight()
+        process = _BlockingProcess('value')
+        message = protocol.Get(None, 'key')
+
+        results = []
+
+        threads = [threading.Thread(target=lambda: results.append(single_flight.process(process, message)))
+                   for _ in xrange(2)]
+        threads[0].start()
+        process.started.wait()
+
+        for message_ in [protocol.Nop(), protocol.WhoMaster(), protocol.Statistics(),
+                         protocol.AssertExists(None, 'key')]:
+            single_flight.process(lambda _: None, message_)
+        single_flight.process_many(lambda messages: [None] * len(messages), [protocol.Version()])
+
+        threads[1].start()
+        threads[1].join(0.1)
+        process.release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(process.calls, 1)
+        self.assertEquals(results, ['value'] * 2)
+
+    def test_keys(self):
+        '''Test requests only coalesce when type, arguments and consistency are equal'''
+
+        single_flight = singleflight.SingleFlight()
+        key = single_flight.key
+
+        self.assertEquals(key(protocol.Get(None, 'a')), key(protocol.Get(consistency.CONSISTENT, 'a')))
+        self.assertNotEquals(key(protocol.Get(None, 'a')), key(protocol.Get(None, 'b')))
+        self.assertNotEquals(key(protocol.Get(None, 'a')), key(protocol.Get(consistency.INCONSISTENT, 'a')))
+        self.assertNotEquals(key(protocol.Get(None, 'a')), key(protocol.Exists(None, 'a')))
+        self.assertEquals(key(protocol.Delete('a')), None)
+
+    def test_deferred(self):
+        '''Test waiters on a Twisted protocol get a Deferred fired with the shared result'''
+
+        single_flight = singleflight.SingleFlight()
+        pending = []
+
+        def process(message):
+            pending.append(defer.Deferred())
+            return pending[-1]
+
+        message = protocol.Get(None, 'key')
+        results = []
+        for _ in xrange(3):
+            single_flight.process(process, message).addBoth(results.append)
+
+        self.assertEquals(len(pending), 1)
+        pending[0].callback('value')
+        self.assertEquals(results, ['value'] * 3)
+
+        single_flight.process(process, message).addBoth(results.append)
+        single_flight.process(process, message).addBoth(results.append)
+        pending[1].errback(errors.NotFound('key'))
+        self.assertEquals(len(pending), 2)
+        self.assert_(all(result.check(errors.NotFound) for result in results[3:]))
+
+
+class TestCompatSingleFlight(unittest.TestCase):
+    '''Coalesce reads of a compat client on a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=1)
+        self.cluster.start()
+
+        self.client = compat.ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+        self.single_flight = singleflight.SingleFlight()
+        self.client.setSingleFlight(self.single_flight)
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def test_reads(self):
+        '''Test reads go through the single-flight layer, and writes don't'''
+
+        self.client.set('key', 'value')
+        self.assertEquals(self.client.get('key'), 'value')
+        self.assertEquals(self.client.multiGet(['key']), ['value'])
+        self.assertRaises(compat.ArakoonNotFound, self.client.get, 'missing')
+
+        self.assertEquals(self.single_flight.stats(), {'requests': 3, 'coalesced': 0, 'in_flight': 0})
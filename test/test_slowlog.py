@@ -0,0 +1,122 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.slowlog`'''
+
+import logging
+import unittest
+
+from pyrakoon import client, compat, errors, fake, protocol
+from pyrakoon.client import slowlog
+from pyrakoon.constants.logging import PYRAKOON_COMPAT_LOGGER
+
+CLUSTER_ID = 'pyrakoon_test_slowlog'
+
+class Client(client.SocketClient, client.ClientMixin):
+    '''Native socket client'''
+
+
+class _ListHandler(logging.Handler):
+    '''Logging handler keeping all records'''
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TestSlowCallLog(unittest.TestCase):
+    '''Tests for `pyrakoon.client.slowlog.SlowCallLog`'''
+
+    def test_rate_limit(self):
+        '''Test reports are rate limited, counting suppressed calls'''
+
+        calls = []
+        slow_call_log = slowlog.SlowCallLog(0.0, calls.append, max_per_second=2)
+        message = protocol.Get(None, 'key')
+
+        for _ in xrange(10):
+            slow_call_log.observe(message, 0.0, 0.1)
+        self.assertEquals(len(calls), 2)
+
+        # Refill the bucket
+        slow_call_log._refilled -= 1 #pylint: disable=W0212
+        slow_call_log.observe(message, 0.0, 0.1)
+        self.assertEquals(len(calls), 3)
+        self.assertEquals(calls[-1].suppressed, 8)
+
+    def test_sampling(self):
+        '''Test slow calls can be sampled'''
+
+        calls = []
+        slow_call_log = slowlog.SlowCallLog(0.0, calls.append, sample_rate=0.0)
+        slow_call_log.observe(protocol.Get(None, 'key'), 0.0, 0.1)
+        self.assertEquals(calls, [])
+
+    def test_format(self):
+        '''Test formatting of reports'''
+
+        record = slowlog.SlowCall('DeletePrefix', slowlog.describe_key(protocol.DeletePrefix('prefix_')),
+            'arakoon_0', 0.25, 0.5, 20, 8, 1, errors.NotFound('key'), 3)
+        self.assertEquals(record.format(),
+            'Slow call: DeletePrefix key=\'prefix_\' node=arakoon_0 duration=0.750s lock_wait=0.250s '
+            'wire_time=0.500s sent=20B received=8B retries=1 error=NotFound (3 more slow calls suppressed)')
+
+        self.assertTrue(slowlog.describe_key(protocol.WhoMaster()) is None)
+
+
+class TestSlowCalls(unittest.TestCase):
+    '''Report slow calls against `pyrakoon.fake.FakeServer`'''
+
+    def setUp(self):
+        self.server = fake.FakeServer(CLUSTER_ID)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_native_client(self):
+        '''Test slow calls of the native client are reported'''
+
+        calls = []
+        client_ = Client(self.server.address, CLUSTER_ID)
+        client_.connect()
+        client_.slow_call_log = slowlog.SlowCallLog(0.05, calls.append)
+
+        client_.set('key', 'value')
+        self.assertEquals(calls, [])
+
+        self.server.latency = 0.1
+        self.assertEquals(client_.get('key'), 'value')
+        self.assertEquals(len(calls), 1)
+
+        call = calls[0]
+        self.assertEquals((call.message_type, call.key, call.node_id), ('Get', "'key'", '%s:%s' % self.server.address))
+        self.assertTrue(call.wire_time >= 0.1)
+        self.assertTrue(call.lock_wait < 0.1)
+        self.assertTrue(call.bytes_sent > 0 and call.bytes_received > 0)
+
+    def test_compat_client(self):
+        '''Test slow calls of the compat client are logged'''
+
+        handler = _ListHandler()
+        logger = logging.getLogger(PYRAKOON_COMPAT_LOGGER)
+        logger.addHandler(handler)
+        try:
+            client_ = compat.ArakoonClient(
+                compat.ArakoonClientConfig(*self.server.client_config))
+            client_.setSlowCallThreshold(0.05)
+
+            self.server.latency = 0.1
+            client_.set('key', 'value')
+
+            client_.setSlowCallThreshold(None)
+            client_.set('key', 'value')
+        finally:
+            logger.removeHandler(handler)
+
+        messages = [record.getMessage() for record in handler.records if record.getMessage().startswith('Slow')]
+        self.assertEquals(len(messages), 1)
+        self.assertTrue(messages[0].startswith('Slow call: Set key=\'key\' node=arakoon_0 '), messages[0])
@@ -0,0 +1,130 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.statistics`'''
+
+import time
+import unittest
+
+from pyrakoon import compat, fake
+from pyrakoon.client import statistics
+
+CLUSTER_ID = 'pyrakoon_test_statistics'
+
+def _sample(count, avg, timestamp, start=1.0):
+    '''Build a sample of a single `set_info` operation'''
+
+    return statistics.StatisticsSample.from_dict('arakoon_0', {
+        'start': start, 'last': timestamp,
+        'set_info': {'n': count, 'min': 0.0, 'max': 1.0, 'avg': avg, 'var': 0.0},
+        'avg_set_size': 10.0,
+        'node_is': {'arakoon_0': 12},
+    }, timestamp)
+
+
+class TestComputeRates(unittest.TestCase):
+    '''Tests for `pyrakoon.client.statistics.compute_rates`'''
+
+    def test_parse(self):
+        '''Test parsing of statistics results'''
+
+        sample = _sample(10, 0.5, 5.0)
+        self.assertEquals(sorted(sample.operations), ['set_info'])
+        self.assertEquals(sample.operations['set_info'].count, 10)
+        self.assertEquals(sample.node_is, {'arakoon_0': 12})
+        self.assertEquals(sample.values, {'avg_set_size': 10.0})
+        self.assertEquals((sample.start, sample.last), (1.0, 5.0))
+
+    def test_restart(self):
+        '''Test counters going down are handled as a statistics reset'''
+
+        rates = statistics.compute_rates(_sample(100, 0.5, 5.0), _sample(10, 0.25, 10.0))
+        self.assertTrue(rates.restarted)
+        self.assertEquals(rates.operations['set_info'].count, 10)
+        self.assertEquals(rates.operations['set_info'].avg_latency, 0.25)
+
+        rates = statistics.compute_rates(_sample(5, 0.5, 5.0), _sample(10, 0.25, 10.0, start=7.0))
+        self.assertTrue(rates.restarted)
+        self.assertEquals(rates.operations['set_info'].count, 10)
+
+    def test_idle(self):
+        '''Test rates without activity'''
+
+        rates = statistics.compute_rates(_sample(10, 0.5, 5.0), _sample(10, 0.5, 10.0))
+        self.assertFalse(rates.restarted)
+        self.assertEquals(rates.operations['set_info'].per_second, 0.0)
+        self.assertTrue(rates.operations['set_info'].avg_latency is None)
+
+    def test_invalid(self):
+        '''Test samples must be of the same node, in order'''
+
+        self.assertRaises(ValueError, statistics.compute_rates, _sample(10, 0.5, 10.0), _sample(10, 0.5, 5.0))
+
+
+class TestStatisticsPoller(unittest.TestCase):
+    '''Poll a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=2)
+        self.cluster.start()
+
+        self.client = compat.ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def test_poll(self):
+        '''Test polling, rates and the sample ring buffer'''
+
+        polled = []
+        poller = statistics.StatisticsPoller(*self.cluster.client_config, history=3, callback=polled.append)
+        try:
+            for i in xrange(10):
+                self.client.set('key_%d' % i, 'value')
+            self.assertEquals(sorted(poller.poll()), ['arakoon_0', 'arakoon_1'])
+            self.assertTrue(poller.rates('arakoon_0') is None)
+
+            time.sleep(0.01)
+            for i in xrange(20):
+                self.client.set('key_%d' % i, 'value')
+            poller.poll()
+
+            master = self.cluster.master
+            rates = poller.rates(master)
+            self.assertEquals(rates.operations['set_info'].count, 20)
+            self.assertTrue(rates.operations['set_info'].per_second > 0)
+            self.assertEquals(poller.latest(master).operations['set_info'].count, 30)
+
+            for _ in xrange(3):
+                poller.poll()
+            self.assertEquals(len(poller.samples(master)), 3)
+            self.assertEquals(len(polled), 10)
+            self.assertEquals(poller.rates(master, window=3600).operations['set_info'].count, 0)
+        finally:
+            poller.stop()
+
+    def test_node_failure(self):
+        '''Test failing nodes are counted and reconnected'''
+
+        poller = statistics.StatisticsPoller(*self.cluster.client_config)
+        try:
+            poller.poll()
+            self.cluster.crash('arakoon_1')
+            self.assertEquals(sorted(poller.poll()), ['arakoon_0'])
+            self.assertEquals(poller.errors(), {'arakoon_0': 0, 'arakoon_1': 1})
+
+            self.cluster.restart('arakoon_1')
+            self.assertEquals(sorted(poller.poll()), ['arakoon_0', 'arakoon_1'])
+        finally:
+            poller.stop()
+
+    def test_background(self):
+        '''Test polling in a background thread'''
+
+        with statistics.StatisticsPoller(*self.cluster.client_config, interval=0.01) as poller:
+            deadline = time.time() + 5
+            while len(poller.samples('arakoon_0')) < 3 and time.time() < deadline:
+                time.sleep(0.01)
+
+        self.assertTrue(len(poller.samples('arakoon_0')) >= 3)
+        self.assertTrue(poller.rates('arakoon_0') is not None)
@@ -0,0 +1,78 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.tracing`'''
+
+import unittest
+
+from pyrakoon import client, compat, errors, fake, tracing
+
+CLUSTER_ID = 'pyrakoon_test_tracing'
+
+class Client(client.SocketClient, client.ClientMixin):
+    '''Native socket client'''
+
+
+class TestTracing(unittest.TestCase):
+    '''Trace calls against `pyrakoon.fake.FakeServer`'''
+
+    def setUp(self):
+        self.server = fake.FakeServer(CLUSTER_ID)
+        self.server.start()
+
+        self.events = []
+        tracing.subscribe(self._subscriber)
+
+    def tearDown(self):
+        tracing.unsubscribe(self._subscriber)
+        self.server.stop()
+
+    def _subscriber(self, event, trace):
+        self.events.append((event, trace.message_type, trace.node_id,
+            trace.bytes_sent, trace.bytes_received))
+
+    def test_native_client(self):
+        '''Test the phases of native client calls'''
+
+        client_ = Client(self.server.address, CLUSTER_ID)
+        client_.connect()
+        node = '%s:%s' % self.server.address
+
+        client_.set('key', 'value')
+        self.assertEquals([event[0] for event in self.events], [
+            tracing.EVENT_REQUEST_START, tracing.EVENT_BYTES_WRITTEN,
+            tracing.EVENT_FIRST_BYTE, tracing.EVENT_DECODE_COMPLETE])
+        self.assertEquals(self.events[-1][1:], ('Set', node, 20, 4))
+
+        del self.events[:]
+        self.assertRaises(errors.NotFound, client_.get, 'other')
+        self.assertEquals([event[0] for event in self.events], [
+            tracing.EVENT_REQUEST_START, tracing.EVENT_BYTES_WRITTEN,
+            tracing.EVENT_FIRST_BYTE, tracing.EVENT_ERROR])
+
+    def test_compat_client(self):
+        '''Test compat client calls report the node they were sent to'''
+
+        client_ = compat.ArakoonClient(
+            compat.ArakoonClientConfig(*self.server.client_config))
+        client_.set('key', 'value')
+
+        self.assertEquals(self.events[-1][:3],
+            (tracing.EVENT_DECODE_COMPLETE, 'Set', 'arakoon_0'))
+
+    def test_failing_subscriber(self):
+        '''Test a failing subscriber doesn't break calls'''
+
+        def fail(event, trace):
+            '''Failing subscriber'''
+            raise RuntimeError(event)
+
+        tracing.subscribe(fail)
+        try:
+            client_ = Client(self.server.address, CLUSTER_ID)
+            client_.connect()
+            self.assertEquals(client_.who_master(), 'arakoon_0')
+        finally:
+            tracing.unsubscribe(fail)
+
+        self.assertEquals(len(self.events), 4)
@@ -0,0 +1,136 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.transaction`'''
+
+import threading
+import unittest
+
+from pyrakoon import compat, errors, fake
+from pyrakoon.client import compression, retry, transaction
+
+CLUSTER_ID = 'pyrakoon_test_transaction'
+
+
+class TestTransaction(unittest.TestCase):
+    '''Run transactions against a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=1)
+        self.cluster.start()
+
+        self.client = self._client()
+        self.client.set('ann', '100')
+        self.client.set('bob', '50')
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def _client(self):
+        return compat.client._ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+
+    def test_commit(self):
+        '''Test reads are asserted and writes applied in a single sequence'''
+
+        transaction_ = transaction.Transaction(self.client)
+        self.assertEquals(transaction_.get_many(['ann', 'bob', 'carl']), ['100', '50', None])
+        self.assertRaises(errors.NotFound, transaction_.get, 'carl')
+        transaction_.set('ann', '90')
+        transaction_.set('carl', '10')
+        transaction_.delete('bob')
+        transaction_.delete('dave')
+
+        self.assertEquals(self.client.metrics()['commands']['MultiGetOption']['calls'], 1)
+        self.assertEquals(transaction_.read_set, set(['ann', 'bob', 'carl']))
+        self.assertEquals(transaction_.write_set, set(['ann', 'bob', 'carl', 'dave']))
+
+        transaction_.commit()
+        self.assertEquals(self.client.multi_get_option(['ann', 'bob', 'carl']), ['90', None, '10'])
+        self.assertEquals(self.client.metrics()['commands']['Sequence']['calls'], 1)
+        self.assertRaises(RuntimeError, transaction_.commit)
+
+    def test_own_writes(self):
+        '''Test keys written by a transaction are read back locally'''
+
+        transaction_ = transaction.Transaction(self.client)
+        transaction_.set('carl', '1')
+        transaction_.delete('ann')
+
+        self.assertEquals(transaction_.get('carl'), '1')
+        self.assertFalse(transaction_.exists('ann'))
+        self.assertEquals(transaction_.read_set, set())
+        self.assertNotIn('MultiGetOption', self.client.metrics()['commands'])
+
+    def test_conflict(self):
+        '''Test a transaction fails when a key it read was changed'''
+
+        transaction_ = transaction.Transaction(self.client)
+        transaction_.get('ann')
+        transaction_.get_option('carl')
+        transaction_.set('bob', '0')
+        self.client.set('carl', 'new')
+
+        self.assertRaises(errors.AssertionFailed, transaction_.commit)
+        self.assertEquals(self.client.get('bob'), '50')
+
+    def test_run(self):
+        '''Test conflicting transactions are retried'''
+
+        attempts = []
+
+        def transfer(transaction_):
+            attempts.append(None)
+            ann = int(transaction_.get('ann'))
+            if len(attempts) == 1:
+                self.client.set('ann', '200')
+            transaction_.set('ann', str(ann - 10))
+            transaction_.set('bob', str(int(transaction_.get('bob')) + 10))
+            return ann
+
+        self.assertEquals(transaction.run(self.client, transfer), 200)
+        self.assertEquals(len(attempts), 2)
+        self.assertEquals(self.client.multi_get(['ann', 'bob']), ['190', '60'])
+
+        def conflict(transaction_):
+            attempts.append(None)
+            transaction_.get('ann')
+            self.client.set('ann', str(len(attempts)))
+
+        self.assertRaises(errors.AssertionFailed, transaction.run, self.client, conflict, max_attempts=2)
+        self.assertEquals(len(attempts), 4)
+
+    def test_concurrent(self):
+        '''Test concurrent increments don't get lost'''
+
+        policy = retry.RetryPolicy(base=0.001, cap=0.01, budget_ratio=1, burst=1000)
+
+        def increment(transaction_):
+            transaction_.set('counter', str(int(transaction_.get_option('counter') or '0') + 1))
+
+        def worker():
+            client = self._client()
+            for _ in xrange(10):
+                transaction.run(client, increment, max_attempts=100, policy=policy)
+
+        threads = [threading.Thread(target=worker) for _ in xrange(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(self.client.get('counter'), '40')
+
+    def test_compression(self):
+        '''Test compressed values are asserted as stored and decoded for the transaction'''
+
+        self.client.value_codec = compression.ValueCodec(compression.CompressionPolicy(threshold=10))
+        value = 'x' * 100
+        self.client.set('large', value)
+
+        transaction_ = transaction.Transaction(self.client)
+        self.assertEquals(transaction_.get('large'), value)
+        transaction_.set('copy', transaction_.get('large'))
+        transaction_.commit()
+
+        self.assertEquals(self.client.get('copy'), value)
+        self.assertEquals(self.client.value_codec.stats()['values_compressed'], 2)
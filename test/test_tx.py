@@ -142,6 +142,17 @@ class TestTwistedClient(unittest.TestCase):
         deferred = client.get('key')
         deferred.addErrback(lambda exc: exc.trap(errors.NotFound))
 
+        def check_metrics(_):
+            '''Check the failed call is recorded'''
+
+            metrics = client.metrics()
+            self.assertEquals(metrics['commands']['Get']['calls'], 1)
+            self.assertEquals(metrics['commands']['Get']['errors'], 1)
+            self.assertEquals(metrics['errors'], {'NotFound': 1})
+            self.assertEquals(metrics['bytes_received'], len(to_send))
+
+        deferred.addCallback(check_metrics)
+
         return deferred
 
     def test_disconnect(self):
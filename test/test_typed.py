@@ -0,0 +1,113 @@
+# Copyright (C) iNuron - info@openvstorage.com
+# This file is part of Open vStorage. For license information, see <LICENSE.txt>
+
+'''Tests for code in `pyrakoon.client.typed`'''
+
+import unittest
+
+from pyrakoon import compat, errors, fake
+from pyrakoon.client import compression, typed
+
+CLUSTER_ID = 'pyrakoon_test_typed'
+
+
+class TestSerializers(unittest.TestCase):
+    '''Tests for the `pyrakoon.client.typed.Serializer` implementations'''
+
+    VALUES = [{'name': 'ann', 'groups': ['admin']}, [1, 2.5, None], u'caf\xe9', 42, True]
+
+    def test_round_trip(self):
+        '''Test values are deserialized as serialized, one by one and in batches'''
+
+        for serializer in (typed.JSON, typed.MARSHAL, typed.PICKLE):
+            data = serializer.dumps_many(self.VALUES)
+            self.assert_(all(isinstance(data_, str) for data_ in data))
+            self.assertEquals(serializer.loads_many(data), self.VALUES)
+            self.assertEquals([serializer.loads(data_) for data_ in data], self.VALUES)
+
+        self.assertEquals(typed.RAW.loads_many(['a', 'b']), ['a', 'b'])
+        self.assertRaises(TypeError, typed.RAW.dumps, 1)
+
+    def test_json_fallback(self):
+        '''Test JSON batches fall back to decoding values one by one'''
+
+        self.assertEquals(typed.JSON.loads_many(['1', '2']), [1, 2])
+        self.assertRaises(ValueError, typed.JSON.loads_many, ['1', '2,3'])
+        self.assertRaises(ValueError, typed.JSON.loads_many, ['1', ''])
+        self.assertRaises(ValueError, typed.JSON.loads_many, ['1,[2', '3]'])
+        self.assertEquals(typed.JSON.loads_many([' 1', '[2] ']), [1, [2]])
+
+
+class TestTypedClient(unittest.TestCase):
+    '''Store structured values in a `pyrakoon.fake.FakeCluster`'''
+
+    def setUp(self):
+        self.cluster = fake.FakeCluster(CLUSTER_ID, node_count=1)
+        self.cluster.start()
+
+        self.client = compat.client._ArakoonClient(compat.ArakoonClientConfig(*self.cluster.client_config))
+        self.typed = typed.TypedClient(self.client, serializers={
+            'users/': typed.JSON,
+            'counters/': typed.MARSHAL,
+            'raw/': typed.RAW,
+        })
+
+    def tearDown(self):
+        self.cluster.stop()
+
+    def test_prefixes(self):
+        '''Test values are serialized by the serializer of the longest matching prefix'''
+
+        self.typed.register('users/sessions/', typed.PICKLE)
+
+        self.typed.set('users/ann', {'name': 'ann'})
+        self.typed.set('users/sessions/ann', set(['a', 'b']))
+        self.typed.set('raw/data', 'bytes')
+        self.typed.set('other', [1])
+
+        self.assertEquals(self.client.get('users/ann'), '{"name":"ann"}')
+        self.assertEquals(self.typed.get('users/sessions/ann'), set(['a', 'b']))
+        self.assertEquals(self.client.get('raw/data'), 'bytes')
+        self.assertEquals(self.typed.get('other'), [1])
+        self.assertRaises(errors.NotFound, self.typed.get, 'users/bob')
+
+    def test_batches(self):
+        '''Test writing and reading several values at once'''
+
+        self.typed.set_many([('users/%d' % i, {'id': i}) for i in xrange(5)] + [('counters/users', 5)])
+
+        self.assertEquals(self.client.metrics()['commands']['Sequence']['calls'], 1)
+        self.assertEquals(self.typed.multi_get(['counters/users', 'users/3', 'users/1']), [5, {'id': 3}, {'id': 1}])
+        self.assertEquals(self.typed.multi_get_option(['users/0', 'users/9', 'counters/users']),
+            [{'id': 0}, None, 5])
+
+    def test_lazy(self):
+        '''Test range entries are only deserialized when accessed'''
+
+        self.typed.set_many(('users/%03d' % i, {'id': i}) for i in xrange(100))
+
+        entries = self.typed.range_entries('users/', True, 'users0', False)
+        self.assertEquals(len(entries), 100)
+        self.assertEquals(entries.decoded, 0)
+        self.assertEquals(entries[10], ('users/010', {'id': 10}))
+        self.assertEquals(entries[:2], [('users/000', {'id': 0}), ('users/001', {'id': 1})])
+        self.assertEquals(entries.raw(50), '{"id":50}')
+        self.assertEquals(entries.decoded, 3)
+
+        self.assertEquals(entries.decode_all(), [('users/%03d' % i, {'id': i}) for i in xrange(100)])
+        self.assertEquals(entries.decoded, 100)
+
+        reverse = self.typed.rev_range_entries('users/099', True, None, True, 2)
+        self.assertEquals(list(reverse), [('users/099', {'id': 99}), ('users/098', {'id': 98})])
+
+    def test_compression(self):
+        '''Test serialized values are compressed by the codec of the client'''
+
+        self.client.value_codec = compression.ValueCodec(compression.CompressionPolicy(threshold=100))
+        value = {'items': ['item'] * 100}
+
+        self.typed.set_many([('users/a', value)])
+        self.typed.set('users/b', value)
+
+        self.assertEquals(self.client.value_codec.stats()['values_compressed'], 2)
+        self.assertEquals(self.typed.multi_get(['users/a', 'users/b']), [value, value])